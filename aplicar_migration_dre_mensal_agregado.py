@@ -0,0 +1,62 @@
+"""
+Aplicar Migration: DRE - Agregado mensal incremental
+Data: 16/10/2026
+Descrição: Executa sql/migrations/migration_dre_mensal_agregado.sql no banco de dados
+"""
+
+import os
+import sys
+from database_postgresql import DatabaseManager, return_to_pool
+
+
+def aplicar_migration_dre_mensal_agregado():
+    """Cria dre_mensal_agregado, o trigger em lancamentos e faz a carga inicial"""
+
+    print("=" * 80)
+    print("🚀 MIGRATION: DRE - Agregado mensal incremental")
+    print("=" * 80)
+    print()
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    sql_file = os.path.join(script_dir, 'sql', 'migrations', 'migration_dre_mensal_agregado.sql')
+
+    if not os.path.exists(sql_file):
+        print(f"❌ Arquivo SQL não encontrado: {sql_file}")
+        return False
+
+    with open(sql_file, 'r', encoding='utf-8') as f:
+        sql_script = f.read()
+
+    db = DatabaseManager()
+    conn = db.get_connection()
+    conn.autocommit = False  # LOCK TABLE da carga inicial exige transação
+    cursor = conn.cursor()
+
+    try:
+        # Script inteiro em uma transação: a função plpgsql contém ';' dentro de $$
+        print("⚙️  Executando migration (tabela + trigger + carga inicial)...")
+        cursor.execute(sql_script)
+        conn.commit()
+
+        cursor.execute("""
+            SELECT COUNT(*) AS linhas, COUNT(DISTINCT empresa_id) AS empresas
+            FROM dre_mensal_agregado
+        """)
+        resultado = cursor.fetchone()
+        print(f"   ✅ {resultado['linhas']} linha(s) agregada(s) para {resultado['empresas']} empresa(s)")
+        print()
+        print("✅ MIGRATION CONCLUÍDA COM SUCESSO!")
+        return True
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Erro ao aplicar migration: {e}")
+        return False
+
+    finally:
+        cursor.close()
+        return_to_pool(conn)
+
+
+if __name__ == '__main__':
+    sys.exit(0 if aplicar_migration_dre_mensal_agregado() else 1)
@@ -0,0 +1,59 @@
+"""
+Aplicar Migration: Versão dos lançamentos por empresa
+Data: 16/10/2026
+Descrição: Executa sql/migrations/migration_lancamentos_versao.sql no banco de dados
+"""
+
+import os
+import sys
+from database_postgresql import DatabaseManager, return_to_pool
+
+
+def aplicar_migration_lancamentos_versao():
+    """Cria lancamentos_versao e os triggers em lancamentos"""
+
+    print("=" * 80)
+    print("🚀 MIGRATION: Versão dos lançamentos por empresa")
+    print("=" * 80)
+    print()
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    sql_file = os.path.join(script_dir, 'sql', 'migrations', 'migration_lancamentos_versao.sql')
+
+    if not os.path.exists(sql_file):
+        print(f"❌ Arquivo SQL não encontrado: {sql_file}")
+        return False
+
+    with open(sql_file, 'r', encoding='utf-8') as f:
+        sql_script = f.read()
+
+    db = DatabaseManager()
+    conn = db.get_connection()
+    conn.autocommit = False
+    cursor = conn.cursor()
+
+    try:
+        # Script inteiro em uma transação: a função plpgsql contém ';' dentro de $$
+        print("⚙️  Executando migration (tabela + triggers + carga inicial)...")
+        cursor.execute(sql_script)
+        conn.commit()
+
+        cursor.execute("SELECT COUNT(*) AS empresas FROM lancamentos_versao")
+        empresas = cursor.fetchone()['empresas']
+        print(f"   ✅ Versão registrada para {empresas} empresa(s)")
+        print()
+        print("✅ MIGRATION CONCLUÍDA COM SUCESSO!")
+        return True
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Erro ao aplicar migration: {e}")
+        return False
+
+    finally:
+        cursor.close()
+        return_to_pool(conn)
+
+
+if __name__ == '__main__':
+    sys.exit(0 if aplicar_migration_lancamentos_versao() else 1)
@@ -0,0 +1,58 @@
+"""
+Aplicar Migration: Checkpoints mensais de saldo do extrato
+Data: 17/10/2026
+Descrição: Executa sql/migrations/migration_saldos_extrato_mensais.sql no banco de dados
+"""
+
+import os
+import sys
+from database_postgresql import DatabaseManager, return_to_pool
+
+
+def aplicar_migration_saldos_extrato_mensais():
+    """Instala os triggers de saldos_extrato_mensais e reconstrói os checkpoints"""
+
+    print("=" * 80)
+    print("🚀 MIGRATION: Checkpoints mensais de saldo do extrato")
+    print("=" * 80)
+    print()
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    sql_file = os.path.join(script_dir, 'sql', 'migrations', 'migration_saldos_extrato_mensais.sql')
+
+    if not os.path.exists(sql_file):
+        print(f"❌ Arquivo SQL não encontrado: {sql_file}")
+        return False
+
+    with open(sql_file, 'r', encoding='utf-8') as f:
+        sql_script = f.read()
+
+    db = DatabaseManager()
+    conn = db.get_connection()
+    conn.autocommit = False
+    cursor = conn.cursor()
+
+    try:
+        # Script inteiro em uma transação: a função plpgsql contém ';' dentro de $$
+        print("⚙️  Executando migration (triggers + reconstrução dos checkpoints)...")
+        cursor.execute(sql_script)
+        meses = cursor.fetchone()['meses']
+        conn.commit()
+
+        print(f"   ✅ Checkpoints reconstruídos: {meses} mês(es)")
+        print()
+        print("✅ MIGRATION CONCLUÍDA COM SUCESSO!")
+        return True
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Erro ao aplicar migration: {e}")
+        return False
+
+    finally:
+        cursor.close()
+        return_to_pool(conn)
+
+
+if __name__ == '__main__':
+    sys.exit(0 if aplicar_migration_saldos_extrato_mensais() else 1)
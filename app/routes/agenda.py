@@ -91,12 +91,70 @@ def _save_to_db(settings):
         print(f"⚠️ Não foi possível salvar config no banco: {e}")
         raise
 
+# Destinatários dos resumos de notificação: uma lista por empresa (nunca
+# global - cada empresa só recebe as próprias sessões e contratos)
+_CHAVE_EMAILS_EMPRESA = 'agenda_notification_emails:{}'
+
+def load_notification_emails(empresa_ids):
+    """
+    E-mails que recebem os resumos de notificação de cada empresa.
+    Empresa sem lista configurada fica fora do dict.
+
+    Returns:
+        {empresa_id: [emails]}
+    """
+    empresa_ids = [int(e) for e in empresa_ids if e]
+    if not empresa_ids:
+        return {}
+    try:
+        from database_postgresql import get_db_connection
+        with get_db_connection(allow_global=True) as conn:
+            cur = conn.cursor()
+            _ensure_config_table(cur)
+            cur.execute(
+                "SELECT chave, valor FROM config_sistema WHERE chave = ANY(%s)",
+                ([_CHAVE_EMAILS_EMPRESA.format(e) for e in empresa_ids],)
+            )
+            rows = cur.fetchall()
+    except Exception as e:
+        print(f"⚠️ Não foi possível carregar e-mails de notificação: {e}")
+        return {}
+
+    resultado = {}
+    for row in rows:
+        emails = [e for e in json.loads(row['valor'] or '[]') if e]
+        if emails:
+            resultado[int(row['chave'].rsplit(':', 1)[1])] = emails
+    return resultado
+
+def save_notification_emails(empresa_id, emails):
+    """Persiste a lista de destinatários dos resumos da empresa."""
+    from database_postgresql import get_db_connection
+    with get_db_connection(allow_global=True) as conn:
+        cur = conn.cursor()
+        _ensure_config_table(cur)
+        cur.execute("""
+            INSERT INTO config_sistema (chave, valor, atualizado_em)
+            VALUES (%s, %s, NOW())
+            ON CONFLICT (chave) DO UPDATE
+                SET valor = EXCLUDED.valor, atualizado_em = NOW()
+        """, (_CHAVE_EMAILS_EMPRESA.format(int(empresa_id)), json.dumps(emails or [], ensure_ascii=False)))
+
+def _notification_emails_da_sessao():
+    """Lista da empresa selecionada na sessão ([] sem empresa)."""
+    empresa_id = session.get('empresa_id')
+    if not empresa_id:
+        return []
+    return load_notification_emails([empresa_id]).get(int(empresa_id), [])
+
 # ---------------------------------------------------------------------------
 
 def load_email_settings():
     """
     Carregar configurações de e-mail.
     Prioridade: env vars (Railway) > PostgreSQL > config/email_settings.json > defaults
+
+    Os destinatários dos resumos são por empresa: load_notification_emails().
     """
     # 1. Tentar arquivo local (fallback / dev local)
     file_settings = {}
@@ -124,7 +182,6 @@ def load_email_settings():
         smtp_enabled = False
 
     return {
-        'notification_emails': file_settings.get('notification_emails', []),
         'google_calendar_enabled': file_settings.get('google_calendar_enabled', False),
         'google_calendar_id': file_settings.get('google_calendar_id'),
         'google_credentials': file_settings.get('google_credentials'),
@@ -161,7 +218,7 @@ def get_email_settings():
     try:
         settings = load_email_settings()
         safe_settings = {
-            'notification_emails': settings.get('notification_emails', []),
+            'notification_emails': _notification_emails_da_sessao(),
             'google_calendar_enabled': settings.get('google_calendar_enabled', False),
             'google_calendar_id': settings.get('google_calendar_id'),
             'smtp_enabled': settings.get('smtp_enabled', False),
@@ -183,11 +240,16 @@ def update_email_settings():
     try:
         data = request.json
         
+        # Destinatários dos resumos: só da empresa selecionada
+        empresa_id = session.get('empresa_id')
+        if not empresa_id:
+            return jsonify({'error': 'Empresa não identificada'}), 403
+        save_notification_emails(empresa_id, data.get('notification_emails', []))
+
         # Carregar configurações existentes
         settings = load_email_settings()
         
         # Atualizar
-        settings['notification_emails'] = data.get('notification_emails', [])
         settings['google_calendar_enabled'] = data.get('google_calendar_enabled', False)
         settings['google_calendar_id'] = data.get('google_calendar_id')
         
@@ -721,7 +783,7 @@ def test_notifications():
         else:
             # Sem sessões/contratos para notificar — testar envio direto
             settings = load_email_settings()
-            recipients = settings.get('notification_emails', [])
+            recipients = load_notification_emails([empresa_id]).get(int(empresa_id), [])
             if not recipients:
                 return jsonify({
                     'success': False,
@@ -782,7 +844,7 @@ def notification_settings():
                 'smtp_user': settings.get('smtp_user', ''),
                 'smtp_from_email': settings.get('smtp_from_email', ''),
                 'smtp_from_name': settings.get('smtp_from_name', 'Sistema Financeiro DWM'),
-                'notification_emails': settings.get('notification_emails', [])
+                'notification_emails': _notification_emails_da_sessao()
             }
             return jsonify(safe_settings)
         except Exception as e:
@@ -10,6 +10,7 @@ Endpoints:
 
 from flask import Blueprint, jsonify, request
 from app.utils.cache_manager import get_cache_stats, invalidate_cache, cleanup_expired
+import cache_manager as cache_empresas
 from app.utils.query_optimizer import profiler
 from auth_middleware import require_permission
 
@@ -24,20 +25,30 @@ def get_performance_stats():
         cache_stats = get_cache_stats()
         query_stats = profiler.get_stats()
         
-        # Calcular hit rate
-        hit_rate = 0
-        if cache_stats['total_keys'] > 0:
-            hit_rate = (cache_stats['valid_keys'] / cache_stats['total_keys']) * 100
+        # Cache por empresa (somado entre workers no backend compartilhado)
+        empresas_stats = cache_empresas.get_cache_stats()
         
         return jsonify({
             'success': True,
             'cache': {
                 'enabled': cache_stats['enabled'],
-                'total_keys': cache_stats['total_keys'],
-                'valid_keys': cache_stats['valid_keys'],
-                'expired_keys': cache_stats['expired_keys'],
-                'hit_rate_percent': round(hit_rate, 2),
-                'memory_size_kb': round(cache_stats['memory_size_kb'], 2)
+                'backend': cache_stats['backend'],
+                'workers': cache_stats['workers'],
+                'cache_size': cache_stats['cache_size'],
+                'hits': cache_stats['cache_hits'],
+                'misses': cache_stats['cache_misses'],
+                'hit_rate_percent': cache_stats['hit_rate']
+            },
+            'cache_empresas': {
+                'backend': empresas_stats.get('backend'),
+                'workers': empresas_stats.get('workers', 1),
+                'cache_size': empresas_stats.get('cache_size', 0),
+                'max_size': empresas_stats.get('max_size', 0),
+                'hits': empresas_stats.get('hits', 0),
+                'misses': empresas_stats.get('misses', 0),
+                'invalidations': empresas_stats.get('invalidations', 0),
+                'hit_rate_percent': empresas_stats.get('hit_rate', 0),
+                'per_empresa': empresas_stats.get('per_empresa', {})
             },
             'queries': {
                 'total_queries': query_stats.get('total_queries', 0),
@@ -83,15 +94,21 @@ def get_slow_queries():
 @performance_bp.route('/clear-cache', methods=['POST'])
 @require_permission('admin')
 def clear_cache():
-    """Limpa cache do sistema"""
+    """Limpa cache do sistema (empresa_id + tag opcional invalida o cache da empresa em todos os workers)"""
     try:
         pattern = request.json.get('pattern') if request.json else None
+        empresa_id = request.json.get('empresa_id') if request.json else None
         
-        if pattern:
+        if empresa_id:
+            tag = request.json.get('tag')
+            cache_empresas.invalidate_cache(int(empresa_id), tag)
+            message = f"Cache da empresa {empresa_id} invalidado" + (f" (tag: {tag})" if tag else "")
+        elif pattern:
             invalidate_cache(pattern)
             message = f"Cache invalidado para padrão: {pattern}"
         else:
             invalidate_cache()
+            cache_empresas.reset_cache()
             message = "Cache totalmente limpo"
         
         return jsonify({
@@ -29,11 +29,20 @@ from database_postgresql import StatusLancamento, TipoLancamento
 import database_postgresql as db
 from app.utils import parse_date, format_date_br, get_current_date_br, get_current_date_filename
 from app.utils.cache_manager import cached, invalidate_cache
+from app.utils.livro_colunar import obter_livro, RECEITA, DESPESA, TRANSFERENCIA, PAGO, PENDENTE
 
 # Criar blueprint
 relatorios_bp = Blueprint('relatorios', __name__, url_prefix='/api/relatorios')
 
 
+def _mascara_cliente(livro):
+    """Linhas visíveis ao usuário: não-admin com cliente_id vê só os próprios lançamentos"""
+    usuario = request.usuario
+    if usuario['tipo'] != 'admin' and usuario.get('cliente_id'):
+        return livro.mascara(pessoa=usuario['cliente_id'])
+    return livro.mascara()
+
+
 @relatorios_bp.route('/fluxo-caixa', methods=['GET'])
 @require_permission('relatorios_view')
 def relatorio_fluxo_caixa():
@@ -192,6 +201,8 @@ def dashboard():
     """
     Dados para o dashboard
     
+    Agregações sobre o snapshot colunar da empresa (app/utils/livro_colunar.py).
+    
     Security:
         🔒 Validado empresa_id da sessão
     """
@@ -207,47 +218,30 @@ def dashboard():
         mes = request.args.get('mes', type=int)
         
         # 🔒 Passar empresa_id explicitamente
-        lancamentos = db.listar_lancamentos(empresa_id=empresa_id)
+        livro = obter_livro(empresa_id)
         contas = db.listar_contas_por_empresa(empresa_id=empresa_id)
         
         # Filtrar lançamentos por cliente se necessário
-        usuario = request.usuario
-        if usuario['tipo'] != 'admin' and usuario.get('cliente_id'):
-            lancamentos = [l for l in lancamentos if getattr(l, 'pessoa', None) == usuario['cliente_id']]
+        base = _mascara_cliente(livro)
         
         # Calcular saldos
         saldo_total = Decimal('0')
         for c in contas:
             saldo_total += Decimal(str(c.saldo_inicial))
         
-        for lanc in lancamentos:
-            if lanc.status == StatusLancamento.PAGO and lanc.tipo != TipoLancamento.TRANSFERENCIA:
-                valor_decimal = Decimal(str(lanc.valor))
-                if lanc.tipo == TipoLancamento.RECEITA:
-                    saldo_total += valor_decimal
-                else:
-                    saldo_total -= valor_decimal
+        pagos = base & livro.mascara(tipos=(RECEITA, DESPESA), status=(PAGO,))
+        totais_pagos = livro.somar_por_tipo(pagos)
+        saldo_total += Decimal(str(totais_pagos[RECEITA])) - Decimal(str(totais_pagos[DESPESA]))
         
         # Contas pendentes
         hoje = date.today()
-        contas_receber = Decimal('0')
-        contas_pagar = Decimal('0')
-        contas_vencidas = Decimal('0')
-        
-        for l in lancamentos:
-            if l.tipo != TipoLancamento.TRANSFERENCIA:
-                valor_decimal = Decimal(str(l.valor))
-                if l.tipo == TipoLancamento.RECEITA and l.status == StatusLancamento.PENDENTE:
-                    contas_receber += valor_decimal
-                if l.tipo == TipoLancamento.DESPESA and l.status == StatusLancamento.PENDENTE:
-                    contas_pagar += valor_decimal
-                # Converter datetime para date se necessário
-                data_venc = l.data_vencimento.date() if hasattr(l.data_vencimento, 'date') else l.data_vencimento
-                if l.status == StatusLancamento.PENDENTE and data_venc < hoje:
-                    contas_vencidas += valor_decimal
+        pendentes = base & livro.mascara(tipos=(RECEITA, DESPESA), status=(PENDENTE,))
+        totais_pendentes = livro.somar_por_tipo(pendentes)
+        contas_receber = totais_pendentes[RECEITA]
+        contas_pagar = totais_pendentes[DESPESA]
+        contas_vencidas = livro.somar(pendentes & livro.mascara(vencimento_antes=hoje))
         
         # Dados para gráfico - últimos 12 meses ou filtrado por ano/mês
-        from calendar import monthrange
         import locale
         
         # Tentar configurar locale para português
@@ -259,87 +253,37 @@ def dashboard():
             except:
                 pass
         
-        meses_labels = []
-        receitas_dados = []
-        despesas_dados = []
-        
         if ano and mes:
             # Apenas um mês específico
-            _, ultimo_dia = monthrange(ano, mes)
-            data_inicio = date(ano, mes, 1)
-            data_fim = date(ano, mes, ultimo_dia)
-            
-            lancamentos_periodo = [
-                l for l in lancamentos 
-                if l.status == StatusLancamento.PAGO and l.data_pagamento and l.tipo != TipoLancamento.TRANSFERENCIA
-                and data_inicio <= (l.data_pagamento.date() if hasattr(l.data_pagamento, 'date') else l.data_pagamento) <= data_fim
-            ]
-            
-            receitas_mes = sum(Decimal(str(l.valor)) for l in lancamentos_periodo if l.tipo == TipoLancamento.RECEITA)
-            despesas_mes = sum(Decimal(str(l.valor)) for l in lancamentos_periodo if l.tipo == TipoLancamento.DESPESA)
-            
-            meses_labels = [data_inicio.strftime('%b/%Y')]
-            receitas_dados = [float(receitas_mes)]
-            despesas_dados = [float(despesas_mes)]
-        
+            meses = [(ano, mes)]
         elif ano:
             # Todos os meses do ano
-            for m in range(1, 13):
-                _, ultimo_dia = monthrange(ano, m)
-                data_inicio = date(ano, m, 1)
-                data_fim = date(ano, m, ultimo_dia)
-                
-                lancamentos_periodo = [
-                    l for l in lancamentos 
-                    if l.status == StatusLancamento.PAGO and l.data_pagamento and l.tipo != TipoLancamento.TRANSFERENCIA
-                    and data_inicio <= (l.data_pagamento.date() if hasattr(l.data_pagamento, 'date') else l.data_pagamento) <= data_fim
-                ]
-                
-                receitas_mes = sum(Decimal(str(l.valor)) for l in lancamentos_periodo if l.tipo == TipoLancamento.RECEITA)
-                despesas_mes = sum(Decimal(str(l.valor)) for l in lancamentos_periodo if l.tipo == TipoLancamento.DESPESA)
-                
-                meses_labels.append(data_inicio.strftime('%b/%Y'))
-                receitas_dados.append(float(receitas_mes))
-                despesas_dados.append(float(despesas_mes))
-        
+            meses = [(ano, m) for m in range(1, 13)]
         else:
             # Últimos 12 meses
-            data_ref = hoje
+            meses = []
             for i in range(11, -1, -1):
-                mes_ref = data_ref.month - i
-                ano_ref = data_ref.year
-                
+                mes_ref = hoje.month - i
+                ano_ref = hoje.year
                 while mes_ref <= 0:
                     mes_ref += 12
                     ano_ref -= 1
-                
-                _, ultimo_dia = monthrange(ano_ref, mes_ref)
-                data_inicio = date(ano_ref, mes_ref, 1)
-                data_fim = date(ano_ref, mes_ref, ultimo_dia)
-                
-                lancamentos_periodo = [
-                    l for l in lancamentos 
-                    if l.status == StatusLancamento.PAGO and l.data_pagamento and l.tipo != TipoLancamento.TRANSFERENCIA
-                    and data_inicio <= (l.data_pagamento.date() if hasattr(l.data_pagamento, 'date') else l.data_pagamento) <= data_fim
-                ]
-                
-                receitas_mes = sum(Decimal(str(l.valor)) for l in lancamentos_periodo if l.tipo == TipoLancamento.RECEITA)
-                despesas_mes = sum(Decimal(str(l.valor)) for l in lancamentos_periodo if l.tipo == TipoLancamento.DESPESA)
-                
-                meses_labels.append(data_inicio.strftime('%b/%Y'))
-                receitas_dados.append(float(receitas_mes))
-                despesas_dados.append(float(despesas_mes))
+                meses.append((ano_ref, mes_ref))
+        
+        # Receitas/despesas pagas por mês de pagamento
+        por_mes = livro.somar_por_mes(pagos, meses)
+        meses_labels = [date(a, m, 1).strftime('%b/%Y') for a, m in meses]
         
         return jsonify({
             'saldo_total': float(saldo_total),
-            'contas_receber': float(contas_receber),
-            'contas_pagar': float(contas_pagar),
-            'contas_vencidas': float(contas_vencidas),
+            'contas_receber': contas_receber,
+            'contas_pagar': contas_pagar,
+            'contas_vencidas': contas_vencidas,
             'total_contas': len(contas),
-            'total_lancamentos': len(lancamentos),
+            'total_lancamentos': int(base.sum()),
             'meses': meses_labels,
-            'receitas': receitas_dados,
-            'despesas': despesas_dados
+            'receitas': por_mes[RECEITA],
+            'despesas': por_mes[DESPESA]
         })
     except Exception as e:
         print(f"Erro no dashboard: {str(e)}")
@@ -470,13 +414,11 @@ def relatorio_fluxo_projetado():
         periodo_texto = f"PROJEÇÃO - PRÓXIMOS {dias} DIAS"
         
         # 🔒 Passar empresa_id explicitamente
-        lancamentos = db.listar_lancamentos(empresa_id=empresa_id)
+        livro = obter_livro(empresa_id)
         contas = db.listar_contas_por_empresa(empresa_id=empresa_id)
         
         # Filtrar lançamentos por cliente se necessário
-        usuario = request.usuario
-        if usuario['tipo'] != 'admin' and usuario.get('cliente_id'):
-            lancamentos = [l for l in lancamentos if getattr(l, 'pessoa', None) == usuario['cliente_id']]
+        base = _mascara_cliente(livro)
         
         # Saldo atual (saldo inicial + todos os lançamentos pagos até hoje)
         saldo_atual = Decimal('0')
@@ -484,114 +426,53 @@ def relatorio_fluxo_projetado():
             saldo_atual += Decimal(str(c.saldo_inicial))
         
         # Adicionar todas as receitas e despesas JÁ PAGAS até hoje (exceto transferências)
-        for l in lancamentos:
-            # Converter data_pagamento para date se for datetime
-            if l.data_pagamento:
-                if isinstance(l.data_pagamento, datetime):
-                    data_pgto = l.data_pagamento.date()
-                else:
-                    data_pgto = l.data_pagamento
-            else:
-                data_pgto = None
-            
-            if l.status == StatusLancamento.PAGO and data_pgto and data_pgto <= hoje and l.tipo != TipoLancamento.TRANSFERENCIA:
-                valor_decimal = Decimal(str(l.valor))
-                if l.tipo == TipoLancamento.RECEITA:
-                    saldo_atual += valor_decimal
-                else:
-                    saldo_atual -= valor_decimal
-        
-        # Buscar lançamentos PENDENTES para projeção (vencidos + futuros)
-        lancamentos_futuros = []
-        lancamentos_vencidos = []
-        receitas_previstas = Decimal('0')
-        despesas_previstas = Decimal('0')
-        receitas_vencidas = Decimal('0')
-        despesas_vencidas = Decimal('0')
-        
-        for l in lancamentos:
-            if l.status == StatusLancamento.PENDENTE and l.tipo != TipoLancamento.TRANSFERENCIA:
-                # Converter data_vencimento para date se for datetime
-                if isinstance(l.data_vencimento, datetime):
-                    data_venc = l.data_vencimento.date()
-                else:
-                    data_venc = l.data_vencimento
-                
-                valor_decimal = Decimal(str(l.valor))
-                
-                # Lançamentos vencidos (já passaram do vencimento)
-                if data_venc < hoje:
-                    lancamentos_vencidos.append(l)
-                    if l.tipo == TipoLancamento.RECEITA:
-                        receitas_vencidas += valor_decimal
-                    else:
-                        despesas_vencidas += valor_decimal
-                
-                # Lançamentos futuros (dentro do período de projeção)
-                elif data_inicial <= data_venc <= data_final:
-                    lancamentos_futuros.append(l)
-                    if l.tipo == TipoLancamento.RECEITA:
-                        receitas_previstas += valor_decimal
-                    else:
-                        despesas_previstas += valor_decimal
+        pagos = base & livro.mascara(tipos=(RECEITA, DESPESA), status=(PAGO,), pago_entre=(date.min, hoje))
+        totais_pagos = livro.somar_por_tipo(pagos)
+        saldo_atual += Decimal(str(totais_pagos[RECEITA])) - Decimal(str(totais_pagos[DESPESA]))
+        
+        # Lançamentos PENDENTES para projeção (vencidos + futuros no período)
+        pendentes = base & livro.mascara(tipos=(RECEITA, DESPESA), status=(PENDENTE,))
+        mascara_vencidos = pendentes & livro.mascara(vencimento_antes=hoje)
+        mascara_futuros = pendentes & livro.mascara(vencimento_entre=(data_inicial, data_final))
+        
+        totais_vencidos = livro.somar_por_tipo(mascara_vencidos)
+        totais_futuros = livro.somar_por_tipo(mascara_futuros)
+        receitas_vencidas = Decimal(str(totais_vencidos[RECEITA]))
+        despesas_vencidas = Decimal(str(totais_vencidos[DESPESA]))
+        receitas_previstas = Decimal(str(totais_futuros[RECEITA]))
+        despesas_previstas = Decimal(str(totais_futuros[DESPESA]))
         
         # Calcular saldo projetado (incluindo vencidos)
         saldo_projetado = saldo_atual + (receitas_previstas + receitas_vencidas) - (despesas_previstas + despesas_vencidas)
         
-        # Ordenar por data de vencimento
-        lancamentos_vencidos.sort(key=lambda x: x.data_vencimento)
-        lancamentos_futuros.sort(key=lambda x: x.data_vencimento)
+        # Ordenados por data de vencimento
+        lancamentos_vencidos = livro.linhas(mascara_vencidos, ordem='vencimento')
+        lancamentos_futuros = livro.linhas(mascara_futuros, ordem='vencimento')
         
         # Montar fluxo projetado dia a dia (VENCIDOS PRIMEIRO, depois futuros)
         fluxo = []
         saldo_acumulado = saldo_atual
         
-        # Adicionar vencidos primeiro
-        for lanc in lancamentos_vencidos:
-            valor_decimal = Decimal(str(lanc.valor))
-            if lanc.tipo == TipoLancamento.RECEITA:
+        for lanc in lancamentos_vencidos + lancamentos_futuros:
+            valor_decimal = Decimal(str(lanc['valor']))
+            if lanc['tipo'] == 'receita':
                 saldo_acumulado += valor_decimal
             else:
                 saldo_acumulado -= valor_decimal
             
-            # Calcular dias de atraso
-            data_venc_date = lanc.data_vencimento.date() if isinstance(lanc.data_vencimento, datetime) else lanc.data_vencimento
-            dias_atraso = (hoje - data_venc_date).days
-            
+            vencido = lanc['data_vencimento'] < hoje
             fluxo.append({
-                'data_vencimento': lanc.data_vencimento.isoformat(),
-                'descricao': lanc.descricao,
-                'tipo': lanc.tipo.value,
-                'valor': float(lanc.valor),
-                'categoria': lanc.categoria,
-                'subcategoria': lanc.subcategoria,
-                'pessoa': lanc.pessoa,
-                'conta_bancaria': lanc.conta_bancaria,
+                'data_vencimento': lanc['data_vencimento'].isoformat(),
+                'descricao': lanc['descricao'],
+                'tipo': lanc['tipo'],
+                'valor': lanc['valor'],
+                'categoria': lanc['categoria'],
+                'subcategoria': lanc['subcategoria'],
+                'pessoa': lanc['pessoa'],
+                'conta_bancaria': lanc['conta_bancaria'],
                 'saldo_acumulado': float(saldo_acumulado),
-                'status': 'VENCIDO',
-                'dias_atraso': dias_atraso
-            })
-        
-        # Adicionar lançamentos futuros
-        for lanc in lancamentos_futuros:
-            valor_decimal = Decimal(str(lanc.valor))
-            if lanc.tipo == TipoLancamento.RECEITA:
-                saldo_acumulado += valor_decimal
-            else:
-                saldo_acumulado -= valor_decimal
-            
-            fluxo.append({
-                'data_vencimento': lanc.data_vencimento.isoformat(),
-                'descricao': lanc.descricao,
-                'tipo': lanc.tipo.value,
-                'valor': float(lanc.valor),
-                'categoria': lanc.categoria,
-                'subcategoria': lanc.subcategoria,
-                'pessoa': lanc.pessoa,
-                'conta_bancaria': lanc.conta_bancaria,
-                'saldo_acumulado': float(saldo_acumulado),
-                'status': 'PENDENTE',
-                'dias_atraso': 0
+                'status': 'VENCIDO' if vencido else 'PENDENTE',
+                'dias_atraso': (hoje - lanc['data_vencimento']).days if vencido else 0
             })
         
         return jsonify({
@@ -707,52 +588,34 @@ def relatorio_resumo_parceiros():
         data_inicio = datetime.fromisoformat(data_inicio).date()
         data_fim = datetime.fromisoformat(data_fim).date()
         
-        lancamentos = db.listar_lancamentos(empresa_id=empresa_id)
+        livro = obter_livro(empresa_id)
+        
+        # Pagos no período, com pessoa informada
+        pagos = livro.mascara(tipos=(RECEITA, DESPESA), status=(PAGO,), pago_entre=(data_inicio, data_fim))
+        pagos &= livro.pessoa != 0
         
         # Agrupar por pessoa
         resumo_clientes = {}
         resumo_fornecedores = {}
         
-        for l in lancamentos:
-            if l.status == StatusLancamento.PAGO and l.data_pagamento and l.tipo != TipoLancamento.TRANSFERENCIA:
-                data_pag = l.data_pagamento.date() if hasattr(l.data_pagamento, 'date') else l.data_pagamento
-                if data_inicio <= data_pag <= data_fim and l.pessoa:
-                    valor = float(l.valor)
-                    categoria = l.categoria or 'Sem categoria'
-                    
-                    if l.tipo == TipoLancamento.RECEITA:
-                        if l.pessoa not in resumo_clientes:
-                            resumo_clientes[l.pessoa] = {'total': 0, 'quantidade': 0, 'categorias': {}}
-                        resumo_clientes[l.pessoa]['total'] += valor
-                        resumo_clientes[l.pessoa]['quantidade'] += 1
-                        # Contar por categoria
-                        if categoria not in resumo_clientes[l.pessoa]['categorias']:
-                            resumo_clientes[l.pessoa]['categorias'][categoria] = 0
-                        resumo_clientes[l.pessoa]['categorias'][categoria] += valor
-                    else:
-                        if l.pessoa not in resumo_fornecedores:
-                            resumo_fornecedores[l.pessoa] = {'total': 0, 'quantidade': 0, 'categorias': {}}
-                        resumo_fornecedores[l.pessoa]['total'] += valor
-                        resumo_fornecedores[l.pessoa]['quantidade'] += 1
-                        # Contar por categoria
-                        if categoria not in resumo_fornecedores[l.pessoa]['categorias']:
-                            resumo_fornecedores[l.pessoa]['categorias'][categoria] = 0
-                        resumo_fornecedores[l.pessoa]['categorias'][categoria] += valor
+        for (tipo, pessoa, categoria), (total, quantidade) in livro.somar_por(pagos, 'tipo', 'pessoa', 'categoria').items():
+            resumo = resumo_clientes if tipo == RECEITA else resumo_fornecedores
+            if pessoa not in resumo:
+                resumo[pessoa] = {'total': 0, 'quantidade': 0, 'categorias': {}}
+            resumo[pessoa]['total'] += total
+            resumo[pessoa]['quantidade'] += quantidade
+            # Somar por categoria
+            categoria = categoria or 'Sem categoria'
+            resumo[pessoa]['categorias'][categoria] = resumo[pessoa]['categorias'].get(categoria, 0) + total
         
         # Adicionar categoria principal para cada cliente/fornecedor
-        for pessoa, dados in resumo_clientes.items():
-            if dados['categorias']:
-                categoria_principal = max(dados['categorias'].items(), key=lambda x: x[1])
-                dados['categoria_principal'] = categoria_principal[0]
-            else:
-                dados['categoria_principal'] = 'Sem categoria'
-        
-        for pessoa, dados in resumo_fornecedores.items():
-            if dados['categorias']:
-                categoria_principal = max(dados['categorias'].items(), key=lambda x: x[1])
-                dados['categoria_principal'] = categoria_principal[0]
-            else:
-                dados['categoria_principal'] = 'Sem categoria'
+        for resumo in (resumo_clientes, resumo_fornecedores):
+            for pessoa, dados in resumo.items():
+                if dados['categorias']:
+                    categoria_principal = max(dados['categorias'].items(), key=lambda x: x[1])
+                    dados['categoria_principal'] = categoria_principal[0]
+                else:
+                    dados['categoria_principal'] = 'Sem categoria'
         
         return jsonify({
             'clientes': resumo_clientes,
@@ -788,34 +651,24 @@ def relatorio_analise_categorias():
         data_inicio = datetime.fromisoformat(data_inicio).date()
         data_fim = datetime.fromisoformat(data_fim).date()
         
-        lancamentos = db.listar_lancamentos(empresa_id=empresa_id)
+        livro = obter_livro(empresa_id)
+        pagos = livro.mascara(tipos=(RECEITA, DESPESA), status=(PAGO,), pago_entre=(data_inicio, data_fim))
         
         # Agrupar por categoria e subcategoria
         receitas = {}
         despesas = {}
         
-        for l in lancamentos:
-            if l.status == StatusLancamento.PAGO and l.data_pagamento and l.tipo != TipoLancamento.TRANSFERENCIA:
-                data_pag = l.data_pagamento.date() if hasattr(l.data_pagamento, 'date') else l.data_pagamento
-                if data_inicio <= data_pag <= data_fim:
-                    categoria = l.categoria or 'Sem Categoria'
-                    subcategoria = l.subcategoria or 'Sem Subcategoria'
-                    valor = float(l.valor)
-                    
-                    if l.tipo == TipoLancamento.RECEITA:
-                        if categoria not in receitas:
-                            receitas[categoria] = {}
-                        if subcategoria not in receitas[categoria]:
-                            receitas[categoria][subcategoria] = {'total': 0, 'quantidade': 0}
-                        receitas[categoria][subcategoria]['total'] += valor
-                        receitas[categoria][subcategoria]['quantidade'] += 1
-                    else:
-                        if categoria not in despesas:
-                            despesas[categoria] = {}
-                        if subcategoria not in despesas[categoria]:
-                            despesas[categoria][subcategoria] = {'total': 0, 'quantidade': 0}
-                        despesas[categoria][subcategoria]['total'] += valor
-                        despesas[categoria][subcategoria]['quantidade'] += 1
+        for (tipo, categoria, subcategoria), (total, quantidade) in livro.somar_por(pagos, 'tipo', 'categoria', 'subcategoria').items():
+            destino = receitas if tipo == RECEITA else despesas
+            categoria = categoria or 'Sem Categoria'
+            subcategoria = subcategoria or 'Sem Subcategoria'
+            
+            if categoria not in destino:
+                destino[categoria] = {}
+            if subcategoria not in destino[categoria]:
+                destino[categoria][subcategoria] = {'total': 0, 'quantidade': 0}
+            destino[categoria][subcategoria]['total'] += total
+            destino[categoria][subcategoria]['quantidade'] += quantidade
         
         return jsonify({
             'receitas': receitas,
@@ -958,7 +811,7 @@ def relatorio_indicadores():
         return jsonify({'erro': 'Empresa não selecionada'}), 403
     
     try:
-        lancamentos = db.listar_lancamentos(empresa_id=empresa_id)
+        livro = obter_livro(empresa_id)
         contas = db.listar_contas_por_empresa(empresa_id=empresa_id)
         
         # Obter filtros de data
@@ -975,40 +828,21 @@ def relatorio_indicadores():
             inicio_mes = date(hoje.year, hoje.month, 1)
             fim_periodo = hoje
         
-        # Totais do mês atual
-        receitas_mes = Decimal('0')
-        despesas_mes = Decimal('0')
+        # Totais do período (pagos, exceto transferências)
+        pagos = livro.mascara(tipos=(RECEITA, DESPESA), status=(PAGO,), pago_entre=(inicio_mes, fim_periodo))
+        totais_pagos = livro.somar_por_tipo(pagos)
+        receitas_mes = Decimal(str(totais_pagos[RECEITA]))
+        despesas_mes = Decimal(str(totais_pagos[DESPESA]))
         
-        # Totais a receber/pagar
-        total_receber = Decimal('0')
-        total_pagar = Decimal('0')
+        # Totais a receber/pagar (pendentes que não são receita entram em "pagar")
+        a_receber = livro.mascara(tipos=(RECEITA,), status=(PENDENTE,))
+        a_pagar = livro.mascara(tipos=(DESPESA, TRANSFERENCIA), status=(PENDENTE,))
+        vencidos = livro.mascara(vencimento_antes=hoje)
         
-        # Vencidos
-        vencidos_receber = Decimal('0')
-        vencidos_pagar = Decimal('0')
-        
-        for l in lancamentos:
-            if l.status == StatusLancamento.PAGO and l.data_pagamento and l.tipo != TipoLancamento.TRANSFERENCIA:
-                data_pag = l.data_pagamento.date() if hasattr(l.data_pagamento, 'date') else l.data_pagamento
-                if data_pag >= inicio_mes and data_pag <= fim_periodo:
-                    valor = Decimal(str(l.valor))
-                    if l.tipo == TipoLancamento.RECEITA:
-                        receitas_mes += valor
-                    else:
-                        despesas_mes += valor
-            
-            if l.status == StatusLancamento.PENDENTE:
-                valor = Decimal(str(l.valor))
-                data_venc = l.data_vencimento.date() if hasattr(l.data_vencimento, 'date') else l.data_vencimento
-                
-                if l.tipo == TipoLancamento.RECEITA:
-                    total_receber += valor
-                    if data_venc < hoje:
-                        vencidos_receber += valor
-                else:
-                    total_pagar += valor
-                    if data_venc < hoje:
-                        vencidos_pagar += valor
+        total_receber = Decimal(str(livro.somar(a_receber)))
+        total_pagar = Decimal(str(livro.somar(a_pagar)))
+        vencidos_receber = Decimal(str(livro.somar(a_receber & vencidos)))
+        vencidos_pagar = Decimal(str(livro.somar(a_pagar & vencidos)))
         
         # Saldo em caixa
         saldo_caixa = sum(Decimal(str(c.saldo_inicial)) for c in contas)
@@ -1059,47 +893,32 @@ def relatorio_inadimplencia():
         return jsonify({'erro': 'Empresa não selecionada'}), 403
     
     try:
-        lancamentos = db.listar_lancamentos(empresa_id=empresa_id)
+        livro = obter_livro(empresa_id)
         hoje = date.today()
         
-        inadimplentes = []
-        
-        for l in lancamentos:
-            # Excluir transferências e considerar apenas PENDENTES
-            if l.tipo == TipoLancamento.TRANSFERENCIA:
-                continue
-                
-            if l.status == StatusLancamento.PENDENTE:
-                # Converter data_vencimento para date se for datetime
-                data_venc = l.data_vencimento.date() if hasattr(l.data_vencimento, 'date') else l.data_vencimento
-                
-                # Verificar se está vencido (data anterior a hoje)
-                if data_venc < hoje:
-                    dias_atraso = (hoje - data_venc).days
-                    inadimplentes.append({
-                        'id': l.id,
-                        'tipo': l.tipo.value.upper(),
-                        'descricao': l.descricao,
-                        'valor': float(l.valor),
-                        'data_vencimento': data_venc.isoformat(),
-                        'dias_atraso': dias_atraso,
-                        'pessoa': l.pessoa or 'Não informado',
-                        'categoria': l.categoria or 'Sem categoria'
-                    })
-        
-        # Ordenar por dias de atraso (maior primeiro)
-        inadimplentes.sort(key=lambda x: x['dias_atraso'], reverse=True)
+        # PENDENTES vencidos (data anterior a hoje), exceto transferências
+        vencidos = livro.mascara(tipos=(RECEITA, DESPESA), status=(PENDENTE,), vencimento_antes=hoje)
+        totais = livro.somar_por_tipo(vencidos)
         
-        # Calcular totais
-        total_inadimplente = sum(i['valor'] for i in inadimplentes)
-        total_receitas_vencidas = sum(i['valor'] for i in inadimplentes if i['tipo'] == 'RECEITA')
-        total_despesas_vencidas = sum(i['valor'] for i in inadimplentes if i['tipo'] == 'DESPESA')
+        # Ordem de vencimento = maior atraso primeiro
+        inadimplentes = []
+        for l in livro.linhas(vencidos, ordem='vencimento'):
+            inadimplentes.append({
+                'id': l['id'],
+                'tipo': l['tipo'].upper(),
+                'descricao': l['descricao'],
+                'valor': l['valor'],
+                'data_vencimento': l['data_vencimento'].isoformat(),
+                'dias_atraso': (hoje - l['data_vencimento']).days,
+                'pessoa': l['pessoa'] or 'Não informado',
+                'categoria': l['categoria'] or 'Sem categoria'
+            })
         
         return jsonify({
             'inadimplentes': inadimplentes,
-            'total': float(total_inadimplente),
-            'total_receitas': float(total_receitas_vencidas),
-            'total_despesas': float(total_despesas_vencidas),
+            'total': livro.somar(vencidos),
+            'total_receitas': totais[RECEITA],
+            'total_despesas': totais[DESPESA],
             'quantidade': len(inadimplentes)
         })
     except Exception as e:
@@ -15,7 +15,9 @@ Data: 20/01/2026
 from flask import Blueprint, request, jsonify, session
 from auth_middleware import require_permission, filtrar_por_cliente, get_usuario_logado
 from auth_functions import obter_permissoes_usuario_empresa
+import json
 import database_postgresql as db
+from app.utils.json_stream import resposta_json_stream
 
 try:
     from app.utils import google_calendar_helper as _gcal
@@ -169,6 +171,49 @@ def _sync_sessao_google(sessao_id: int, dados: dict, empresa_id: int, google_eve
 sessoes_bp = Blueprint('sessoes', __name__, url_prefix='/api/sessoes')
 
 
+def _mapear_sessao_frontend(sessao: dict) -> dict:
+    """🔧 Mapeia campos do backend para o frontend (uma sessão)"""
+    # Mapear data_sessao → data (se data não existir ou for None)
+    if not sessao.get('data') and sessao.get('data_sessao'):
+        sessao['data'] = sessao['data_sessao']
+    
+    # Converter duracao (minutos) → quantidade_horas
+    if 'duracao' in sessao and sessao['duracao']:
+        sessao['quantidade_horas'] = sessao['duracao'] / 60
+    
+    # Extrair dados do dados_json
+    if 'dados_json' in sessao and sessao['dados_json']:
+        try:
+            dados_json = json.loads(sessao['dados_json']) if isinstance(sessao['dados_json'], str) else sessao['dados_json']
+            if not sessao.get('horario'):
+                sessao['horario'] = dados_json.get('horario')
+            if 'tipo_foto' not in sessao or sessao.get('tipo_foto') is None:
+                sessao['tipo_foto'] = dados_json.get('tipo_foto', False)
+            if 'tipo_video' not in sessao or sessao.get('tipo_video') is None:
+                sessao['tipo_video'] = dados_json.get('tipo_video', False)
+            if 'tipo_mobile' not in sessao or sessao.get('tipo_mobile') is None:
+                sessao['tipo_mobile'] = dados_json.get('tipo_mobile', False)
+            if not sessao.get('tags'):
+                sessao['tags'] = dados_json.get('tags', '')
+            if not sessao.get('equipe'):
+                sessao['equipe'] = dados_json.get('equipe', [])
+            if not sessao.get('responsaveis'):
+                sessao['responsaveis'] = dados_json.get('responsaveis', [])
+            if not sessao.get('equipamentos'):
+                sessao['equipamentos'] = dados_json.get('equipamentos', [])
+            if not sessao.get('equipamentos_alugados'):
+                sessao['equipamentos_alugados'] = dados_json.get('equipamentos_alugados', [])
+            if not sessao.get('custos_adicionais'):
+                sessao['custos_adicionais'] = dados_json.get('custos_adicionais', [])
+        except Exception as e:
+            print(f"⚠️ Erro ao extrair dados_json: {e}")
+    
+    # Adicionar contrato_nome se não existir
+    if 'contrato_numero' in sessao and not sessao.get('contrato_nome'):
+        sessao['contrato_nome'] = sessao['contrato_numero']
+    return sessao
+
+
 @sessoes_bp.route('', methods=['GET', 'POST'])
 def sessoes():
     """
@@ -209,78 +254,19 @@ def sessoes():
         try:
             print(f"📋 [SESSÕES] GET - empresa_id: {empresa_id}, usuario_id: {usuario.get('id')}")
             
-            # 🔒 VALIDAÇÃO DE SEGURANÇA OBRIGATÓRIA
-            
-            import json
-            # 🔒 Passar empresa_id explicitamente
-            sessoes = db.listar_sessoes(empresa_id=empresa_id)
-            
-            print(f"\n🔍 [GET /api/sessoes] Total de sessões retornadas: {len(sessoes)}")
-            
-            # 🔧 Mapear campos do backend para o frontend
-            for i, sessao in enumerate(sessoes):
-                if i == 0:
-                    print(f"\n📊 [SESSÃO 0] Campos disponíveis: {list(sessao.keys())}")
-                    print(f"   - data: {sessao.get('data')}")
-                    print(f"   - horario: {sessao.get('horario')}")
-                    print(f"   - tipo_foto: {sessao.get('tipo_foto')}")
-                
-                # Mapear data_sessao → data (se data não existir ou for None)
-                if not sessao.get('data') and sessao.get('data_sessao'):
-                    sessao['data'] = sessao['data_sessao']
-                
-                # Converter duracao (minutos) → quantidade_horas
-                if 'duracao' in sessao and sessao['duracao']:
-                    sessao['quantidade_horas'] = sessao['duracao'] / 60
-                
-                # Extrair dados do dados_json
-                if 'dados_json' in sessao and sessao['dados_json']:
-                    try:
-                        dados_json = json.loads(sessao['dados_json']) if isinstance(sessao['dados_json'], str) else sessao['dados_json']
-                        if not sessao.get('horario'):
-                            sessao['horario'] = dados_json.get('horario')
-                        if 'tipo_foto' not in sessao or sessao.get('tipo_foto') is None:
-                            sessao['tipo_foto'] = dados_json.get('tipo_foto', False)
-                        if 'tipo_video' not in sessao or sessao.get('tipo_video') is None:
-                            sessao['tipo_video'] = dados_json.get('tipo_video', False)
-                        if 'tipo_mobile' not in sessao or sessao.get('tipo_mobile') is None:
-                            sessao['tipo_mobile'] = dados_json.get('tipo_mobile', False)
-                        if not sessao.get('tags'):
-                            sessao['tags'] = dados_json.get('tags', '')
-                        if not sessao.get('equipe'):
-                            sessao['equipe'] = dados_json.get('equipe', [])
-                        if not sessao.get('responsaveis'):
-                            sessao['responsaveis'] = dados_json.get('responsaveis', [])
-                        if not sessao.get('equipamentos'):
-                            sessao['equipamentos'] = dados_json.get('equipamentos', [])
-                        if not sessao.get('equipamentos_alugados'):
-                            sessao['equipamentos_alugados'] = dados_json.get('equipamentos_alugados', [])
-                        if not sessao.get('custos_adicionais'):
-                            sessao['custos_adicionais'] = dados_json.get('custos_adicionais', [])
-                    except Exception as e:
-                        print(f"⚠️ Erro ao extrair dados_json: {e}")
-                
-                # Adicionar contrato_nome se não existir
-                if 'contrato_numero' in sessao and not sessao.get('contrato_nome'):
-                    sessao['contrato_nome'] = sessao['contrato_numero']
-                
-                if i == 0:
-                    print(f"\n✅ [SESSÃO 0 APÓS MAPEAMENTO]")
-                    print(f"   - data: {sessao.get('data')}")
-                    print(f"   - horario: {sessao.get('horario')}")
-                    print(f"   - tipo_foto: {sessao.get('tipo_foto')}")
-                    print(f"   - endereco: {sessao.get('endereco')}")
-            
             # 🔧 FIX: Adicionar empresa_id ao dict do usuario para o filtro funcionar
             usuario_com_empresa = usuario.copy()
             usuario_com_empresa['empresa_id'] = empresa_id
             
-            # Aplicar filtro por cliente
-            sessoes_filtradas = filtrar_por_cliente(sessoes, usuario_com_empresa)
-            
-            print(f"✅ [GET /api/sessoes] Retornando {len(sessoes_filtradas)} sessões após filtro\n")
+            def _sessoes():
+                # 🔒 Passar empresa_id explicitamente; linhas lidas do cursor aos poucos
+                for sessao in db.iterar_sessoes(empresa_id=empresa_id):
+                    # Aplicar filtro por cliente
+                    if filtrar_por_cliente([sessao], usuario_com_empresa):
+                        yield _mapear_sessao_frontend(sessao)
             
-            return jsonify(sessoes_filtradas)
+            # Array JSON escrito conforme as sessões chegam do banco
+            return resposta_json_stream(_sessoes(), chave=None)
         except Exception as e:
             print(f"❌ Erro em GET /api/sessoes: {e}")
             import traceback
@@ -1,28 +1,39 @@
 """
-🚀 Cache Manager - Sistema de cache em memória e Redis (opcional)
+🚀 Cache Manager - Cache de blueprints (dashboard, relatórios, listas)
 
-Performance otimizada para queries frequentes:
-- Dashboard
-- Relatórios
-- Listas de categorias/contas
+Fachada sobre o cache global do cache_manager da raiz (CACHE_BACKEND): as
+entradas ficam no mesmo backend compartilhado entre workers, então um SET
+num worker é HIT nos outros e invalidate_cache() vale para todos.
+
+As entradas daqui não pertencem a uma empresa: ficam no escopo reservado
+ESCOPO_APP, separado do cache por empresa. Funções cujo resultado depende da
+empresa devem recebê-la nos argumentos (faz parte da chave) ou usar o
+@cached do cache_manager da raiz.
 """
 
 from functools import wraps
-from datetime import datetime, timedelta
 from typing import Any, Optional, Callable
-import json
 import hashlib
+import logging
+import time
+
+import cache_manager as _cache_raiz
 
-# Cache em memória (fallback)
-_memory_cache = {}
-_cache_timestamps = {}
-_cache_hits = 0
-_cache_misses = 0
+logger = logging.getLogger(__name__)
 
 # Configuração
 CACHE_DEFAULT_TTL = 300  # 5 minutos
 CACHE_ENABLED = True
 
+# "empresa_id" das entradas deste módulo no backend (nenhuma empresa tem id 0)
+ESCOPO_APP = 0
+# func_name das chaves gravadas diretamente com set_cached()
+_CHAVES_AVULSAS = 'app_cache'
+
+
+def _backend():
+    return _cache_raiz.get_cache_backend()
+
 
 def _get_cache_key(prefix: str, *args, **kwargs) -> str:
     """Gera chave única para o cache baseada nos argumentos"""
@@ -30,133 +41,90 @@ def _get_cache_key(prefix: str, *args, **kwargs) -> str:
     return hashlib.md5(key_data.encode()).hexdigest()
 
 
-def _is_cache_valid(key: str, ttl: int) -> bool:
-    """Verifica se o cache ainda é válido"""
-    if key not in _cache_timestamps:
-        return False
-    
-    timestamp = _cache_timestamps[key]
-    return (datetime.now() - timestamp).total_seconds() < ttl
-
-
 def get_cached(key: str) -> Optional[Any]:
-    """Recupera valor do cache"""
+    """Recupera valor do cache (None se ausente ou expirado)"""
     if not CACHE_ENABLED:
         return None
-    
-    if key in _memory_cache and _is_cache_valid(key, CACHE_DEFAULT_TTL):
-        global _cache_hits
-        _cache_hits += 1
-        print(f"✅ Cache HIT: {key[:16]}...")
-        return _memory_cache[key]
-    
-    global _cache_misses
-    _cache_misses += 1
-    print(f"❌ Cache MISS: {key[:16]}...")
-    return None
-
-
-def set_cached(key: str, value: Any, ttl: int = CACHE_DEFAULT_TTL):
-    """Armazena valor no cache"""
+    found, value = _backend().get(ESCOPO_APP, _CHAVES_AVULSAS, (key,), {})
+    return value if found else None
+
+
+def set_cached(key: str, value: Any, ttl: int = CACHE_DEFAULT_TTL, tags: tuple = ()):
+    """Armazena valor no cache (tags: invalidáveis com invalidate_cache(tag))"""
     if not CACHE_ENABLED:
         return
-    
-    _memory_cache[key] = value
-    _cache_timestamps[key] = datetime.now()
-    print(f"💾 Cache SET: {key[:16]}... (TTL: {ttl}s)")
+    _backend().set(ESCOPO_APP, _CHAVES_AVULSAS, (key,), {}, value, ttl=ttl, tags=tags)
 
 
 def invalidate_cache(pattern: str = None):
-    """Invalida cache por padrão ou limpa tudo"""
-    global _cache_hits, _cache_misses
-    
-    if pattern:
-        keys_to_remove = [k for k in _memory_cache.keys() if pattern in k]
-        for key in keys_to_remove:
-            del _memory_cache[key]
-            del _cache_timestamps[key]
-        print(f"🗑️ Cache invalidado: {len(keys_to_remove)} chaves com padrão '{pattern}'")
-    else:
-        _memory_cache.clear()
-        _cache_timestamps.clear()
-        _cache_hits = 0
-        _cache_misses = 0
-        print("🗑️ Cache completamente limpo")
-        print("🗑️ Cache totalmente limpo")
+    """
+    Invalida as entradas com a tag `pattern` (o prefix do @cached) ou todas
+    as entradas deste módulo, em todos os workers
+
+    O cache por empresa não é afetado (ver cache_manager.invalidate_cache).
+    """
+    _backend().invalidate_empresa(ESCOPO_APP, pattern or None)
+    logger.info(f"🗑️ Cache invalidado: {pattern or 'todas as chaves'}")
 
 
 def cached(ttl: int = CACHE_DEFAULT_TTL, prefix: str = ""):
     """
     Decorator para cachear resultado de funções
-    
+
     Usage:
         @cached(ttl=600, prefix="dashboard")
         def get_dashboard_data(user_id):
             # query pesada...
             return data
+
+        invalidate_cache("dashboard")  # em todos os workers
     """
     def decorator(func: Callable) -> Callable:
+        cache_prefix = prefix or func.__name__
+
         @wraps(func)
         def wrapper(*args, **kwargs):
             if not CACHE_ENABLED:
                 return func(*args, **kwargs)
-            
-            # Gerar chave do cache
-            cache_prefix = prefix or func.__name__
+
+            backend = _backend()
             cache_key = _get_cache_key(cache_prefix, *args, **kwargs)
-            
-            # Tentar recuperar do cache
-            cached_value = get_cached(cache_key)
-            if cached_value is not None:
+            found, cached_value = backend.get(ESCOPO_APP, cache_prefix, (cache_key,), {})
+            if found:
                 return cached_value
-            
-            # Executar função e cachear resultado
+
+            # Valor calculado durante uma invalidação não é gravado
+            inicio = time.time()
             result = func(*args, **kwargs)
-            set_cached(cache_key, result, ttl)
-            
+            backend.set(ESCOPO_APP, cache_prefix, (cache_key,), {}, result,
+                        ttl=ttl, tags=(cache_prefix,), inicio=inicio)
+
             return result
-        
+
         return wrapper
     return decorator
 
 
 def get_cache_stats() -> dict:
-    """Retorna estatísticas do cache"""
-    total_keys = len(_memory_cache)
-    valid_keys = sum(1 for k in _memory_cache.keys() if _is_cache_valid(k, CACHE_DEFAULT_TTL))
-    expired_keys = total_keys - valid_keys
-    
-    # Calcular hit rate
-    total_requests = _cache_hits + _cache_misses
-    hit_rate = (_cache_hits / total_requests * 100) if total_requests > 0 else 0
-    
-    # Calcular tamanho da memória
-    memory_kb = sum(len(str(v)) for v in _memory_cache.values()) / 1024
-    memory_usage = f"{memory_kb:.2f} KB" if memory_kb < 1024 else f"{memory_kb/1024:.2f} MB"
-    
+    """Retorna estatísticas do cache (somadas entre workers no backend compartilhado)"""
+    backend = _backend()
+    escopo = backend.get_stats(ESCOPO_APP)
+    geral = backend.get_stats()
+
     return {
         'enabled': CACHE_ENABLED,
-        'total_keys': total_keys,
-        'valid_keys': valid_keys,
-        'expired_keys': expired_keys,
-        'memory_size_kb': memory_kb,
-        'memory_usage': memory_usage,
-        'cache_hits': _cache_hits,
-        'cache_misses': _cache_misses,
-        'hit_rate': hit_rate
+        'backend': geral.get('backend'),
+        'workers': geral.get('workers', 1),
+        'cache_size': geral.get('cache_size', 0),
+        'cache_hits': escopo['hits'],
+        'cache_misses': escopo['misses'],
+        'invalidations': escopo['invalidations'],
+        'hit_rate': escopo['hit_rate']
     }
 
 
 def cleanup_expired():
-    """Remove entradas expiradas do cache"""
-    expired_keys = [
-        k for k in _memory_cache.keys() 
-        if not _is_cache_valid(k, CACHE_DEFAULT_TTL)
-    ]
-    
-    for key in expired_keys:
-        del _memory_cache[key]
-        del _cache_timestamps[key]
-    
-    print(f"🧹 Limpeza automática: {len(expired_keys)} chaves expiradas removidas")
-    return len(expired_keys)
+    """Remove entradas expiradas do backend (de todos os escopos)"""
+    removidas = _backend().cleanup_expired()
+    logger.info(f"🧹 Limpeza automática: {removidas} chaves expiradas removidas")
+    return removidas
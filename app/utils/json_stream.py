@@ -0,0 +1,193 @@
+"""
+📤 JSON Stream - Respostas JSON de listagens sem montar a lista inteira
+======================================================================
+
+As listagens grandes faziam fetchall() + um laço copiando cada linha para
+converter Decimal/date + jsonify() do resultado inteiro: três cópias do
+resultado em memória ao mesmo tempo. Aqui as linhas vêm de um cursor nomeado
+(server-side) e o JSON é escrito em blocos conforme elas chegam:
+
+    - linhas_cursor(): lê um cursor nomeado, ITERSIZE linhas por vez
+    - codificar_json(): converte Decimal/date/datetime/Enum durante a codificação
+    - resposta_json_stream(): Response Flask com o array (ou o objeto com o
+      array) escrito aos poucos, em gzip quando o cliente aceita
+
+A memória por requisição fica limitada a ITERSIZE linhas + um bloco de saída,
+qualquer que seja o tamanho do resultado.
+
+Uso:
+    def linhas():
+        with get_db_connection(empresa_id=empresa_id) as conn:
+            yield from linhas_cursor(conn, "SELECT ...", params)
+
+    return resposta_json_stream(linhas(), chave='transacoes',
+                                campos={'saldo_anterior': saldo})
+
+Data: 16/10/2026
+"""
+
+import itertools
+import json
+import logging
+import uuid
+import zlib
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from flask import Response, request, stream_with_context
+from psycopg2.extras import RealDictCursor
+
+logger = logging.getLogger(__name__)
+
+# Linhas trazidas do servidor a cada FETCH do cursor nomeado
+ITERSIZE = 2000
+# Linhas codificadas por bloco escrito na resposta
+LINHAS_POR_BLOCO = 500
+
+
+def converter_valor(valor: Any) -> Any:
+    """default do encoder: tipos do banco para equivalentes JSON"""
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, (datetime, date, time)):
+        return valor.isoformat()
+    if isinstance(valor, timedelta):
+        return valor.total_seconds()
+    if isinstance(valor, Enum):
+        return valor.value
+    if isinstance(valor, (set, frozenset)):
+        return list(valor)
+    raise TypeError(f"Tipo {type(valor).__name__} não serializável em JSON")
+
+
+_encoder = json.JSONEncoder(default=converter_valor, ensure_ascii=False, separators=(',', ':'))
+codificar_json = _encoder.encode
+
+
+def linhas_cursor(conn, query: str, params=None, itersize: int = ITERSIZE) -> Iterator[Dict[str, Any]]:
+    """
+    Linhas de uma consulta lidas por um cursor nomeado (server-side)
+
+    Só itersize linhas ficam em memória por vez. O cursor nomeado exige
+    transação: em conexões autocommit ela é aberta aqui e desfeita no fim
+    (a consulta é somente leitura), devolvendo a conexão como veio.
+
+    Args:
+        conn: Conexão psycopg2 (do pool ou psycopg2.connect)
+        query: SELECT a executar
+        params: Parâmetros da consulta
+        itersize: Linhas por FETCH
+    """
+    autocommit = conn.autocommit
+    if autocommit:
+        conn.autocommit = False  # DECLARE CURSOR só existe dentro de transação
+    cursor = conn.cursor(name=f'json_stream_{uuid.uuid4().hex[:12]}', cursor_factory=RealDictCursor)
+    cursor.itersize = itersize
+    try:
+        cursor.execute(query, params)
+        yield from cursor
+    finally:
+        try:
+            cursor.close()
+            if autocommit:
+                conn.rollback()
+                conn.autocommit = True
+        except Exception as e:
+            logger.warning(f"⚠️  JSON stream: erro ao encerrar o cursor ({e})")
+
+
+def gerar_json(linhas: Iterable[Any], chave: Optional[str] = 'data',
+               campos: Optional[Dict[str, Any]] = None, chave_total: Optional[str] = 'total',
+               linhas_por_bloco: int = LINHAS_POR_BLOCO) -> Iterator[str]:
+    """
+    Texto JSON em blocos: {**campos, chave: [linhas...], chave_total: n, "success": true}
+
+    chave_total=None omite a contagem (quando campos já traz um "total" com
+    outro significado). Com chave=None escreve só o array.
+
+    Se as linhas falharem no meio, o objeto termina com "success": false e
+    "error"; o array puro fica sem o ']' final, para o cliente não confundir
+    um resultado parcial com o completo.
+    """
+    if chave is None:
+        yield '['
+    else:
+        cabecalho = ''.join(f'{codificar_json(k)}:{codificar_json(v)},' for k, v in (campos or {}).items())
+        yield '{' + cabecalho + codificar_json(chave) + ':['
+
+    sufixo_total = f',{codificar_json(chave_total)}:{{}}' if chave_total else ''
+    total = 0
+    bloco = []
+    erro = None
+    try:
+        for linha in linhas:
+            bloco.append(codificar_json(linha))
+            if len(bloco) >= linhas_por_bloco:
+                yield (',' if total else '') + ','.join(bloco)
+                total += len(bloco)
+                bloco = []
+    except Exception as e:
+        erro = e
+
+    if bloco:
+        yield (',' if total else '') + ','.join(bloco)
+        total += len(bloco)
+
+    if erro is not None:
+        logger.error(f"❌ JSON stream interrompido após {total} linhas: {erro}")
+        if chave is not None:
+            yield ']' + sufixo_total.format(total) + f',"success":false,"error":{codificar_json(str(erro))}}}'
+        return
+
+    yield ']' if chave is None else ']' + sufixo_total.format(total) + ',"success":true}'
+
+
+def resposta_json_stream(linhas: Iterable[Any], chave: Optional[str] = 'data',
+                         campos: Optional[Dict[str, Any]] = None, chave_total: Optional[str] = 'total',
+                         status: int = 200) -> Response:
+    """
+    Response Flask que escreve o JSON de gerar_json() conforme as linhas chegam
+
+    A primeira linha é lida antes de montar a resposta: falha de conexão ou
+    de SQL ainda sobe como exceção para o except da rota (resposta 500).
+    O gerador de linhas é fechado ao final ou se o cliente desconectar,
+    o que devolve a conexão ao pool na hora.
+
+    Args:
+        linhas: Iterável de dicts (tipicamente um gerador sobre linhas_cursor)
+        chave: Nome do array no objeto JSON (None = responde só o array)
+        campos: Campos do objeto escritos antes do array
+        chave_total: Nome do campo com o número de linhas (None = omite)
+        status: Código HTTP
+    """
+    linhas = iter(linhas)
+    try:
+        primeiras = [next(linhas)]
+    except StopIteration:
+        primeiras = []
+
+    aceita_gzip = 'gzip' in request.headers.get('Accept-Encoding', '').lower()
+
+    def corpo():
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if aceita_gzip else None
+        try:
+            for texto in gerar_json(itertools.chain(primeiras, linhas), chave, campos, chave_total):
+                dados = texto.encode('utf-8')
+                if compressor is not None:
+                    dados = compressor.compress(dados)
+                if dados:
+                    yield dados
+            if compressor is not None:
+                yield compressor.flush()
+        finally:
+            fechar = getattr(linhas, 'close', None)
+            if fechar is not None:
+                fechar()
+
+    resposta = Response(stream_with_context(corpo()), status=status, mimetype='application/json')
+    resposta.headers['Vary'] = 'Accept-Encoding'
+    if aceita_gzip:
+        resposta.headers['Content-Encoding'] = 'gzip'
+    return resposta
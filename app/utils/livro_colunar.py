@@ -0,0 +1,379 @@
+"""
+📚 Livro Colunar - Snapshot dos lançamentos por empresa
+=======================================================
+
+Representação compacta dos lançamentos de uma empresa para os relatórios
+financeiros (/api/relatorios/dashboard, /indicadores, /inadimplencia,
+/analise-categorias, /resumo-parceiros, /fluxo-projetado).
+
+Em vez de materializar um objeto Lancamento por linha (Decimal + Enum) e
+agregar com loops Python, o snapshot guarda colunas NumPy:
+    - valor em centavos (int64)
+    - vencimento / pagamento como ordinal de data (int32, 0 = sem data)
+    - tipo / status como códigos inteiros (int8)
+    - categoria / subcategoria / pessoa / conta como códigos de dicionário (int32)
+
+Agregações usam máscaras booleanas + np.bincount, então o custo cresce com o
+número de grupos e não com o número de linhas.
+
+Cache por empresa com invalidação por versão: a tabela lancamentos_versao
+(sql/migrations/migration_lancamentos_versao.sql) é incrementada por trigger
+a cada escrita em lancamentos; o snapshot é reconstruído quando a versão muda.
+Sem a migration, vale um TTL curto.
+
+Autor: Sistema de Otimização
+Data: 16/10/2026
+"""
+
+import threading
+import time
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Códigos de tipo/status (índice nas tuplas)
+TIPOS = ('receita', 'despesa', 'transferencia')
+RECEITA, DESPESA, TRANSFERENCIA = 0, 1, 2
+
+STATUS = ('pendente', 'pago', 'cancelado', 'vencido')
+PENDENTE, PAGO, CANCELADO, VENCIDO = 0, 1, 2, 3
+
+SEM_DATA = 0  # ordinal usado para data nula
+
+# Sem a tabela de versão o snapshot vale por este tempo
+_CACHE_TIMEOUT_SEM_VERSAO = 60  # segundos
+
+_livros_cache: Dict[int, tuple] = {}  # empresa_id -> (livro, versao, timestamp)
+_cache_lock = threading.Lock()
+
+
+def _ordinal(valor) -> int:
+    if valor is None:
+        return SEM_DATA
+    if isinstance(valor, datetime):
+        valor = valor.date()
+    return valor.toordinal()
+
+
+class _Dicionario:
+    """Codifica textos em inteiros; '' (ou None) é sempre o código 0"""
+
+    def __init__(self):
+        self.valores: List[str] = ['']
+        self._codigos: Dict[str, int] = {'': 0}
+
+    def codificar(self, valor) -> int:
+        valor = valor or ''
+        codigo = self._codigos.get(valor)
+        if codigo is None:
+            codigo = len(self.valores)
+            self._codigos[valor] = codigo
+            self.valores.append(valor)
+        return codigo
+
+    def codigo(self, valor) -> int:
+        """Código existente ou -1"""
+        return self._codigos.get(valor or '', -1)
+
+
+class LivroColunar:
+    """
+    Lançamentos de uma empresa em colunas NumPy
+
+    Linhas com tipo/status desconhecidos ficam de fora (como em
+    listar_lancamentos, que as descarta ao montar os objetos).
+    """
+
+    # Colunas esperadas em de_linhas()
+    COLUNAS = ('id', 'tipo', 'status', 'valor', 'data_vencimento', 'data_pagamento',
+               'categoria', 'subcategoria', 'pessoa', 'conta_bancaria', 'descricao')
+
+    def __init__(self):
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.valor_centavos = np.zeros(0, dtype=np.int64)
+        self.tipo = np.zeros(0, dtype=np.int8)
+        self.status = np.zeros(0, dtype=np.int8)
+        self.vencimento = np.zeros(0, dtype=np.int32)
+        self.pagamento = np.zeros(0, dtype=np.int32)
+        self.categoria = np.zeros(0, dtype=np.int32)
+        self.subcategoria = np.zeros(0, dtype=np.int32)
+        self.pessoa = np.zeros(0, dtype=np.int32)
+        self.conta = np.zeros(0, dtype=np.int32)
+        self.descricoes: List[str] = []
+        self.categorias = _Dicionario()
+        self.subcategorias = _Dicionario()
+        self.pessoas = _Dicionario()
+        self.contas = _Dicionario()
+
+    @classmethod
+    def de_linhas(cls, linhas: Iterable[Sequence]) -> 'LivroColunar':
+        """
+        Monta o snapshot a partir de linhas na ordem de COLUNAS
+
+        tipo/status nulos valem 'receita'/'pendente' (mesmo default de
+        listar_lancamentos); valores desconhecidos descartam a linha.
+        """
+        livro = cls()
+        codigo_tipo = {nome: i for i, nome in enumerate(TIPOS)}
+        codigo_status = {nome: i for i, nome in enumerate(STATUS)}
+
+        ids, valores, tipos, status, vencimentos, pagamentos = [], [], [], [], [], []
+        categorias, subcategorias, pessoas, contas = [], [], [], []
+
+        for (id_, tipo, st, valor, vencimento, pagamento,
+             categoria, subcategoria, pessoa, conta, descricao) in linhas:
+            t = codigo_tipo.get((tipo or 'receita').lower())
+            s = codigo_status.get((st or 'pendente').lower())
+            if t is None or s is None:
+                continue
+            ids.append(id_)
+            valores.append(int(round((valor or 0) * 100)))
+            tipos.append(t)
+            status.append(s)
+            vencimentos.append(_ordinal(vencimento))
+            pagamentos.append(_ordinal(pagamento))
+            categorias.append(livro.categorias.codificar(categoria))
+            subcategorias.append(livro.subcategorias.codificar(subcategoria))
+            pessoas.append(livro.pessoas.codificar(pessoa))
+            contas.append(livro.contas.codificar(conta))
+            livro.descricoes.append(descricao)
+
+        livro.ids = np.array(ids, dtype=np.int64)
+        livro.valor_centavos = np.array(valores, dtype=np.int64)
+        livro.tipo = np.array(tipos, dtype=np.int8)
+        livro.status = np.array(status, dtype=np.int8)
+        livro.vencimento = np.array(vencimentos, dtype=np.int32)
+        livro.pagamento = np.array(pagamentos, dtype=np.int32)
+        livro.categoria = np.array(categorias, dtype=np.int32)
+        livro.subcategoria = np.array(subcategorias, dtype=np.int32)
+        livro.pessoa = np.array(pessoas, dtype=np.int32)
+        livro.conta = np.array(contas, dtype=np.int32)
+        return livro
+
+    def __len__(self):
+        return len(self.ids)
+
+    # ------------------------------------------------------------------
+    # Filtros
+    # ------------------------------------------------------------------
+
+    def mascara(
+        self,
+        tipos: Optional[Sequence[int]] = None,
+        status: Optional[Sequence[int]] = None,
+        pago_entre: Optional[Tuple[date, date]] = None,
+        vencimento_ate: Optional[date] = None,
+        vencimento_antes: Optional[date] = None,
+        vencimento_entre: Optional[Tuple[date, date]] = None,
+        pessoa=None
+    ) -> np.ndarray:
+        """
+        Máscara booleana das linhas que atendem a todos os filtros
+
+        Args:
+            tipos / status: códigos aceitos (RECEITA, PAGO, ...)
+            pago_entre: (inicio, fim) inclusivo sobre data_pagamento (exige data)
+            vencimento_antes: data_vencimento < data (exige data)
+            vencimento_ate: data_vencimento <= data (exige data)
+            vencimento_entre: (inicio, fim) inclusivo sobre data_vencimento
+            pessoa: valor exato da coluna pessoa
+        """
+        m = np.ones(len(self), dtype=bool)
+        if tipos is not None:
+            m &= np.isin(self.tipo, tipos)
+        if status is not None:
+            m &= np.isin(self.status, status)
+        if pago_entre is not None:
+            inicio, fim = pago_entre
+            m &= (self.pagamento != SEM_DATA) & (self.pagamento >= _ordinal(inicio)) & (self.pagamento <= _ordinal(fim))
+        if vencimento_antes is not None:
+            m &= (self.vencimento != SEM_DATA) & (self.vencimento < _ordinal(vencimento_antes))
+        if vencimento_ate is not None:
+            m &= (self.vencimento != SEM_DATA) & (self.vencimento <= _ordinal(vencimento_ate))
+        if vencimento_entre is not None:
+            inicio, fim = vencimento_entre
+            m &= (self.vencimento >= _ordinal(inicio)) & (self.vencimento <= _ordinal(fim))
+        if pessoa is not None:
+            m &= self.pessoa == self.pessoas.codigo(pessoa)
+        return m
+
+    # ------------------------------------------------------------------
+    # Agregações
+    # ------------------------------------------------------------------
+
+    def somar(self, mascara: np.ndarray) -> float:
+        """Total em reais das linhas da máscara"""
+        return int(self.valor_centavos[mascara].sum()) / 100
+
+    def somar_por_tipo(self, mascara: np.ndarray) -> Dict[int, float]:
+        """Total em reais por código de tipo"""
+        totais = np.bincount(self.tipo[mascara], weights=self.valor_centavos[mascara],
+                             minlength=len(TIPOS))
+        return {t: round(totais[t]) / 100 for t in range(len(TIPOS))}
+
+    def somar_por(self, mascara: np.ndarray, *colunas: str) -> Dict[tuple, Tuple[float, int]]:
+        """
+        Group-by vetorizado sobre colunas codificadas
+
+        Args:
+            mascara: linhas consideradas
+            colunas: nomes de colunas de código ('tipo', 'categoria',
+                'subcategoria', 'pessoa', 'conta')
+
+        Returns:
+            {(valor_coluna_1, ...): (total_reais, quantidade)}, com os códigos
+            de dicionário já traduzidos para texto
+        """
+        if not mascara.any():
+            return {}
+
+        chave = np.zeros(int(mascara.sum()), dtype=np.int64)
+        tamanhos = []
+        for nome in colunas:
+            coluna = getattr(self, nome)[mascara].astype(np.int64)
+            tamanho = len(TIPOS) if nome == 'tipo' else len(self._dicionario(nome).valores)
+            chave = chave * tamanho + coluna
+            tamanhos.append(tamanho)
+
+        grupos, inverso = np.unique(chave, return_inverse=True)
+        totais = np.bincount(inverso, weights=self.valor_centavos[mascara])
+        quantidades = np.bincount(inverso)
+
+        resultado = {}
+        for grupo, total, quantidade in zip(grupos.tolist(), totais.tolist(), quantidades.tolist()):
+            codigos = []
+            for tamanho in reversed(tamanhos):
+                grupo, codigo = divmod(grupo, tamanho)
+                codigos.append(codigo)
+            codigos.reverse()
+            rotulo = tuple(
+                codigo if nome == 'tipo' else self._dicionario(nome).valores[codigo]
+                for nome, codigo in zip(colunas, codigos)
+            )
+            resultado[rotulo] = (round(total) / 100, quantidade)
+        return resultado
+
+    def somar_por_mes(self, mascara: np.ndarray, meses: Sequence[Tuple[int, int]],
+                      coluna: str = 'pagamento') -> Dict[int, List[float]]:
+        """
+        Totais por tipo em cada mês (ano, mes) pela coluna de data indicada
+
+        Returns:
+            {codigo_tipo: [total_reais por mês, na ordem de `meses`]}
+        """
+        limites = []
+        for ano, mes in meses:
+            limites.append(date(ano, mes, 1).toordinal())
+        ano, mes = meses[-1]
+        limites.append(date(ano + (mes // 12), mes % 12 + 1, 1).toordinal())
+        limites = np.array(limites, dtype=np.int64)
+
+        datas = getattr(self, coluna)[mascara]
+        posicao = np.searchsorted(limites, datas, side='right') - 1
+        dentro = (posicao >= 0) & (posicao < len(meses)) & (datas != SEM_DATA)
+
+        tipos = self.tipo[mascara][dentro].astype(np.int64)
+        chave = tipos * len(meses) + posicao[dentro]
+        totais = np.bincount(chave, weights=self.valor_centavos[mascara][dentro],
+                             minlength=len(TIPOS) * len(meses))
+        return {
+            t: [round(v) / 100 for v in totais[t * len(meses):(t + 1) * len(meses)].tolist()]
+            for t in range(len(TIPOS))
+        }
+
+    def linhas(self, mascara: np.ndarray, ordem: Optional[str] = None) -> List[Dict]:
+        """Linhas da máscara como dicts (para relatórios que listam lançamentos)"""
+        indices = np.flatnonzero(mascara)
+        if ordem is not None:
+            indices = indices[np.argsort(getattr(self, ordem)[indices], kind='stable')]
+        resultado = []
+        for i in indices.tolist():
+            resultado.append({
+                'id': int(self.ids[i]),
+                'tipo': TIPOS[self.tipo[i]],
+                'status': STATUS[self.status[i]],
+                'valor': int(self.valor_centavos[i]) / 100,
+                'data_vencimento': date.fromordinal(int(self.vencimento[i])) if self.vencimento[i] != SEM_DATA else None,
+                'data_pagamento': date.fromordinal(int(self.pagamento[i])) if self.pagamento[i] != SEM_DATA else None,
+                'categoria': self.categorias.valores[self.categoria[i]],
+                'subcategoria': self.subcategorias.valores[self.subcategoria[i]],
+                'pessoa': self.pessoas.valores[self.pessoa[i]],
+                'conta_bancaria': self.contas.valores[self.conta[i]],
+                'descricao': self.descricoes[i]
+            })
+        return resultado
+
+    def _dicionario(self, nome: str) -> _Dicionario:
+        return {
+            'categoria': self.categorias,
+            'subcategoria': self.subcategorias,
+            'pessoa': self.pessoas,
+            'conta': self.contas
+        }[nome]
+
+
+# ============================================================================
+# CACHE POR EMPRESA
+# ============================================================================
+
+def _versao_lancamentos(cursor, empresa_id: int) -> Optional[int]:
+    """Versão atual dos lançamentos da empresa (None sem a migration)"""
+    cursor.execute("SELECT to_regclass('lancamentos_versao') IS NOT NULL AS existe")
+    if not cursor.fetchone()['existe']:
+        return None
+    cursor.execute("SELECT versao FROM lancamentos_versao WHERE empresa_id = %s", (empresa_id,))
+    row = cursor.fetchone()
+    return row['versao'] if row else 0
+
+
+def _carregar_livro(cursor, empresa_id: int) -> LivroColunar:
+    cursor.execute("""
+        SELECT id, tipo, status, valor, data_vencimento, data_pagamento,
+               categoria, subcategoria, pessoa, conta_bancaria, descricao
+        FROM lancamentos
+        WHERE empresa_id = %s
+    """, (empresa_id,))
+    colunas = LivroColunar.COLUNAS
+    return LivroColunar.de_linhas(tuple(row[c] for c in colunas) for row in cursor.fetchall())
+
+
+def obter_livro(empresa_id: int) -> LivroColunar:
+    """
+    Snapshot colunar dos lançamentos da empresa (com cache por versão)
+
+    Uma consulta de versão por chamada; os lançamentos só são relidos (em uma
+    única query) quando a versão muda.
+    """
+    from database_postgresql import get_db_connection
+
+    with get_db_connection(empresa_id=empresa_id) as conn:
+        cursor = conn.cursor()
+        try:
+            versao = _versao_lancamentos(cursor, empresa_id)
+            agora = time.time()
+            with _cache_lock:
+                cached = _livros_cache.get(empresa_id)
+            if cached:
+                livro, versao_cache, timestamp = cached
+                if versao is not None and versao_cache == versao:
+                    return livro
+                if versao is None and agora - timestamp < _CACHE_TIMEOUT_SEM_VERSAO:
+                    return livro
+
+            livro = _carregar_livro(cursor, empresa_id)
+        finally:
+            cursor.close()
+
+    with _cache_lock:
+        _livros_cache[empresa_id] = (livro, versao, agora)
+    return livro
+
+
+def invalidar_livro(empresa_id: int = None):
+    """Descarta o snapshot da empresa (ou de todas, se None)"""
+    with _cache_lock:
+        if empresa_id is None:
+            _livros_cache.clear()
+        else:
+            _livros_cache.pop(int(empresa_id), None)
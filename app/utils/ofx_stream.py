@@ -0,0 +1,383 @@
+"""
+🏦 OFX Stream - Leitura incremental de extratos OFX
+===================================================
+
+Tokenizador OFX/SGML (e OFX 2.x em XML) que lê o arquivo em blocos e
+entrega as transações uma a uma, sem carregar o extrato inteiro em memória.
+
+Mantém as mesmas regras do upload antigo baseado em ofxparse:
+- bytes decodificados como latin-1 (nunca falha, 1 byte = 1 caractere),
+  o que torna irrelevante o header CHARSET/ENCODING declarado pelo banco
+- caracteres de controle invisíveis removidos antes da tokenização
+- datas convertidas como o ofxparse (offset [-3:BRT] aplicado)
+- valores aceitando "1.234,56", "1234,56" e "+10.00"
+- filtros de MEMO (tabela ofx_filtros_memo) aplicados sobre MEMO e NAME
+
+Uso:
+    resumos = resumir_ofx(arquivo, memos_ignorar)      # 1ª passada: saldos
+    arquivo.seek(0)
+    for trans in iter_transacoes_ofx(arquivo, memos_ignorar):  # 2ª passada
+        ...
+
+Autor: Sistema de Otimização
+Data: 16/10/2026
+"""
+
+import html
+import re
+from datetime import datetime, timedelta, date
+from decimal import Decimal, InvalidOperation
+from typing import BinaryIO, Dict, Iterator, List, Optional, Set, Tuple
+
+
+# Tamanho do bloco lido do arquivo a cada iteração
+CHUNK_SIZE = 64 * 1024
+
+# Caracteres de controle que quebram o parser (mantém \t, \n e \r)
+_RE_CONTROLE = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f]')
+_RE_TAG = re.compile(r'<([^<>]*)>')
+_RE_TZ = re.compile(r"\[(?P<tz>[-+]?\d+\.?\d*)\:\w*\]$")
+_RE_MSEC = re.compile(r"^[0-9]*\.([0-9]{0,5})")
+
+# Tipos OFX padrão de DÉBITO (saída de dinheiro)
+TIPOS_DEBITO = {'DEBIT', 'DEB', 'PAYMENT', 'ATM', 'DIRECTDEBIT', 'REPEATPMT',
+                'FEE', 'SRVCHG', 'CHECK', 'POS', 'DÉBITO', 'DEBITO'}
+# Tipos OFX padrão de CRÉDITO (entrada de dinheiro)
+TIPOS_CREDITO = {'CREDIT', 'DIRECTDEP', 'DEP', 'INT', 'DIV', 'XFER',
+                 'HOLD', 'OTHER', 'CASH', 'CRÉDITO', 'CREDITO'}
+
+# Agregados que delimitam uma conta/extrato
+_TAGS_EXTRATO = {'STMTRS', 'CCSTMTRS'}
+_TAGS_CONTA = {'BANKACCTFROM', 'CCACCTFROM'}
+
+
+def parse_ofx_datetime(valor: str) -> Optional[datetime]:
+    """
+    Converte data OFX (ex: 20260223000000[-3:BRT]) para datetime
+
+    Replica ofxparse.OfxParser.parseOfxDateTime: o offset do fuso é
+    subtraído, então 20260223000000[-3:BRT] vira 2026-02-23 03:00.
+
+    Args:
+        valor: String de data no formato OFX
+
+    Returns:
+        datetime ou None para datas zeradas (00000000)
+
+    Raises:
+        ValueError: Se a data não puder ser interpretada
+    """
+    valor = valor.strip()
+    res = _RE_TZ.search(valor)
+    offset = timedelta(hours=float(res.group('tz'))) if res else timedelta(0)
+
+    res = _RE_MSEC.search(valor)
+    msec = timedelta(seconds=float('0.' + res.group(1))) if res else timedelta(0)
+
+    try:
+        return datetime.strptime(valor[:14], '%Y%m%d%H%M%S') - offset + msec
+    except ValueError:
+        if valor[:8] == '00000000':
+            return None
+        return datetime.strptime(valor[:8], '%Y%m%d') - offset + msec
+
+
+def parse_ofx_valor(valor: str) -> Decimal:
+    """
+    Converte valor OFX para Decimal aceitando formatos brasileiros
+
+    Args:
+        valor: String do valor (ex: "-1.234,56", "+10.00", "null")
+
+    Returns:
+        Decimal (0 para transações "null" usadas por alguns bancos)
+
+    Raises:
+        ValueError: Se o valor não for numérico
+
+    Examples:
+        >>> parse_ofx_valor('1.234,56')
+        Decimal('1234.56')
+    """
+    d = valor.strip()
+    if d in ('null', '-null'):
+        return Decimal('0')
+    # 10,000.50
+    if re.search(r'.*\..*,', d):
+        d = d.replace('.', '')
+    # 10.000,50
+    if re.search(r'.*,.*\.', d):
+        d = d.replace(',', '')
+    # 10000,50
+    if '.' not in d and ',' in d:
+        d = d.replace(',', '.')
+    d = d.replace(' ', '').replace('+', '')
+    try:
+        return Decimal(d)
+    except InvalidOperation:
+        raise ValueError(f"Valor de transação inválido: '{valor}'")
+
+
+def data_sem_fuso(valor: datetime) -> date:
+    """
+    Extrai a data usando os componentes year/month/day
+
+    Evita o bug de -1 dia quando o servidor roda em UTC (Railway).
+    """
+    if hasattr(valor, 'year'):
+        return date(valor.year, valor.month, valor.day)
+    return valor
+
+
+def classificar_transacao(trntype: Optional[str], valor: Decimal) -> Tuple[str, Decimal]:
+    """
+    Determina o tipo (debito/credito) e corrige o sinal do valor
+
+    Args:
+        trntype: TRNTYPE do OFX (pode ser None)
+        valor: Valor informado no OFX
+
+    Returns:
+        Tupla (tipo, valor_correto) — débito sempre negativo, crédito positivo.
+        TRNTYPE desconhecido ou ausente usa o sinal do valor como desempate.
+    """
+    if trntype:
+        tt = trntype.upper()
+        if tt in TIPOS_DEBITO:
+            return 'debito', -abs(valor)
+        if tt in TIPOS_CREDITO:
+            return 'credito', abs(valor)
+    if valor < 0:
+        return 'debito', valor
+    return 'credito', valor
+
+
+def iter_tokens_ofx(arquivo: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[str, str]]:
+    """
+    Tokeniza um arquivo OFX lendo blocos de chunk_size bytes
+
+    Yields:
+        ('abre', TAG), ('fecha', TAG) ou ('texto', conteúdo)
+        Tags em maiúsculas; declarações (<?xml?>, <!-- -->) são ignoradas.
+    """
+    buffer = ''
+    while True:
+        bloco = arquivo.read(chunk_size)
+        fim = not bloco
+        if bloco:
+            # latin-1 mapeia 1:1 bytes -> unicode, então decodificar por bloco é seguro
+            buffer += _RE_CONTROLE.sub('', bloco.decode('latin-1'))
+
+        # Processar até o último '<' (o restante pode ser uma tag incompleta)
+        corte = len(buffer) if fim else buffer.rfind('<')
+        if corte <= 0:
+            if fim:
+                break
+            continue
+
+        segmento, buffer = buffer[:corte], buffer[corte:]
+        pos = 0
+        for match in _RE_TAG.finditer(segmento):
+            texto = segmento[pos:match.start()]
+            if texto.strip():
+                yield 'texto', texto
+            pos = match.end()
+
+            conteudo = match.group(1).strip()
+            if not conteudo or conteudo[0] in '?!':
+                continue
+            if conteudo[0] == '/':
+                yield 'fecha', conteudo[1:].strip().upper()
+            else:
+                yield 'abre', conteudo.split()[0].upper()
+
+        texto = segmento[pos:]
+        if texto.strip():
+            yield 'texto', texto
+
+        if fim:
+            break
+
+
+def iter_eventos_ofx(arquivo: BinaryIO, memos_ignorar: Optional[Set[str]] = None,
+                     chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[str, Dict]]:
+    """
+    Percorre o OFX emitindo transações e, ao final de cada extrato, o resumo da conta
+
+    Args:
+        arquivo: Arquivo binário (file-like) posicionado no início
+        memos_ignorar: MEMOs/NAMEs em maiúsculas a descartar (ofx_filtros_memo)
+        chunk_size: Bytes lidos por bloco
+
+    Yields:
+        ('transacao', dict) com conta_idx, datahora, data, valor_ofx, trntype,
+        payee, memo, fitid, checknum
+        ('conta', dict) com conta_idx, numero, saldo_final, data_inicio,
+        data_fim, total_transacoes, soma_valores, data_primeira_transacao,
+        ignoradas_memo
+
+    Raises:
+        ValueError: Se uma transação não tiver TRNAMT ou DTPOSTED válidos
+    """
+    memos_ignorar = memos_ignorar or set()
+    conta_idx = -1
+    conta = None
+    trans = None
+    na_conta = na_lista = no_ledger = False
+    tag_atual = None
+
+    for tipo, valor in iter_tokens_ofx(arquivo, chunk_size):
+        if tipo == 'abre':
+            tag_atual = valor
+            if valor in _TAGS_EXTRATO:
+                conta_idx += 1
+                conta = {
+                    'conta_idx': conta_idx,
+                    'numero': None,
+                    'saldo_final': None,
+                    'data_inicio': None,
+                    'data_fim': None,
+                    'total_transacoes': 0,
+                    'soma_valores': Decimal('0'),
+                    'data_primeira_transacao': None,
+                    'ignoradas_memo': 0
+                }
+            elif valor == 'STMTTRN':
+                trans = {'trntype': None, 'payee': '', 'memo': '', 'fitid': '',
+                         'checknum': '', 'valor': None, 'datahora': None}
+            elif valor in _TAGS_CONTA:
+                na_conta = True
+            elif valor == 'BANKTRANLIST':
+                na_lista = True
+            elif valor == 'LEDGERBAL':
+                no_ledger = True
+            continue
+
+        if tipo == 'fecha':
+            tag_atual = None
+            if valor == 'STMTTRN' and trans is not None:
+                evento = _finalizar_transacao(trans, conta, conta_idx, memos_ignorar)
+                trans = None
+                if evento:
+                    yield 'transacao', evento
+            elif valor in _TAGS_EXTRATO and conta is not None:
+                yield 'conta', conta
+                conta = None
+            elif valor in _TAGS_CONTA:
+                na_conta = False
+            elif valor == 'BANKTRANLIST':
+                na_lista = False
+            elif valor == 'LEDGERBAL':
+                no_ledger = False
+            continue
+
+        # Texto: valor da última tag folha aberta
+        if tag_atual is None:
+            continue
+        texto = html.unescape(valor.strip())
+
+        if trans is not None:
+            if tag_atual == 'TRNTYPE':
+                trans['trntype'] = texto.lower()
+            elif tag_atual == 'NAME':
+                trans['payee'] = texto
+            elif tag_atual == 'MEMO':
+                trans['memo'] = texto
+            elif tag_atual == 'FITID':
+                trans['fitid'] = texto
+            elif tag_atual == 'CHECKNUM':
+                trans['checknum'] = texto
+            elif tag_atual == 'TRNAMT':
+                trans['valor'] = parse_ofx_valor(texto)
+            elif tag_atual == 'DTPOSTED':
+                trans['datahora'] = parse_ofx_datetime(texto)
+        elif conta is not None:
+            if na_conta and tag_atual == 'ACCTID':
+                conta['numero'] = texto
+            elif na_lista and tag_atual == 'DTSTART':
+                conta['data_inicio'] = parse_ofx_datetime(texto)
+            elif na_lista and tag_atual == 'DTEND':
+                conta['data_fim'] = parse_ofx_datetime(texto)
+            elif no_ledger and tag_atual == 'BALAMT':
+                conta['saldo_final'] = parse_ofx_valor(texto)
+
+        # SGML: tags folha não têm fechamento, o texto encerra o valor
+        tag_atual = None
+
+
+def _finalizar_transacao(trans: Dict, conta: Optional[Dict], conta_idx: int,
+                         memos_ignorar: Set[str]) -> Optional[Dict]:
+    """Valida a transação, aplica filtros de MEMO e acumula o resumo da conta"""
+    if trans['valor'] is None:
+        raise ValueError("Transação sem TRNAMT (campo obrigatório)")
+    if trans['datahora'] is None:
+        raise ValueError("Transação sem DTPOSTED (campo obrigatório)")
+
+    if memos_ignorar and (
+        trans['memo'].strip().upper() in memos_ignorar
+        or trans['payee'].strip().upper() in memos_ignorar
+    ):
+        if conta is not None:
+            conta['ignoradas_memo'] += 1
+        return None
+
+    data = data_sem_fuso(trans['datahora'])
+    if conta is not None:
+        _, valor_correto = classificar_transacao(trans['trntype'], trans['valor'])
+        conta['total_transacoes'] += 1
+        conta['soma_valores'] += valor_correto
+        if conta['data_primeira_transacao'] is None or data < conta['data_primeira_transacao']:
+            conta['data_primeira_transacao'] = data
+
+    return {
+        'conta_idx': max(conta_idx, 0),
+        'datahora': trans['datahora'],
+        'data': data,
+        'valor_ofx': trans['valor'],
+        'trntype': trans['trntype'],
+        'payee': trans['payee'],
+        'memo': trans['memo'],
+        'fitid': trans['fitid'],
+        'checknum': trans['checknum']
+    }
+
+
+def resumir_ofx(arquivo: BinaryIO, memos_ignorar: Optional[Set[str]] = None,
+                chunk_size: int = CHUNK_SIZE) -> List[Dict]:
+    """
+    Primeira passada: resumo de cada conta do OFX sem guardar as transações
+
+    Returns:
+        Lista de resumos (um por STMTRS/CCSTMTRS), ver iter_eventos_ofx
+    """
+    return [
+        evento for tipo, evento in iter_eventos_ofx(arquivo, memos_ignorar, chunk_size)
+        if tipo == 'conta'
+    ]
+
+
+def iter_transacoes_ofx(arquivo: BinaryIO, memos_ignorar: Optional[Set[str]] = None,
+                        chunk_size: int = CHUNK_SIZE) -> Iterator[Dict]:
+    """
+    Segunda passada: transações do OFX, uma a uma, na ordem do arquivo
+
+    Yields:
+        dict pronto para extrato_functions.salvar_transacoes_extrato_bulk
+        (data, datahora, descricao, valor, tipo, fitid, memo, checknum, grupo)
+    """
+    for tipo, trans in iter_eventos_ofx(arquivo, memos_ignorar, chunk_size):
+        if tipo != 'transacao':
+            continue
+        tipo_trans, valor_correto = classificar_transacao(trans['trntype'], trans['valor_ofx'])
+        yield {
+            'data': trans['data'],
+            'datahora': trans['datahora'],
+            'descricao': trans['payee'] or trans['memo'] or 'Sem descricao',
+            'valor': float(valor_correto),
+            'tipo': tipo_trans.upper(),  # DEBITO ou CREDITO (maiúsculo)
+            'saldo': None,  # Calculado na ingestão a partir de saldos_iniciais
+            'fitid': trans['fitid'],
+            'memo': trans['memo'],
+            'checknum': trans['checknum'],
+            'grupo': trans['conta_idx']
+        }
@@ -0,0 +1,133 @@
+"""
+🔐 Cache de Sessões e Permissões
+================================
+
+Evita que cada requisição autenticada repita as mesmas queries de
+autenticação (validar_sessao + tem_acesso_empresa + obter_permissoes_usuario_empresa).
+Uma carga do dashboard dispara 20+ chamadas de API; com o cache apenas a
+primeira de cada janela de TTL consulta o banco.
+
+Dois níveis:
+    - sessão: token -> dados do usuário + empresas vinculadas
+    - acesso: (usuario_id, empresa_id) -> tem_acesso + permissões da empresa
+
+Invalidação imediata (neste worker):
+    - logout (invalidar_sessao)
+    - sincronizar_permissoes_usuario / alterações em usuarios e usuario_empresas
+    - suspensão / reativação / edição da empresa
+Outros workers gunicorn convergem pelo TTL curto.
+
+Data: 16/10/2026
+"""
+
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+
+# TTL curto: limita a janela em que outro worker ainda enxerga
+# uma sessão encerrada ou uma empresa recém-suspensa
+_CACHE_TIMEOUT = 30  # segundos
+
+_sessoes_cache: Dict[str, tuple] = {}
+_acessos_cache: Dict[tuple, tuple] = {}
+_cache_geracao = 0  # evita gravar dado carregado antes de uma invalidação
+_cache_lock = threading.Lock()
+
+
+def obter_sessao(token: str, carregar: Callable[[str], Optional[Dict]]) -> Optional[Dict]:
+    """
+    Obtém os dados da sessão (com cache)
+
+    Args:
+        token: Token da sessão
+        carregar: Função que consulta o banco; retorna dict com ao menos
+            usuario_id e expira_em, ou None para sessão inválida
+
+    Returns:
+        Cópia dos dados da sessão ou None (sessões inválidas não são cacheadas)
+    """
+    agora = time.time()
+    with _cache_lock:
+        cached = _sessoes_cache.get(token)
+        if cached and agora - cached[1] < _CACHE_TIMEOUT:
+            return dict(cached[0])
+        geracao = _cache_geracao
+
+    dados = carregar(token)
+    if dados is None:
+        return None
+
+    with _cache_lock:
+        if _cache_geracao == geracao:
+            _sessoes_cache[token] = (dados, agora)
+    return dict(dados)
+
+
+def obter_acesso_empresa(usuario_id: int, empresa_id: int,
+                         carregar: Callable[[int, int], Dict]) -> Dict:
+    """
+    Obtém acesso e permissões do usuário na empresa (com cache)
+
+    Args:
+        usuario_id: ID do usuário
+        empresa_id: ID da empresa
+        carregar: Função que retorna {'tem_acesso': bool, 'permissoes': list}
+
+    Returns:
+        Dict {'tem_acesso': bool, 'permissoes': list} (cópia)
+    """
+    chave = (int(usuario_id), int(empresa_id))
+    agora = time.time()
+    with _cache_lock:
+        cached = _acessos_cache.get(chave)
+        if cached and agora - cached[1] < _CACHE_TIMEOUT:
+            acesso = cached[0]
+            return {'tem_acesso': acesso['tem_acesso'], 'permissoes': list(acesso['permissoes'])}
+        geracao = _cache_geracao
+
+    acesso = carregar(usuario_id, empresa_id)
+    with _cache_lock:
+        if _cache_geracao == geracao:
+            _acessos_cache[chave] = (acesso, agora)
+    return {'tem_acesso': acesso['tem_acesso'], 'permissoes': list(acesso['permissoes'])}
+
+
+def invalidar_sessao_cache(token: str = None):
+    """Descarta a sessão do token (ou todas, se None)"""
+    global _cache_geracao
+    with _cache_lock:
+        _cache_geracao += 1
+        if token is None:
+            _sessoes_cache.clear()
+        else:
+            _sessoes_cache.pop(token, None)
+
+
+def invalidar_usuario_cache(usuario_id: int = None):
+    """Descarta sessões e acessos do usuário (ou de todos, se None)"""
+    global _cache_geracao
+    with _cache_lock:
+        _cache_geracao += 1
+        if usuario_id is None:
+            _sessoes_cache.clear()
+            _acessos_cache.clear()
+            return
+        usuario_id = int(usuario_id)
+        for token in [t for t, (dados, _) in _sessoes_cache.items() if dados.get('usuario_id') == usuario_id]:
+            del _sessoes_cache[token]
+        for chave in [c for c in _acessos_cache if c[0] == usuario_id]:
+            del _acessos_cache[chave]
+
+
+def invalidar_empresa_cache(empresa_id: int = None):
+    """Descarta os acessos de todos os usuários à empresa (ou a todas, se None)"""
+    global _cache_geracao
+    with _cache_lock:
+        _cache_geracao += 1
+        if empresa_id is None:
+            _acessos_cache.clear()
+            return
+        empresa_id = int(empresa_id)
+        for chave in [c for c in _acessos_cache if c[1] == empresa_id]:
+            del _acessos_cache[chave]
@@ -9,6 +9,8 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 from flask import session as flask_session
 
+from auth_cache import invalidar_sessao_cache, invalidar_usuario_cache
+
 # Importação opcional do bcrypt (para compatibilidade durante deploy)
 try:
     import bcrypt
@@ -354,6 +356,7 @@ def invalidar_sessao(token: str, db) -> bool:
     cursor.close()
     conn.close()
     
+    invalidar_sessao_cache(token)
     return sucesso
 
 
@@ -477,6 +480,7 @@ def atualizar_usuario(usuario_id: int, dados: Dict, db) -> bool:
     cursor.close()
     conn.close()
     
+    invalidar_usuario_cache(usuario_id)
     return sucesso
 
 
@@ -496,6 +500,7 @@ def deletar_usuario(usuario_id: int, db) -> bool:
     cursor.close()
     conn.close()
     
+    invalidar_usuario_cache(usuario_id)
     return sucesso
 
 
@@ -620,6 +625,7 @@ def sincronizar_permissoes_usuario(usuario_id: int, codigos_permissoes: List[str
     cursor.close()
     conn.close()
     
+    invalidar_usuario_cache(usuario_id)
     return True
 
 
@@ -874,6 +880,7 @@ def vincular_usuario_empresa(usuario_id: int, empresa_id: int, papel: str,
         vinculo_id = result['id'] if result else None
         
         conn.commit()
+        invalidar_usuario_cache(usuario_id)
         return vinculo_id
         
     except Exception as e:
@@ -898,6 +905,7 @@ def remover_usuario_empresa(usuario_id: int, empresa_id: int, db) -> bool:
         """, (usuario_id, empresa_id))
         
         conn.commit()
+        invalidar_usuario_cache(usuario_id)
         return True
         
     except Exception as e:
@@ -954,6 +962,7 @@ def atualizar_usuario_empresa(usuario_id: int, empresa_id: int,
         
         cursor.execute(query, params)
         conn.commit()
+        invalidar_usuario_cache(usuario_id)
         return True
         
     except Exception as e:
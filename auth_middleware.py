@@ -2,7 +2,7 @@
 Middlewares de Autenticacao e Autorizacao
 Otimizado para PostgreSQL
 """
-from flask import session, request, jsonify, redirect, url_for
+from flask import session, request, jsonify, redirect, url_for, g
 from functools import wraps
 import os
 import sys
@@ -22,10 +22,16 @@ except Exception as e:
     log(f"Erro ao importar database_postgresql em auth_middleware: {e}")
     raise
 
+from auth_cache import obter_acesso_empresa as _obter_acesso_empresa_cache
+
 
 def get_usuario_logado():
     """
     Retorna dados do usuario logado via session token
+    
+    Memorizado por requisicao (flask.g): decoradores empilhados e a propria
+    rota reutilizam o mesmo resultado. Entre requisicoes, validar_sessao
+    usa o cache curto de auth_cache.
     """
     try:
         token = session.get('session_token')
@@ -34,10 +40,13 @@ def get_usuario_logado():
             log("[get_usuario_logado] Sem token na sessao")
             return None
         
-        log(f"[get_usuario_logado] Validando token: {token[:20]}...")
+        memo = g.get('_usuario_logado')
+        if memo is not None and memo[0] == token:
+            return dict(memo[1]) if memo[1] else None
+        
         usuario = auth_db.validar_sessao(token)
-        log(f"[get_usuario_logado] Usuario validado: {usuario.get('username') if usuario else 'None'}")
-        return usuario
+        g._usuario_logado = (token, usuario)
+        return dict(usuario) if usuario else None
     except Exception as e:
         log(f"[get_usuario_logado] Erro: {e}")
         import traceback
@@ -45,6 +54,27 @@ def get_usuario_logado():
         return None
 
 
+def _carregar_acesso_empresa(usuario_id, empresa_id):
+    """Consulta acesso e permissoes do usuario na empresa (sem cache)"""
+    from auth_functions import tem_acesso_empresa, obter_permissoes_usuario_empresa
+    if not tem_acesso_empresa(usuario_id, empresa_id, auth_db):
+        return {'tem_acesso': False, 'permissoes': []}
+    return {
+        'tem_acesso': True,
+        'permissoes': obter_permissoes_usuario_empresa(usuario_id, empresa_id, auth_db)
+    }
+
+
+def obter_acesso_empresa(usuario_id, empresa_id):
+    """
+    Retorna {'tem_acesso': bool, 'permissoes': list} do usuario na empresa
+    
+    Usa o cache curto de auth_cache (invalidado por suspensao da empresa,
+    alteracoes de vinculo e sincronizar_permissoes_usuario).
+    """
+    return _obter_acesso_empresa_cache(usuario_id, empresa_id, _carregar_acesso_empresa)
+
+
 def require_auth(f):
     """
     Decorador que requer autenticacao
@@ -103,8 +133,9 @@ def require_auth(f):
                         }), 403
 
                 # Validar se usuário tem acesso à empresa
-                from auth_functions import tem_acesso_empresa, obter_bloqueio_empresa, descrever_bloqueio_empresa
-                if not tem_acesso_empresa(usuario['id'], empresa_id, auth_db):
+                from auth_functions import obter_bloqueio_empresa, descrever_bloqueio_empresa
+                acesso = obter_acesso_empresa(usuario['id'], empresa_id)
+                if not acesso['tem_acesso']:
                     log(f"[require_auth] Usuario {usuario['username']} sem acesso a empresa {empresa_id}")
                     # NÃO apagar da sessão: pode ser só esta aba com empresa_id inválido
 
@@ -126,9 +157,8 @@ def require_auth(f):
                         'requireEmpresaSelection': True
                     }), 403
 
-                # Carregar permissões específicas da empresa
-                from auth_functions import obter_permissoes_usuario_empresa
-                permissoes = obter_permissoes_usuario_empresa(usuario['id'], empresa_id, auth_db)
+                # Permissões específicas da empresa
+                permissoes = acesso['permissoes']
                 usuario['permissoes'] = permissoes
                 usuario['empresa_id'] = empresa_id
 
@@ -286,8 +316,9 @@ def require_permission(permission_code: str):
             # pagamento, contrato encerrado, etc). Sem essa checagem, uma
             # empresa bloqueada continuaria acessível por qualquer rota que
             # use @require_permission (a maioria das rotas de dados do sistema).
-            from auth_functions import tem_acesso_empresa, obter_bloqueio_empresa, descrever_bloqueio_empresa
-            if not tem_acesso_empresa(usuario['id'], empresa_id, auth_db):
+            from auth_functions import obter_bloqueio_empresa, descrever_bloqueio_empresa
+            acesso = obter_acesso_empresa(usuario['id'], empresa_id)
+            if not acesso['tem_acesso']:
                 print(f"❌ [PERMISSION CHECK] Usuario {usuario['username']} sem acesso a empresa {empresa_id}")
 
                 bloqueio = obter_bloqueio_empresa(empresa_id, auth_db)
@@ -307,9 +338,8 @@ def require_permission(permission_code: str):
                     'requireEmpresaSelection': True
                 }), 403
 
-            # Buscar permissões da empresa (não permissões globais)
-            from auth_functions import obter_permissoes_usuario_empresa
-            permissoes = obter_permissoes_usuario_empresa(usuario['id'], empresa_id, auth_db)
+            # Permissões da empresa (não permissões globais)
+            permissoes = acesso['permissoes']
             print(f"🔒 [PERMISSION CHECK] Permissões da empresa {empresa_id}: {len(permissoes)} itens")
             print(f"🔒 [PERMISSION CHECK] Verificando se '{permission_code}' está em: {permissoes[:10]}..." if len(permissoes) > 10 else f"🔒 [PERMISSION CHECK] Permissões: {permissoes}")
             
@@ -1,16 +1,33 @@
 """
 Módulo de geração de backup do banco de dados.
-Gera um .zip em memória com os dados de todas as empresas (um JSON por tabela),
+Gera um .zip com os dados de todas as empresas (um arquivo por tabela),
 para download manual pelo painel admin. Envio automático por e-mail foi desativado.
+
+O ZIP é gravado direto no destino (arquivo em disco) enquanto as linhas são
+lidas por cursores de servidor, em lotes de LINHAS_POR_LOTE: a memória usada
+não depende do tamanho do banco.
+
+    - formato 'jsonl': uma linha JSON por registro ({tabela}.jsonl)
+    - formato 'copy': CSV com cabeçalho gerado pelo COPY do PostgreSQL
+      ({tabela}.csv), restaurável com COPY ... FROM ... (FORMAT csv, HEADER)
+    - incremental: só as linhas alteradas desde a marca d'água do último
+      backup sem erros (backup_execucoes), pela coluna de alteração da
+      tabela (updated_at, atualizado_em...) - apenas quando um trigger
+      BEFORE UPDATE a mantém. Coluna gravada pela aplicação (ou só de
+      criação) perde UPDATEs que não a tocam, então essas tabelas vão
+      completas; exclusões não aparecem no incremental (um backup completo
+      periódico resolve)
 """
 import os
+import re
 import json
-import io
+import tempfile
 import zipfile
-from datetime import datetime
+from datetime import datetime, timedelta
 
 import psycopg2
 import psycopg2.extras
+from psycopg2.extensions import ISOLATION_LEVEL_REPEATABLE_READ
 
 
 # ─── CONFIGURAÇÃO ────────────────────────────────────────────────────────────
@@ -41,6 +58,28 @@ TABELAS_GLOBAIS = [
     'usuario_permissoes',
 ]
 
+# Colunas exportadas mascaradas
+COLUNAS_MASCARADAS = {
+    'usuarios': {'password_hash'},
+}
+VALOR_MASCARADO = '*** REDACTED ***'
+
+# Colunas (TIMESTAMP) que indicam alteração da linha, em ordem de preferência.
+# Só valem se um trigger BEFORE UPDATE da tabela as atribui (NEW.coluna := ...)
+COLUNAS_ALTERACAO = ('updated_at', 'atualizado_em', 'data_atualizacao', 'data_alteracao')
+
+# Linhas lidas do cursor de servidor por vez
+LINHAS_POR_LOTE = int(os.getenv('BACKUP_LINHAS_POR_LOTE', '2000'))
+
+# Sobreposição do incremental com o backup anterior: cobre transações que
+# gravaram updated_at antes da marca d'água, mas só confirmaram depois dela
+MARGEM_INCREMENTAL = timedelta(minutes=int(os.getenv('BACKUP_MARGEM_INCREMENTAL_MIN', '5')))
+
+FORMATOS = {
+    'jsonl': '.jsonl',
+    'copy': '.csv',
+}
+
 
 def _json_default(obj):
     """Serializa tipos não-padrão (datetime, date, Decimal)"""
@@ -49,85 +88,320 @@ def _json_default(obj):
     return str(obj)
 
 
-def gerar_backup_zip_por_empresa():
+def _ident(nome):
+    """Identificador SQL entre aspas (nomes vindos do information_schema)"""
+    return '"' + nome.replace('"', '""') + '"'
+
+
+def nome_arquivo_backup(agora=None, incremental=False):
+    agora = agora or datetime.now()
+    sufixo = '_incremental' if incremental else ''
+    return f"backup_DWM_empresas_{agora.strftime('%Y%m%d_%H%M')}{sufixo}.zip"
+
+
+# ─── ESTRUTURA E CONSULTAS ───────────────────────────────────────────────────
+
+def _mantida_por_trigger(coluna, fontes):
+    """Se algum corpo de trigger atribui NEW.coluna"""
+    padrao = re.compile(rf'\bNEW\.{re.escape(coluna)}\s*:?=(?!=)', re.IGNORECASE)
+    return any(padrao.search(fonte or '') for fonte in fontes)
+
+
+def _estrutura_tabelas(colunas, gatilhos=()):
+    """
+    Agrupa as linhas (table_name, column_name, data_type) do information_schema.
+
+    Args:
+        colunas: linhas do information_schema.columns
+        gatilhos: linhas (table_name, fonte) dos triggers BEFORE UPDATE por
+            linha ativos (fonte = corpo da função, pg_proc.prosrc)
+
+    Returns:
+        {tabela: {'colunas': [...], 'alteracao': coluna TIMESTAMP mantida por trigger ou None}}
+    """
+    fontes = {}
+    for row in gatilhos:
+        fontes.setdefault(row['table_name'], []).append(row['fonte'])
+
+    estrutura = {}
+    for row in colunas:
+        tabela = estrutura.setdefault(row['table_name'], {'colunas': [], 'alteracao': None, '_tempo': set()})
+        tabela['colunas'].append(row['column_name'])
+        if row['data_type'].startswith('timestamp'):
+            tabela['_tempo'].add(row['column_name'])
+    for nome, tabela in estrutura.items():
+        tempo = tabela.pop('_tempo')
+        tabela['alteracao'] = next((c for c in COLUNAS_ALTERACAO
+                                    if c in tempo and _mantida_por_trigger(c, fontes.get(nome, ()))), None)
+    return estrutura
+
+
+def _montar_consulta(tabela, estrutura, empresa_id=None, desde=None):
+    """
+    SELECT de uma tabela (colunas mascaradas substituídas), filtrado por
+    empresa e, no incremental, pela coluna de alteração.
+
+    Returns:
+        (sql, params, incremental) - incremental=False se a tabela foi completa
+    """
+    mascaradas = COLUNAS_MASCARADAS.get(tabela, set())
+    campos = ', '.join(
+        f"'{VALOR_MASCARADO}' AS {_ident(c)}" if c in mascaradas else _ident(c)
+        for c in estrutura['colunas']
+    )
+    filtros, params = [], []
+    if empresa_id is not None:
+        filtros.append('empresa_id = %s')
+        params.append(empresa_id)
+    incremental = desde is not None and estrutura['alteracao'] is not None
+    if incremental:
+        # NULL: linha inserida sem a coluna (sem DEFAULT) - vai sempre
+        coluna = _ident(estrutura['alteracao'])
+        filtros.append(f"({coluna} > %s OR {coluna} IS NULL)")
+        params.append(desde)
+
+    consulta = f"SELECT {campos} FROM {_ident(tabela)}"
+    if filtros:
+        consulta += ' WHERE ' + ' AND '.join(filtros)
+    if 'id' in estrutura['colunas']:
+        consulta += ' ORDER BY id'
+    return consulta, params, incremental
+
+
+# ─── ESCRITA DOS MEMBROS ─────────────────────────────────────────────────────
+
+def _escrever_jsonl(cursor, destino, linhas_por_lote=LINHAS_POR_LOTE):
+    """Lotes do cursor (já executado) como JSON por linha. Returns: nº de linhas"""
+    total = 0
+    while True:
+        linhas = cursor.fetchmany(linhas_por_lote)
+        if not linhas:
+            return total
+        destino.write(''.join(
+            json.dumps(dict(row), ensure_ascii=False, default=_json_default) + '\n' for row in linhas
+        ).encode('utf-8'))
+        total += len(linhas)
+
+
+def _exportar_tabela(conn, zf, membro, consulta, params, formato, sequencia):
+    """
+    Exporta uma consulta para um membro do ZIP, dentro de um SAVEPOINT (uma
+    tabela com erro não aborta a transação do backup).
+
+    Returns:
+        nº de linhas exportadas (None se o COPY não informar)
+    """
+    controle = conn.cursor()
+    controle.execute("SAVEPOINT backup_tabela")
+    try:
+        if formato == 'copy':
+            copia = controle.mogrify(consulta, params).decode('utf-8')
+            with zf.open(membro, 'w', force_zip64=True) as destino:
+                controle.copy_expert(f"COPY ({copia}) TO STDOUT WITH (FORMAT csv, HEADER)", destino)
+            total = controle.rowcount if controle.rowcount >= 0 else None
+        else:
+            with conn.cursor(name=f'backup_{sequencia}', cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+                cursor.execute(consulta, params)
+                with zf.open(membro, 'w', force_zip64=True) as destino:
+                    total = _escrever_jsonl(cursor, destino)
+        controle.execute("RELEASE SAVEPOINT backup_tabela")
+        return total
+    except Exception:
+        controle.execute("ROLLBACK TO SAVEPOINT backup_tabela")
+        raise
+    finally:
+        controle.close()
+
+
+# ─── EXECUÇÕES (marca d'água do incremental) ─────────────────────────────────
+
+def _garantir_tabela_execucoes(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS backup_execucoes (
+            id SERIAL PRIMARY KEY,
+            modo VARCHAR(20) NOT NULL,
+            formato VARCHAR(10) NOT NULL,
+            marca_dagua TIMESTAMP NOT NULL,
+            desde TIMESTAMP,
+            arquivo VARCHAR(255),
+            total_registros BIGINT,
+            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def _ultima_marca_dagua(cur):
+    cur.execute("SELECT MAX(marca_dagua) AS marca FROM backup_execucoes")
+    row = cur.fetchone()
+    return row['marca'] if row else None
+
+
+# ─── BACKUP ──────────────────────────────────────────────────────────────────
+
+def gerar_backup_arquivo(destino, formato='jsonl', incremental=False, ao_progredir=None):
     """
-    Gera backup completo do banco separado por empresa.
+    Gera o backup separado por empresa, gravando o ZIP direto em `destino`.
     Estrutura do zip:
-      empresa_1_NomeEmpresa/clientes.json
-      empresa_1_NomeEmpresa/lancamentos.json
+      empresa_1_NomeEmpresa/clientes.jsonl
+      empresa_1_NomeEmpresa/lancamentos.jsonl
       ...
-      _global/empresas.json
-      _global/usuarios.json
+      _global/empresas.jsonl
+      _global/usuarios.jsonl
       _resumo.json
-    Retorna (bytes_do_zip, nome_do_arquivo, info_resumo).
+
+    Todas as tabelas são lidas no mesmo snapshot (transação REPEATABLE READ
+    somente leitura), cujo instante vira a marca d'água do próximo incremental.
+
+    Args:
+        destino: Caminho do .zip ou arquivo binário aberto (com seek)
+        formato: 'jsonl' ou 'copy' (CSV do COPY)
+        incremental: Só linhas alteradas desde o último backup (sem backup
+            anterior, gera o completo)
+        ao_progredir: Callback (feitas, total, descricao) a cada empresa
+
+    Returns:
+        info_resumo (também gravado em _resumo.json), com nome_arquivo
     """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de backup inválido: {formato}")
+    extensao = FORMATOS[formato]
     agora = datetime.now()
-    nome_arquivo = f"backup_DWM_empresas_{agora.strftime('%Y%m%d_%H%M')}.zip"
 
     conn = psycopg2.connect(DATABASE_URL)
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-
-    # Listar todas as empresas
-    cur.execute("SELECT id, razao_social, nome_fantasia FROM empresas ORDER BY id")
-    empresas = [dict(r) for r in cur.fetchall()]
-
-    zip_buffer = io.BytesIO()
-    resumo = {'empresas': {}, 'global': {}}
-
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-        # Dados por empresa
-        for empresa in empresas:
-            eid = empresa['id']
-            nome_empresa = (empresa.get('razao_social') or empresa.get('nome_fantasia') or f'empresa_{eid}')
-            # Sanitizar nome para usar como pasta
-            nome_pasta = "".join(c if c.isalnum() or c in (' ', '_', '-') else '_' for c in nome_empresa)
-            pasta = f"empresa_{eid}_{nome_pasta}"
-            resumo['empresas'][pasta] = {}
-
-            for tabela in TABELAS_POR_EMPRESA:
-                try:
-                    cur.execute(f"SELECT * FROM {tabela} WHERE empresa_id = %s ORDER BY id", (eid,))
-                    rows = [dict(r) for r in cur.fetchall()]
-                    conteudo = json.dumps(rows, ensure_ascii=False, indent=2, default=_json_default)
-                    zf.writestr(f"{pasta}/{tabela}.json", conteudo)
-                    resumo['empresas'][pasta][tabela] = len(rows)
-                except Exception as e:
-                    zf.writestr(f"{pasta}/{tabela}_ERRO.txt", str(e))
-                    resumo['empresas'][pasta][tabela] = f'ERRO: {e}'
-
-        # Tabelas globais
-        for tabela in TABELAS_GLOBAIS:
+    try:
+        conn.autocommit = True
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        _garantir_tabela_execucoes(cur)
+        anterior = _ultima_marca_dagua(cur) if incremental else None
+        desde = anterior - MARGEM_INCREMENTAL if anterior else None
+        modo = 'incremental' if desde else 'completo'
+        cur.close()
+
+        conn.autocommit = False
+        conn.set_session(isolation_level=ISOLATION_LEVEL_REPEATABLE_READ, readonly=True)
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute("SELECT transaction_timestamp()::timestamp AS marca")
+        marca_dagua = cur.fetchone()['marca']
+
+        cur.execute("""
+            SELECT table_name, column_name, data_type
+            FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = ANY(%s)
+            ORDER BY table_name, ordinal_position
+        """, (TABELAS_POR_EMPRESA + TABELAS_GLOBAIS,))
+        colunas = cur.fetchall()
+        # Triggers BEFORE UPDATE FOR EACH ROW ativos (tgtype: 1 = ROW, 2 = BEFORE, 16 = UPDATE)
+        cur.execute("""
+            SELECT c.relname AS table_name, p.prosrc AS fonte
+            FROM pg_trigger t
+            JOIN pg_class c ON c.oid = t.tgrelid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            JOIN pg_proc p ON p.oid = t.tgfoid
+            WHERE n.nspname = 'public' AND c.relname = ANY(%s)
+              AND NOT t.tgisinternal AND t.tgenabled <> 'D'
+              AND t.tgtype & 19 = 19
+        """, (TABELAS_POR_EMPRESA + TABELAS_GLOBAIS,))
+        estrutura = _estrutura_tabelas(colunas, cur.fetchall())
+
+        # Listar todas as empresas
+        cur.execute("SELECT id, razao_social, nome_fantasia FROM empresas ORDER BY id")
+        empresas = [dict(r) for r in cur.fetchall()]
+
+        resumo = {'empresas': {}, 'global': {}}
+        tabelas_completas = set()
+        tabelas_com_erro = []
+        sequencia = 0
+
+        def exportar(zf, tabela, pasta, empresa_id, contagem):
+            nonlocal sequencia
+            if tabela not in estrutura:
+                zf.writestr(f"{pasta}/{tabela}_ERRO.txt", f'Tabela {tabela} não encontrada')
+                contagem[tabela] = 'ERRO: tabela não encontrada'
+                return
+            consulta, params, filtrada = _montar_consulta(tabela, estrutura[tabela], empresa_id, desde)
+            if desde and not filtrada:
+                tabelas_completas.add(tabela)
+            sequencia += 1
             try:
-                cur.execute(f"SELECT * FROM {tabela} ORDER BY id")
-                rows = [dict(r) for r in cur.fetchall()]
-                # Mascarar senhas
-                if tabela == 'usuarios':
-                    for row in rows:
-                        if 'password_hash' in row:
-                            row['password_hash'] = '*** REDACTED ***'
-                conteudo = json.dumps(rows, ensure_ascii=False, indent=2, default=_json_default)
-                zf.writestr(f"_global/{tabela}.json", conteudo)
-                resumo['global'][tabela] = len(rows)
+                contagem[tabela] = _exportar_tabela(conn, zf, f"{pasta}/{tabela}{extensao}",
+                                                    consulta, params, formato, sequencia)
             except Exception as e:
-                zf.writestr(f"_global/{tabela}_ERRO.txt", str(e))
-                resumo['global'][tabela] = f'ERRO: {e}'
-
-        total_registros = sum(
-            v for emp_tabs in resumo['empresas'].values()
-            for v in emp_tabs.values() if isinstance(v, int)
-        ) + sum(v for v in resumo['global'].values() if isinstance(v, int))
-
-        info = {
-            'gerado_em': agora.isoformat(),
-            'total_empresas': len(empresas),
-            'total_registros': total_registros,
-            'empresas': resumo['empresas'],
-            'global': resumo['global'],
-        }
-        zf.writestr('_resumo.json', json.dumps(info, ensure_ascii=False, indent=2))
-
-    cur.close()
-    conn.close()
-
-    zip_buffer.seek(0)
-    return zip_buffer.read(), nome_arquivo, info
+                zf.writestr(f"{pasta}/{tabela}_ERRO.txt", str(e))
+                contagem[tabela] = f'ERRO: {e}'
+                tabelas_com_erro.append(f"{pasta}/{tabela}")
+
+        with zipfile.ZipFile(destino, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+            # Dados por empresa
+            for posicao, empresa in enumerate(empresas):
+                eid = empresa['id']
+                nome_empresa = (empresa.get('razao_social') or empresa.get('nome_fantasia') or f'empresa_{eid}')
+                # Sanitizar nome para usar como pasta
+                nome_pasta = "".join(c if c.isalnum() or c in (' ', '_', '-') else '_' for c in nome_empresa)
+                pasta = f"empresa_{eid}_{nome_pasta}"
+                resumo['empresas'][pasta] = {}
+                if ao_progredir:
+                    ao_progredir(posicao, len(empresas) + 1, pasta)
+
+                for tabela in TABELAS_POR_EMPRESA:
+                    exportar(zf, tabela, pasta, eid, resumo['empresas'][pasta])
+
+            # Tabelas globais
+            if ao_progredir:
+                ao_progredir(len(empresas), len(empresas) + 1, '_global')
+            for tabela in TABELAS_GLOBAIS:
+                exportar(zf, tabela, '_global', None, resumo['global'])
+
+            total_registros = sum(
+                v for emp_tabs in resumo['empresas'].values()
+                for v in emp_tabs.values() if isinstance(v, int)
+            ) + sum(v for v in resumo['global'].values() if isinstance(v, int))
+
+            info = {
+                'nome_arquivo': nome_arquivo_backup(agora, modo == 'incremental'),
+                'gerado_em': agora.isoformat(),
+                'modo': modo,
+                'formato': formato,
+                'marca_dagua': marca_dagua.isoformat(),
+                'alteracoes_desde': desde.isoformat() if desde else None,
+                'tabelas_sem_coluna_alteracao': sorted(tabelas_completas),
+                'tabelas_com_erro': tabelas_com_erro,
+                'total_empresas': len(empresas),
+                'total_registros': total_registros,
+                'empresas': resumo['empresas'],
+                'global': resumo['global'],
+            }
+            zf.writestr('_resumo.json', json.dumps(info, ensure_ascii=False, indent=2))
+
+        conn.commit()
+
+        # Registrar a marca d'água só depois do ZIP completo e sem tabela com
+        # erro: senão o próximo incremental pularia as alterações dela
+        if not tabelas_com_erro:
+            conn.set_session(readonly=False, autocommit=True)
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO backup_execucoes (modo, formato, marca_dagua, desde, arquivo, total_registros)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, (modo, formato, marca_dagua, desde, info['nome_arquivo'], total_registros))
+            cur.close()
+    finally:
+        conn.close()
+
+    return info
+
+
+def gerar_backup_temporario(formato='jsonl', incremental=False):
+    """
+    Gera o backup num arquivo temporário (apagado ao ser fechado), para
+    devolver como download sem montar o ZIP em memória.
+
+    Retorna (arquivo_posicionado_no_inicio, nome_do_arquivo, info_resumo).
+    """
+    arquivo = tempfile.TemporaryFile()
+    try:
+        info = gerar_backup_arquivo(arquivo, formato=formato, incremental=incremental)
+    except Exception:
+        arquivo.close()
+        raise
+    arquivo.seek(0)
+    return arquivo, info['nome_arquivo'], info
@@ -0,0 +1,350 @@
+"""
+🗄️ Cache Compartilhado entre Workers
+====================================
+
+Backend do cache_manager que guarda as entradas fora do processo, em um
+diretório de memória compartilhada (/dev/shm), visível a todos os workers
+gunicorn e aos serviços app_fiscal / app_nfe / app_nfse do mesmo host.
+
+    - Entradas: um arquivo por chave (pickle de empresa_id, expiração,
+      momento do cálculo, tags e valor), gravado de forma atômica (os.replace)
+    - Tags: toda entrada carrega a tag empresa:{id} (+ tags extras da função);
+      invalidar uma tag grava o instante da invalidação, e toda entrada
+      calculada antes dele passa a ser MISS em todos os processos; uma tag
+      extra também pode ser invalidada em todas as empresas de uma vez
+    - Estatísticas: cada processo publica seus contadores em stats/;
+      get_stats() soma os de todos os processos vivos
+    - Segurança: um diretório por usuário (dwm_cache-<uid>), recusado se
+      não for do usuário ou se grupo/outros tiverem acesso - as entradas
+      são lidas com pickle
+
+Mesma interface do LRUCache. Para trocar por um sidecar (Redis, memcached...)
+aponte CACHE_BACKEND para uma classe compatível ("modulo:Classe").
+
+Data: 16/10/2026
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import stat
+import tempfile
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from cache_manager import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Tag invalidada por invalidate_all()
+TAG_GLOBAL = '*'
+
+
+def diretorio_padrao() -> str:
+    """/dev/shm/dwm_cache-<uid> (tmpfs) quando existir; senão o diretório temporário"""
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    sufixo = f'-{os.getuid()}' if hasattr(os, 'getuid') else ''
+    return os.path.join(base, f'dwm_cache{sufixo}')
+
+
+def _diretorio_privado(caminho: str):
+    """
+    Cria (0700) ou valida um diretório do cache
+
+    Quem consegue gravar no diretório consegue executar código nos processos
+    que leem as entradas (pickle). Diretório existente só é aceito se for um
+    diretório de verdade (não link simbólico), do próprio usuário e sem
+    permissão para grupo/outros; senão PermissionError.
+    """
+    os.makedirs(caminho, mode=0o700, exist_ok=True)
+    if os.name != 'posix':
+        return
+    info = os.lstat(caminho)
+    if not stat.S_ISDIR(info.st_mode):
+        raise PermissionError(f"{caminho} não é um diretório")
+    if info.st_uid != os.getuid():
+        raise PermissionError(f"{caminho} pertence ao uid {info.st_uid}, não ao uid {os.getuid()}")
+    if info.st_mode & 0o077:
+        raise PermissionError(f"{caminho} acessível por outros usuários (modo {stat.S_IMODE(info.st_mode):o})")
+
+
+def _gravar_atomico(caminho: str, dados: bytes):
+    """Grava em arquivo temporário e troca de uma vez (leitor nunca vê meio arquivo)"""
+    fd, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(dados)
+        os.replace(temporario, caminho)
+    except BaseException:
+        try:
+            os.unlink(temporario)
+        except OSError:
+            pass
+        raise
+
+
+def _processo_vivo(pid: int) -> bool:
+    if os.name != 'posix':
+        return True  # os.kill no Windows encerraria o processo
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class CacheCompartilhado(LRUCache):
+    """
+    Cache com isolamento por empresa armazenado em memória compartilhada
+
+    Args:
+        diretorio: Diretório das entradas (padrão: diretorio_padrao())
+        max_size: Número aproximado de entradas mantidas (as mais antigas saem)
+        default_ttl: Tempo de vida padrão em segundos
+    """
+
+    # A cada N gravações verifica o tamanho do cache
+    VERIFICAR_TAMANHO_A_CADA = 64
+    # Intervalo mínimo entre publicações das estatísticas deste processo
+    PUBLICAR_STATS_A_CADA = 1.0  # segundos
+
+    def __init__(self, diretorio: Optional[str] = None, max_size: int = 1000, default_ttl: int = 300):
+        super().__init__(max_size=max_size, default_ttl=default_ttl)
+        self.diretorio = diretorio or diretorio_padrao()
+        self._dir_entradas = os.path.join(self.diretorio, 'entradas')
+        self._dir_tags = os.path.join(self.diretorio, 'tags')
+        self._dir_stats = os.path.join(self.diretorio, 'stats')
+        for caminho in (self.diretorio, self._dir_entradas, self._dir_tags, self._dir_stats):
+            _diretorio_privado(caminho)
+
+        self._arquivo_stats = os.path.join(self._dir_stats, f'{os.getpid()}-{id(self):x}.json')
+        self._gravacoes = 0
+        self._stats_publicadas_em = 0.0
+
+        logger.info(f"✅ Cache compartilhado em {self.diretorio}: max_size={max_size}, default_ttl={default_ttl}s")
+
+    # ------------------------------------------------------------------
+    # Tags
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _tags_da_entrada(empresa_id: int, tags: Iterable[str] = ()) -> Tuple[str, ...]:
+        tags = tuple(tags)
+        return ((TAG_GLOBAL, f'empresa:{empresa_id}')
+                + tuple(f'empresa:{empresa_id}:{t}' for t in tags)
+                + tuple(f'*:{t}' for t in tags))
+
+    def _arquivo_tag(self, tag: str) -> str:
+        return os.path.join(self._dir_tags, hashlib.md5(tag.encode('utf-8')).hexdigest())
+
+    def _invalidada_em(self, tag: str) -> float:
+        """Instante da última invalidação da tag (0 se nunca)"""
+        try:
+            with open(self._arquivo_tag(tag), 'rb') as f:
+                return float(f.read() or 0)
+        except (OSError, ValueError):
+            return 0.0
+
+    def invalidate_tag(self, tag: str):
+        """Invalida a tag em todos os processos que compartilham o diretório"""
+        _gravar_atomico(self._arquivo_tag(tag), repr(time.time()).encode('ascii'))
+
+    # ------------------------------------------------------------------
+    # Interface do LRUCache
+    # ------------------------------------------------------------------
+
+    def get(self, empresa_id: int, func_name: str, args: tuple, kwargs: dict) -> Tuple[bool, Any]:
+        key = self._generate_key(empresa_id, func_name, args, kwargs)
+        caminho = os.path.join(self._dir_entradas, key)
+
+        entrada = None
+        try:
+            with open(caminho, 'rb') as f:
+                entrada = pickle.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.debug(f"⚠️  Cache: entrada ilegível removida ({e})")
+            self._remover(caminho)
+
+        valido = False
+        if entrada is not None:
+            dono, expiration_time, calculado_em, tags, value = entrada
+            valido = (
+                dono == empresa_id  # 🔒 nunca entrega entrada de outra empresa
+                and time.time() <= expiration_time
+                and all(self._invalidada_em(tag) < calculado_em for tag in tags)
+            )
+            if not valido:
+                self._remover(caminho)
+
+        with self.lock:
+            stats = self._get_stats(empresa_id)
+            if valido:
+                stats.hit()
+            else:
+                stats.miss()
+        self._publicar_stats()
+
+        if valido:
+            logger.debug(f"✅ Cache HIT: empresa={empresa_id}, func={func_name}")
+            return True, value
+        logger.debug(f"❌ Cache MISS: empresa={empresa_id}, func={func_name}")
+        return False, None
+
+    def set(self, empresa_id: int, func_name: str, args: tuple, kwargs: dict,
+            value: Any, ttl: Optional[int] = None, tags: Iterable[str] = (),
+            inicio: Optional[float] = None):
+        key = self._generate_key(empresa_id, func_name, args, kwargs)
+        ttl = ttl or self.default_ttl
+        agora = time.time()
+        entrada = (empresa_id, agora + ttl, inicio or agora,
+                   self._tags_da_entrada(empresa_id, tags), value)
+        try:
+            dados = pickle.dumps(entrada, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.debug(f"⚠️  Cache: valor de {func_name} não serializável, não cacheado ({e})")
+            return
+
+        _gravar_atomico(os.path.join(self._dir_entradas, key), dados)
+        logger.debug(f"💾 Cache SET: empresa={empresa_id}, func={func_name}, ttl={ttl}s")
+
+        with self.lock:
+            self._gravacoes += 1
+            verificar = self._gravacoes % self.VERIFICAR_TAMANHO_A_CADA == 0
+        if verificar:
+            self._limitar_tamanho()
+
+    def invalidate_empresa(self, empresa_id: Optional[int], tag: Optional[str] = None):
+        if empresa_id is None:
+            # A tag em todas as empresas
+            self.invalidate_tag(f'*:{tag}' if tag else TAG_GLOBAL)
+            logger.info(f"🗑️  Cache INVALIDADO: todas as empresas, tag={tag or '*'}")
+            return
+        self.invalidate_tag(f'empresa:{empresa_id}:{tag}' if tag else f'empresa:{empresa_id}')
+        with self.lock:
+            self._get_stats(empresa_id).invalidate()
+        self._publicar_stats()
+        logger.info(f"🗑️  Cache INVALIDADO: empresa={empresa_id}, tag={tag or '*'}")
+
+    def invalidate_all(self):
+        self.invalidate_tag(TAG_GLOBAL)
+        logger.warning("🗑️  Cache TOTALMENTE INVALIDADO (todos os processos)")
+
+    def cleanup_expired(self) -> int:
+        agora = time.time()
+        removidas = 0
+        for item in self._listar_entradas():
+            try:
+                with open(item.path, 'rb') as f:
+                    expiration_time = pickle.load(f)[1]
+            except Exception:
+                expiration_time = 0
+            if agora > expiration_time:
+                self._remover(item.path)
+                removidas += 1
+        if removidas:
+            logger.info(f"🧹 Cache CLEANUP: {removidas} itens expirados removidos")
+        return removidas
+
+    def get_stats(self, empresa_id: Optional[int] = None) -> Dict[str, Any]:
+        """Estatísticas somadas de todos os processos que usam o diretório"""
+        self._publicar_stats(forcar=True)
+
+        por_empresa: Dict[str, Dict[str, int]] = {}
+        workers = 0
+        for item in os.scandir(self._dir_stats):
+            if not item.name.endswith('.json'):
+                continue
+            pid = int(item.name.split('-', 1)[0])
+            if not _processo_vivo(pid):
+                self._remover(item.path)
+                continue
+            try:
+                with open(item.path, 'r', encoding='utf-8') as f:
+                    publicado = json.load(f)
+            except (OSError, ValueError):
+                continue
+            workers += 1
+            for emp_id, contadores in publicado.items():
+                total = por_empresa.setdefault(emp_id, {'hits': 0, 'misses': 0, 'invalidations': 0})
+                for nome in total:
+                    total[nome] += contadores.get(nome, 0)
+
+        def resumo(contadores):
+            consultas = contadores['hits'] + contadores['misses']
+            return {
+                **contadores,
+                'total_queries': consultas,
+                'hit_rate': round(contadores['hits'] / consultas * 100, 2) if consultas else 0.0
+            }
+
+        if empresa_id is not None:
+            contadores = por_empresa.get(str(empresa_id), {'hits': 0, 'misses': 0, 'invalidations': 0})
+            return {'empresa_id': empresa_id, **resumo(contadores)}
+
+        geral = {'hits': 0, 'misses': 0, 'invalidations': 0}
+        for contadores in por_empresa.values():
+            for nome in geral:
+                geral[nome] += contadores[nome]
+
+        return {
+            'backend': 'compartilhado',
+            'diretorio': self.diretorio,
+            'workers': workers,
+            'total_empresas': len(por_empresa),
+            'cache_size': sum(1 for _ in self._listar_entradas()),
+            'max_size': self.max_size,
+            **resumo(geral),
+            'per_empresa': {int(emp_id): resumo(c) for emp_id, c in por_empresa.items()}
+        }
+
+    # ------------------------------------------------------------------
+    # Internos
+    # ------------------------------------------------------------------
+
+    def _listar_entradas(self):
+        return (item for item in os.scandir(self._dir_entradas) if not item.name.startswith('.'))
+
+    @staticmethod
+    def _remover(caminho: str):
+        try:
+            os.unlink(caminho)
+        except OSError:
+            pass
+
+    def _limitar_tamanho(self):
+        """Remove as entradas mais antigas quando o cache passa de max_size"""
+        entradas = []
+        for item in self._listar_entradas():
+            try:
+                entradas.append((item.stat().st_mtime, item.path))
+            except OSError:
+                pass
+        excesso = len(entradas) - self.max_size
+        if excesso <= 0:
+            return
+        entradas.sort()
+        for _, caminho in entradas[:excesso]:
+            self._remover(caminho)
+        logger.debug(f"🗑️  Cache LRU: {excesso} itens mais antigos removidos")
+
+    def _publicar_stats(self, forcar: bool = False):
+        """Grava os contadores deste processo para agregação em get_stats()"""
+        agora = time.time()
+        with self.lock:
+            if not forcar and agora - self._stats_publicadas_em < self.PUBLICAR_STATS_A_CADA:
+                return
+            self._stats_publicadas_em = agora
+            dados = {
+                str(emp_id): {'hits': s.hits, 'misses': s.misses, 'invalidations': s.invalidations}
+                for emp_id, s in self.stats_per_empresa.items()
+            }
+        try:
+            _gravar_atomico(self._arquivo_stats, json.dumps(dados).encode('utf-8'))
+        except OSError as e:
+            logger.debug(f"⚠️  Cache: estatísticas não publicadas ({e})")
@@ -0,0 +1,159 @@
+"""
+♻️ Invalidação do Cache por Escrita no Banco
+============================================
+
+As funções cacheadas de database_postgresql (@cached) dependem de tabelas.
+Em vez de cada método de escrita lembrar de chamar invalidate_cache, as
+conexões do pool (ConexaoRastreada) observam os comandos executados:
+
+    - INSERT / UPDATE / DELETE / TRUNCATE em uma tabela de DEPENDENCIAS_CACHE
+      é anotado pela conexão
+    - no commit (ou logo após o comando, em autocommit) as funções
+      dependentes são invalidadas; rollback descarta as anotações
+
+A empresa invalidada é a da conexão (get_db_connection(empresa_id=...)).
+Conexões sem empresa (DatabaseManager.get_connection, allow_global) podem
+alterar linhas de qualquer empresa: a função é invalidada em todas.
+
+Data: 16/10/2026
+"""
+
+import logging
+import re
+from typing import Dict, Optional, Set, Tuple
+
+from psycopg2 import extensions  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+
+# Tabela -> funções cacheadas (@cached) que leem a tabela.
+# Ao cachear uma nova função, registre aqui as tabelas de que ela depende.
+DEPENDENCIAS_CACHE: Dict[str, Tuple[str, ...]] = {
+    'contas_bancarias': ('listar_contas',),
+    'categorias': ('listar_categorias',),
+    'clientes': ('listar_clientes',),
+}
+
+_RE_ESCRITA = re.compile(
+    r'\b(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM|TRUNCATE(?:\s+TABLE)?)\s+(?:ONLY\s+)?(?:"?\w+"?\.)?"?(\w+)"?',
+    re.IGNORECASE
+)
+
+
+def tabelas_escritas(sql: str) -> Set[str]:
+    """Tabelas de DEPENDENCIAS_CACHE alteradas pelo comando SQL"""
+    return {tabela.lower() for tabela in _RE_ESCRITA.findall(sql)} & DEPENDENCIAS_CACHE.keys()
+
+
+def invalidar_tabelas(empresa_id: Optional[int], tabelas: Set[str]):
+    """
+    Invalida as funções cacheadas que dependem das tabelas
+
+    Args:
+        empresa_id: Empresa afetada (None = todas as empresas)
+        tabelas: Tabelas alteradas
+    """
+    try:
+        from cache_manager import invalidate_cache
+    except ImportError:
+        return
+    funcoes = {funcao for tabela in tabelas for funcao in DEPENDENCIAS_CACHE.get(tabela, ())}
+    for funcao in sorted(funcoes):
+        try:
+            invalidate_cache(empresa_id, tag=funcao)
+        except Exception as e:
+            logger.warning(f"⚠️  Falha ao invalidar cache de {funcao} (empresa={empresa_id}): {e}")
+
+
+def marcar_empresa_conexao(conn, empresa_id: Optional[int]):
+    """Define a empresa das escritas feitas pela conexão (None = desconhecida)"""
+    conn = getattr(conn, '_conn', conn)
+    if isinstance(conn, ConexaoRastreada):
+        conn.empresa_id = empresa_id
+
+
+def _texto_sql(query, conn) -> str:
+    if isinstance(query, str):
+        return query
+    if isinstance(query, bytes):
+        return query.decode('utf-8', 'ignore')
+    try:
+        return query.as_string(conn)  # psycopg2.sql.Composed
+    except Exception:
+        return ''
+
+
+class _CursorRastreado:
+    """Mixin de cursor: informa à conexão os comandos executados com sucesso"""
+
+    def execute(self, query, vars=None):
+        resultado = super().execute(query, vars)
+        self.connection._anotar_escrita(query)
+        return resultado
+
+    def executemany(self, query, vars_list):
+        resultado = super().executemany(query, vars_list)
+        self.connection._anotar_escrita(query)
+        return resultado
+
+
+_fabricas_rastreadas: Dict[type, type] = {}
+
+
+def _fabrica_rastreada(fabrica: type) -> type:
+    if issubclass(fabrica, _CursorRastreado):
+        return fabrica
+    rastreada = _fabricas_rastreadas.get(fabrica)
+    if rastreada is None:
+        rastreada = type(f'{fabrica.__name__}Rastreado', (_CursorRastreado, fabrica), {})
+        _fabricas_rastreadas[fabrica] = rastreada
+    return rastreada
+
+
+class ConexaoRastreada(extensions.connection):
+    """
+    Conexão psycopg2 que invalida o cache das tabelas alteradas
+
+    Usada como connection_factory do pool; todo cursor criado (inclusive com
+    cursor_factory explícito) passa a anotar as escritas.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.empresa_id = None
+        self._tabelas_pendentes: Set[str] = set()
+
+    def cursor(self, *args, **kwargs):
+        fabrica = kwargs.get('cursor_factory') or self.cursor_factory or extensions.cursor
+        kwargs['cursor_factory'] = _fabrica_rastreada(fabrica)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self):
+        super().commit()
+        self._emitir()
+
+    def rollback(self):
+        super().rollback()
+        self._tabelas_pendentes.clear()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        resultado = super().__exit__(exc_type, exc_value, traceback)
+        if exc_type is None:
+            self._emitir()
+        else:
+            self._tabelas_pendentes.clear()
+        return resultado
+
+    def _anotar_escrita(self, query):
+        tabelas = tabelas_escritas(_texto_sql(query, self))
+        if not tabelas:
+            return
+        self._tabelas_pendentes |= tabelas
+        if self.autocommit:
+            self._emitir()
+
+    def _emitir(self):
+        if self._tabelas_pendentes:
+            tabelas, self._tabelas_pendentes = self._tabelas_pendentes, set()
+            invalidar_tabelas(self.empresa_id, tabelas)
@@ -13,6 +13,8 @@ FUNCIONALIDADES:
     - Thread-safe para ambientes multi-thread
     - Métricas de hit/miss rate
     - Warm-up de cache na inicialização
+    - Backend plugável (CACHE_BACKEND): memória do processo ou compartilhado
+      entre workers (cache_compartilhado.py), com invalidação por tag
 
 SEGURANÇA:
     - ✅ Chaves SEMPRE incluem empresa_id
@@ -29,7 +31,9 @@ PERFORMANCE:
 
 import functools
 import hashlib
+import importlib
 import json
+import os
 import time
 from collections import OrderedDict
 from datetime import datetime, timedelta
@@ -113,6 +117,7 @@ class LRUCache:
         self.cache: OrderedDict = OrderedDict()
         self.lock = Lock()
         self.stats_per_empresa: Dict[int, CacheStats] = {}
+        self._invalidado_em: Dict[Optional[int], float] = {}  # empresa_id (None = todas) -> última invalidação
         
         logger.info(f"✅ Cache LRU inicializado: max_size={max_size}, default_ttl={default_ttl}s")
     
@@ -175,7 +180,7 @@ class LRUCache:
                 return False, None
             
             # Verifica validade (TTL)
-            value, expiration_time = self.cache[key]
+            value, expiration_time, _, _ = self.cache[key]
             if time.time() > expiration_time:
                 # Cache expirado
                 del self.cache[key]
@@ -190,7 +195,8 @@ class LRUCache:
             return True, value
     
     def set(self, empresa_id: int, func_name: str, args: tuple, kwargs: dict, 
-            value: Any, ttl: Optional[int] = None):
+            value: Any, ttl: Optional[int] = None, tags: tuple = (),
+            inicio: Optional[float] = None):
         """
         Armazena valor no cache
         
@@ -201,53 +207,64 @@ class LRUCache:
             kwargs: Argumentos nomeados
             value: Valor a ser armazenado
             ttl: Tempo de vida em segundos (usa default se None)
+            tags: Tags extras da entrada (invalidáveis por empresa)
+            inicio: Momento em que o valor começou a ser calculado; valor
+                calculado antes de uma invalidação da empresa não é gravado
         """
         key = self._generate_key(empresa_id, func_name, args, kwargs)
         ttl = ttl or self.default_ttl
         expiration_time = time.time() + ttl
         
         with self.lock:
+            invalidado_em = max(self._invalidado_em.get(empresa_id, 0), self._invalidado_em.get(None, 0))
+            if inicio is not None and inicio <= invalidado_em:
+                logger.debug(f"⏭️  Cache SET ignorado (invalidado durante o cálculo): empresa={empresa_id}")
+                return
+            
             # Remove mais antigo se atingiu tamanho máximo
             if len(self.cache) >= self.max_size and key not in self.cache:
                 oldest_key = next(iter(self.cache))
                 del self.cache[oldest_key]
                 logger.debug(f"🗑️  Cache LRU: removido item mais antigo")
             
-            self.cache[key] = (value, expiration_time)
+            self.cache[key] = (value, expiration_time, empresa_id, frozenset(tags))
             self.cache.move_to_end(key)
             logger.debug(f"💾 Cache SET: empresa={empresa_id}, func={func_name}, ttl={ttl}s")
     
-    def invalidate_empresa(self, empresa_id: int):
+    def invalidate_empresa(self, empresa_id: Optional[int], tag: Optional[str] = None):
         """
-        Invalida TODO o cache de uma empresa específica
+        Invalida o cache de uma empresa específica
         
         Args:
-            empresa_id: ID da empresa
+            empresa_id: ID da empresa (None = a tag em todas as empresas)
+            tag: Se informada, invalida só as entradas da empresa com esta tag
         """
-        prefix = f"empresa:{empresa_id}"
-        stats = self._get_stats(empresa_id)
+        if empresa_id is None and tag is None:
+            self.invalidate_all()
+            return
         
         with self.lock:
-            # Identifica chaves da empresa
-            keys_to_delete = []
-            for key in self.cache.keys():
-                # Recria chave original para verificar empresa
-                # (simplificado: assume que todas as chaves incluem empresa_id)
-                if prefix in str(key):
-                    keys_to_delete.append(key)
+            # As chaves são hashes: a empresa fica guardada na própria entrada
+            keys_to_delete = [
+                key for key, (_, _, dono, tags) in self.cache.items()
+                if (empresa_id is None or dono == empresa_id) and (tag is None or tag in tags)
+            ]
             
             # Remove chaves
             for key in keys_to_delete:
+                self._get_stats(self.cache[key][2]).invalidate()
                 del self.cache[key]
-                stats.invalidate()
             
-            logger.info(f"🗑️  Cache INVALIDADO: empresa={empresa_id}, itens={len(keys_to_delete)}")
+            self._invalidado_em[empresa_id] = time.time()
+            
+            logger.info(f"🗑️  Cache INVALIDADO: empresa={empresa_id}, tag={tag or '*'}, itens={len(keys_to_delete)}")
     
     def invalidate_all(self):
         """Invalida TODO o cache (todas as empresas)"""
         with self.lock:
             count = len(self.cache)
             self.cache.clear()
+            self._invalidado_em[None] = time.time()
             logger.warning(f"🗑️  Cache TOTALMENTE INVALIDADO: {count} itens removidos")
     
     def get_stats(self, empresa_id: Optional[int] = None) -> Dict[str, Any]:
@@ -269,6 +286,7 @@ class LRUCache:
         
         # Estatísticas gerais
         total_stats = {
+            'backend': 'memoria',
             'total_empresas': len(self.stats_per_empresa),
             'cache_size': len(self.cache),
             'max_size': self.max_size,
@@ -278,15 +296,24 @@ class LRUCache:
         for emp_id, stats in self.stats_per_empresa.items():
             total_stats['per_empresa'][emp_id] = stats.to_dict()
         
+        hits = sum(s.hits for s in self.stats_per_empresa.values())
+        misses = sum(s.misses for s in self.stats_per_empresa.values())
+        total_stats.update({
+            'workers': 1,
+            'hits': hits,
+            'misses': misses,
+            'invalidations': sum(s.invalidations for s in self.stats_per_empresa.values()),
+            'hit_rate': round(hits / (hits + misses) * 100, 2) if hits + misses else 0.0
+        })
         return total_stats
     
-    def cleanup_expired(self):
-        """Remove entradas expiradas do cache"""
+    def cleanup_expired(self) -> int:
+        """Remove entradas expiradas do cache (retorna quantas saíram)"""
         with self.lock:
             current_time = time.time()
             keys_to_delete = []
             
-            for key, (value, expiration_time) in self.cache.items():
+            for key, (value, expiration_time, _, _) in self.cache.items():
                 if current_time > expiration_time:
                     keys_to_delete.append(key)
             
@@ -295,13 +322,43 @@ class LRUCache:
             
             if keys_to_delete:
                 logger.info(f"🧹 Cache CLEANUP: {len(keys_to_delete)} itens expirados removidos")
+            return len(keys_to_delete)
+
+
+def criar_cache_global(max_size: int = 1000, default_ttl: int = 300) -> LRUCache:
+    """
+    Cria o cache global conforme a variável CACHE_BACKEND
+    
+        'compartilhado' (padrão): entradas em memória compartilhada, vistas e
+            invalidadas por todos os workers do host (CACHE_DIR opcional);
+            diretório inseguro ou indisponível cai para o cache em memória
+        'memoria': LRUCache do próprio processo
+        'modulo:Classe': backend externo com a interface do LRUCache
+            (ex.: cliente de um sidecar)
+    """
+    backend = os.getenv('CACHE_BACKEND', 'compartilhado').strip()
+    
+    if backend == 'memoria':
+        return LRUCache(max_size=max_size, default_ttl=default_ttl)
+    
+    if backend == 'compartilhado':
+        try:
+            from cache_compartilhado import CacheCompartilhado
+            return CacheCompartilhado(os.getenv('CACHE_DIR') or None,
+                                      max_size=max_size, default_ttl=default_ttl)
+        except (OSError, ImportError) as e:
+            logger.warning(f"⚠️  Cache compartilhado indisponível ({e}) - usando cache em memória")
+            return LRUCache(max_size=max_size, default_ttl=default_ttl)
+    
+    modulo, _, classe = backend.partition(':')
+    return getattr(importlib.import_module(modulo), classe)(max_size=max_size, default_ttl=default_ttl)
 
 
 # Instância global do cache
-_global_cache = LRUCache(max_size=1000, default_ttl=300)
+_global_cache = criar_cache_global(max_size=1000, default_ttl=300)
 
 
-def cached(ttl: int = 300, cache_instance: Optional[LRUCache] = None):
+def cached(ttl: int = 300, cache_instance: Optional[LRUCache] = None, tags: tuple = ()):
     """
     Decorator para cachear resultados de funções com empresa_id
     
@@ -310,6 +367,8 @@ def cached(ttl: int = 300, cache_instance: Optional[LRUCache] = None):
     Args:
         ttl: Tempo de vida do cache em segundos (padrão: 300s = 5min)
         cache_instance: Instância customizada do cache (usa global se None)
+        tags: Tags extras das entradas; o nome da função é sempre uma tag
+            (invalidate_cache(empresa_id, tag=func.__name__))
     
     Example:
         ```python
@@ -328,6 +387,8 @@ def cached(ttl: int = 300, cache_instance: Optional[LRUCache] = None):
     cache = cache_instance or _global_cache
     
     def decorator(func: Callable) -> Callable:
+        tags_entrada = (func.__name__,) + tuple(tags)
+        
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
             # Extrai empresa_id (deve ser primeiro argumento ou kwarg)
@@ -355,6 +416,7 @@ def cached(ttl: int = 300, cache_instance: Optional[LRUCache] = None):
                 return cached_value
             
             # Executa função e armazena no cache
+            inicio = time.time()
             result = func(*args, **kwargs)
             cache.set(
                 empresa_id=empresa_id,
@@ -362,25 +424,28 @@ def cached(ttl: int = 300, cache_instance: Optional[LRUCache] = None):
                 args=args,
                 kwargs=kwargs,
                 value=result,
-                ttl=ttl
+                ttl=ttl,
+                tags=tags_entrada,
+                inicio=inicio
             )
             
             return result
         
         # Adiciona método para invalidar cache desta função
-        wrapper.invalidate_cache = lambda empresa_id: cache.invalidate_empresa(empresa_id)
+        wrapper.invalidate_cache = lambda empresa_id, tag=None: cache.invalidate_empresa(empresa_id, tag)
         
         return wrapper
     
     return decorator
 
 
-def invalidate_cache(empresa_id: int):
+def invalidate_cache(empresa_id: Optional[int], tag: Optional[str] = None):
     """
-    Invalida todo o cache de uma empresa
+    Invalida o cache de uma empresa (em todos os workers, no backend compartilhado)
     
     Args:
-        empresa_id: ID da empresa
+        empresa_id: ID da empresa (None com tag = a tag em todas as empresas)
+        tag: Se informada, invalida só as entradas da empresa com esta tag
     
     Example:
         ```python
@@ -388,7 +453,7 @@ def invalidate_cache(empresa_id: int):
         invalidate_cache(empresa_id=1)
         ```
     """
-    _global_cache.invalidate_empresa(empresa_id)
+    _global_cache.invalidate_empresa(empresa_id, tag)
 
 
 def get_cache_stats(empresa_id: Optional[int] = None) -> Dict[str, Any]:
@@ -404,9 +469,14 @@ def get_cache_stats(empresa_id: Optional[int] = None) -> Dict[str, Any]:
     return _global_cache.get_stats(empresa_id)
 
 
-def cleanup_expired_cache():
+def cleanup_expired_cache() -> int:
     """Remove entradas expiradas do cache"""
-    _global_cache.cleanup_expired()
+    return _global_cache.cleanup_expired()
+
+
+def get_cache_backend() -> LRUCache:
+    """Cache global (backend de CACHE_BACKEND), para outros módulos de cache"""
+    return _global_cache
 
 
 def reset_cache():
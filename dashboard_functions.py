@@ -51,21 +51,20 @@ def gerar_dashboard_gerencial(
         primeiro_dia_mes = data_referencia.replace(day=1)
         ultimo_dia_mes = data_referencia.replace(day=monthrange(data_referencia.year, data_referencia.month)[1])
         
-        # Gerar DRE do mês atual
-        from relatorios_contabeis_functions import gerar_dre
-        dre_mes = gerar_dre(
+        # DRE dos últimos 12 meses (inclui o mês atual e o anterior) em uma única leitura
+        from relatorios_contabeis_functions import gerar_evolucao_mensal_dre, resumir_mes_dre
+        evolucao = gerar_evolucao_mensal_dre(
             conn=conn,
             empresa_id=empresa_id,
-            data_inicio=primeiro_dia_mes,
-            data_fim=ultimo_dia_mes,
-            versao_plano_id=versao_plano_id,
-            comparar_periodo_anterior=False
+            mes_inicio=primeiro_dia_mes - relativedelta(months=11),
+            mes_fim=primeiro_dia_mes,
+            versao_plano_id=versao_plano_id
         )
         
-        if not dre_mes['success']:
-            return dre_mes
+        if not evolucao['success']:
+            return evolucao
         
-        dre = dre_mes['dre']
+        dre = evolucao['meses'][-1]['dre']
         
         # KPIs do mês
         receita_mes = dre['receita_bruta']['total']
@@ -117,31 +116,7 @@ def gerar_dashboard_gerencial(
         receitas_por_categoria = sorted(receitas_detalhadas, key=lambda x: x['valor'], reverse=True)[:10]
         
         # ===== EVOLUÇÃO MENSAL (últimos 12 meses para gráficos) =====
-        evolucao_mensal = []
-        
-        for i in range(11, -1, -1):  # 12 meses (de 11 meses atrás até o mês atual)
-            mes_ref = primeiro_dia_mes - relativedelta(months=i)
-            ultimo_dia = mes_ref.replace(day=monthrange(mes_ref.year, mes_ref.month)[1])
-            
-            dre_mensal = gerar_dre(
-                conn=conn,
-                empresa_id=empresa_id,
-                data_inicio=mes_ref,
-                data_fim=ultimo_dia,
-                versao_plano_id=versao_plano_id,
-                comparar_periodo_anterior=False
-            )
-            
-            if dre_mensal['success']:
-                dre_m = dre_mensal['dre']
-                evolucao_mensal.append({
-                    'mes': mes_ref.strftime('%m/%Y'),
-                    'mes_nome': mes_ref.strftime('%b/%Y'),
-                    'receita': dre_m['receita_bruta']['total'],
-                    'despesas': dre_m['custos']['total'] + dre_m['despesas_operacionais']['total'],
-                    'lucro_liquido': dre_m['lucro_liquido']['total'],
-                    'margem': dre_m['lucro_liquido']['percentual']
-                })
+        evolucao_mensal = [resumir_mes_dre(item['mes'], item['dre']) for item in evolucao['meses']]
         
         # ===== PONTO DE EQUILÍBRIO =====
         # Ponto de Equilíbrio = Custos Fixos / Margem de Contribuição (%)
@@ -160,32 +135,17 @@ def gerar_dashboard_gerencial(
         
         # ===== INDICADORES ADICIONAIS =====
         # Comparação com mês anterior
-        mes_anterior = primeiro_dia_mes - relativedelta(months=1)
-        ultimo_dia_anterior = mes_anterior.replace(day=monthrange(mes_anterior.year, mes_anterior.month)[1])
-        
-        dre_anterior = gerar_dre(
-            conn=conn,
-            empresa_id=empresa_id,
-            data_inicio=mes_anterior,
-            data_fim=ultimo_dia_anterior,
-            versao_plano_id=versao_plano_id,
-            comparar_periodo_anterior=False
-        )
+        dre_ant = evolucao['meses'][-2]['dre']
         
         variacao_receita = 0
         variacao_lucro = 0
-        receita_anterior = 0
-        lucro_anterior = 0
-        
-        if dre_anterior['success']:
-            dre_ant = dre_anterior['dre']
-            receita_anterior = dre_ant['receita_bruta']['total']
-            lucro_anterior = dre_ant['lucro_liquido']['total']
-            
-            if receita_anterior > 0:
-                variacao_receita = ((receita_mes - receita_anterior) / receita_anterior) * 100
-            if lucro_anterior != 0:
-                variacao_lucro = ((lucro_liquido_mes - lucro_anterior) / abs(lucro_anterior)) * 100
+        receita_anterior = dre_ant['receita_bruta']['total']
+        lucro_anterior = dre_ant['lucro_liquido']['total']
+        
+        if receita_anterior > 0:
+            variacao_receita = ((receita_mes - receita_anterior) / receita_anterior) * 100
+        if lucro_anterior != 0:
+            variacao_lucro = ((lucro_liquido_mes - lucro_anterior) / abs(lucro_anterior)) * 100
         
         return {
             'success': True,
@@ -7,9 +7,10 @@ import psycopg2  # type: ignore
 from psycopg2 import Error, sql, pool, errors, OperationalError, InterfaceError  # type: ignore
 from psycopg2.extras import RealDictCursor  # type: ignore
 from datetime import datetime, date
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from decimal import Decimal
 from enum import Enum
+import base64
 import json
 import os
 import sys
@@ -73,6 +74,24 @@ except ImportError:
         pass
 
 
+# 🎯 Matcher compilado (Aho-Corasick) das regras de auto-conciliação
+from regras_conciliacao_matcher import obter_matcher, invalidar_matcher
+
+# 🔐 Cache curto de sessões e permissões (auth_middleware)
+from auth_cache import (
+    obter_sessao as obter_sessao_cache,
+    invalidar_sessao_cache,
+    invalidar_usuario_cache,
+    invalidar_empresa_cache
+)
+
+# 🚦 Pool com fila justa, quota por empresa e métricas
+from pool_conexoes import PoolConexoesJusto
+
+# ♻️ Conexões do pool invalidam o cache das tabelas que alteram
+from cache_invalidacao import ConexaoRastreada, marcar_empresa_conexao
+
+
 # ============================================================================
 # MODELOS DE DADOS
 # ============================================================================
@@ -356,8 +375,133 @@ def get_nfse_db_params() -> dict:
     
     return params
 
+class _RLSConnectionPool(PoolConexoesJusto):
+    """
+    Pool que lembra a empresa (RLS) configurada em cada conexão
+
+    set_current_empresa grava app.current_empresa_id no nível da sessão
+    PostgreSQL, então a configuração sobrevive à devolução ao pool. Em vez de
+    SET no checkout + RESET na devolução (2 round trips por requisição), a
+    conexão fica vinculada à empresa e o SET só é executado quando a empresa
+    muda. Conexões livres já vinculadas à empresa pedida têm preferência.
+
+    getconn() "cru" (conexões globais, validar_sessao, DatabaseManager)
+    continua recebendo conexão sem empresa: o vínculo é desfeito com RESET.
+
+    Fila justa, quota por empresa, saúde e métricas: ver pool_conexoes.py
+    """
+
+    def __init__(self, *args, **kwargs):
+        # Vínculo conexão -> empresa_id (sai sozinho quando a conexão é coletada)
+        self._empresa_vinculada = weakref.WeakKeyDictionary()
+        super().__init__(*args, **kwargs)
+
+    def getconn_empresa(self, empresa_id):
+        """Obtém conexão com RLS configurado para a empresa"""
+        conn = self._obter(empresa_id)
+        try:
+            conn.autocommit = True
+        except Exception:
+            self.putconn(conn, close=True)
+            raise
+        try:
+            if self._empresa_vinculada.get(conn) != empresa_id:
+                self._empresa_vinculada.pop(conn, None)
+                cursor = conn.cursor()
+                try:
+                    cursor.execute("SELECT set_current_empresa(%s)", (empresa_id,))
+                finally:
+                    cursor.close()
+                self._empresa_vinculada[conn] = empresa_id
+                log(f"🔒 RLS ativado para empresa {empresa_id}")
+        except Exception as e:
+            # A sessão pode continuar com a empresa do uso anterior: limpa o
+            # app.current_empresa_id (ou descarta a conexão) e não a entrega
+            self._empresa_vinculada.pop(conn, None)
+            log(f"⚠️ Erro ao configurar RLS: {e}")
+            try:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute("RESET app.current_empresa_id")
+                finally:
+                    cursor.close()
+            except Exception:
+                self.putconn(conn, close=True)
+            else:
+                self.putconn(conn)
+            raise
+        return conn
+
+    def getconn(self, key=None):
+        """
+        Obtém conexão sem empresa vinculada
+
+        O RESET roda em autocommit (a conexão pode ter voltado com
+        autocommit=False e não deve abrir transação); se falhar, a conexão,
+        ainda com a empresa do uso anterior, é descartada e outra é obtida.
+        """
+        while True:
+            conn = super().getconn(key)
+            if self._empresa_vinculada.get(conn) is None:
+                return conn
+            try:
+                conn.autocommit = True
+                cursor = conn.cursor()
+                try:
+                    cursor.execute("RESET app.current_empresa_id")
+                finally:
+                    cursor.close()
+            except Exception as e:
+                log(f"⚠️ Erro ao limpar RLS: {e}")
+                self.putconn(conn, key, close=True)
+                continue
+            self._empresa_vinculada.pop(conn, None)
+            return conn
+
+    def putconn(self, conn=None, key=None, close=False):
+        """Devolve a conexão mantendo o vínculo (descartado se for fechada)"""
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            if conn is not None and conn.closed:
+                self._empresa_vinculada.pop(conn, None)
+
+    def esquecer_empresa(self, conn):
+        """Descarta o vínculo (app.current_empresa_id alterado fora do pool)"""
+        self._empresa_vinculada.pop(conn, None)
+
+    def _antes_de_adquirir(self, empresa_id):
+        """Move uma conexão livre da empresa (ou sem empresa, para getconn cru)
+        para o fim da lista de livres (_getconn usa pop())"""
+        for i in range(len(self._pool) - 1, -1, -1):
+            if self._empresa_vinculada.get(self._pool[i]) == empresa_id:
+                if i != len(self._pool) - 1:
+                    self._pool.append(self._pool.pop(i))
+                return
+
+
+def esquecer_empresa_conexao(conn):
+    """
+    Descarta o vínculo de empresa da conexão no pool
+
+    Deve ser chamado por quem executa set_current_empresa/RESET diretamente
+    em uma conexão do pool (ex.: security_wrapper.secure_connection).
+    """
+    pool_obj = _connection_pool
+    if isinstance(pool_obj, _RLSConnectionPool):
+        pool_obj.esquecer_empresa(getattr(conn, '_conn', conn))
+
+
 # Pool de conexões global para reutilização eficiente
 _connection_pool = None
+# Espera máxima, quota de conexões simultâneas por empresa (0 = sem limite)
+# e reciclagem/verificação das conexões (ver pool_conexoes.py)
+_POOL_LIMITES = {
+    'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+    'quota_empresa': int(os.getenv('DB_POOL_QUOTA_EMPRESA', '0')) or None,
+    'max_lifetime': int(os.getenv('DB_POOL_MAX_LIFETIME', '1800')),
+    'idle_check': int(os.getenv('DB_POOL_IDLE_CHECK', '60')),
+}
 _pool_lock = threading.Lock()  # Lock para prevenir race condition em ambiente multi-threaded
 _database_initialized = False  # Flag para controlar inicializai?i?o i?nica
 
@@ -372,24 +516,29 @@ def _get_connection_pool():
             if _connection_pool is None:
                 try:
                     if 'dsn' in POSTGRESQL_CONFIG:
-                        _connection_pool = pool.ThreadedConnectionPool(
+                        _connection_pool = _RLSConnectionPool(
                             minconn=10,
                             maxconn=100,  # Aumentado de 50 para 100 (suportar 694 reqs paralelas)
                             dsn=POSTGRESQL_CONFIG['dsn'],
                             cursor_factory=RealDictCursor,
+                            connection_factory=ConexaoRastreada,
                             connect_timeout=5,  # Reduzido de 10 para 5s
-                            options='-c statement_timeout=15000'  # Reduzido de 30s para 15s
+                            options='-c statement_timeout=15000',  # Reduzido de 30s para 15s
+                            **_POOL_LIMITES
                         )
                     else:
-                        _connection_pool = pool.ThreadedConnectionPool(
+                        _connection_pool = _RLSConnectionPool(
                             minconn=10,
                             maxconn=100,  # Aumentado de 50 para 100 (suportar 694 reqs paralelas)
                             cursor_factory=RealDictCursor,
+                            connection_factory=ConexaoRastreada,
                             connect_timeout=5,  # Reduzido de 10 para 5s
                             options='-c statement_timeout=15000',  # Reduzido de 30s para 15s
+                            **_POOL_LIMITES,
                             **POSTGRESQL_CONFIG
                         )
-                    print("✅ Pool de conexões PostgreSQL criado (10-100 conexões, timeout=5s, query_timeout=15s)")
+                    print(f"✅ Pool de conexões PostgreSQL criado (10-100 conexões, timeout=5s, query_timeout=15s, "
+                          f"espera={_POOL_LIMITES['timeout']:g}s, quota_empresa={_POOL_LIMITES['quota_empresa']})")
                 except Exception as e:
                     print(f"❌ Erro ao criar pool de conexões: {e}")
                     raise
@@ -456,40 +605,12 @@ def get_db_connection(empresa_id=None, allow_global=False):
     """
     pool_obj = _get_connection_pool()
     
-    # Tentar obter conexão com retry em caso de pool esgotado
-    max_retries = 3
-    retry_delay = 0.5  # 500ms
-    
-    for attempt in range(max_retries):
-        try:
-            conn = pool_obj.getconn()
-            break
-        except Exception as e:
-            if "connection pool exhausted" in str(e):
-                if attempt < max_retries - 1:
-                    # Log do status do pool
-                    pool_status = get_pool_status()
-                    log(f"⚠️ Pool esgotado (tentativa {attempt + 1}/{max_retries}): {pool_status}")
-                    
-                    # Aguardar um pouco antes de tentar novamente
-                    import time
-                    time.sleep(retry_delay)
-                else:
-                    # Última tentativa falhou - logar status completo
-                    pool_status = get_pool_status()
-                    log(f"❌ POOL CRÍTICO: {pool_status}")
-                    raise
-            else:
-                # Erro diferente de pool esgotado
-                raise
-    
     # Se empresa_id não fornecido, tentar obter da sessão Flask
     if empresa_id is None and not allow_global:
         empresa_id = _get_empresa_id_from_session()
         
         # ⚠️ VALIDAÇÃO DE SEGURANÇA CRÍTICA
         if empresa_id is None:
-            pool_obj.putconn(conn)
             raise ValueError(
                 "❌ SEGURANÇA: empresa_id é obrigatório para acessar dados de empresa!\n"
                 "   Soluções:\n"
@@ -498,19 +619,24 @@ def get_db_connection(empresa_id=None, allow_global=False):
                 "   3. Ver: REGRAS_SEGURANCA_OBRIGATORIAS.md"
             )
     
+    # ✅ RLS: o pool só executa set_current_empresa se a conexão estiver
+    # vinculada a outra empresa (sem RESET na devolução)
+    usar_rls = empresa_id is not None and SECURITY_ENABLED
+    
+    # Pool com fila justa: aguarda até DB_POOL_TIMEOUT segundos por uma conexão
+    try:
+        if usar_rls:
+            conn = pool_obj.getconn_empresa(empresa_id)
+        else:
+            conn = pool_obj.getconn()
+    except pool.PoolError:
+        log(f"❌ POOL CRÍTICO: {get_pool_status()}")
+        raise
+    
     conn.autocommit = True
+    marcar_empresa_conexao(conn, empresa_id)
     
-    # ✅ ATIVAR RLS SE EMPRESA_ID DISPONÍVEL
-    if empresa_id is not None and SECURITY_ENABLED:
-        cursor = conn.cursor()
-        try:
-            cursor.execute("SELECT set_current_empresa(%s)", (empresa_id,))
-            log(f"🔒 RLS ativado para empresa {empresa_id}")
-        except Exception as e:
-            log(f"⚠️ Erro ao configurar RLS: {e}")
-        finally:
-            cursor.close()
-    elif allow_global:
+    if allow_global and not usar_rls:
         log(f"⚪ Conexão global (sem RLS) - Tabelas: usuarios, empresas, permissoes")
     
     # 🔒 Marcar como gerenciada pelo context manager via WeakSet
@@ -520,15 +646,7 @@ def get_db_connection(empresa_id=None, allow_global=False):
         yield conn
     finally:
         _managed_connections.discard(conn)
-        # Limpar configuração RLS
-        if empresa_id is not None and SECURITY_ENABLED:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("RESET app.current_empresa_id")
-                cursor.close()
-            except:
-                pass
-        
+        marcar_empresa_conexao(conn, None)
         pool_obj.putconn(conn)
 
 
@@ -611,26 +729,9 @@ def return_to_pool(conn):
 # ============================================================================
 
 def get_pool_status():
-    """Retorna status do pool de conexões para diagnóstico"""
-    pool_obj = _get_connection_pool()
+    """Retorna status e métricas (espera, retenção, fila) do pool de conexões"""
     try:
-        # Tentar acessar atributos internos do pool
-        status = {
-            'minconn': pool_obj.minconn,
-            'maxconn': pool_obj.maxconn,
-            'closed': pool_obj.closed,
-        }
-        
-        # Verificar conexões disponíveis (se possível)
-        try:
-            # psycopg2.pool ThreadedConnectionPool usa _used para rastrear conexões em uso
-            if hasattr(pool_obj, '_used'):
-                status['in_use'] = len(pool_obj._used)
-                status['available'] = pool_obj.maxconn - len(pool_obj._used)
-        except:
-            pass
-            
-        return status
+        return _get_connection_pool().metricas()
     except Exception as e:
         return {'error': str(e)}
 
@@ -835,21 +936,10 @@ class DatabaseManager:
                         raise
                         
             except pool.PoolError as e:
-                print(f"⚠️ Pool esgotado! (tentativa {attempt + 1}/{max_retries})")
-                if attempt == max_retries - 1:
-                    # Última tentativa: recria pool
-                    print("🔄 Recriando pool de conexões...")
-                    try:
-                        pool_obj.closeall()
-                    except:
-                        pass
-                    global _connection_pool
-                    _connection_pool = None
-                    pool_obj = _get_connection_pool()
-                    conn = pool_obj.getconn()
-                    conn.autocommit = True
-                    return _PooledConnection(conn)
-                time.sleep(retry_delay)
+                # O pool já aguardou DB_POOL_TIMEOUT na fila; recriá-lo derrubaria
+                # as conexões em uso e quem está esperando
+                print(f"❌ Pool esgotado: {e} - {get_pool_status()}")
+                raise
                 
             except Error as e:
                 print(f"❌ Erro ao obter conexão do pool (tentativa {attempt + 1}/{max_retries}): {e}")
@@ -1390,6 +1480,37 @@ class DatabaseManager:
             CREATE INDEX IF NOT EXISTS idx_extrato_pessoa 
             ON transacoes_extrato(pessoa)
         """)
+
+        # Checkpoints mensais de saldo do extrato: soma e ultimo saldo de cada
+        # (empresa, conta, mes). Saldo numa data = checkpoints anteriores + soma
+        # curta do mes da data, sem varrer o historico da conta.
+        # Mantidos pelos triggers de sql/migrations/migration_saldos_extrato_mensais.sql
+        # em qualquer escrita em transacoes_extrato.
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS saldos_extrato_mensais (
+                empresa_id INTEGER NOT NULL,
+                conta_bancaria VARCHAR(255) NOT NULL,
+                mes DATE NOT NULL,
+                soma DECIMAL(15,2) NOT NULL,
+                quantidade INTEGER NOT NULL,
+                ultima_data DATE NOT NULL,
+                ultimo_saldo DECIMAL(15,2),
+                atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (empresa_id, conta_bancaria, mes)
+            )
+        """)
+        cursor.execute("""
+            SELECT COUNT(*) AS triggers FROM pg_trigger
+            WHERE tgrelid = 'transacoes_extrato'::regclass
+              AND tgname LIKE 'trg_saldos_extrato_mensais_%'
+        """)
+        if cursor.fetchone()['triggers'] < 3:
+            # Script inteiro numa instrucao = uma transacao: triggers + reconstrucao
+            sql_saldos = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                      'sql', 'migrations', 'migration_saldos_extrato_mensais.sql')
+            with open(sql_saldos, 'r', encoding='utf-8') as f:
+                cursor.execute(f.read())
+            print(f"✅ Checkpoints de saldo do extrato reconstruidos: {cursor.fetchone()['meses']} meses")
         
         # Tabela de conciliacoes (relaciona transacoes_extrato com lancamentos)
         cursor.execute("""
@@ -3408,13 +3529,130 @@ class DatabaseManager:
             print(f"   ✅ Lançamento criado com ID: {lancamento_id}")
             return lancamento_id
     
+    def _consulta_lancamentos(self, empresa_id: int, filtros: Dict[str, Any] = None) -> Tuple[str, list]:
+        """
+        SELECT base da listagem de lançamentos (sem ORDER BY/LIMIT) e seus parâmetros
+
+        Filtros aceitos: tipo, status, data_inicio, data_fim, categoria,
+        subcategoria, conta_bancaria, pessoa (igualdade) e busca (descrição,
+        pessoa ou observações contendo o texto).
+        """
+        # Colunas específicas + informação de conciliação
+        # (EXISTS em vez de JOIN: uma linha por lançamento mesmo com várias conciliações)
+        query = """
+            SELECT
+                l.id, l.tipo, l.descricao, l.valor, l.data_vencimento, l.data_pagamento,
+                l.categoria, l.subcategoria, l.conta_bancaria, l.cliente_fornecedor,
+                l.pessoa, l.status, l.observacoes, l.anexo, l.recorrente,
+                l.frequencia_recorrencia, l.dia_vencimento, l.associacao, l.numero_documento,
+                EXISTS (
+                    SELECT 1 FROM conciliacoes c
+                    WHERE c.lancamento_id = l.id AND c.empresa_id = l.empresa_id
+                      AND c.transacao_extrato_id IS NOT NULL
+                ) AS conciliado
+            FROM lancamentos l
+            WHERE l.empresa_id = %s
+        """
+        params = [empresa_id]
+
+        filtros = filtros or {}
+        if 'tipo' in filtros:
+            query += " AND UPPER(l.tipo) = UPPER(%s)"
+            params.append(filtros['tipo'])
+        if 'status' in filtros:
+            query += " AND UPPER(l.status) = UPPER(%s)"
+            params.append(filtros['status'])
+        if 'data_inicio' in filtros:
+            query += " AND l.data_vencimento >= %s"
+            params.append(filtros['data_inicio'])
+        if 'data_fim' in filtros:
+            query += " AND l.data_vencimento <= %s"
+            params.append(filtros['data_fim'])
+        if 'categoria' in filtros:
+            query += " AND l.categoria = %s"
+            params.append(filtros['categoria'])
+        if 'subcategoria' in filtros:
+            query += " AND l.subcategoria = %s"
+            params.append(filtros['subcategoria'])
+        if 'conta_bancaria' in filtros:
+            query += " AND l.conta_bancaria = %s"
+            params.append(filtros['conta_bancaria'])
+        if 'pessoa' in filtros:
+            query += " AND l.pessoa = %s"
+            params.append(filtros['pessoa'])
+        if filtros.get('busca'):
+            termo = '%' + filtros['busca'].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            query += " AND (l.descricao ILIKE %s OR l.pessoa ILIKE %s OR l.observacoes ILIKE %s)"
+            params.extend([termo, termo, termo])
+
+        return query, params
+
+    @staticmethod
+    def _linha_para_lancamento(row: Dict[str, Any]) -> Lancamento:
+        """Converte uma linha de _consulta_lancamentos em Lancamento"""
+        # Tratar valores que podem ser None
+        tipo_value = row['tipo'].lower() if row['tipo'] else 'receita'
+        status_value = row['status'].lower() if row['status'] else 'pendente'
+
+        lancamento = Lancamento(
+            id=row['id'],
+            tipo=TipoLancamento(tipo_value),
+            descricao=row['descricao'],
+            valor=Decimal(str(row['valor'])),
+            data_vencimento=row['data_vencimento'],
+            data_pagamento=row['data_pagamento'],
+            categoria=row['categoria'] or '',
+            subcategoria=row['subcategoria'] or '',
+            conta_bancaria=row['conta_bancaria'] or '',
+            cliente_fornecedor=row['cliente_fornecedor'] or '',
+            pessoa=row['pessoa'] or '',
+            status=StatusLancamento(status_value),
+            observacoes=row['observacoes'] or '',
+            anexo=row['anexo'] or '',
+            recorrente=row['recorrente'] or False,
+            frequencia_recorrencia=row['frequencia_recorrencia'] or '',
+            dia_vencimento=row['dia_vencimento'] or 0,
+            associacao=row.get('associacao', '') or ''
+        )
+        # Adicionar atributos extras
+        lancamento.numero_documento = row.get('numero_documento', '') or ''
+        lancamento.conciliado = row.get('conciliado', False)  # ✅ NOVO: Flag de conciliação
+        return lancamento
+
+    def _converter_linhas_lancamentos(self, rows):
+        """Gera Lancamento por linha (linhas inválidas são registradas e puladas)"""
+        for row in rows:
+            try:
+                yield self._linha_para_lancamento(row)
+            except Exception as e:
+                log(f"⚠️ Erro ao processar lançamento ID {row.get('id', 'unknown')}: {e}")
+
+    def _linhas_para_lancamentos(self, rows) -> List[Lancamento]:
+        return list(self._converter_linhas_lancamentos(rows))
+
+    @staticmethod
+    def _estimar_linhas(cursor, query: str, params: list) -> Optional[int]:
+        """Número de linhas estimado pelo planner (EXPLAIN, sem executar a consulta)"""
+        try:
+            cursor.execute("EXPLAIN (FORMAT JSON) " + query, params)
+            plano = next(iter(cursor.fetchone().values()))
+            if isinstance(plano, str):
+                plano = json.loads(plano)
+            return int(plano[0]['Plan']['Plan Rows'])
+        except Exception as e:
+            log(f"⚠️ Estimativa de total indisponível: {e}")
+            return None
+
     def listar_lancamentos(self, empresa_id: int = None, filtros: Dict[str, Any] = None, 
                           filtro_cliente_id: int = None, page: int = None, per_page: int = 50) -> List[Lancamento]:
         """
-        Lista lani?amentos com filtros opcionais, multi-tenancy e pagina??o
+        Lista lançamentos com filtros opcionais, multi-tenancy e paginação
         
         ATUALIZADO (2026-02-26): Adiciona informação de conciliação bancária
         
+        Para listas grandes prefira listar_lancamentos_pagina (cursor/keyset):
+        o OFFSET abaixo fica mais lento a cada página.
+        
         Args:
             empresa_id: ID da empresa para filtro (opcional)
             filtros: Dicionário com filtros (tipo, status, datas, etc)
@@ -3425,125 +3663,125 @@ class DatabaseManager:
         Returns:
             Lista de objetos Lancamento (com atributo extra 'conciliado')
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Colunas específicas + informação de conciliação
-        columns = """
-            l.id, l.tipo, l.descricao, l.valor, l.data_vencimento, l.data_pagamento,
-            l.categoria, l.subcategoria, l.conta_bancaria, l.cliente_fornecedor,
-            l.pessoa, l.status, l.observacoes, l.anexo, l.recorrente,
-            l.frequencia_recorrencia, l.dia_vencimento, l.associacao, l.numero_documento,
-            CASE WHEN c.transacao_extrato_id IS NOT NULL THEN TRUE ELSE FALSE END as conciliado
-        """
-        
-        query = f"""
-            SELECT {columns} 
-            FROM lancamentos l
-            LEFT JOIN conciliacoes c ON c.lancamento_id = l.id AND c.empresa_id = l.empresa_id
-            WHERE 1=1
-        """
-        params = []
-        
         # 🔒 FILTRO CRÍTICO DE SEGURANÇA: Isolamento por empresa
         # OBRIGATÓRIO: Sempre filtrar por empresa_id para evitar vazamento de dados
-        if empresa_id is not None:
-            query += " AND l.empresa_id = %s"
-            params.append(empresa_id)
-        elif filtro_cliente_id is not None:
-            query += " AND l.empresa_id = %s"
-            params.append(filtro_cliente_id)
-        else:
+        if empresa_id is None:
+            empresa_id = filtro_cliente_id
+        if empresa_id is None:
             # ⚠️ SEGURANÇA: Se não houver empresa_id, não retornar nada
             # Evita vazamento de dados entre empresas
             log("⚠️ AVISO: listar_lancamentos chamado sem empresa_id - retornando lista vazia")
             return []
         
-        if filtros:
-            if 'tipo' in filtros:
-                query += " AND UPPER(l.tipo) = UPPER(%s)"
-                params.append(filtros['tipo'])
-            if 'status' in filtros:
-                query += " AND UPPER(l.status) = UPPER(%s)"
-                params.append(filtros['status'])
-            if 'data_inicio' in filtros:
-                query += " AND l.data_vencimento >= %s"
-                params.append(filtros['data_inicio'])
-            if 'data_fim' in filtros:
-                query += " AND l.data_vencimento <= %s"
-                params.append(filtros['data_fim'])
-            if 'categoria' in filtros:
-                query += " AND l.categoria = %s"
-                params.append(filtros['categoria'])
-            if 'subcategoria' in filtros:
-                query += " AND l.subcategoria = %s"
-                params.append(filtros['subcategoria'])
-            if 'conta_bancaria' in filtros:
-                query += " AND l.conta_bancaria = %s"
-                params.append(filtros['conta_bancaria'])
-        
-        query += " ORDER BY l.data_vencimento DESC"
+        query, params = self._consulta_lancamentos(empresa_id, filtros)
+        query += " ORDER BY l.data_vencimento DESC, l.id DESC"
         
         # Adicionar paginação se especificado
         if page is not None:
             per_page = min(per_page, 500)  # Máximo 500 por página
-            offset = (page - 1) * per_page
-            query += f" LIMIT {per_page} OFFSET {offset}"
-        
-        print(f"🔍 SQL Query: {query}")
-        print(f"📋 Params: {params}")
-        print(f"📄 Page: {page}, Per Page: {per_page}")
+            query += " LIMIT %s OFFSET %s"
+            params.extend([per_page, (max(page, 1) - 1) * per_page])
         
+        conn = self.get_connection()
+        cursor = conn.cursor()
         try:
             cursor.execute(query, params)
             rows = cursor.fetchall()
-            print(f"✅ Query executada com sucesso! Rows: {len(rows)}")
         except Exception as e:
-            print(f"❌ Erro ao executar query: {e}")
-            import traceback
-            traceback.print_exc()
-            cursor.close()
-            return_to_pool(conn)
+            log(f"❌ Erro ao listar lançamentos: {e}")
             raise
+        finally:
+            cursor.close()
+            return_to_pool(conn)  # Devolver ao pool
         
-        lancamentos = []
-        for row in rows:
+        return self._linhas_para_lancamentos(rows)
+    
+    def iterar_lancamentos(self, empresa_id: int, filtros: Dict[str, Any] = None):
+        """
+        Gera todos os lançamentos da empresa um a um (cursor server-side)
+        
+        Para respostas grandes (ex: /api/lancamentos sem paginação com
+        app.utils.json_stream): a lista inteira nunca fica em memória.
+        A conexão fica reservada até o gerador terminar ou ser fechado.
+        
+        Args:
+            empresa_id: ID da empresa [OBRIGATÓRIO]
+            filtros: Mesmos filtros de _consulta_lancamentos
+        
+        Raises:
+            ValueError: Se empresa_id não fornecido
+        """
+        from app.utils.json_stream import linhas_cursor
+        
+        if not empresa_id:
+            raise ValueError("empresa_id é obrigatório para iterar_lancamentos")
+        query, params = self._consulta_lancamentos(empresa_id, filtros)
+        query += " ORDER BY l.data_vencimento DESC, l.id DESC"
+        
+        with get_db_connection(empresa_id=empresa_id) as conn:
+            yield from self._converter_linhas_lancamentos(linhas_cursor(conn, query, params))
+    
+    def listar_lancamentos_pagina(self, empresa_id: int, filtros: Dict[str, Any] = None,
+                                  cursor_pagina: str = None, limite: int = 50,
+                                  estimar_total: bool = False) -> Dict[str, Any]:
+        """
+        Lista uma página de lançamentos por cursor (keyset) em (data_vencimento, id)
+        
+        Cada página continua exatamente depois do último item da anterior
+        (WHERE (data_vencimento, id) < chave), então o custo não cresce com a
+        profundidade como no OFFSET, e inserções no meio não repetem nem pulam itens.
+        
+        Args:
+            empresa_id: ID da empresa [OBRIGATÓRIO]
+            filtros: Mesmos filtros de _consulta_lancamentos
+            cursor_pagina: Token 'proximo_cursor' da página anterior (None = primeira página)
+            limite: Itens por página (máx: 500)
+            estimar_total: Inclui o total estimado pelo planner (sem COUNT(*))
+        
+        Returns:
+            Dict com 'lancamentos', 'proximo_cursor' (None na última página)
+            e 'total_estimado' (None se não solicitado/indisponível)
+        
+        Raises:
+            ValueError: Se empresa_id não fornecido ou cursor inválido
+        """
+        if not empresa_id:
+            raise ValueError("empresa_id é obrigatório para listar_lancamentos_pagina")
+        limite = max(1, min(int(limite), 500))
+        
+        query, params = self._consulta_lancamentos(empresa_id, filtros)
+        consulta_total, params_total = query, list(params)
+        
+        if cursor_pagina:
+            data_vencimento, lancamento_id = decodificar_cursor_lancamentos(cursor_pagina)
+            query += " AND (l.data_vencimento, l.id) < (%s, %s)"
+            params.extend([data_vencimento, lancamento_id])
+        
+        # Um item a mais só para saber se existe próxima página
+        query += " ORDER BY l.data_vencimento DESC, l.id DESC LIMIT %s"
+        params.append(limite + 1)
+        
+        with get_db_connection(empresa_id=empresa_id) as conn:
+            cursor = conn.cursor()
             try:
-                # Tratar valores que podem ser None
-                tipo_value = row['tipo'].lower() if row['tipo'] else 'receita'
-                status_value = row['status'].lower() if row['status'] else 'pendente'
-                
-                lancamento = Lancamento(
-                    id=row['id'],
-                    tipo=TipoLancamento(tipo_value),
-                    descricao=row['descricao'],
-                    valor=Decimal(str(row['valor'])),
-                    data_vencimento=row['data_vencimento'],
-                    data_pagamento=row['data_pagamento'],
-                    categoria=row['categoria'] or '',
-                    subcategoria=row['subcategoria'] or '',
-                    conta_bancaria=row['conta_bancaria'] or '',
-                    cliente_fornecedor=row['cliente_fornecedor'] or '',
-                    pessoa=row['pessoa'] or '',
-                    status=StatusLancamento(status_value),
-                    observacoes=row['observacoes'] or '',
-                    anexo=row['anexo'] or '',
-                    recorrente=row['recorrente'] or False,
-                    frequencia_recorrencia=row['frequencia_recorrencia'] or '',
-                    dia_vencimento=row['dia_vencimento'] or 0,
-                    associacao=row.get('associacao', '') or ''
-                )
-                # Adicionar atributos extras
-                lancamento.numero_documento = row.get('numero_documento', '') or ''
-                lancamento.conciliado = row.get('conciliado', False)  # ✅ NOVO: Flag de conciliação
-                lancamentos.append(lancamento)
-            except Exception as e:
-                print(f"? Erro ao processar lani?amento ID {row.get('id', 'unknown')}: {e}")
-                continue
+                cursor.execute(query, params)
+                rows = cursor.fetchall()
+                total_estimado = (self._estimar_linhas(cursor, consulta_total, params_total)
+                                  if estimar_total else None)
+            finally:
+                cursor.close()
         
-        cursor.close()
-        return_to_pool(conn)  # Devolver ao pool
-        return lancamentos
+        proximo_cursor = None
+        if len(rows) > limite:
+            rows = rows[:limite]
+            ultima = rows[-1]
+            proximo_cursor = codificar_cursor_lancamentos(ultima['data_vencimento'], ultima['id'])
+        
+        return {
+            'lancamentos': self._linhas_para_lancamentos(rows),
+            'proximo_cursor': proximo_cursor,
+            'total_estimado': total_estimado
+        }
     
     def obter_lancamento(self, lancamento_id: int, empresa_id: int = None) -> Optional[Lancamento]:
         """Obtém um lançamento específico por ID COM filtro de empresa"""
@@ -4135,6 +4373,7 @@ class DatabaseManager:
             
             conn.commit()
             print(f"✅ [criar_regra] COMMIT executado", flush=True)
+            invalidar_matcher(empresa_id)
             
             regra = cursor.fetchone()
             print(f"✅ [criar_regra] Regra retornada: {regra}", flush=True)
@@ -4205,6 +4444,7 @@ class DatabaseManager:
             """, valores)
             
             conn.commit()
+            invalidar_matcher(empresa_id)
             return cursor.rowcount > 0
             
         except Exception as e:
@@ -4241,6 +4481,7 @@ class DatabaseManager:
             """, (regra_id, empresa_id))
             
             conn.commit()
+            invalidar_matcher(empresa_id)
             return cursor.rowcount > 0
             
         except Exception as e:
@@ -4336,25 +4577,21 @@ class DatabaseManager:
             if conn:
                 return_to_pool(conn)
     
-    def buscar_regra_aplicavel(self, empresa_id: int, descricao: str) -> Optional[Dict]:
+    def _carregar_regras_ativas(self, empresa_id: int) -> List[Dict]:
         """
-        Busca uma regra de auto-conciliação aplicável para uma descrição
+        Carrega as regras ativas da empresa para compilar o matcher
         
         Args:
             empresa_id: ID da empresa
-            descricao: Descrição da transação
             
         Returns:
-            Dicionário com a regra encontrada ou None
+            Lista de regras ativas
         """
-        # Usar context manager para garantir devolução automática da conexão
         max_retries = 3
         for attempt in range(max_retries):
             try:
                 with get_db_connection(empresa_id=empresa_id) as conn:
                     cursor = conn.cursor(cursor_factory=RealDictCursor)
-                    
-                    # Buscar regra mais específica que match com a descrição (case-insensitive)
                     cursor.execute("""
                         SELECT 
                             id, 
@@ -4369,28 +4606,59 @@ class DatabaseManager:
                         FROM regras_conciliacao
                         WHERE empresa_id = %s 
                             AND ativo = TRUE
-                            AND UPPER(%s) LIKE '%%' || UPPER(palavra_chave) || '%%'
-                        ORDER BY LENGTH(palavra_chave) DESC
-                        LIMIT 1
-                    """, (empresa_id, descricao))
+                    """, (empresa_id,))
                     
-                    regra = cursor.fetchone()
+                    regras = cursor.fetchall()
                     cursor.close()
-                    return dict(regra) if regra else None
+                    return [dict(r) for r in regras]
                     
             except pool.PoolError as e:
                 if attempt < max_retries - 1:
                     time.sleep(0.1 * (attempt + 1))  # Backoff exponencial
                     continue
-                print(f"❌ Pool esgotado após {max_retries} tentativas: {e}")
-                return None
-            except Exception as e:
-                print(f"❌ Erro ao buscar regra aplicável: {e}")
-                import traceback
-                traceback.print_exc()
-                return None
+                raise
         
-        return None
+        return []
+    
+    def obter_matcher_regras(self, empresa_id: int):
+        """
+        Obtém o matcher compilado (Aho-Corasick) das regras ativas da empresa
+        
+        O matcher fica em cache por empresa e é invalidado por
+        criar/atualizar/excluir_regra_conciliacao.
+        
+        Args:
+            empresa_id: ID da empresa
+            
+        Returns:
+            RegrasMatcher (ver regras_conciliacao_matcher)
+        """
+        return obter_matcher(empresa_id, self._carregar_regras_ativas)
+    
+    def buscar_regra_aplicavel(self, empresa_id: int, descricao: str) -> Optional[Dict]:
+        """
+        Busca uma regra de auto-conciliação aplicável para uma descrição
+        
+        Usa o matcher compilado da empresa: palavra-chave contida na descrição
+        (case-insensitive), a mais longa vence.
+        
+        Args:
+            empresa_id: ID da empresa
+            descricao: Descrição da transação
+            
+        Returns:
+            Dicionário com a regra encontrada ou None
+        """
+        try:
+            return self.obter_matcher_regras(empresa_id).buscar(descricao)
+        except pool.PoolError as e:
+            print(f"❌ Pool esgotado ao carregar regras: {e}")
+            return None
+        except Exception as e:
+            print(f"❌ Erro ao buscar regra aplicável: {e}")
+            import traceback
+            traceback.print_exc()
+            return None
 
     
     def buscar_funcionario_por_cpf(self, empresa_id: int, cpf: str) -> Optional[Dict]:
@@ -4447,6 +4715,51 @@ class DatabaseManager:
         
         return None
 
+    def buscar_funcionarios_por_cpfs(self, empresa_id: int, cpfs: List[str]) -> Dict[str, Dict]:
+        """
+        Busca funcionários ativos por uma lista de CPFs em uma única query
+        
+        Args:
+            empresa_id: ID da empresa
+            cpfs: CPFs (11 dígitos, sem formatação)
+            
+        Returns:
+            Dicionário {cpf: funcionario}
+        """
+        cpfs = sorted({c for c in cpfs if c})
+        if not cpfs:
+            return {}
+        
+        try:
+            with get_db_connection(empresa_id=empresa_id) as conn:
+                cursor = conn.cursor(cursor_factory=RealDictCursor)
+                cursor.execute("""
+                    SELECT DISTINCT ON (cpf)
+                        id,
+                        empresa_id,
+                        nome,
+                        cpf,
+                        cargo,
+                        salario,
+                        data_admissao,
+                        ativo
+                    FROM funcionarios
+                    WHERE empresa_id = %s 
+                        AND cpf = ANY(%s)
+                        AND ativo = TRUE
+                    ORDER BY cpf, id
+                """, (empresa_id, cpfs))
+                
+                funcionarios = cursor.fetchall()
+                cursor.close()
+                return {f['cpf']: dict(f) for f in funcionarios}
+                
+        except Exception as e:
+            print(f"❌ Erro ao buscar funcionários por CPF (lote): {e}")
+            import traceback
+            traceback.print_exc()
+            return {}
+
 
 # Funi?i?es standalone para compatibilidade
 def criar_tabelas():
@@ -4479,7 +4792,7 @@ def adicionar_conta(empresa_id: int, conta: ContaBancaria) -> int:
     invalidate_cache(empresa_id)
     return result
 
-@cached(ttl=600)  # Cache por 10 minutos
+@cached(ttl=7200)  # Cache por 2 horas (invalidado nas escritas: cache_invalidacao.py)
 def listar_contas(empresa_id: int) -> List[ContaBancaria]:
     """
     Lista contas bancárias da empresa
@@ -4549,7 +4862,7 @@ def adicionar_categoria(empresa_id: int, categoria: Categoria) -> int:
     invalidate_cache(empresa_id)
     return result
 
-@cached(ttl=600)  # Cache por 10 minutos
+@cached(ttl=7200)  # Cache por 2 horas (invalidado nas escritas: cache_invalidacao.py)
 def listar_categorias(empresa_id: int, tipo: Optional[TipoLancamento] = None) -> List[Categoria]:
     """
     Lista categorias da empresa
@@ -4624,7 +4937,7 @@ def adicionar_cliente(empresa_id: int, cliente_data, cpf_cnpj: str = None, email
     invalidate_cache(empresa_id)
     return result
 
-@cached(ttl=300)  # Cache por 5 minutos
+@cached(ttl=7200)  # Cache por 2 horas (invalidado nas escritas: cache_invalidacao.py)
 def listar_clientes(empresa_id: int, ativos: bool = True) -> List[Dict]:
     """
     Lista clientes da empresa
@@ -4730,6 +5043,64 @@ def listar_lancamentos(empresa_id: int, filtros: Dict[str, Any] = None, filtro_c
     cliente_id = filtro_cliente_id if filtro_cliente_id else empresa_id
     return db.listar_lancamentos(empresa_id=empresa_id, filtros=filtros, filtro_cliente_id=cliente_id, page=page, per_page=per_page)
 
+def codificar_cursor_lancamentos(data_vencimento: date, lancamento_id: int) -> str:
+    """Token opaco (base64 url-safe) com a chave (data_vencimento, id) do último item da página"""
+    chave = json.dumps([data_vencimento.isoformat(), int(lancamento_id)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(chave.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decodificar_cursor_lancamentos(token: str) -> Tuple[date, int]:
+    """
+    Inverso de codificar_cursor_lancamentos
+
+    Raises:
+        ValueError: Se o token não for um cursor válido
+    """
+    try:
+        preenchido = token + '=' * (-len(token) % 4)
+        data_iso, lancamento_id = json.loads(base64.urlsafe_b64decode(preenchido.encode('ascii')))
+        return date.fromisoformat(data_iso), int(lancamento_id)
+    except Exception as e:
+        raise ValueError("Cursor de paginação inválido") from e
+
+def iterar_lancamentos(empresa_id: int, filtros: Dict[str, Any] = None):
+    """
+    Gera os lançamentos da empresa um a um, sem carregar a lista inteira
+
+    Args:
+        empresa_id (int): ID da empresa [OBRIGATÓRIO]
+        filtros (Dict): Dicionário com filtros (tipo, status, datas, pessoa, busca)
+
+    Security:
+        🔒 RLS aplicado - retorna apenas lançamentos da empresa
+    """
+    db = DatabaseManager()
+    return db.iterar_lancamentos(empresa_id, filtros=filtros)
+
+def listar_lancamentos_pagina(empresa_id: int, filtros: Dict[str, Any] = None, cursor_pagina: str = None,
+                              limite: int = 50, estimar_total: bool = False) -> Dict[str, Any]:
+    """
+    Lista uma página de lançamentos por cursor (keyset)
+
+    Args:
+        empresa_id (int): ID da empresa [OBRIGATÓRIO]
+        filtros (Dict): Dicionário com filtros (tipo, status, datas, pessoa, busca)
+        cursor_pagina (str): 'proximo_cursor' da página anterior (None = primeira página)
+        limite (int): Itens por página (padrão: 50, máx: 500)
+        estimar_total (bool): Inclui 'total_estimado' (estatísticas do planner)
+
+    Returns:
+        Dict: {'lancamentos', 'proximo_cursor', 'total_estimado'}
+
+    Raises:
+        ValueError: Se empresa_id não fornecido ou cursor inválido
+
+    Security:
+        🔒 RLS aplicado - retorna apenas lançamentos da empresa
+    """
+    db = DatabaseManager()
+    return db.listar_lancamentos_pagina(empresa_id, filtros=filtros, cursor_pagina=cursor_pagina,
+                                        limite=limite, estimar_total=estimar_total)
+
 def obter_lancamento(empresa_id: int, lancamento_id: int) -> Optional[Lancamento]:
     """
     Obtém um lançamento específico por ID
@@ -5306,6 +5677,92 @@ def adicionar_sessao(dados: Dict) -> int:
         return sessao_id
 
 
+def _linha_para_sessao(row) -> Dict:
+    """Converte uma linha da consulta de listar_sessoes no dict enviado ao frontend"""
+    # Trata dados_json que pode vir como dict ou string
+    if row['dados_json']:
+        if isinstance(row['dados_json'], dict):
+            dados_json = row['dados_json']  # Já é dict
+        else:
+            dados_json = json.loads(row['dados_json'])  # Parse string
+    else:
+        dados_json = {}
+    
+    return {
+        'id': row['id'],
+        'empresa_id': row['empresa_id'],  # 🔒 Incluir empresa_id para filtros
+        'cliente_id': row['cliente_id'],
+        'cliente_nome': row['cliente_nome'] or '-',
+        'cliente_nome_fantasia': row.get('cliente_nome_fantasia') or None,
+        'contrato_id': row['contrato_id'],
+        'contrato_numero': row['contrato_numero'],
+        'contrato_nome': row['contrato_nome'],
+        'data': row['data'].isoformat() if row['data'] else None,
+        'horario': dados_json.get('horario'),
+        'quantidade_horas': dados_json.get('quantidade_horas'),
+        'horas_subtrair': dados_json.get('horas_subtrair'),
+        'endereco': row['endereco'],
+        'tipo_foto': dados_json.get('tipo_foto', False),
+        'tipo_video': dados_json.get('tipo_video', False),
+        'tipo_mobile': dados_json.get('tipo_mobile', False),
+        'descricao': row['descricao'],
+        'tags': dados_json.get('tags'),
+        'prazo_entrega': row['prazo_entrega'].isoformat() if row['prazo_entrega'] else None,
+        'equipe': dados_json.get('equipe', []),
+        'responsaveis': dados_json.get('responsaveis', []),
+        'equipamentos': dados_json.get('equipamentos', []),
+        'equipamentos_alugados': dados_json.get('equipamentos_alugados', []),
+        'custos_adicionais': dados_json.get('custos_adicionais', []),
+        'observacoes': row['observacoes'],
+        'status': row.get('status', 'rascunho'),  # 🔒 Campo status (default: rascunho)
+        'numero_nf': row.get('numero_nf'),
+        'horas_trabalhadas': float(row['horas_trabalhadas']) if row.get('horas_trabalhadas') else None,
+        'finalizada_em': row['finalizada_em'].isoformat() if row.get('finalizada_em') else None,
+        'concluida_em': row['concluida_em'].isoformat() if row.get('concluida_em') else None,
+        'google_event_id': row.get('google_event_id'),
+    }
+
+
+_CONSULTA_SESSOES = """
+    SELECT 
+        s.id, s.cliente_id, s.contrato_id, s.data, s.endereco,
+        s.descricao, s.prazo_entrega, s.observacoes, s.dados_json,
+        s.created_at, s.updated_at, s.empresa_id, s.status,
+        s.numero_nf, s.horas_trabalhadas, s.finalizada_em, s.concluida_em,
+        s.google_event_id,
+        COALESCE(c.razao_social, c.nome) AS cliente_nome,
+        c.nome_fantasia AS cliente_nome_fantasia,
+        ct.numero AS contrato_numero, ct.descricao AS contrato_nome
+    FROM sessoes s
+    LEFT JOIN clientes c ON s.cliente_id = c.id
+    LEFT JOIN contratos ct ON s.contrato_id = ct.id
+    WHERE s.empresa_id = %s
+    ORDER BY s.data DESC, s.id DESC
+"""
+
+def iterar_sessoes(empresa_id: int):
+    """
+    Gera as sessões da empresa uma a uma (cursor server-side)
+    
+    Mesmo formato de listar_sessoes, sem carregar a lista inteira.
+    
+    Raises:
+        ValueError: Se empresa_id não fornecido
+        
+    Security:
+        🔒 RLS aplicado - retorna apenas sessões da empresa
+    """
+    from app.utils.json_stream import linhas_cursor
+    
+    if not empresa_id:
+        raise ValueError("empresa_id é obrigatório para iterar_sessoes")
+    
+    with get_db_connection(empresa_id=empresa_id) as conn:
+        # 🔒 FILTRO OBRIGATÓRIO: WHERE empresa_id garante isolamento
+        for row in linhas_cursor(conn, _CONSULTA_SESSOES, [empresa_id]):
+            yield _linha_para_sessao(row)
+
+
 def listar_sessoes(empresa_id: int) -> List[Dict]:
     """
     Lista todas as sessões da empresa
@@ -5322,84 +5779,16 @@ def listar_sessoes(empresa_id: int) -> List[Dict]:
     Security:
         🔒 RLS aplicado - retorna apenas sessões da empresa
     """
-    import json
-    
     if not empresa_id:
         raise ValueError("empresa_id é obrigatório para listar_sessoes")
     
     # 🔒 Usar get_db_connection com empresa_id (retorna context manager)
     with get_db_connection(empresa_id=empresa_id) as conn:
         cursor = conn.cursor()
-        
-        # 🔒 FILTRO OBRIGATÓRIO: Adicionar WHERE empresa_id para garantir isolamento
-        query = """
-            SELECT 
-                s.id, s.cliente_id, s.contrato_id, s.data, s.endereco,
-                s.descricao, s.prazo_entrega, s.observacoes, s.dados_json,
-                s.created_at, s.updated_at, s.empresa_id, s.status,
-                s.numero_nf, s.horas_trabalhadas, s.finalizada_em, s.concluida_em,
-                s.google_event_id,
-                COALESCE(c.razao_social, c.nome) AS cliente_nome,
-                c.nome_fantasia AS cliente_nome_fantasia,
-                ct.numero AS contrato_numero, ct.descricao AS contrato_nome
-            FROM sessoes s
-            LEFT JOIN clientes c ON s.cliente_id = c.id
-            LEFT JOIN contratos ct ON s.contrato_id = ct.id
-            WHERE s.empresa_id = %s
-            ORDER BY s.data DESC, s.id DESC
-        """
-        
-        cursor.execute(query, [empresa_id])
+        cursor.execute(_CONSULTA_SESSOES, [empresa_id])
         rows = cursor.fetchall()
-        
-        sessoes = []
-        for row in rows:
-            # Trata dados_json que pode vir como dict ou string
-            if row['dados_json']:
-                if isinstance(row['dados_json'], dict):
-                    dados_json = row['dados_json']  # Já é dict
-                else:
-                    dados_json = json.loads(row['dados_json'])  # Parse string
-            else:
-                dados_json = {}
-            
-            sessao = {
-                'id': row['id'],
-                'empresa_id': row['empresa_id'],  # 🔒 Incluir empresa_id para filtros
-                'cliente_id': row['cliente_id'],
-                'cliente_nome': row['cliente_nome'] or '-',
-                'cliente_nome_fantasia': row.get('cliente_nome_fantasia') or None,
-                'contrato_id': row['contrato_id'],
-                'contrato_numero': row['contrato_numero'],
-                'contrato_nome': row['contrato_nome'],
-                'data': row['data'].isoformat() if row['data'] else None,
-                'horario': dados_json.get('horario'),
-                'quantidade_horas': dados_json.get('quantidade_horas'),
-                'horas_subtrair': dados_json.get('horas_subtrair'),
-                'endereco': row['endereco'],
-                'tipo_foto': dados_json.get('tipo_foto', False),
-                'tipo_video': dados_json.get('tipo_video', False),
-                'tipo_mobile': dados_json.get('tipo_mobile', False),
-                'descricao': row['descricao'],
-                'tags': dados_json.get('tags'),
-                'prazo_entrega': row['prazo_entrega'].isoformat() if row['prazo_entrega'] else None,
-                'equipe': dados_json.get('equipe', []),
-                'responsaveis': dados_json.get('responsaveis', []),
-                'equipamentos': dados_json.get('equipamentos', []),
-                'equipamentos_alugados': dados_json.get('equipamentos_alugados', []),
-                'custos_adicionais': dados_json.get('custos_adicionais', []),
-                'observacoes': row['observacoes'],
-                'status': row.get('status', 'rascunho'),  # 🔒 Campo status (default: rascunho)
-                'numero_nf': row.get('numero_nf'),
-                'horas_trabalhadas': float(row['horas_trabalhadas']) if row.get('horas_trabalhadas') else None,
-                'finalizada_em': row['finalizada_em'].isoformat() if row.get('finalizada_em') else None,
-                'concluida_em': row['concluida_em'].isoformat() if row.get('concluida_em') else None,
-                'google_event_id': row.get('google_event_id'),
-            }
-            
-            sessoes.append(sessao)
     
-    return sessoes
+    return [_linha_para_sessao(row) for row in rows]
 
 
 def buscar_sessao(sessao_id: int, empresa_id: int = None) -> Dict:
@@ -7807,14 +8196,12 @@ def criar_sessao(usuario_id: int, ip_address: str, user_agent: str) -> str:
     db = DatabaseManager()
     return _criar_sessao(usuario_id, ip_address, user_agent, db)
 
-def validar_sessao(token: str) -> Optional[Dict]:
+def _carregar_sessao(token: str) -> Optional[Dict]:
     """
-    Valida uma sessão e retorna os dados do usuário
-    ATUALIZADO: 2026-02-04 18:30 - Incluir empresas associadas
-    OTIMIZADO: 2026-02-25 20:30 - Usar pool global (fix "too many clients")
+    Consulta a sessão no banco (usada por validar_sessao via auth_cache)
     
     Returns:
-        Dict com dados do usuário se sessão válida, None caso contrário
+        Dict com dados do usuário, expira_em e empresas vinculadas, ou None
     """
     # ✅ USAR POOL GLOBAL ao invés de criar novo DatabaseManager
     pool = _get_connection_pool()
@@ -7861,35 +8248,65 @@ def validar_sessao(token: str) -> Optional[Dict]:
         
         print(f"🔍 [validar_sessao DB] Usuario {sessao['username']} tem empresas: {empresas}")
         
-        # Determinar empresa_id (da sessão ou primeira disponível)
-        from flask import session as flask_session
-        empresa_id = flask_session.get('empresa_id')
-        print(f"🔍 [validar_sessao DB] empresa_id da sessão Flask: {empresa_id}")
-        
-        if not empresa_id and empresas:
-            empresa_id = empresas[0]
-            flask_session['empresa_id'] = empresa_id
-            print(f"🔍 [validar_sessao DB] Definindo empresa_id como: {empresa_id}")
-        
-        usuario_retorno = {
-            'id': sessao['usuario_id'],
+        return {
+            'usuario_id': sessao['usuario_id'],
+            'expira_em': sessao['expira_em'],
             'username': sessao['username'],
             'tipo': sessao['tipo'],
             'nome_completo': sessao['nome_completo'],
             'email': sessao['email'],
             'cliente_id': sessao['cliente_id'],
-            'empresa_id': empresa_id,
             'empresas': empresas
         }
-        
-        print(f"✅ [validar_sessao DB] Retornando: empresa_id={empresa_id}, empresas={empresas}")
-        return usuario_retorno
     finally:
         if cursor:
             cursor.close()
         if conn:
             return_to_pool(conn)  # ✅ Usar função segura anti-duplo-retorno
 
+def validar_sessao(token: str) -> Optional[Dict]:
+    """
+    Valida uma sessão e retorna os dados do usuário
+    ATUALIZADO: 2026-02-04 18:30 - Incluir empresas associadas
+    OTIMIZADO: 2026-02-25 20:30 - Usar pool global (fix "too many clients")
+    OTIMIZADO: 2026-10-16 - Cache curto por token (auth_cache)
+    
+    Returns:
+        Dict com dados do usuário se sessão válida, None caso contrário
+    """
+    sessao = obter_sessao_cache(token, _carregar_sessao)
+    if not sessao:
+        return None
+    
+    # Sessão em cache pode ter expirado dentro do TTL: desativar no banco
+    from datetime import datetime
+    if sessao['expira_em'] < datetime.now():
+        invalidar_sessao_cache(token)
+        _carregar_sessao(token)
+        return None
+    
+    empresas = sessao['empresas']
+    
+    # Determinar empresa_id (da sessão ou primeira disponível)
+    from flask import session as flask_session
+    empresa_id = flask_session.get('empresa_id')
+    
+    if not empresa_id and empresas:
+        empresa_id = empresas[0]
+        flask_session['empresa_id'] = empresa_id
+        print(f"🔍 [validar_sessao] Definindo empresa_id como: {empresa_id}")
+    
+    return {
+        'id': sessao['usuario_id'],
+        'username': sessao['username'],
+        'tipo': sessao['tipo'],
+        'nome_completo': sessao['nome_completo'],
+        'email': sessao['email'],
+        'cliente_id': sessao['cliente_id'],
+        'empresa_id': empresa_id,
+        'empresas': list(empresas)
+    }
+
 def invalidar_sessao(token: str) -> bool:
     """
     Invalida uma sessão (logout)
@@ -7907,6 +8324,7 @@ def invalidar_sessao(token: str) -> bool:
             UPDATE sessoes_login SET ativo = FALSE WHERE session_token = %s
         """, (token,))
         conn.commit()
+        invalidar_sessao_cache(token)
         return True
     except Exception as e:
         print(f"Erro ao invalidar sessão: {e}")
@@ -8090,6 +8508,7 @@ def atualizar_usuario(usuario_id: int, dados: Dict) -> bool:
         cursor.execute(query, valores)
         affected = cursor.rowcount
         conn.commit()
+        invalidar_usuario_cache(usuario_id)
         
         print(f"\n✅ UPDATE executado com sucesso!")
         print(f"   Linhas afetadas: {affected}")
@@ -8147,6 +8566,7 @@ def deletar_usuario(usuario_id: int) -> bool:
         affected = cursor.rowcount
         
         if affected > 0:
+            invalidar_usuario_cache(usuario_id)
             log(f"Usuario {usuario_id} deletado com sucesso")
         else:
             log(f"Usuario {usuario_id} nao encontrado")
@@ -8269,6 +8689,8 @@ def sincronizar_permissoes_usuario(usuario_id: int, codigos_permissoes: List[str
                 permissoes_adicionadas += 1
         
         print(f"? {permissoes_adicionadas} permissi?es sincronizadas para usui?rio {usuario_id}")
+        invalidar_usuario_cache(usuario_id)
+        clear_permissions_cache(usuario_id)
         return True
     except Exception as e:
         print(f"? Erro ao sincronizar permissi?es: {e}")
@@ -8882,6 +9304,9 @@ def atualizar_empresa(empresa_id, dados):
             conn.commit()
             cursor.close()
             
+            # Suspensão/reativação muda tem_acesso_empresa na hora
+            invalidar_empresa_cache(empresa_id)
+            
             log(f"Empresa {empresa_id} atualizada")
             return {'success': True}
         
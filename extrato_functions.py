@@ -3,15 +3,33 @@ Funcoes para gerenciamento de extratos bancarios (importacao OFX e conciliacao)
 """
 
 import sys
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from decimal import Decimal
+from itertools import islice
 import uuid
 
+from psycopg2.extras import execute_values
+
 # Funcao de log
 def log(msg):
     print(msg, file=sys.stderr, flush=True)
 
 
+# Tamanho dos lotes enviados para a tabela de staging na importacao em massa
+BULK_CHUNK_SIZE = 1000
+
+
+def _montar_ignoradas_info(data_ini, data_fim, total_datas):
+    """Monta o resumo amigavel do intervalo de datas ignoradas por duplicidade"""
+    if not total_datas:
+        return None
+    return {
+        'data_inicio': data_ini.strftime('%d/%m/%Y') if hasattr(data_ini, 'strftime') else str(data_ini),
+        'data_fim': data_fim.strftime('%d/%m/%Y') if hasattr(data_fim, 'strftime') else str(data_fim),
+        'total_datas': total_datas
+    }
+
+
 def salvar_transacoes_extrato(database, empresa_id, conta_bancaria, transacoes, importacao_id=None):
     """
     Salva transacoes do extrato no banco
@@ -85,13 +103,11 @@ def salvar_transacoes_extrato(database, empresa_id, conta_bancaria, transacoes,
             ignoradas_datas_sorted = sorted(ignoradas_datas) if ignoradas_datas else []
             ignoradas_info = None
             if ignoradas_datas_sorted:
-                data_ini = ignoradas_datas_sorted[0]
-                data_fim = ignoradas_datas_sorted[-1]
-                ignoradas_info = {
-                    'data_inicio': data_ini.strftime('%d/%m/%Y') if hasattr(data_ini, 'strftime') else str(data_ini),
-                    'data_fim': data_fim.strftime('%d/%m/%Y') if hasattr(data_fim, 'strftime') else str(data_fim),
-                    'total_datas': len(ignoradas_datas_sorted)
-                }
+                ignoradas_info = _montar_ignoradas_info(
+                    ignoradas_datas_sorted[0],
+                    ignoradas_datas_sorted[-1],
+                    len(ignoradas_datas_sorted)
+                )
 
             log(f"Extrato importado: {inseridas} novas, {duplicadas} duplicadas ignoradas")
             return {
@@ -109,139 +125,458 @@ def salvar_transacoes_extrato(database, empresa_id, conta_bancaria, transacoes,
         return {'success': False, 'error': str(e)}
 
 
-def listar_transacoes_extrato(database, empresa_id, filtros=None):
+def salvar_transacoes_extrato_bulk(database, empresa_id, conta_bancaria, transacoes,
+                                   importacao_id=None, chunk_size=BULK_CHUNK_SIZE,
+                                   saldos_iniciais=None):
     """
-    Lista transacoes do extrato com filtros
+    Salva transacoes do extrato no banco em modo set-based (importacao em massa)
+    
+    Em vez de um SELECT + INSERT por transacao, o lote e enviado em blocos para
+    uma tabela temporaria (staging), deduplicado contra os FITIDs ja existentes
+    e inserido com um unico INSERT ... SELECT. Um extrato anual de 3.000 linhas
+    passa de ~6.000 round trips para poucas dezenas.
+    
+    Regras de deduplicacao identicas a salvar_transacoes_extrato:
+    - transacao com FITID ja existente na empresa e ignorada
+    - FITID repetido dentro do proprio arquivo: apenas a primeira ocorrencia entra
+    - transacoes sem FITID (NULL ou vazio) sao sempre inseridas, com o
+      FITID gravado como recebido (igual a salvar_transacoes_extrato)
     
     Args:
         database: instancia do DatabaseManager
         empresa_id: ID da empresa
-        filtros: dict opcional com conta, data_inicio, data_fim, conciliado
+        conta_bancaria: nome da conta bancaria
+        transacoes: iteravel de dicts com as transacoes (lista ou gerador)
+        importacao_id: ID unico da importacao (para rastrear)
+        chunk_size: quantidade de linhas por bloco enviado ao staging
+        saldos_iniciais: dict opcional {grupo: saldo_inicial}. Quando informado,
+            o saldo de cada linha e calculado no banco como saldo_inicial + soma
+            acumulada em ordem cronologica dentro do grupo (conta do OFX),
+            dispensando ordenar o extrato em memoria
     
     Returns:
-        dict: {'transacoes': list, 'saldo_anterior': float}
+        dict: {'success': bool, 'inseridas': int, 'duplicadas': int,
+               'importacao_id': str, 'ignoradas_info': dict|None}
     """
     try:
-        log(f"🔍 listar_transacoes_extrato: empresa_id={empresa_id}, filtros={filtros}")
+        if not importacao_id:
+            importacao_id = str(uuid.uuid4())
         
         # 🔒 Passar empresa_id para RLS
-        log(f"🔍 Tentando obter conexão com empresa_id={empresa_id}")
         with database.get_db_connection(empresa_id=empresa_id) as conn:
-            log(f"✅ Conexão obtida com sucesso!")
+            conn.autocommit = False
             cursor = conn.cursor(cursor_factory=database.RealDictCursor)
             
-            # 🏦 CALCULAR SALDO ANTERIOR dinamicamente (imune a valores armazenados incorretos)
-            # ESTRATÉGIA: saldo_inicial_conta + SUM(transacoes desde data_inicio_conta até data_filtro)
-            # Isso é correto mesmo quando o campo 'saldo' armazenado foi calculado errado
-            # (ex: OFX com transações fake como "SALDO ANTERIOR" ou data_inicio errada na conta)
-            saldo_anterior = None
-            data_inicio_filtro = filtros.get('data_inicio') if filtros else None
-
-            if data_inicio_filtro:
-                conta_bancaria_filtro = filtros.get('conta_bancaria') if filtros else None
-                saldo_base = 0.0
-                data_base = None
-
-                # 1) Obter saldo_inicial e data_inicio da conta (se filtro por conta específica)
-                if conta_bancaria_filtro:
-                    cursor.execute("""
-                        SELECT saldo_inicial, data_inicio
-                        FROM contas_bancarias
-                        WHERE empresa_id = %s AND nome = %s
-                        LIMIT 1
-                    """, (empresa_id, conta_bancaria_filtro))
-                    conta_row = cursor.fetchone()
-                    if conta_row:
-                        saldo_base = float(conta_row['saldo_inicial'] or 0)
-                        data_base = conta_row['data_inicio']
-                        log(f"🏦 Conta encontrada: saldo_inicial={saldo_base}, data_inicio={data_base}")
-
-                # 2) Somar transações: desde data_base (ou all-time) até data_filtro
-                query_soma = """
-                    SELECT COALESCE(SUM(valor), 0) AS soma
-                    FROM transacoes_extrato
-                    WHERE empresa_id = %s
-                      AND data < %s
-                """
-                params_soma = [empresa_id, data_inicio_filtro]
-
-                if conta_bancaria_filtro:
-                    query_soma += " AND conta_bancaria = %s"
-                    params_soma.append(conta_bancaria_filtro)
-
-                # Só somar transações desde a data_inicio da conta (a partir de quando o saldo_inicial vale)
-                if data_base:
-                    query_soma += " AND data >= %s"
-                    params_soma.append(data_base)
-
-                cursor.execute(query_soma, params_soma)
-                soma_row = cursor.fetchone()
-                soma_anterior = float((soma_row['soma'] if isinstance(soma_row, dict) else soma_row[0]) or 0)
-
-                saldo_anterior = saldo_base + soma_anterior
-                log(f"🏦 Saldo anterior calculado: {saldo_base} (base) + {soma_anterior:.2f} (soma) = R$ {saldo_anterior:,.2f}")
-            
-            # Query principal de transações
-            # Usar tabela conciliacoes para verificar conciliação
-            query = """
-                SELECT t.*, 
-                       c.lancamento_id,
-                       l.descricao as lancamento_descricao
-                FROM transacoes_extrato t
-                LEFT JOIN conciliacoes c ON c.transacao_extrato_id = t.id AND c.empresa_id = t.empresa_id
-                LEFT JOIN lancamentos l ON l.id = c.lancamento_id AND l.empresa_id = t.empresa_id
-                WHERE t.empresa_id = %s
-            """
-            params = [empresa_id]
-            
-            if filtros:
-                if filtros.get('conta_bancaria'):
-                    query += " AND t.conta_bancaria = %s"
-                    params.append(filtros['conta_bancaria'])
-                
-                if filtros.get('data_inicio'):
-                    query += " AND t.data >= %s"
-                    params.append(filtros['data_inicio'])
-                
-                if filtros.get('data_fim'):
-                    query += " AND t.data <= %s"
-                    params.append(filtros['data_fim'])
-                
-                if filtros.get('conciliado') is not None:
-                    query += " AND t.conciliado = %s"
-                    params.append(filtros['conciliado'])
-            
-            # Ordenar do passado para o presente (ASC) para que o saldo faça sentido visual
-            query += " ORDER BY t.data ASC, t.id ASC LIMIT 1000"
+            # Staging da importacao: some automaticamente no COMMIT/ROLLBACK,
+            # entao a conexao volta limpa para o pool
+            cursor.execute("""
+                CREATE TEMP TABLE extrato_staging (
+                    ordem INTEGER NOT NULL,
+                    grupo INTEGER NOT NULL,
+                    datahora TIMESTAMP,
+                    data DATE NOT NULL,
+                    descricao TEXT NOT NULL,
+                    valor DECIMAL(15,2) NOT NULL,
+                    tipo VARCHAR(20) NOT NULL,
+                    saldo DECIMAL(15,2),
+                    fitid VARCHAR(255),
+                    memo TEXT,
+                    checknum VARCHAR(50)
+                ) ON COMMIT DROP
+            """)
             
-            log(f"📊 Executando query: {query}")
-            log(f"📊 Parâmetros: {params}")
+            total_staging = 0
+            iterador = iter(transacoes)
+            while True:
+                bloco = list(islice(iterador, chunk_size))
+                if not bloco:
+                    break
+                execute_values(cursor, """
+                    INSERT INTO extrato_staging (
+                        ordem, grupo, datahora, data, descricao, valor, tipo,
+                        saldo, fitid, memo, checknum
+                    ) VALUES %s
+                """, [
+                    (
+                        total_staging + i,
+                        trans.get('grupo', 0),
+                        trans.get('datahora'),
+                        trans['data'],
+                        trans['descricao'],
+                        trans['valor'],
+                        trans['tipo'],
+                        trans.get('saldo'),
+                        trans.get('fitid'),
+                        trans.get('memo'),
+                        trans.get('checknum')
+                    )
+                    for i, trans in enumerate(bloco)
+                ], page_size=chunk_size)
+                total_staging += len(bloco)
             
-            cursor.execute(query, params)
-            transacoes = cursor.fetchall()
+            if total_staging == 0:
+                conn.rollback()
+                cursor.close()
+                log("Extrato importado (bulk): nenhuma transacao recebida")
+                return {
+                    'success': True,
+                    'inseridas': 0,
+                    'duplicadas': 0,
+                    'importacao_id': importacao_id,
+                    'ignoradas_info': None
+                }
             
-            log(f"📊 Query retornou {len(transacoes)} transação(ões)")
+            # Deduplicar contra os FITIDs existentes e inserir em uma unica passada
+            grupos = list(saldos_iniciais.keys()) if saldos_iniciais else []
+            saldos = [saldos_iniciais[g] for g in grupos]
+            cursor.execute("""
+                WITH classificadas AS (
+                    SELECT s.ordem, s.data, s.descricao, s.valor, s.tipo,
+                           s.fitid, s.memo, s.checknum,
+                           COALESCE(
+                               si.saldo_inicial + SUM(s.valor) OVER (
+                                   PARTITION BY s.grupo
+                                   ORDER BY COALESCE(s.datahora, s.data::timestamp), s.ordem
+                               ),
+                               s.saldo
+                           ) AS saldo,
+                           (s.fitid IS NULL OR s.fitid = '' OR (
+                               ROW_NUMBER() OVER (PARTITION BY s.fitid ORDER BY s.ordem) = 1
+                               AND NOT EXISTS (
+                                   SELECT 1 FROM transacoes_extrato t
+                                   WHERE t.fitid = s.fitid AND t.empresa_id = %s
+                               )
+                           )) AS nova
+                    FROM extrato_staging s
+                    LEFT JOIN unnest(%s::int[], %s::numeric[]) AS si(grupo, saldo_inicial)
+                        ON si.grupo = s.grupo
+                ),
+                inseridas AS (
+                    INSERT INTO transacoes_extrato (
+                        empresa_id, conta_bancaria, data, descricao, valor, tipo,
+                        saldo, fitid, memo, checknum, importacao_id
+                    )
+                    SELECT %s, %s, data, descricao, valor, tipo,
+                           saldo, fitid, memo, checknum, %s
+                    FROM classificadas
+                    WHERE nova
+                    ORDER BY ordem
+                    RETURNING 1
+                )
+                SELECT (SELECT COUNT(*) FROM inseridas) AS inseridas,
+                       COUNT(*) FILTER (WHERE NOT nova) AS duplicadas,
+                       MIN(data) FILTER (WHERE NOT nova) AS dup_data_inicio,
+                       MAX(data) FILTER (WHERE NOT nova) AS dup_data_fim,
+                       COUNT(DISTINCT data) FILTER (WHERE NOT nova) AS dup_total_datas
+                FROM classificadas
+            """, (empresa_id, grupos, saldos, empresa_id, conta_bancaria, importacao_id))
+            resumo = cursor.fetchone()
             
+            conn.commit()
             cursor.close()
             
-            # Converter date/datetime/Decimal para tipos JSON-safe
-            result = []
-            for t in transacoes:
-                d = dict(t)
-                for key, val in d.items():
-                    if hasattr(val, 'isoformat'):
-                        d[key] = val.isoformat()
-                    elif isinstance(val, Decimal):
-                        d[key] = float(val)
-                result.append(d)
-            
-            log(f"✅ Retornando {len(result)} transação(ões) para o frontend")
+            inseridas = int(resumo['inseridas'] or 0)
+            duplicadas = int(resumo['duplicadas'] or 0)
+            ignoradas_info = _montar_ignoradas_info(
+                resumo['dup_data_inicio'],
+                resumo['dup_data_fim'],
+                int(resumo['dup_total_datas'] or 0)
+            )
             
+            log(f"Extrato importado (bulk): {inseridas} novas, {duplicadas} duplicadas ignoradas")
             return {
-                'transacoes': result,
-                'saldo_anterior': saldo_anterior
+                'success': True,
+                'inseridas': inseridas,
+                'duplicadas': duplicadas,
+                'importacao_id': importacao_id,
+                'ignoradas_info': ignoradas_info
             }
         
+    except Exception as e:
+        log(f"Erro ao salvar transacoes (bulk): {e}")
+        import traceback
+        traceback.print_exc(file=sys.stderr)
+        return {'success': False, 'error': str(e)}
+
+
+# Maximo de transacoes devolvidas pela listagem do extrato
+LIMITE_TRANSACOES_EXTRATO = 1000
+
+
+def _para_data(valor):
+    """date a partir de date, datetime ou texto ISO (YYYY-MM-DD...)"""
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    return date.fromisoformat(str(valor)[:10])
+
+
+def _proximo_mes(data):
+    """Primeiro dia do mes seguinte"""
+    return (data.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def reconstruir_saldos_mensais(cursor, empresa_id=None):
+    """
+    Reconstroi do zero os checkpoints de saldo (saldos_extrato_mensais)
+
+    No dia a dia os checkpoints sao mantidos pelos triggers de
+    transacoes_extrato (sql/migrations/migration_saldos_extrato_mensais.sql);
+    isto e para corrigir checkpoints de antes dos triggers ou apos restaurar
+    a tabela por fora do banco.
+
+    Args:
+        cursor: cursor com RealDictCursor, dentro da transacao do chamador
+        empresa_id: ID da empresa (None = todas)
+
+    Returns:
+        int: quantidade de (conta, mes) gravados
+    """
+    cursor.execute("SELECT reconstruir_saldos_extrato_mensais(%s) AS meses", (empresa_id,))
+    return cursor.fetchone()['meses']
+
+
+def somar_extrato_ate(cursor, empresa_id, data_limite, conta_bancaria=None, desde=None):
+    """
+    SUM(valor) das transacoes do extrato com desde <= data < data_limite
+
+    Meses inteiros saem dos checkpoints mensais; so as pontas (o mes de
+    data_limite e, com desde, o comeco do mes de desde) somam transacoes.
+
+    Args:
+        cursor: cursor com RealDictCursor
+        empresa_id: ID da empresa
+        data_limite: data final, exclusiva
+        conta_bancaria: conta (None = todas as contas da empresa)
+        desde: data inicial, inclusiva (None = todo o historico)
+
+    Returns:
+        float: soma dos valores
+    """
+    ate = _para_data(data_limite)
+    inicio = _para_data(desde) if desde else None
+    mes_ate = ate.replace(day=1)
+    primeiro_mes_inteiro = None
+    if inicio is not None:
+        primeiro_mes_inteiro = inicio if inicio.day == 1 else _proximo_mes(inicio)
+
+    if inicio is not None and (inicio >= ate or primeiro_mes_inteiro > mes_ate):
+        # Periodo dentro de um unico mes: so soma direta
+        faixas = [(inicio, ate)] if inicio < ate else []
+        usar_checkpoints = False
+    else:
+        faixas = [(mes_ate, ate)] if mes_ate < ate else []
+        if inicio is not None and inicio < primeiro_mes_inteiro:
+            faixas.append((inicio, primeiro_mes_inteiro))
+        usar_checkpoints = True
+
+    filtro_conta = " AND conta_bancaria = %s" if conta_bancaria else ""
+    partes = []
+    params = []
+    if usar_checkpoints:
+        query = "SELECT COALESCE(SUM(soma), 0) FROM saldos_extrato_mensais WHERE empresa_id = %s AND mes < %s"
+        params += [empresa_id, mes_ate]
+        if primeiro_mes_inteiro is not None:
+            query += " AND mes >= %s"
+            params.append(primeiro_mes_inteiro)
+        partes.append(query + filtro_conta)
+        if conta_bancaria:
+            params.append(conta_bancaria)
+    if faixas:
+        query = (
+            "SELECT COALESCE(SUM(valor), 0) FROM transacoes_extrato WHERE empresa_id = %s"
+            + filtro_conta + " AND ("
+            + " OR ".join("(data >= %s AND data < %s)" for _ in faixas) + ")"
+        )
+        params.append(empresa_id)
+        if conta_bancaria:
+            params.append(conta_bancaria)
+        for faixa_inicio, faixa_fim in faixas:
+            params += [faixa_inicio, faixa_fim]
+        partes.append(query)
+    if not partes:
+        return 0.0
+
+    cursor.execute(
+        "SELECT " + " + ".join(f"({parte})" for parte in partes) + " AS soma",
+        params
+    )
+    row = cursor.fetchone()
+    return float((row['soma'] if isinstance(row, dict) else row[0]) or 0)
+
+
+def ultimos_saldos_extrato(cursor, empresa_id):
+    """
+    Saldo informado na transacao mais recente de cada conta, pelos checkpoints
+
+    Returns:
+        dict: {conta_bancaria: saldo (Decimal ou None se a linha nao tinha saldo)}
+    """
+    cursor.execute("""
+        SELECT DISTINCT ON (conta_bancaria) conta_bancaria, ultimo_saldo
+        FROM saldos_extrato_mensais
+        WHERE empresa_id = %s
+        ORDER BY conta_bancaria, mes DESC
+    """, (empresa_id,))
+    return {row['conta_bancaria']: row['ultimo_saldo'] for row in cursor.fetchall()}
+
+
+def apagar_transacoes_extrato(cursor, empresa_id, condicao, params=()):
+    """
+    DELETE em transacoes_extrato restrito a empresa
+
+    Os checkpoints mensais dos meses afetados sao recalculados pelo trigger
+    da tabela, na mesma transacao.
+
+    Args:
+        cursor: cursor com RealDictCursor, dentro da transacao do chamador
+        empresa_id: ID da empresa (sempre aplicado)
+        condicao: condicao SQL adicional (ex.: "conta_bancaria = %s")
+        params: parametros da condicao
+
+    Returns:
+        int: transacoes apagadas
+    """
+    cursor.execute(f"""
+        DELETE FROM transacoes_extrato
+        WHERE empresa_id = %s AND ({condicao})
+    """, (empresa_id, *params))
+    return cursor.rowcount
+
+
+def calcular_saldo_anterior_extrato(cursor, empresa_id, filtros):
+    """
+    Saldo da conta no inicio do periodo filtrado (None sem data_inicio)
+
+    Calculado dinamicamente (imune a valores armazenados incorretos):
+    saldo_inicial_conta + SUM(transacoes desde data_inicio_conta ate data_filtro).
+    Isso e correto mesmo quando o campo 'saldo' armazenado foi calculado errado
+    (ex: OFX com transacoes fake como "SALDO ANTERIOR" ou data_inicio errada na conta)
+    """
+    data_inicio_filtro = filtros.get('data_inicio') if filtros else None
+    if not data_inicio_filtro:
+        return None
+
+    conta_bancaria_filtro = filtros.get('conta_bancaria')
+    saldo_base = 0.0
+    data_base = None
+
+    # 1) Obter saldo_inicial e data_inicio da conta (se filtro por conta especifica)
+    if conta_bancaria_filtro:
+        cursor.execute("""
+            SELECT saldo_inicial, data_inicio
+            FROM contas_bancarias
+            WHERE empresa_id = %s AND nome = %s
+            LIMIT 1
+        """, (empresa_id, conta_bancaria_filtro))
+        conta_row = cursor.fetchone()
+        if conta_row:
+            saldo_base = float(conta_row['saldo_inicial'] or 0)
+            data_base = conta_row['data_inicio']
+            log(f"🏦 Conta encontrada: saldo_inicial={saldo_base}, data_inicio={data_base}")
+
+    # 2) Somar transações: desde data_base (ou all-time) até data_filtro
+    # Só soma desde a data_inicio da conta (a partir de quando o saldo_inicial vale);
+    # meses inteiros vêm dos checkpoints mensais
+    soma_anterior = somar_extrato_ate(cursor, empresa_id, data_inicio_filtro,
+                                      conta_bancaria_filtro, desde=data_base)
+
+    saldo_anterior = saldo_base + soma_anterior
+    log(f"🏦 Saldo anterior calculado: {saldo_base} (base) + {soma_anterior:.2f} (soma) = R$ {saldo_anterior:,.2f}")
+    return saldo_anterior
+
+
+def _consulta_transacoes_extrato(empresa_id, filtros):
+    """SELECT das transacoes do extrato (com a conciliacao) e seus parametros"""
+    # Usar tabela conciliacoes para verificar conciliação
+    query = """
+        SELECT t.*, 
+               c.lancamento_id,
+               l.descricao as lancamento_descricao
+        FROM transacoes_extrato t
+        LEFT JOIN conciliacoes c ON c.transacao_extrato_id = t.id AND c.empresa_id = t.empresa_id
+        LEFT JOIN lancamentos l ON l.id = c.lancamento_id AND l.empresa_id = t.empresa_id
+        WHERE t.empresa_id = %s
+    """
+    params = [empresa_id]
+
+    if filtros:
+        if filtros.get('conta_bancaria'):
+            query += " AND t.conta_bancaria = %s"
+            params.append(filtros['conta_bancaria'])
+
+        if filtros.get('data_inicio'):
+            query += " AND t.data >= %s"
+            params.append(filtros['data_inicio'])
+
+        if filtros.get('data_fim'):
+            query += " AND t.data <= %s"
+            params.append(filtros['data_fim'])
+
+        if filtros.get('conciliado') is not None:
+            query += " AND t.conciliado = %s"
+            params.append(filtros['conciliado'])
+
+    # Ordenar do passado para o presente (ASC) para que o saldo faça sentido visual
+    query += " ORDER BY t.data ASC, t.id ASC LIMIT %s"
+    params.append(LIMITE_TRANSACOES_EXTRATO)
+    return query, params
+
+
+def iterar_transacoes_extrato(database, empresa_id, filtros=None):
+    """
+    Gera as transacoes do extrato uma a uma (cursor server-side)
+
+    As linhas saem com os tipos do banco (Decimal, date); a conversao para
+    JSON acontece na codificacao (app.utils.json_stream), sem copia da lista.
+
+    Args:
+        database: modulo/instancia com get_db_connection
+        empresa_id: ID da empresa
+        filtros: dict opcional com conta_bancaria, data_inicio, data_fim, conciliado
+    """
+    from app.utils.json_stream import linhas_cursor
+
+    query, params = _consulta_transacoes_extrato(empresa_id, filtros)
+    # 🔒 Passar empresa_id para RLS
+    with database.get_db_connection(empresa_id=empresa_id) as conn:
+        yield from linhas_cursor(conn, query, params)
+
+
+def listar_transacoes_extrato(database, empresa_id, filtros=None):
+    """
+    Lista transacoes do extrato com filtros
+    
+    Args:
+        database: instancia do DatabaseManager
+        empresa_id: ID da empresa
+        filtros: dict opcional com conta, data_inicio, data_fim, conciliado
+    
+    Returns:
+        dict: {'transacoes': list, 'saldo_anterior': float}
+        (valores Decimal/date como vieram do banco; para respostas HTTP use
+        iterar_transacoes_extrato + app.utils.json_stream)
+    """
+    try:
+        log(f"🔍 listar_transacoes_extrato: empresa_id={empresa_id}, filtros={filtros}")
+        
+        # 🔒 Passar empresa_id para RLS
+        with database.get_db_connection(empresa_id=empresa_id) as conn:
+            cursor = conn.cursor(cursor_factory=database.RealDictCursor)
+            saldo_anterior = calcular_saldo_anterior_extrato(cursor, empresa_id, filtros)
+            
+            query, params = _consulta_transacoes_extrato(empresa_id, filtros)
+            cursor.execute(query, params)
+            transacoes = [dict(t) for t in cursor.fetchall()]
+            cursor.close()
+        
+        log(f"✅ Retornando {len(transacoes)} transação(ões)")
+        return {
+            'transacoes': transacoes,
+            'saldo_anterior': saldo_anterior
+        }
+        
     except Exception as e:
         log(f"❌ ERRO ao listar transacoes: {e}")
         import traceback
@@ -507,6 +842,348 @@ def conciliar_transacao(database, empresa_id, transacao_id, lancamento_id):
         return {'success': False, 'error': str(e)}
 
 
+def _tipo_lancamento_extrato(tipo_extrato, valor):
+    """Débito vira despesa, crédito vira receita; tipo desconhecido usa o sinal do valor"""
+    tipo_upper = (tipo_extrato or '').upper()
+    if tipo_upper in ('DÉBITO', 'DEBITO'):
+        return 'despesa'
+    if tipo_upper in ('CRÉDITO', 'CREDITO'):
+        return 'receita'
+    return 'receita' if float(valor or 0) >= 0 else 'despesa'
+
+
+def conciliar_transacoes_lote(database, empresa_id, itens, clientes_por_documento=None,
+                              fornecedores_por_documento=None):
+    """
+    Conciliação geral em lote: cria um lançamento PAGO para cada transação do extrato
+
+    Mesmo resultado de chamar conciliar_transacao(..., 'auto') item a item e depois
+    aplicar categoria/subcategoria/pessoa/descrição escolhidas pelo usuário, mas com
+    uma única conexão e uma única transação:
+    - transações e contas bancárias carregadas uma vez (WHERE id = ANY(...))
+    - lançamentos, conciliações, flags do extrato e histórico gravados em lote
+
+    Args:
+        database: instancia do DatabaseManager
+        empresa_id: ID da empresa [OBRIGATÓRIO]
+        itens: lista de dicts {transacao_id, categoria, subcategoria, razao_social, descricao}
+        clientes_por_documento: {cpf/cnpj só dígitos: nome} usado em créditos
+        fornecedores_por_documento: {cpf/cnpj só dígitos: nome} usado em débitos
+
+    Returns:
+        dict: {'success': bool, 'criados': int, 'erros': list, 'lancamentos': {transacao_id: lancamento_id}}
+
+    Security:
+        🔒 RLS aplicado via empresa_id
+    """
+    clientes_por_documento = clientes_por_documento or {}
+    fornecedores_por_documento = fornecedores_por_documento or {}
+    erros = []
+
+    # Uma linha por transação: repetições no mesmo pedido são ignoradas
+    itens_unicos = {}
+    for item in itens:
+        transacao_id = item.get('transacao_id')
+        try:
+            transacao_id = int(transacao_id)
+        except (TypeError, ValueError):
+            erros.append(f"Transação {transacao_id} não encontrada")
+            continue
+        if transacao_id in itens_unicos:
+            erros.append(f"Transação {transacao_id}: enviada mais de uma vez na mesma conciliação")
+            continue
+        itens_unicos[transacao_id] = item
+
+    if not itens_unicos:
+        return {'success': False, 'criados': 0, 'erros': erros, 'lancamentos': {}}
+
+    try:
+        # 🔒 Passar empresa_id para RLS
+        with database.get_db_connection(empresa_id=empresa_id) as conn:
+            conn.autocommit = False
+            cursor = conn.cursor(cursor_factory=database.RealDictCursor)
+
+            try:
+                cursor.execute("""
+                    SELECT * FROM transacoes_extrato
+                    WHERE id = ANY(%s) AND empresa_id = %s
+                """, (list(itens_unicos), empresa_id))
+                transacoes = {t['id']: t for t in cursor.fetchall()}
+
+                cursor.execute("""
+                    SELECT nome, ativa FROM contas_bancarias
+                    WHERE empresa_id = %s
+                """, (empresa_id,))
+                contas = {c['nome']: c for c in cursor.fetchall()}
+
+                # Validar e montar as linhas em memória
+                linhas = []
+                for transacao_id, item in itens_unicos.items():
+                    transacao = transacoes.get(transacao_id)
+                    if not transacao:
+                        erros.append(f"Transação {transacao_id} não encontrada")
+                        continue
+
+                    conta_bancaria = transacao['conta_bancaria']
+                    conta = contas.get(conta_bancaria)
+                    if not conta:
+                        erros.append(f"Transação {transacao_id}: A conta bancária '{conta_bancaria}' não está cadastrada no sistema ou o nome não corresponde exatamente. Verifique o cadastro de contas.")
+                        continue
+                    if conta['ativa'] is False:
+                        erros.append(f"Transação {transacao_id}: A conta bancária '{conta_bancaria}' está inativa. Reative a conta antes de conciliar.")
+                        continue
+
+                    categoria = item.get('categoria') or ''
+                    subcategoria = item.get('subcategoria') or ''
+                    razao_social = item.get('razao_social') or ''
+                    descricao_personalizada = item.get('descricao') or ''
+
+                    # Matching automático por CPF (11 dígitos) ou CNPJ (14 dígitos)
+                    if not razao_social:
+                        numeros = ''.join(filter(str.isdigit, transacao['descricao'] or ''))
+                        if len(numeros) in (11, 14):
+                            if (transacao['tipo'] or '').upper() == 'CREDITO':
+                                razao_social = clientes_por_documento.get(numeros, '')
+                            else:
+                                razao_social = fornecedores_por_documento.get(numeros, '')
+
+                    linhas.append({
+                        'transacao_id': transacao_id,
+                        'tipo': _tipo_lancamento_extrato(transacao['tipo'], transacao['valor']),
+                        'descricao': descricao_personalizada or transacao['descricao'] or 'Lançamento criado automaticamente via conciliação',
+                        'valor': abs(float(transacao['valor'] or 0)),
+                        'data': transacao['data'],
+                        'conta_bancaria': conta_bancaria,
+                        'categoria': categoria or transacao.get('categoria') or 'Conciliação Bancária',
+                        'subcategoria': subcategoria or transacao.get('subcategoria'),
+                        'pessoa': razao_social or transacao.get('pessoa'),
+                        'observacoes': f"Criado automaticamente pela conciliação com transação #{transacao_id}",
+                        # Gravados de volta no extrato (None mantém o valor atual)
+                        'extrato_categoria': categoria or None,
+                        'extrato_subcategoria': subcategoria or None,
+                        'extrato_pessoa': razao_social or None
+                    })
+
+                if not linhas:
+                    conn.rollback()
+                    return {'success': False, 'criados': 0, 'erros': erros, 'lancamentos': {}}
+
+                # Reservar os IDs antes do INSERT: mapeamento transação -> lançamento explícito
+                cursor.execute("""
+                    SELECT nextval(pg_get_serial_sequence('lancamentos', 'id')) AS id
+                    FROM generate_series(1, %s)
+                """, (len(linhas),))
+                for linha, row in zip(linhas, cursor.fetchall()):
+                    linha['lancamento_id'] = row['id']
+
+                execute_values(cursor, """
+                    INSERT INTO lancamentos (
+                        id, empresa_id, tipo, descricao, valor,
+                        data_vencimento, data_pagamento, status,
+                        conta_bancaria, categoria, subcategoria, pessoa, observacoes
+                    ) VALUES %s
+                """, [(
+                    l['lancamento_id'], empresa_id, l['tipo'], l['descricao'], l['valor'],
+                    l['data'], l['data'], 'pago',
+                    l['conta_bancaria'], l['categoria'], l['subcategoria'], l['pessoa'], l['observacoes']
+                ) for l in linhas], page_size=BULK_CHUNK_SIZE)
+
+                execute_values(cursor, """
+                    INSERT INTO conciliacoes (
+                        empresa_id, transacao_extrato_id, lancamento_id
+                    ) VALUES %s
+                    ON CONFLICT (transacao_extrato_id)
+                    DO UPDATE SET
+                        lancamento_id = EXCLUDED.lancamento_id,
+                        data_conciliacao = CURRENT_TIMESTAMP,
+                        updated_at = CURRENT_TIMESTAMP
+                """, [(empresa_id, l['transacao_id'], l['lancamento_id']) for l in linhas],
+                    page_size=BULK_CHUNK_SIZE)
+
+                execute_values(cursor, """
+                    UPDATE transacoes_extrato AS te
+                    SET conciliado = TRUE,
+                        categoria = COALESCE(v.categoria, te.categoria),
+                        subcategoria = COALESCE(v.subcategoria, te.subcategoria),
+                        pessoa = COALESCE(v.pessoa, te.pessoa)
+                    FROM (VALUES %s) AS v(id, empresa_id, categoria, subcategoria, pessoa)
+                    WHERE te.id = v.id AND te.empresa_id = v.empresa_id
+                """, [(
+                    l['transacao_id'], empresa_id,
+                    l['extrato_categoria'], l['extrato_subcategoria'], l['extrato_pessoa']
+                ) for l in linhas], template='(%s::int, %s::int, %s::text, %s::text, %s::text)',
+                    page_size=BULK_CHUNK_SIZE)
+
+                # Histórico permanente: falha aqui não desfaz a conciliação
+                cursor.execute("SAVEPOINT historico_lote")
+                try:
+                    cursor.execute("""
+                        CREATE TABLE IF NOT EXISTS historico_conciliacoes (
+                            id BIGSERIAL PRIMARY KEY, empresa_id INT NOT NULL,
+                            evento VARCHAR(20) NOT NULL, data_evento TIMESTAMPTZ DEFAULT NOW(),
+                            transacao_extrato_id INT, lancamento_id INT, data_transacao DATE,
+                            conta_bancaria VARCHAR(255), descricao_extrato TEXT,
+                            valor NUMERIC(15,2), tipo_extrato VARCHAR(50),
+                            descricao_lancamento TEXT, categoria VARCHAR(255),
+                            subcategoria VARCHAR(255), pessoa VARCHAR(255),
+                            observacoes TEXT, memo TEXT, fitid VARCHAR(255)
+                        )
+                    """)
+                    cursor.execute("""
+                        INSERT INTO historico_conciliacoes (
+                            empresa_id, evento, transacao_extrato_id, lancamento_id,
+                            data_transacao, conta_bancaria, descricao_extrato, valor, tipo_extrato,
+                            descricao_lancamento, categoria, subcategoria, pessoa, observacoes, memo, fitid
+                        )
+                        SELECT
+                            te.empresa_id, 'conciliado', te.id, l.id,
+                            te.data, te.conta_bancaria, te.descricao, ABS(COALESCE(te.valor, 0)), te.tipo,
+                            l.descricao, l.categoria, l.subcategoria, l.pessoa,
+                            l.observacoes, te.memo, te.fitid
+                        FROM unnest(%s::int[], %s::int[]) AS v(transacao_id, lancamento_id)
+                        JOIN transacoes_extrato te ON te.id = v.transacao_id AND te.empresa_id = %s
+                        JOIN lancamentos l ON l.id = v.lancamento_id AND l.empresa_id = te.empresa_id
+                    """, (
+                        [l['transacao_id'] for l in linhas],
+                        [l['lancamento_id'] for l in linhas],
+                        empresa_id
+                    ))
+                    cursor.execute("RELEASE SAVEPOINT historico_lote")
+                except Exception as _he:
+                    cursor.execute("ROLLBACK TO SAVEPOINT historico_lote")
+                    log(f"Historico insert warning: {_he}")
+
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+        log(f"✅ Conciliação em lote: {len(linhas)} lançamento(s) criado(s), {len(erros)} erro(s)")
+        return {
+            'success': True,
+            'criados': len(linhas),
+            'erros': erros,
+            'lancamentos': {l['transacao_id']: l['lancamento_id'] for l in linhas}
+        }
+
+    except Exception as e:
+        log(f"❌ Erro na conciliação em lote: {e}")
+        import traceback
+        log(traceback.format_exc())
+        # Transação única: nenhuma linha foi gravada
+        erros.extend(f"Erro na transação {transacao_id}: {str(e)}" for transacao_id in itens_unicos)
+        return {'success': False, 'criados': 0, 'erros': erros, 'lancamentos': {}}
+
+
+def sugerir_conciliacoes_lote(database, empresa_id, transacao_ids=None, conta_bancaria=None,
+                              data_inicio=None, data_fim=None, limite=None):
+    """
+    Sugere lancamentos para conciliar com varias transacoes do extrato de uma vez
+
+    Tres consultas no total, qualquer que seja o numero de transacoes:
+    - transacoes do extrato (por id, ou as nao conciliadas da conta/periodo)
+    - lancamentos pago/pendente ainda sem conciliacao nas contas e na janela de
+      datas das transacoes (+/- JANELA_DIAS), em faixa de data indexavel
+    - CPF/CNPJ de clientes e fornecedores, para comparar com o texto do extrato
+    O casamento e a pontuacao sao feitos em memoria por IndiceCandidatos.
+
+    Args:
+        database: instancia do DatabaseManager
+        empresa_id: ID da empresa
+        transacao_ids: IDs das transacoes (ex.: a pagina do extrato exibida)
+        conta_bancaria: sem transacao_ids, filtra as nao conciliadas por conta
+        data_inicio: sem transacao_ids, data inicial (YYYY-MM-DD)
+        data_fim: sem transacao_ids, data final (YYYY-MM-DD)
+        limite: sugestoes por transacao (padrao MAX_SUGESTOES)
+
+    Returns:
+        dict: {transacao_id: [lancamentos sugeridos com score, do mais provavel ao menos]}
+    """
+    from sugestoes_conciliacao import (IndiceCandidatos, JANELA_DIAS, MAX_SUGESTOES,
+                                       normalizar_texto)
+
+    limite = limite or MAX_SUGESTOES
+
+    # 🔒 Passar empresa_id para RLS
+    with database.get_db_connection(empresa_id=empresa_id) as conn:
+        cursor = conn.cursor(cursor_factory=database.RealDictCursor)
+
+        if transacao_ids is not None:
+            ids = list({int(i) for i in transacao_ids})
+            if not ids:
+                return {}
+            cursor.execute("""
+                SELECT id, conta_bancaria, data, descricao, valor, tipo, memo
+                FROM transacoes_extrato
+                WHERE empresa_id = %s AND id = ANY(%s)
+            """, (empresa_id, ids))
+        else:
+            query = """
+                SELECT id, conta_bancaria, data, descricao, valor, tipo, memo
+                FROM transacoes_extrato
+                WHERE empresa_id = %s AND conciliado IS NOT TRUE
+            """
+            params = [empresa_id]
+            if conta_bancaria:
+                query += " AND conta_bancaria = %s"
+                params.append(conta_bancaria)
+            if data_inicio:
+                query += " AND data >= %s"
+                params.append(data_inicio)
+            if data_fim:
+                query += " AND data <= %s"
+                params.append(data_fim)
+            query += " ORDER BY data DESC, id DESC LIMIT %s"
+            params.append(LIMITE_TRANSACOES_EXTRATO)
+            cursor.execute(query, params)
+        transacoes = cursor.fetchall()
+
+        transacoes = [t for t in transacoes if t['data'] and t['conta_bancaria']]
+        if not transacoes:
+            cursor.close()
+            return {}
+
+        contas = sorted({t['conta_bancaria'] for t in transacoes})
+        datas = [t['data'] for t in transacoes]
+        cursor.execute("""
+            SELECT l.id, l.tipo, l.descricao, l.valor, l.data_vencimento, l.data_pagamento,
+                   l.categoria, l.subcategoria, l.conta_bancaria, l.pessoa, l.status,
+                   l.numero_documento
+            FROM lancamentos l
+            WHERE l.empresa_id = %s
+              AND l.conta_bancaria = ANY(%s)
+              AND l.data_vencimento BETWEEN %s::date - %s AND %s::date + %s
+              AND LOWER(l.status) IN ('pago', 'pendente')
+              AND NOT EXISTS (
+                  SELECT 1 FROM conciliacoes c
+                  WHERE c.lancamento_id = l.id AND c.empresa_id = l.empresa_id
+              )
+        """, (empresa_id, contas, min(datas), JANELA_DIAS, max(datas), JANELA_DIAS))
+        lancamentos = cursor.fetchall()
+
+        documentos_por_pessoa = {}
+        if lancamentos:
+            cursor.execute("""
+                SELECT nome, razao_social, cpf_cnpj FROM clientes
+                WHERE empresa_id = %s AND cpf_cnpj IS NOT NULL AND cpf_cnpj <> ''
+                UNION ALL
+                SELECT nome, razao_social, cpf_cnpj FROM fornecedores
+                WHERE empresa_id = %s AND cpf_cnpj IS NOT NULL AND cpf_cnpj <> ''
+            """, (empresa_id, empresa_id))
+            for pessoa in cursor.fetchall():
+                documento = ''.join(c for c in pessoa['cpf_cnpj'] if c.isdigit())
+                for nome in (pessoa['nome'], pessoa['razao_social']):
+                    if nome:
+                        documentos_por_pessoa.setdefault(normalizar_texto(nome).strip(), documento)
+        cursor.close()
+
+    indice = IndiceCandidatos(lancamentos, documentos_por_pessoa)
+    log(f"Sugestoes em lote: {len(transacoes)} transacoes x {len(indice)} lancamentos candidatos")
+    return {t['id']: indice.sugerir(t, limite) for t in transacoes}
+
+
 def sugerir_conciliacoes(database, empresa_id, transacao_id):
     """
     Sugere lancamentos para conciliar com uma transacao
@@ -520,56 +1197,7 @@ def sugerir_conciliacoes(database, empresa_id, transacao_id):
         list: lista de lancamentos sugeridos
     """
     try:
-        # 🔒 Passar empresa_id para RLS
-        with database.get_db_connection(empresa_id=empresa_id) as conn:
-            cursor = conn.cursor(cursor_factory=database.RealDictCursor)
-            
-            # Buscar transacao
-            cursor.execute("""
-                SELECT * FROM transacoes_extrato WHERE id = %s AND empresa_id = %s
-            """, (transacao_id, empresa_id))
-            transacao = cursor.fetchone()
-            
-            if not transacao:
-                return []
-            
-            # Buscar lancamentos similares (mesmo valor +/- 5%, data proxima +/- 7 dias)
-            valor_min = float(transacao['valor']) * 0.95
-            valor_max = float(transacao['valor']) * 1.05
-            
-            cursor.execute("""
-                SELECT *, 
-                    ABS(EXTRACT(DAY FROM (data_vencimento - %s::date))) as dias_diferenca,
-                    ABS(valor - %s) as diferenca_valor
-                FROM lancamentos
-                WHERE empresa_id = %s
-                AND conta_bancaria = %s
-                AND valor BETWEEN %s AND %s
-                AND ABS(EXTRACT(DAY FROM (data_vencimento - %s::date))) <= 7
-                AND status IN ('pago', 'pendente')
-                ORDER BY dias_diferenca ASC, diferenca_valor ASC
-                LIMIT 10
-            """, (
-                transacao['data'], transacao['valor'],
-                empresa_id, transacao['conta_bancaria'],
-                valor_min, valor_max,
-                transacao['data']
-            ))
-            
-            sugestoes = cursor.fetchall()
-            cursor.close()
-            
-            result = []
-            for s in sugestoes:
-                d = dict(s)
-                for key, val in d.items():
-                    if hasattr(val, 'isoformat'):
-                        d[key] = val.isoformat()
-                    elif isinstance(val, Decimal):
-                        d[key] = float(val)
-                result.append(d)
-            return result
-        
+        return sugerir_conciliacoes_lote(database, empresa_id, transacao_ids=[transacao_id]).get(transacao_id, [])
     except Exception as e:
         log(f"Erro ao sugerir conciliacoes: {e}")
         return []
@@ -594,13 +1222,11 @@ def deletar_transacoes_extrato(database, empresa_id, importacao_id):
         # 🔒 Passar empresa_id para RLS
         with database.get_db_connection(empresa_id=empresa_id) as conn:
             conn.autocommit = False
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                DELETE FROM transacoes_extrato WHERE importacao_id = %s
-            """, (importacao_id,))
+            cursor = conn.cursor(cursor_factory=database.RealDictCursor)
             
-            deletadas = cursor.rowcount
+            deletadas = apagar_transacoes_extrato(
+                cursor, empresa_id, "importacao_id = %s", (importacao_id,)
+            )
             conn.commit()
             cursor.close()
             
@@ -0,0 +1,873 @@
+"""
+⏳ Fila de Jobs em Segundo Plano
+===============================
+
+Busca de NFS-e, busca DF-e na SEFAZ, geração de SPED ECD / EFD-Contribuições,
+DIRF e o ZIP de backup levam minutos e rodavam dentro da requisição HTTP,
+segurando um worker do servidor. Aqui elas viram jobs:
+
+    - Tabela jobs_fila no PostgreSQL (durável: sobrevive a restart/deploy)
+    - Workers em processos separados (python fila_jobs.py, ou iniciados pelo
+      web_server com JOBS_WORKERS) reservam um job por vez com lease; um
+      worker que morre tem o job devolvido à fila quando o lease expira
+    - Retentativas com espera exponencial (ErroDefinitivo não é repetido)
+    - Limite de jobs simultâneos por empresa (JOBS_MAX_POR_EMPRESA): um
+      cliente com vários jobs pesados não ocupa todos os workers
+    - Progresso (0-100 + mensagem) gravado pelo próprio job
+    - Resultado em JSON e artefato (TXT, ZIP...) em disco, em
+      storage/jobs/{empresa}/{job}, baixado depois por
+      GET /api/jobs/<job_id>/download
+
+Tipos de job são registrados com @registrar_tipo (ver "TAREFAS" no fim).
+
+Data: 16/10/2026
+"""
+
+import atexit
+import json
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from psycopg2.extras import Json
+
+from database_postgresql import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================================
+# CONFIGURAÇÕES
+# ============================================================================
+
+# Jobs executando ao mesmo tempo para uma mesma empresa
+MAX_JOBS_POR_EMPRESA = int(os.getenv('JOBS_MAX_POR_EMPRESA', '1'))
+# Duração do lease; o batimento do worker renova a cada 1/3 disso
+LEASE_SEGUNDOS = int(os.getenv('JOBS_LEASE_SEGUNDOS', '120'))
+# Intervalo entre consultas à fila quando não há job disponível
+INTERVALO_POLL = float(os.getenv('JOBS_INTERVALO_POLL', '2.0'))
+# Tentativas padrão e espera entre elas (30s, 60s, 120s... até o máximo)
+MAX_TENTATIVAS = int(os.getenv('JOBS_MAX_TENTATIVAS', '3'))
+ESPERA_RETENTATIVA_BASE = 30
+ESPERA_RETENTATIVA_MAX = 900
+# Jobs encerrados (e seus artefatos) são apagados após esse prazo
+RETENCAO_DIAS = int(os.getenv('JOBS_RETENCAO_DIAS', '7'))
+# Intervalo mínimo entre duas gravações de progresso do mesmo job
+INTERVALO_PROGRESSO = 1.0
+
+JOBS_DIR = os.getenv('JOBS_DIR') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'storage', 'jobs')
+
+STATUS_PENDENTE = 'pendente'
+STATUS_EXECUTANDO = 'executando'
+STATUS_CONCLUIDO = 'concluido'
+STATUS_ERRO = 'erro'
+
+# Chave do pg_advisory_xact_lock que serializa as reservas (e a contagem por empresa)
+_CHAVE_LOCK_RESERVA = 7_310_023
+
+
+class ErroDefinitivo(Exception):
+    """Falha que não adianta repetir (parâmetro inválido, cadastro incompleto...)"""
+
+
+class JobPerdido(Exception):
+    """O lease do job expirou e ele passou para outro worker"""
+
+
+# ============================================================================
+# REGISTRO DE TIPOS
+# ============================================================================
+
+class TipoJob:
+    """Função executora e regras de um tipo de job"""
+
+    def __init__(self, nome: str, funcao: Callable, max_tentativas: int,
+                 validar: Optional[Callable[[Dict], Optional[str]]], somente_admin: bool,
+                 permissao: Optional[str] = None):
+        self.nome = nome
+        self.funcao = funcao
+        self.max_tentativas = max_tentativas
+        self.validar = validar
+        self.somente_admin = somente_admin
+        self.permissao = permissao
+
+    def permite(self, admin: bool, permissoes: List[str]) -> bool:
+        """Se o usuário pode enfileirar, acompanhar e baixar jobs deste tipo"""
+        if admin:
+            return True
+        if self.somente_admin:
+            return False
+        return self.permissao is None or self.permissao in permissoes
+
+
+_TIPOS: Dict[str, TipoJob] = {}
+
+
+def registrar_tipo(nome: str, max_tentativas: int = None,
+                   validar: Callable[[Dict], Optional[str]] = None, somente_admin: bool = False,
+                   permissao: str = None):
+    """
+    Decorador que registra a função executora de um tipo de job.
+
+    A função recebe um ContextoJob e devolve um dict (JSON) com o resultado;
+    validar(parametros) devolve uma mensagem de erro ou None e roda já no
+    enfileiramento, para a requisição responder 400 na hora. permissao é a
+    mesma exigida (require_permission) pelo endpoint síncrono equivalente.
+    """
+    def decorador(funcao: Callable) -> Callable:
+        _TIPOS[nome] = TipoJob(nome, funcao, max_tentativas or MAX_TENTATIVAS, validar, somente_admin,
+                               permissao)
+        return funcao
+    return decorador
+
+
+def obter_tipo(nome: str) -> Optional[TipoJob]:
+    return _TIPOS.get(nome)
+
+
+def calcular_espera_retentativa(tentativa: int) -> int:
+    """Segundos até a próxima tentativa, dobrando a cada falha"""
+    return min(ESPERA_RETENTATIVA_MAX, ESPERA_RETENTATIVA_BASE * 2 ** max(0, tentativa - 1))
+
+
+# ============================================================================
+# TABELA
+# ============================================================================
+
+_tabela_ok = False
+
+
+def _garantir_tabela(conn) -> None:
+    global _tabela_ok
+    if _tabela_ok:
+        return
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS jobs_fila (
+            id VARCHAR(36) PRIMARY KEY,
+            tipo VARCHAR(50) NOT NULL,
+            empresa_id INTEGER,
+            usuario_id INTEGER,
+            parametros JSONB NOT NULL DEFAULT '{}'::jsonb,
+            status VARCHAR(20) NOT NULL DEFAULT 'pendente',
+            prioridade INTEGER NOT NULL DEFAULT 0,
+            tentativas INTEGER NOT NULL DEFAULT 0,
+            max_tentativas INTEGER NOT NULL DEFAULT 3,
+            disponivel_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            worker_id VARCHAR(100),
+            lease_ate TIMESTAMP,
+            progresso INTEGER NOT NULL DEFAULT 0,
+            mensagem TEXT,
+            resultado JSONB,
+            erro TEXT,
+            artefato_caminho TEXT,
+            artefato_nome VARCHAR(255),
+            artefato_mime VARCHAR(100),
+            artefato_tamanho BIGINT,
+            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            iniciado_em TIMESTAMP,
+            atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            concluido_em TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_jobs_fila_ativos
+        ON jobs_fila(status, disponivel_em)
+        WHERE status IN ('pendente', 'executando')
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_jobs_fila_empresa
+        ON jobs_fila(empresa_id, criado_em DESC)
+    """)
+    conn.commit()
+    _tabela_ok = True
+
+
+# ============================================================================
+# ENFILEIRAR / CONSULTAR
+# ============================================================================
+
+_CAMPOS_PUBLICOS = """
+    id, tipo, empresa_id, usuario_id, parametros, status, prioridade, tentativas,
+    max_tentativas, disponivel_em, progresso, mensagem, resultado, erro,
+    artefato_nome, artefato_mime, artefato_tamanho,
+    criado_em, iniciado_em, atualizado_em, concluido_em
+"""
+
+
+def enfileirar(tipo: str, empresa_id: Optional[int], usuario_id: Optional[int] = None,
+               parametros: Dict = None, prioridade: int = 0) -> Dict[str, Any]:
+    """
+    Coloca um job na fila.
+
+    Se já houver um job igual (mesmo tipo, empresa e parâmetros) pendente ou
+    executando, devolve o dele em vez de criar outro.
+
+    Returns:
+        Dict com success, job_id, status e ja_existente
+    """
+    definicao = _TIPOS.get(tipo)
+    if definicao is None:
+        return {'success': False, 'error': f'Tipo de job desconhecido: {tipo}'}
+    parametros = parametros or {}
+    if definicao.validar:
+        erro = definicao.validar(parametros)
+        if erro:
+            return {'success': False, 'error': erro}
+
+    try:
+        with get_db_connection(allow_global=True) as conn:
+            _garantir_tabela(conn)
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, status FROM jobs_fila
+                WHERE tipo = %s
+                  AND empresa_id IS NOT DISTINCT FROM %s
+                  AND parametros = %s::jsonb
+                  AND status IN ('pendente', 'executando')
+                ORDER BY criado_em
+                LIMIT 1
+            """, (tipo, empresa_id, json.dumps(parametros)))
+            existente = cursor.fetchone()
+            if existente:
+                return {'success': True, 'job_id': existente['id'], 'status': existente['status'],
+                        'ja_existente': True}
+
+            job_id = str(uuid.uuid4())
+            cursor.execute("""
+                INSERT INTO jobs_fila (id, tipo, empresa_id, usuario_id, parametros, prioridade, max_tentativas)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, (job_id, tipo, empresa_id, usuario_id, Json(parametros), prioridade,
+                  definicao.max_tentativas))
+            conn.commit()
+
+        logger.info(f"[JOBS] Job {job_id} ({tipo}) enfileirado: empresa_id={empresa_id}")
+        return {'success': True, 'job_id': job_id, 'status': STATUS_PENDENTE, 'ja_existente': False}
+
+    except Exception as e:
+        logger.error(f"[JOBS] Erro ao enfileirar job {tipo}: {e}")
+        return {'success': False, 'error': str(e)}
+
+
+def obter_job(job_id: str, empresa_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    Status, progresso e resultado de um job.
+
+    Args:
+        job_id: ID devolvido por enfileirar()
+        empresa_id: Se informado, só devolve jobs desta empresa
+    """
+    query = f"SELECT {_CAMPOS_PUBLICOS}, artefato_caminho FROM jobs_fila WHERE id = %s"
+    params = [job_id]
+    if empresa_id is not None:
+        query += " AND empresa_id = %s"
+        params.append(empresa_id)
+    with get_db_connection(allow_global=True) as conn:
+        _garantir_tabela(conn)
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        row = cursor.fetchone()
+    if not row:
+        return None
+
+    job = dict(row)
+    caminho = job.pop('artefato_caminho')
+    job['artefato_disponivel'] = bool(caminho) and job['status'] == STATUS_CONCLUIDO
+    if job['status'] == STATUS_PENDENTE:
+        job['posicao_fila'] = _posicao_na_fila(job_id)
+    for campo in ('disponivel_em', 'criado_em', 'iniciado_em', 'atualizado_em', 'concluido_em'):
+        if job.get(campo):
+            job[campo] = job[campo].isoformat()
+    return job
+
+
+def _posicao_na_fila(job_id: str) -> Optional[int]:
+    with get_db_connection(allow_global=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT COUNT(*) AS posicao
+            FROM jobs_fila j, jobs_fila alvo
+            WHERE alvo.id = %s
+              AND j.status = 'pendente'
+              AND (j.prioridade > alvo.prioridade
+                   OR (j.prioridade = alvo.prioridade AND j.criado_em < alvo.criado_em))
+        """, (job_id,))
+        row = cursor.fetchone()
+    return row['posicao'] + 1 if row else None
+
+
+def caminho_artefato(job_id: str, empresa_id: Optional[int] = None) -> Optional[Dict[str, str]]:
+    """
+    Arquivo gerado por um job concluído: {'caminho', 'nome', 'mime', 'tipo'} ou None.
+
+    O caminho é conferido contra JOBS_DIR antes de ser devolvido.
+    """
+    query = """
+        SELECT tipo, artefato_caminho, artefato_nome, artefato_mime
+        FROM jobs_fila
+        WHERE id = %s AND status = 'concluido' AND artefato_caminho IS NOT NULL
+    """
+    params = [job_id]
+    if empresa_id is not None:
+        query += " AND empresa_id = %s"
+        params.append(empresa_id)
+    with get_db_connection(allow_global=True) as conn:
+        _garantir_tabela(conn)
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        row = cursor.fetchone()
+    if not row:
+        return None
+
+    caminho = os.path.realpath(row['artefato_caminho'])
+    base = os.path.realpath(JOBS_DIR)
+    if os.path.commonpath([caminho, base]) != base or not os.path.isfile(caminho):
+        return None
+    return {'caminho': caminho, 'nome': row['artefato_nome'], 'mime': row['artefato_mime'], 'tipo': row['tipo']}
+
+
+# ============================================================================
+# RESERVA, LEASE E ENCERRAMENTO (lado do worker)
+# ============================================================================
+
+def reservar_proximo(worker_id: str, tipos: List[str], lease_segundos: int = LEASE_SEGUNDOS,
+                     max_por_empresa: int = MAX_JOBS_POR_EMPRESA) -> Optional[Dict[str, Any]]:
+    """
+    Reserva o próximo job disponível para este worker (ou None).
+
+    Tudo numa transação sob pg_advisory_xact_lock, para que dois workers não
+    contem ao mesmo tempo os jobs em execução de uma empresa e passem os dois
+    do limite. Antes da reserva, jobs com lease vencido (worker morto) voltam
+    para a fila ou, sem tentativas restantes, terminam em erro.
+    """
+    with get_db_connection(allow_global=True) as conn:
+        _garantir_tabela(conn)
+        conn.autocommit = False
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (_CHAVE_LOCK_RESERVA,))
+            cursor.execute("""
+                UPDATE jobs_fila
+                SET status = CASE WHEN tentativas >= max_tentativas THEN 'erro' ELSE 'pendente' END,
+                    erro = 'Worker interrompido durante a execucao (lease expirado)',
+                    concluido_em = CASE WHEN tentativas >= max_tentativas THEN NOW() END,
+                    worker_id = NULL,
+                    lease_ate = NULL,
+                    disponivel_em = NOW(),
+                    atualizado_em = NOW()
+                WHERE status = 'executando' AND lease_ate < NOW()
+            """)
+            if cursor.rowcount:
+                logger.warning(f"[JOBS] {cursor.rowcount} job(s) com lease expirado devolvido(s) à fila")
+            cursor.execute("""
+                UPDATE jobs_fila
+                SET status = 'executando',
+                    worker_id = %s,
+                    tentativas = tentativas + 1,
+                    lease_ate = NOW() + (%s * INTERVAL '1 second'),
+                    iniciado_em = NOW(),
+                    atualizado_em = NOW()
+                WHERE id = (
+                    SELECT j.id FROM jobs_fila j
+                    WHERE j.status = 'pendente'
+                      AND j.disponivel_em <= NOW()
+                      AND j.tipo = ANY(%s)
+                      AND (SELECT COUNT(*) FROM jobs_fila e
+                           WHERE e.status = 'executando'
+                             AND e.empresa_id IS NOT DISTINCT FROM j.empresa_id) < %s
+                    ORDER BY j.prioridade DESC, j.disponivel_em, j.criado_em
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, tipo, empresa_id, usuario_id, parametros, tentativas, max_tentativas
+            """, (worker_id, lease_segundos, list(tipos), max_por_empresa))
+            job = cursor.fetchone()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.autocommit = True
+    return dict(job) if job else None
+
+
+def renovar_lease(job_id: str, worker_id: str, lease_segundos: int = LEASE_SEGUNDOS) -> bool:
+    """Estende o lease; False se o job não é mais deste worker"""
+    with get_db_connection(allow_global=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE jobs_fila SET lease_ate = NOW() + (%s * INTERVAL '1 second')
+            WHERE id = %s AND worker_id = %s AND status = 'executando'
+        """, (lease_segundos, job_id, worker_id))
+        return cursor.rowcount == 1
+
+
+def registrar_progresso(job_id: str, worker_id: str, progresso: int, mensagem: Optional[str]) -> bool:
+    with get_db_connection(allow_global=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE jobs_fila
+            SET progresso = %s, mensagem = COALESCE(%s, mensagem), atualizado_em = NOW()
+            WHERE id = %s AND worker_id = %s AND status = 'executando'
+        """, (progresso, mensagem, job_id, worker_id))
+        return cursor.rowcount == 1
+
+
+def concluir_job(job_id: str, worker_id: str, resultado: Dict, artefato: Optional[Dict] = None) -> bool:
+    """Grava resultado e artefato; False se o job já não era deste worker"""
+    artefato = artefato or {}
+    with get_db_connection(allow_global=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE jobs_fila
+            SET status = 'concluido', progresso = 100, resultado = %s, erro = NULL,
+                artefato_caminho = %s, artefato_nome = %s, artefato_mime = %s, artefato_tamanho = %s,
+                worker_id = NULL, lease_ate = NULL,
+                atualizado_em = NOW(), concluido_em = NOW()
+            WHERE id = %s AND worker_id = %s AND status = 'executando'
+        """, (Json(resultado), artefato.get('caminho'), artefato.get('nome'), artefato.get('mime'),
+              artefato.get('tamanho'), job_id, worker_id))
+        return cursor.rowcount == 1
+
+
+def falhar_job(job: Dict, worker_id: str, erro: str, definitivo: bool = False) -> str:
+    """
+    Registra a falha da tentativa atual.
+
+    Returns:
+        Novo status: 'pendente' (nova tentativa agendada) ou 'erro'
+    """
+    repetir = not definitivo and job['tentativas'] < job['max_tentativas']
+    espera = calcular_espera_retentativa(job['tentativas']) if repetir else 0
+    with get_db_connection(allow_global=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE jobs_fila
+            SET status = %s, erro = %s,
+                disponivel_em = NOW() + (%s * INTERVAL '1 second'),
+                worker_id = NULL, lease_ate = NULL, atualizado_em = NOW(),
+                concluido_em = CASE WHEN %s THEN NULL ELSE NOW() END
+            WHERE id = %s AND worker_id = %s AND status = 'executando'
+        """, (STATUS_PENDENTE if repetir else STATUS_ERRO, erro[:2000], espera, repetir,
+              job['id'], worker_id))
+    return STATUS_PENDENTE if repetir else STATUS_ERRO
+
+
+def limpar_jobs_antigos(dias: int = RETENCAO_DIAS) -> int:
+    """Apaga jobs encerrados há mais de `dias` e seus artefatos"""
+    with get_db_connection(allow_global=True) as conn:
+        _garantir_tabela(conn)
+        cursor = conn.cursor()
+        cursor.execute("""
+            DELETE FROM jobs_fila
+            WHERE status IN ('concluido', 'erro')
+              AND concluido_em < NOW() - (%s * INTERVAL '1 day')
+            RETURNING id, empresa_id
+        """, (dias,))
+        removidos = cursor.fetchall()
+    for row in removidos:
+        shutil.rmtree(diretorio_job(row['id'], row['empresa_id']), ignore_errors=True)
+    return len(removidos)
+
+
+def diretorio_job(job_id: str, empresa_id: Optional[int]) -> str:
+    return os.path.join(JOBS_DIR, str(empresa_id) if empresa_id is not None else 'global', job_id)
+
+
+# ============================================================================
+# CONTEXTO DO JOB (passado à função executora)
+# ============================================================================
+
+class ContextoJob:
+    """Parâmetros do job, progresso e local do artefato"""
+
+    def __init__(self, job: Dict, worker_id: str, relogio: Callable[[], float] = time.monotonic):
+        self.job_id = job['id']
+        self.tipo = job['tipo']
+        self.empresa_id = job['empresa_id']
+        self.usuario_id = job['usuario_id']
+        self.parametros = job.get('parametros') or {}
+        self.tentativa = job['tentativas']
+        self.worker_id = worker_id
+        self.diretorio = diretorio_job(self.job_id, self.empresa_id)
+        self.artefato: Optional[Dict] = None
+        self.perdido = threading.Event()
+        self._relogio = relogio
+        self._ultimo_progresso = None
+
+    def progresso(self, percentual: float, mensagem: str = None) -> None:
+        """
+        Atualiza o andamento (0-100). Gravações mais próximas que
+        INTERVALO_PROGRESSO são descartadas, exceto a de 100%.
+
+        Levanta JobPerdido se o job passou para outro worker.
+        """
+        if self.perdido.is_set():
+            raise JobPerdido(self.job_id)
+        agora = self._relogio()
+        percentual = max(0, min(100, int(percentual)))
+        if (percentual < 100 and self._ultimo_progresso is not None
+                and agora - self._ultimo_progresso < INTERVALO_PROGRESSO):
+            return
+        self._ultimo_progresso = agora
+        if not registrar_progresso(self.job_id, self.worker_id, percentual, mensagem):
+            self.perdido.set()
+            raise JobPerdido(self.job_id)
+
+    def caminho(self, nome_arquivo: str) -> str:
+        """Caminho (no diretório do job) onde gravar o artefato"""
+        os.makedirs(self.diretorio, exist_ok=True)
+        return os.path.join(self.diretorio, os.path.basename(nome_arquivo))
+
+    def definir_artefato(self, caminho: str, nome: str = None, mime: str = 'application/octet-stream') -> None:
+        """Marca o arquivo gravado em `caminho` como resultado para download"""
+        self.artefato = {
+            'caminho': caminho,
+            'nome': nome or os.path.basename(caminho),
+            'mime': mime,
+            'tamanho': os.path.getsize(caminho),
+        }
+
+
+# ============================================================================
+# WORKER
+# ============================================================================
+
+class WorkerJobs:
+    """
+    Laço de um processo worker: reserva, executa e encerra um job por vez.
+
+    Enquanto o job roda, uma thread de batimento renova o lease; se a
+    renovação falhar (lease perdido), o próximo ctx.progresso() interrompe o job.
+    """
+
+    def __init__(self, tipos: List[str] = None, worker_id: str = None,
+                 lease_segundos: int = LEASE_SEGUNDOS, intervalo_poll: float = INTERVALO_POLL,
+                 max_por_empresa: int = MAX_JOBS_POR_EMPRESA):
+        self.tipos = list(tipos) if tipos else None
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.lease_segundos = lease_segundos
+        self.intervalo_poll = intervalo_poll
+        self.max_por_empresa = max_por_empresa
+        self._ultima_limpeza = 0.0
+
+    def executar_proximo(self) -> bool:
+        """Executa um job, se houver. Returns: True se executou"""
+        job = reservar_proximo(self.worker_id, self.tipos or list(_TIPOS),
+                               self.lease_segundos, self.max_por_empresa)
+        if not job:
+            return False
+        self.executar_job(job)
+        return True
+
+    def executar_job(self, job: Dict) -> None:
+        ctx = ContextoJob(job, self.worker_id)
+        parar_batimento = threading.Event()
+        batimento = threading.Thread(target=self._batimento, args=(ctx, parar_batimento),
+                                     name=f'job-lease-{ctx.job_id[:8]}', daemon=True)
+        batimento.start()
+        inicio = time.time()
+        logger.info(f"[JOBS] {self.worker_id} executando {ctx.job_id} ({ctx.tipo}), tentativa {ctx.tentativa}")
+        try:
+            definicao = _TIPOS.get(ctx.tipo)
+            if definicao is None:
+                raise ErroDefinitivo(f'Tipo de job desconhecido: {ctx.tipo}')
+            resultado = definicao.funcao(ctx) or {}
+            if not concluir_job(ctx.job_id, self.worker_id, resultado, ctx.artefato):
+                raise JobPerdido(ctx.job_id)
+            logger.info(f"[JOBS] {ctx.job_id} concluído em {time.time() - inicio:.1f}s")
+        except JobPerdido:
+            logger.warning(f"[JOBS] {ctx.job_id}: lease perdido, resultado descartado")
+        except Exception as e:
+            definitivo = isinstance(e, ErroDefinitivo)
+            if not definitivo:
+                logger.error(traceback.format_exc())
+            status = falhar_job(job, self.worker_id, str(e) or type(e).__name__, definitivo)
+            if status == STATUS_ERRO:
+                shutil.rmtree(ctx.diretorio, ignore_errors=True)
+            logger.error(f"[JOBS] {ctx.job_id} falhou ({type(e).__name__}: {e}) -> {status}")
+        finally:
+            parar_batimento.set()
+            batimento.join(timeout=5)
+
+    def _batimento(self, ctx: ContextoJob, parar: threading.Event) -> None:
+        while not parar.wait(self.lease_segundos / 3):
+            try:
+                if not renovar_lease(ctx.job_id, self.worker_id, self.lease_segundos):
+                    ctx.perdido.set()
+                    return
+            except Exception as e:
+                logger.warning(f"[JOBS] Falha ao renovar lease de {ctx.job_id}: {e}")
+
+    def executar(self, parar: threading.Event = None) -> None:
+        """Laço principal até `parar` ser sinalizado"""
+        parar = parar or threading.Event()
+        logger.info(f"[JOBS] Worker {self.worker_id} iniciado (tipos: {', '.join(self.tipos or _TIPOS)})")
+        while not parar.is_set():
+            try:
+                if time.time() - self._ultima_limpeza > 3600:
+                    self._ultima_limpeza = time.time()
+                    removidos = limpar_jobs_antigos()
+                    if removidos:
+                        logger.info(f"[JOBS] {removidos} job(s) antigo(s) removido(s)")
+                if self.executar_proximo():
+                    continue
+            except Exception as e:
+                logger.error(f"[JOBS] Erro no laço do worker: {e}")
+            parar.wait(self.intervalo_poll)
+        logger.info(f"[JOBS] Worker {self.worker_id} encerrado")
+
+
+_processos_worker: List[subprocess.Popen] = []
+
+
+def iniciar_workers_processo(quantidade: int) -> int:
+    """
+    Sobe `quantidade` processos `python fila_jobs.py` filhos deste processo,
+    encerrados junto com ele. Processos (e não threads) para que um SPED
+    pesado não dispute o GIL com as requisições; no mesmo host para que os
+    artefatos gravados em JOBS_DIR fiquem visíveis ao download.
+    """
+    for _ in range(max(0, quantidade)):
+        _processos_worker.append(subprocess.Popen([sys.executable, os.path.abspath(__file__)]))
+    if _processos_worker:
+        atexit.register(_encerrar_workers_processo)
+    return len(_processos_worker)
+
+
+def _encerrar_workers_processo() -> None:
+    for processo in _processos_worker:
+        if processo.poll() is None:
+            processo.terminate()
+    for processo in _processos_worker:
+        try:
+            processo.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            processo.kill()
+    _processos_worker.clear()
+
+
+# ============================================================================
+# TAREFAS
+# ============================================================================
+
+def _cnpj_empresa(empresa_id: int) -> str:
+    with get_db_connection(empresa_id=empresa_id) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT cnpj FROM empresas WHERE id = %s", (empresa_id,))
+        empresa = cursor.fetchone()
+    return ''.join(filter(str.isdigit, (empresa or {}).get('cnpj') or ''))
+
+
+def _validar_periodo_ecd(parametros: Dict) -> Optional[str]:
+    if not parametros.get('data_inicio') or not parametros.get('data_fim'):
+        return 'data_inicio e data_fim são obrigatórios'
+    return None
+
+
+def _validar_mes_ano(parametros: Dict) -> Optional[str]:
+    mes, ano = parametros.get('mes'), parametros.get('ano')
+    if not isinstance(mes, int) or not 1 <= mes <= 12:
+        return 'mes deve estar entre 1 e 12'
+    if not isinstance(ano, int) or not 2000 <= ano <= 2100:
+        return 'ano inválido'
+    return None
+
+
+def _validar_ano(parametros: Dict) -> Optional[str]:
+    return None if parametros.get('ano') else 'ano é obrigatório'
+
+
+@registrar_tipo('sped_ecd', validar=_validar_periodo_ecd)
+def tarefa_sped_ecd(ctx: ContextoJob) -> Dict:
+    """SPED ECD gravado direto no artefato (escrever_arquivo_ecd)"""
+    from sped_ecd_functions import escrever_arquivo_ecd
+
+    p = ctx.parametros
+    cnpj = _cnpj_empresa(ctx.empresa_id) or '00000000000000'
+    nome = f"ECD_{cnpj}_{p['data_fim'].replace('-', '')[:8]}.txt"
+    caminho = ctx.caminho(nome)
+    ctx.progresso(5, 'Gerando ECD')
+    with open(caminho, 'wb') as arquivo:
+        resultado = escrever_arquivo_ecd(arquivo, empresa_id=ctx.empresa_id, data_inicio=p['data_inicio'],
+                                         data_fim=p['data_fim'], versao_plano_id=p.get('versao_plano_id'))
+    if not resultado['success']:
+        raise ErroDefinitivo(resultado.get('error') or 'Erro ao gerar ECD')
+    ctx.definir_artefato(caminho, nome, 'text/plain; charset=utf-8')
+    return {'nome_arquivo': nome, 'total_linhas': resultado['total_linhas'], 'hash': resultado['hash'],
+            'data_geracao': resultado['data_geracao']}
+
+
+@registrar_tipo('efd_contribuicoes', validar=_validar_mes_ano)
+def tarefa_efd_contribuicoes(ctx: ContextoJob) -> Dict:
+    from sped_efd_contribuicoes_functions import gerar_arquivo_efd_contribuicoes
+
+    p = ctx.parametros
+    ctx.progresso(5, 'Gerando EFD-Contribuições')
+    resultado = gerar_arquivo_efd_contribuicoes(empresa_id=ctx.empresa_id, mes=p['mes'], ano=p['ano'],
+                                                usar_creditos_reais=p.get('usar_creditos_reais', True))
+    if not resultado['success']:
+        raise ErroDefinitivo(resultado.get('error') or 'Erro ao gerar EFD-Contribuições')
+    cnpj = _cnpj_empresa(ctx.empresa_id) or '00000000000000'
+    nome = f"EFD_Contribuicoes_{cnpj}_{p['ano']}{p['mes']:02d}.txt"
+    caminho = ctx.caminho(nome)
+    with open(caminho, 'w', encoding='utf-8', newline='') as arquivo:
+        arquivo.write(resultado['conteudo'])
+    ctx.definir_artefato(caminho, nome, 'text/plain; charset=utf-8')
+    return {'nome_arquivo': nome, 'total_linhas': resultado['total_linhas'], 'hash': resultado['hash'],
+            'data_geracao': resultado['data_geracao'], 'modo': resultado.get('modo', 'simplificado'),
+            'totais': resultado['totais']}
+
+
+@registrar_tipo('dirf', validar=_validar_ano)
+def tarefa_dirf(ctx: ContextoJob) -> Dict:
+    from dirf_functions import gerar_arquivo_dirf
+
+    ctx.progresso(5, 'Gerando DIRF')
+    resultado = gerar_arquivo_dirf(ctx.empresa_id, ctx.parametros['ano'])
+    if not resultado.get('success'):
+        raise ErroDefinitivo(resultado.get('error') or 'Erro ao gerar DIRF')
+    caminho = ctx.caminho(resultado['nome_arquivo'])
+    with open(caminho, 'w', encoding='utf-8', newline='') as arquivo:
+        arquivo.write(resultado['conteudo'])
+    ctx.definir_artefato(caminho, resultado['nome_arquivo'], 'text/plain; charset=utf-8')
+    return {campo: valor for campo, valor in resultado.items() if campo not in ('success', 'conteudo')}
+
+
+def _validar_backup(parametros: Dict) -> Optional[str]:
+    if parametros.get('formato', 'jsonl') not in ('jsonl', 'copy'):
+        return 'formato deve ser jsonl ou copy'
+    return None
+
+
+@registrar_tipo('backup_zip', max_tentativas=1, validar=_validar_backup, somente_admin=True)
+def tarefa_backup_zip(ctx: ContextoJob) -> Dict:
+    """Backup (todas as empresas) gravado direto no artefato - só administradores enfileiram"""
+    from backup_email import gerar_backup_arquivo
+
+    incremental = bool(ctx.parametros.get('incremental'))
+    caminho = ctx.caminho('backup.zip')
+    info = gerar_backup_arquivo(
+        caminho, formato=ctx.parametros.get('formato', 'jsonl'), incremental=incremental,
+        ao_progredir=lambda feitas, total, pasta: ctx.progresso(95 * feitas / total, f'Exportando {pasta}'))
+    ctx.definir_artefato(caminho, info['nome_arquivo'], 'application/zip')
+    return {'nome_arquivo': info['nome_arquivo'], 'tamanho': ctx.artefato['tamanho'], 'modo': info['modo'],
+            'total_registros': info['total_registros']}
+
+
+@registrar_tipo('dfe_busca', max_tentativas=2, permissao='relatorios_view')
+def tarefa_dfe_busca(ctx: ContextoJob) -> Dict:
+    """Busca DF-e de todos os certificados ativos da empresa (OrquestradorDFe)"""
+    from relatorios.nfe import nfe_orquestrador
+
+    certificados = nfe_orquestrador.listar_certificados_ativos(ctx.empresa_id)
+    if not certificados:
+        raise ErroDefinitivo('Nenhum certificado digital ativo cadastrado.')
+
+    def ao_atualizar(andamento: List[Dict]) -> None:
+        encerrados = sum(1 for c in andamento if c.get('status') in ('concluido', 'erro'))
+        lotes = sum(c.get('lotes', 0) for c in andamento)
+        ctx.progresso(95 * encerrados / len(andamento),
+                      f'{encerrados}/{len(andamento)} certificado(s), {lotes} lote(s)')
+
+    resultado = nfe_orquestrador.OrquestradorDFe(
+        certificados,
+        persistir=nfe_orquestrador.persistidor_dfe(ctx.usuario_id),
+        ao_atualizar=ao_atualizar,
+    ).executar()
+    return resultado
+
+
+def _ultima_emissao_nfse(empresa_id: int) -> Optional[str]:
+    """Data da NFS-e mais recente já baixada (início automático da busca por período)"""
+    with get_db_connection(empresa_id=empresa_id) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT MAX(data_emissao) AS ultima FROM nfse_baixadas WHERE empresa_id = %s",
+                       (empresa_id,))
+        row = cursor.fetchone()
+    return row['ultima'].strftime('%Y-%m-%d') if row and row['ultima'] else None
+
+
+@registrar_tipo('nfse_busca', max_tentativas=2, permissao='nfse_buscar')
+def tarefa_nfse_busca(ctx: ContextoJob) -> Dict:
+    """Busca NFS-e (Ambiente Nacional ou municípios), como _buscar_nfse_local do web_server"""
+    from datetime import date, datetime
+
+    from database_postgresql import get_nfse_db_params
+    from nfse_functions import (buscar_nfse_ambiente_nacional, buscar_nfse_periodo,
+                                get_certificado_para_soap, registrar_operacao)
+
+    p = dict(ctx.parametros)
+    cnpj = _cnpj_empresa(ctx.empresa_id)
+    if not cnpj:
+        raise ErroDefinitivo('CNPJ da empresa nao cadastrado. Acesse Dados da Empresa e preencha o CNPJ '
+                             'antes de buscar NFS-e.')
+
+    db_params = get_nfse_db_params()
+    cert_data = get_certificado_para_soap(db_params, ctx.empresa_id)
+    if cert_data:
+        temp_cert = tempfile.NamedTemporaryFile(delete=False, suffix='.pfx')
+        temp_cert.write(cert_data[0])
+        temp_cert.close()
+        certificado_path = temp_cert.name
+        certificado_senha = cert_data[1]
+    else:
+        certificado_path = os.getenv('CERTIFICADO_A1_PATH', '/app/certificados/certificado.pfx')
+        certificado_senha = os.getenv('CERTIFICADO_A1_SENHA', '')
+        if not os.path.exists(certificado_path):
+            raise ErroDefinitivo('Certificado A1 não configurado')
+
+    ctx.progresso(5, 'Consultando NFS-e')
+    try:
+        if p.get('metodo', 'ambiente_nacional') == 'ambiente_nacional':
+            resultado = buscar_nfse_ambiente_nacional(
+                db_params=db_params, empresa_id=ctx.empresa_id, cnpj_informante=cnpj,
+                certificado_path=certificado_path, certificado_senha=certificado_senha,
+                ambiente=p.get('ambiente', 'producao'), busca_completa=p.get('busca_completa', False),
+                max_documentos=p.get('max_documentos', 50))
+        else:
+            data_final = p.get('data_final') or date.today().strftime('%Y-%m-%d')
+            data_inicial = p.get('data_inicial') or _ultima_emissao_nfse(ctx.empresa_id) or '2016-01-01'
+            resultado = buscar_nfse_periodo(
+                db_params=db_params, empresa_id=ctx.empresa_id, cnpj_prestador=cnpj,
+                data_inicial=datetime.strptime(data_inicial, '%Y-%m-%d').date(),
+                data_final=datetime.strptime(data_final, '%Y-%m-%d').date(),
+                certificado_path=certificado_path, certificado_senha=certificado_senha,
+                codigos_municipios=p.get('codigos_municipios'))
+    finally:
+        if cert_data and os.path.exists(certificado_path):
+            os.unlink(certificado_path)
+
+    registrar_operacao(db_params=db_params, empresa_id=ctx.empresa_id, usuario_id=ctx.usuario_id,
+                       operacao='BUSCA_JOB',
+                       detalhes={'job_id': ctx.job_id, 'metodo': p.get('metodo', 'ambiente_nacional'),
+                                 'total_nfse': resultado.get('total_nfse', 0)},
+                       ip_address=None)
+    return resultado
+
+
+# ============================================================================
+# PROCESSO WORKER (python fila_jobs.py [tipo ...])
+# ============================================================================
+
+if __name__ == '__main__':
+    import signal
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    # Buscas DF-e rodam aqui: pool de parse criado antes do laço do worker
+    from relatorios.nfe import nfe_processor
+    nfe_processor.iniciar_pool_parse()
+    encerrar = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: encerrar.set())
+    signal.signal(signal.SIGINT, lambda *_: encerrar.set())
+    WorkerJobs(tipos=sys.argv[1:] or None).executar(encerrar)
@@ -1808,9 +1808,8 @@ def buscar_nfse_ambiente_nacional(
             'detalhes': list
         }
     """
-    from nfse_service import NFSeAmbienteNacional
+    from nfse_service import NFSeAmbienteNacional, VarreduraNSU
     from lxml import etree
-    import time
     
     resultado = {
         'sucesso': False,
@@ -1847,33 +1846,26 @@ def buscar_nfse_ambiente_nacional(
                 ultimo_nsu = db.get_last_nsu_nfse(empresa_id, cnpj_informante) or 0
                 logger.info(f"📍 BUSCA INCREMENTAL: Último NSU = {ultimo_nsu}")
             
-            nsu_atual = max(ultimo_nsu + 1, 1)  # Começa do próximo NSU (mínimo 1)
-            max_tentativas_404 = 100  # Para após 100 NSUs seguidos sem retorno
-            tentativas_404 = 0
+            # Recomeça pelo último NSU já lido: a resposta dele traz maxNSU, então
+            # uma busca sem novidades termina na primeira consulta (documentos
+            # até ultimo_nsu são ignorados abaixo)
+            nsu_inicial = ultimo_nsu if ultimo_nsu > 0 else 1
             documentos_processados = 0
             maior_nsu = ultimo_nsu  # rastreia o maior ultNSU real visto
             ultimo_doc_nsu = ultimo_nsu  # rastreia o NSU do último doc processado
             
-            logger.info(f"🔍 Buscando a partir do NSU {nsu_atual}")
+            # Varredura adaptativa: pula via ultNSU/maxNSU, janela de requisições
+            # sob rate limit e checkpoint do NSU a cada lote (busca retomável)
+            varredura = VarreduraNSU(
+                cliente.consultar_nsu_status,
+                nsu_inicial,
+                checkpoint=lambda nsu: db.set_last_nsu_nfse(empresa_id, cnpj_informante, nsu)
+            )
             
-            # Loop de consulta incremental
-            while tentativas_404 < max_tentativas_404 and documentos_processados < max_documentos:
-                # Delay para respeitar rate limit (~1 req/segundo)
-                if nsu_atual > ultimo_nsu + 1:
-                    time.sleep(1)
-                
-                # Consultar NSU atual
-                resposta = cliente.consultar_nsu(nsu_atual)
-                
-                if resposta is None:
-                    # NSU não encontrado (404) ou rate limit (429)
-                    tentativas_404 += 1
-                    nsu_atual += 1
-                    continue
-                
-                # Reset contador de 404 (encontrou algo)
-                tentativas_404 = 0
-                
+            logger.info(f"🔍 Buscando a partir do NSU {nsu_inicial}")
+            
+            # Loop de consulta incremental (uma resposta por lote, em ordem de NSU)
+            for resposta in varredura:
                 # Extrai cursores da resposta
                 # ultNSU = último NSU neste lote; maxNSU = máximo disponível na SEFAZ
                 ult_nsu_str = str(resposta.get('ultNSU', '') or '').strip()
@@ -1891,20 +1883,20 @@ def buscar_nfse_ambiente_nacional(
                 if ult_nsu_resp > maior_nsu:
                     maior_nsu = ult_nsu_resp
                 
-                # Calcula próximo NSU: pula direto para depois do lote atual
-                proximo_nsu = ult_nsu_resp + 1 if ult_nsu_resp > nsu_atual else nsu_atual + 1
-                
                 # Extrai documentos do JSON
                 documentos = cliente.extrair_documentos(resposta)
                 
                 if not documentos:
-                    logger.debug(f"📭 NSU {nsu_atual}: sem documentos (ultNSU={ult_nsu_resp})")
-                    nsu_atual = proximo_nsu
+                    logger.debug(f"📭 Sem documentos (ultNSU={ult_nsu_resp}, maxNSU={max_nsu_disp})")
                     continue
                 
                 # Processar cada documento
                 for doc_nsu, xml_content, tipo_doc in documentos:
                     try:
+                        # Já processado em uma busca anterior (lote da âncora)
+                        if int(doc_nsu) <= ultimo_nsu:
+                            continue
+                        
                         # Validar XML
                         if not cliente.validar_xml(xml_content):
                             logger.warning(f"⚠️ NSU {doc_nsu}: XML inválido, pulando")
@@ -2213,18 +2205,26 @@ def buscar_nfse_ambiente_nacional(
                         if int(doc_nsu) > ultimo_doc_nsu:
                             ultimo_doc_nsu = int(doc_nsu)
                 
-                nsu_atual = proximo_nsu
+                if documentos_processados >= max_documentos:
+                    break
+            
+            resultado['erros'].extend(varredura.erros)
             
             # Log do motivo da parada
             if documentos_processados >= max_documentos:
                 logger.info(f"⏸️ Busca pausada: Limite de {max_documentos} documentos atingido")
                 logger.info(f"💡 Clique novamente em 'Baixar NFS-e' para continuar a busca")
-            elif tentativas_404 >= max_tentativas_404:
-                logger.info(f"⏹️ Busca finalizada: {max_tentativas_404} NSUs consecutivos sem retorno")
+            elif varredura.motivo_parada == 'max_nsu':
+                logger.info(f"⏹️ Busca finalizada: maxNSU {varredura.max_nsu} alcançado")
+            elif varredura.motivo_parada == 'vazios':
+                logger.info(f"⏹️ Busca finalizada: {varredura.max_vazios} NSUs consecutivos sem retorno")
+            elif varredura.motivo_parada == 'erro':
+                logger.warning(f"⚠️ Busca interrompida: NSU {varredura.cursor + 1} sem resposta, será consultado na próxima busca")
             
             # Atualizar último NSU processado
-            # Preferência: ultNSU da API (maior_nsu); fallback: doc_nsu do último doc processado
-            nsu_para_salvar = maior_nsu if maior_nsu > ultimo_nsu else ultimo_doc_nsu
+            # Preferência: ultNSU da API (maior_nsu) ou cursor da varredura;
+            # fallback: doc_nsu do último doc processado
+            nsu_para_salvar = max(maior_nsu, varredura.cursor, ultimo_doc_nsu)
             if nsu_para_salvar > ultimo_nsu:
                 db.set_last_nsu_nfse(empresa_id, cnpj_informante, nsu_para_salvar)
                 resultado['ultimo_nsu'] = nsu_para_salvar
@@ -18,18 +18,24 @@ Data: 2026-02-13
 
 import requests
 try:
-    from requests_pkcs12 import post as post_pkcs12, get as get_pkcs12
+    from requests_pkcs12 import post as post_pkcs12, get as get_pkcs12, Pkcs12Adapter
 except ImportError:
     post_pkcs12 = None
     get_pkcs12 = None
+    Pkcs12Adapter = None
 try:
     from lxml import etree
 except ImportError:
     etree = None
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime, date
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import logging
 import os
+import threading
+import time
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -155,6 +161,110 @@ URLS_MUNICIPIOS = {
 # CLASSE PRINCIPAL: NFSeService
 # ============================================================================
 
+# ============================================================================
+# SESSÕES mTLS PERSISTENTES (UMA POR CERTIFICADO)
+# ============================================================================
+# 
+# requests_pkcs12.get/post decifram o PFX e abrem um handshake TLS novo a
+# cada chamada. Aqui cada certificado ganha uma requests.Session com o
+# Pkcs12Adapter montado uma única vez: o PFX é decifrado na criação e as
+# conexões ficam abertas (keep-alive) entre as consultas por NSU, o download
+# do DANFSe e as chamadas SOAP municipais do microserviço (app_nfse).
+# 
+# A chave do cache é a impressão digital (SHA-256) do arquivo PFX, então
+# clientes diferentes — inclusive os que gravam o PFX em arquivo temporário
+# a cada requisição — compartilham a mesma sessão.
+# ============================================================================
+
+# Certificados com sessão aberta ao mesmo tempo (LRU)
+MAX_SESSOES_MTLS = 32
+# Conexões mantidas por host em cada sessão
+CONEXOES_POR_HOST = 4
+
+_sessoes_mtls: 'OrderedDict[Tuple[str, str], requests.Session]' = OrderedDict()
+_sessoes_lock = threading.Lock()
+
+
+def impressao_digital_pfx(pfx_bytes: bytes) -> str:
+    """SHA-256 do PKCS#12 (identifica o certificado sem decifrá-lo)"""
+    return hashlib.sha256(pfx_bytes).hexdigest()
+
+
+def _criar_sessao_mtls(pfx_bytes: bytes, senha: str) -> requests.Session:
+    if Pkcs12Adapter is None:
+        raise ImportError('requests_pkcs12 não instalado')
+    
+    adapter = Pkcs12Adapter(
+        pkcs12_data=pfx_bytes,
+        pkcs12_password=senha or None,
+        pool_connections=CONEXOES_POR_HOST,
+        pool_maxsize=CONEXOES_POR_HOST
+    )
+    sessao = requests.Session()
+    sessao.mount('https://', adapter)
+    sessao.verify = True
+    return sessao
+
+
+def obter_sessao_mtls(pfx_bytes: bytes, senha: str) -> requests.Session:
+    """
+    Sessão HTTPS persistente autenticada com o certificado A1
+    
+    Criada na primeira chamada para o certificado e reaproveitada nas
+    seguintes (mesmo PFX e mesma senha).
+    
+    Args:
+        pfx_bytes: Conteúdo do arquivo .pfx
+        senha: Senha do certificado
+        
+    Returns:
+        requests.Session com o certificado montado para https://
+    """
+    impressao = impressao_digital_pfx(pfx_bytes)
+    # A senha entra na chave: quem tem só o PFX não herda a sessão já aberta
+    chave = (impressao, hashlib.sha256((senha or '').encode('utf-8')).hexdigest())
+    
+    with _sessoes_lock:
+        sessao = _sessoes_mtls.get(chave)
+        if sessao is not None:
+            _sessoes_mtls.move_to_end(chave)
+            return sessao
+    
+    # Decifra o PFX fora do lock (lento; outros certificados não esperam)
+    nova = _criar_sessao_mtls(pfx_bytes, senha)
+    
+    with _sessoes_lock:
+        sessao = _sessoes_mtls.get(chave)
+        if sessao is None:
+            sessao = _sessoes_mtls[chave] = nova
+            nova = None
+            while len(_sessoes_mtls) > MAX_SESSOES_MTLS:
+                _, antiga = _sessoes_mtls.popitem(last=False)
+                antiga.close()
+    
+    if nova is not None:
+        # Outra thread criou a sessão enquanto decifrávamos
+        nova.close()
+    else:
+        logger.info(f"🔐 Sessão mTLS criada para o certificado {impressao[:16]}")
+    return sessao
+
+
+def obter_sessao_mtls_arquivo(certificado_path: str, certificado_senha: str) -> requests.Session:
+    """obter_sessao_mtls() a partir do caminho do .pfx"""
+    with open(certificado_path, 'rb') as f:
+        return obter_sessao_mtls(f.read(), certificado_senha)
+
+
+def fechar_sessoes_mtls() -> None:
+    """Fecha todas as sessões mTLS (ex: após trocar certificados)"""
+    with _sessoes_lock:
+        sessoes = list(_sessoes_mtls.values())
+        _sessoes_mtls.clear()
+    for sessao in sessoes:
+        sessao.close()
+
+
 class NFSeService:
     """
     Classe para comunicação com APIs SOAP de provedores NFS-e
@@ -170,11 +280,18 @@ class NFSeService:
         """
         self.certificado_path = certificado_path
         self.certificado_senha = certificado_senha
+        self._sessao = None
         
         # Validar certificado
         if not os.path.exists(certificado_path):
             raise FileNotFoundError(f"Certificado não encontrado: {certificado_path}")
     
+    def _obter_sessao(self) -> requests.Session:
+        """Sessão mTLS compartilhada do certificado (ver obter_sessao_mtls)"""
+        if self._sessao is None:
+            self._sessao = obter_sessao_mtls_arquivo(self.certificado_path, self.certificado_senha)
+        return self._sessao
+    
     def buscar_nfse(
         self,
         cnpj_prestador: str,
@@ -283,12 +400,10 @@ class NFSeService:
                 'Connection': 'keep-alive'
             }
             
-            response = post_pkcs12(
+            response = self._obter_sessao().post(
                 url_webservice,
                 data=xml_request.encode('utf-8'),
                 headers=headers,
-                pkcs12_filename=self.certificado_path,
-                pkcs12_password=self.certificado_senha,
                 timeout=30,
                 verify=True  # Verificar SSL
             )
@@ -478,12 +593,10 @@ class NFSeService:
                 'Connection': 'keep-alive'
             }
             
-            response = post_pkcs12(
+            response = self._obter_sessao().post(
                 url_webservice,
                 data=xml_request.encode('utf-8'),
                 headers=headers,
-                pkcs12_filename=self.certificado_path,
-                pkcs12_password=self.certificado_senha,
                 timeout=30,
                 verify=True
             )
@@ -677,6 +790,7 @@ class NFSeAmbienteNacional:
         self.certificado_path = certificado_path
         self.certificado_senha = certificado_senha
         self.ambiente = ambiente
+        self._sessao = None
         
         # URLs oficiais do Ambiente Nacional
         if ambiente == 'producao':
@@ -686,6 +800,17 @@ class NFSeAmbienteNacional:
         
         logger.info(f"🌐 Cliente Ambiente Nacional inicializado: {self.url_base}")
     
+    def _obter_sessao(self) -> requests.Session:
+        """
+        Sessão mTLS persistente do certificado (ver obter_sessao_mtls)
+        
+        Compartilhada com outros clientes do mesmo certificado: o loop de NSU
+        e os downloads de DANFSe reaproveitam as conexões TLS já abertas.
+        """
+        if self._sessao is None:
+            self._sessao = obter_sessao_mtls_arquivo(self.certificado_path, self.certificado_senha)
+        return self._sessao
+    
     def consultar_nsu(self, nsu: int, timeout: int = 45) -> Optional[Dict]:
         """
         Consulta documento por NSU (Número Sequencial Único)
@@ -715,6 +840,24 @@ class NFSeAmbienteNacional:
         """
         import time
         
+        status, resultado = self.consultar_nsu_status(nsu, timeout)
+        
+        # Rate limit (aguardar e tentar novamente)
+        if status == 429:
+            time.sleep(2)
+        
+        return resultado
+    
+    def consultar_nsu_status(self, nsu: int, timeout: int = 45) -> Tuple[int, Optional[Dict]]:
+        """
+        Como consultar_nsu(), mas devolve também o status HTTP e não dorme no 429
+        
+        Usado pela VarreduraNSU, que precisa distinguir NSU vazio (404) de
+        rate limit (429) e de falha (status 0 = exceção de rede).
+        
+        Returns:
+            Tuple (status_http, json ou None)
+        """
         endpoint = f"{self.url_base}/contribuintes/DFe/{nsu}"
         
         try:
@@ -725,12 +868,10 @@ class NFSeAmbienteNacional:
                 'User-Agent': 'Sistema Financeiro DWM/1.0'
             }
             
-            # Requisição GET com certificado mTLS
-            response = get_pkcs12(
+            # Requisição GET com certificado mTLS (conexão reaproveitada)
+            response = self._obter_sessao().get(
                 endpoint,
                 headers=headers,
-                pkcs12_filename=self.certificado_path,
-                pkcs12_password=self.certificado_senha,
                 timeout=timeout,
                 verify=True
             )
@@ -738,28 +879,27 @@ class NFSeAmbienteNacional:
             # NSU não encontrado (esperado quando atingir o fim)
             if response.status_code == 404:
                 logger.debug(f"📭 NSU {nsu} não encontrado")
-                return None
+                return 404, None
             
-            # Rate limit (aguardar e tentar novamente)
+            # Rate limit
             if response.status_code == 429:
-                logger.warning(f"⏱️ Rate limit atingido no NSU {nsu}, aguardando 2s...")
-                time.sleep(2)
-                return None
+                logger.warning(f"⏱️ Rate limit atingido no NSU {nsu}")
+                return 429, None
             
             # Outros erros HTTP
             if response.status_code != 200:
                 logger.error(f"❌ Erro HTTP {response.status_code} ao consultar NSU {nsu}")
                 logger.error(f"   Resposta: {response.text[:200]}")
-                return None
+                return response.status_code, None
             
             # Parse JSON
             resultado = response.json()
             logger.debug(f"✅ NSU {nsu}: JSON recebido")
-            return resultado
+            return 200, resultado
             
         except Exception as e:
             logger.error(f"❌ Erro ao consultar NSU {nsu}: {e}")
-            return None
+            return 0, None
     
     def consultar_danfse(self, chave_acesso: str, retry: int = 3, timeout: int = 45) -> Optional[bytes]:
         """
@@ -795,12 +935,10 @@ class NFSeAmbienteNacional:
                     'User-Agent': 'Sistema Financeiro DWM/1.0'
                 }
                 
-                # Requisição GET com certificado mTLS
-                response = get_pkcs12(
+                # Requisição GET com certificado mTLS (conexão reaproveitada)
+                response = self._obter_sessao().get(
                     endpoint,
                     headers=headers,
-                    pkcs12_filename=self.certificado_path,
-                    pkcs12_password=self.certificado_senha,
                     timeout=timeout,
                     verify=True
                 )
@@ -923,6 +1061,245 @@ class NFSeAmbienteNacional:
             return False
 
 
+# ============================================================================
+# VARREDURA ADAPTATIVA DE NSU (AMBIENTE NACIONAL)
+# ============================================================================
+# 
+# Em vez de consultar um NSU por segundo e só parar após 100 NSUs vazios:
+# - ultNSU de cada resposta faz a varredura pular direto para o próximo lote
+# - maxNSU encerra a varredura assim que o último NSU disponível é lido
+# - Trechos vazios (404) são sondados com uma janela de requisições em voo,
+#   sob um balde de tokens que reduz a taxa pela metade a cada 429
+# - O NSU já coberto é informado a um callback de checkpoint, para que uma
+#   busca interrompida continue de onde parou
+# ============================================================================
+
+# Requisições por segundo ao Ambiente Nacional (~1 req/s documentado)
+TAXA_ADN = float(os.getenv('NFSE_ADN_REQ_POR_SEGUNDO', '1'))
+# Requisições em voo ao mesmo tempo durante a varredura
+JANELA_NSU = int(os.getenv('NFSE_ADN_JANELA', '3'))
+# NSUs vazios seguidos que encerram a varredura quando maxNSU é desconhecido
+MAX_NSUS_VAZIOS = 100
+# Pausa aplicada a todas as requisições após um 429
+ESPERA_429 = 2.0
+
+
+def _nsu_int(valor) -> int:
+    try:
+        return int(str(valor or '').strip().lstrip('0') or '0')
+    except ValueError:
+        return 0
+
+
+class BaldeTokens:
+    """
+    Rate limiter de balde de tokens compartilhado entre threads
+    
+    Cada aguardar() reserva um token e dorme até ele existir. Um 429
+    (penalizar) corta a taxa pela metade e empurra todas as próximas
+    reservas para depois da pausa; cada resposta normal (recompensar)
+    devolve a taxa aos poucos até o valor inicial.
+    """
+    
+    def __init__(self, taxa: float = TAXA_ADN, capacidade: float = 1.0, taxa_minima: float = 0.1,
+                 relogio=time.monotonic, dormir=time.sleep):
+        self.taxa_maxima = taxa
+        self.taxa = taxa
+        self.taxa_minima = min(taxa_minima, taxa)
+        self.capacidade = capacidade
+        self._tokens = capacidade
+        self._relogio = relogio
+        self._dormir = dormir
+        self._ultimo = relogio()
+        self._lock = threading.Lock()
+    
+    def _repor(self) -> None:
+        agora = self._relogio()
+        self._tokens = min(self.capacidade, self._tokens + (agora - self._ultimo) * self.taxa)
+        self._ultimo = agora
+    
+    def aguardar(self) -> float:
+        """Reserva um token; devolve quanto tempo dormiu"""
+        with self._lock:
+            self._repor()
+            self._tokens -= 1
+            espera = max(0.0, -self._tokens / self.taxa)
+        if espera:
+            self._dormir(espera)
+        return espera
+    
+    def penalizar(self, espera: float = ESPERA_429) -> None:
+        """429: metade da taxa e pausa de `espera` segundos antes da próxima reserva"""
+        with self._lock:
+            self._repor()
+            self.taxa = max(self.taxa_minima, self.taxa / 2)
+            self._tokens = min(self._tokens, 0.0) - espera * self.taxa
+        logger.warning(f"⏱️ Rate limit: taxa reduzida para {self.taxa:.2f} req/s")
+    
+    def recompensar(self) -> None:
+        """Resposta sem 429: aumento aditivo da taxa até o valor inicial"""
+        with self._lock:
+            if self.taxa < self.taxa_maxima:
+                self.taxa = min(self.taxa_maxima, self.taxa + self.taxa_maxima / 20)
+
+
+class VarreduraNSU:
+    """
+    Percorre os NSUs do Ambiente Nacional a partir de nsu_inicial
+    
+    Iterar devolve, em ordem de NSU, cada resposta 200 (JSON com LoteDFe,
+    ultNSU e maxNSU). Quando o consumidor pede a próxima resposta, o lote
+    anterior é considerado processado e o checkpoint avança.
+    
+    Atributos após a iteração:
+        cursor: maior NSU já coberto (lido ou vazio abaixo de maxNSU)
+        max_nsu: último maxNSU informado pela API (None se nenhum)
+        motivo_parada: 'max_nsu', 'vazios' ou 'erro' (NSU sem resposta após
+            max_tentativas; o cursor fica antes dele)
+        consultas, vazios_total, erros
+    
+    Uso:
+        varredura = VarreduraNSU(cliente.consultar_nsu_status, ultimo_nsu,
+                                 checkpoint=lambda nsu: db.set_last_nsu_nfse(...))
+        for resposta in varredura:
+            documentos = cliente.extrair_documentos(resposta)
+    """
+    
+    def __init__(self, consultar, nsu_inicial: int, limitador: Optional[BaldeTokens] = None,
+                 janela: int = JANELA_NSU, max_vazios: int = MAX_NSUS_VAZIOS,
+                 max_tentativas: int = 3, checkpoint=None, intervalo_checkpoint: int = 20):
+        """
+        Args:
+            consultar: Função nsu -> (status_http, json), ex: consultar_nsu_status
+            nsu_inicial: Primeiro NSU consultado
+            limitador: Rate limiter compartilhado (padrão: BaldeTokens())
+            janela: Requisições em voo ao mesmo tempo
+            max_vazios: NSUs vazios seguidos que encerram a varredura
+            max_tentativas: Tentativas por NSU em erro de rede/5xx antes de parar
+            checkpoint: Função nsu -> None chamada quando o cursor avança
+            intervalo_checkpoint: NSUs vazios entre checkpoints
+        """
+        self.consultar = consultar
+        self.nsu_inicial = max(1, int(nsu_inicial))
+        self.limitador = limitador or BaldeTokens()
+        self.janela = max(1, janela)
+        self.max_vazios = max_vazios
+        self.max_tentativas = max_tentativas
+        self.checkpoint = checkpoint
+        self.intervalo_checkpoint = intervalo_checkpoint
+        
+        self.cursor = self.nsu_inicial - 1
+        self.max_nsu: Optional[int] = None
+        self.consultas = 0
+        self.vazios_total = 0
+        self.erros: List[str] = []
+        self.motivo_parada: Optional[str] = None
+        self._cursor_salvo = self.cursor
+    
+    def _consultar(self, nsu: int) -> Tuple[int, Optional[Dict]]:
+        self.limitador.aguardar()
+        try:
+            return self.consultar(nsu)
+        except Exception as e:
+            logger.error(f"❌ Erro ao consultar NSU {nsu}: {e}")
+            return 0, None
+    
+    def _avancar(self, nsu: int, forcar: bool = False) -> None:
+        """Move o cursor e grava o checkpoint (a cada intervalo ou se forçado)"""
+        if nsu > self.cursor:
+            self.cursor = nsu
+        if self.checkpoint and self.cursor > self._cursor_salvo and (
+                forcar or self.cursor - self._cursor_salvo >= self.intervalo_checkpoint):
+            self.checkpoint(self.cursor)
+            self._cursor_salvo = self.cursor
+    
+    def __iter__(self):
+        esperado = self.nsu_inicial   # próximo NSU a consumir (em ordem)
+        proximo = self.nsu_inicial    # próximo NSU a enviar
+        vazios = 0
+        tentativas: Dict[int, int] = {}
+        pendentes = {}
+        pool = ThreadPoolExecutor(max_workers=self.janela, thread_name_prefix='nsu')
+        
+        try:
+            while True:
+                if self.max_nsu is not None and esperado > self.max_nsu:
+                    self.motivo_parada = 'max_nsu'
+                    break
+                if vazios >= self.max_vazios:
+                    self.motivo_parada = 'vazios'
+                    break
+                
+                # Preenche a janela sem passar de maxNSU nem do limite de vazios
+                limite = esperado + (self.max_vazios - vazios)
+                if self.max_nsu is not None:
+                    limite = min(limite, self.max_nsu + 1)
+                if esperado not in pendentes:
+                    pendentes[esperado] = pool.submit(self._consultar, esperado)
+                    proximo = max(proximo, esperado + 1)
+                # A primeira consulta vai sozinha: costuma trazer maxNSU e evita
+                # sondagens especulativas além do fim
+                janela = self.janela if self.consultas else 1
+                while len(pendentes) < janela and proximo < limite:
+                    pendentes[proximo] = pool.submit(self._consultar, proximo)
+                    proximo += 1
+                
+                status, resposta = pendentes.pop(esperado).result()
+                self.consultas += 1
+                
+                if status == 429:
+                    self.limitador.penalizar()
+                    continue
+                
+                if status not in (200, 404):
+                    tentativas[esperado] = tentativas.get(esperado, 0) + 1
+                    if tentativas[esperado] < self.max_tentativas:
+                        continue
+                    # Falha não é NSU vazio: para sem cobrir este NSU, para que
+                    # a próxima busca o consulte de novo
+                    self.erros.append(f"NSU {esperado}: falha após {self.max_tentativas} tentativas (HTTP {status})")
+                    self.motivo_parada = 'erro'
+                    break
+                
+                self.limitador.recompensar()
+                tentativas.pop(esperado, None)
+                
+                if status != 200 or resposta is None:
+                    # NSU vazio: só conta como coberto abaixo de maxNSU
+                    # (acima dele o NSU ainda pode ser atribuído a um documento novo)
+                    vazios += 1
+                    self.vazios_total += 1
+                    if self.max_nsu is not None:
+                        self._avancar(min(esperado, self.max_nsu))
+                    esperado += 1
+                    continue
+                
+                vazios = 0
+                ult_nsu = _nsu_int(resposta.get('ultNSU'))
+                max_nsu = _nsu_int(resposta.get('maxNSU'))
+                if max_nsu:
+                    self.max_nsu = max_nsu
+                
+                yield resposta
+                
+                # Lote processado: pula tudo até ultNSU
+                novo = max(esperado, ult_nsu)
+                self._avancar(novo, forcar=True)
+                for nsu in [n for n in pendentes if n <= novo]:
+                    pendentes.pop(nsu).cancel()
+                esperado = novo + 1
+                proximo = max(proximo, esperado)
+        finally:
+            # Também ao interromper o for: o lote entregue e não processado
+            # não entrou no cursor
+            for futuro in pendentes.values():
+                futuro.cancel()
+            pool.shutdown(wait=False, cancel_futures=True)
+            self._avancar(self.cursor, forcar=True)
+            logger.info(f"🔎 Varredura NSU {self.nsu_inicial}→{self.cursor}: {self.consultas} consultas, "
+                        f"{self.vazios_total} vazios, parada={self.motivo_parada or 'interrompida'}")
+
+
 # ============================================================================
 # EXEMPLO DE USO
 # ============================================================================
@@ -6,6 +6,7 @@ Envia alertas sobre contratos e sessões via e-mail e Google Calendar
 import os
 import json
 import smtplib
+import time
 import urllib.request
 import urllib.error
 try:
@@ -15,9 +16,12 @@ except ImportError:
     _REQUESTS_AVAILABLE = False
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import List, Dict
 
+from psycopg2.extras import execute_values
+
 
 def _fmt_date(value) -> str:
     """Converte data de yyyy-mm-dd para dd/mm/yyyy. Retorna o valor original se falhar."""
@@ -442,7 +446,6 @@ def load_email_settings():
         smtp_name     = os.getenv('SMTP_FROM_NAME', 'Sistema Financeiro DWM')
         smtp_enabled  = bool(smtp_host and smtp_user and smtp_password)
         return {
-            'notification_emails': [],
             'google_calendar_enabled': False,
             'smtp_enabled': smtp_enabled,
             'smtp_host': smtp_host,
@@ -453,6 +456,18 @@ def load_email_settings():
             'smtp_from_name': smtp_name,
         }
 
+def carregar_destinatarios(empresa_ids: List[int]) -> Dict[int, List[str]]:
+    """
+    Destinatários dos resumos por empresa (app.routes.agenda.load_notification_emails).
+    Empresa sem e-mail configurado não aparece no resultado.
+    """
+    try:
+        from app.routes.agenda import load_notification_emails
+        return load_notification_emails(empresa_ids)
+    except Exception as e:
+        print(f"⚠️ Erro ao carregar destinatários das notificações: {e}")
+        return {}
+
 def _send_via_resend(recipients: List[str], subject: str, html_content: str,
                      plain_content: str, from_email: str, from_name: str) -> bool:
     """
@@ -522,18 +537,20 @@ def _send_via_resend(recipients: List[str], subject: str, html_content: str,
         return False
 
 
-def send_email_notification(recipients: List[str], subject: str, html_content: str, plain_content: str = None):
+def send_email_notification(recipients: List[str], subject: str, html_content: str, plain_content: str = None,
+                            settings: Dict = None):
     """
     Enviar notificação por e-mail.
     Estratégia:
       1. Se RESEND_API_KEY estiver configurada → usa Resend (HTTPS, Railway-safe)
       2. Caso contrário → tenta SMTP (porta 587/465, pode ser bloqueada em alguns PaaS)
+    settings: configurações já carregadas (evita reler a cada e-mail)
     """
     if not recipients:
         print("⚠️ Nenhum destinatário especificado")
         return False
 
-    settings = load_email_settings()
+    settings = settings or load_email_settings()
     from_email = settings.get('smtp_from_email', '')
     from_name  = settings.get('smtp_from_name', 'Sistema Financeiro DWM')
 
@@ -880,130 +897,443 @@ def check_expired_contracts(empresa_id: int) -> List[Dict]:
         print(f"❌ Erro ao verificar contratos vencidos: {e}")
         return []
 
-def send_notification_batch(empresa_id: int):
+# ---------------------------------------------------------------------------
+# Pipeline multi-empresa: pendências de todas as empresas em poucas consultas,
+# deduplicação contra notificacoes_log no próprio SQL (anti-join) e envio em
+# lotes paralelos por uma sessão HTTP reaproveitada
+# ---------------------------------------------------------------------------
+
+# Envios (lotes Resend ou e-mails SMTP) simultâneos
+NOTIFICACOES_PARALELAS = int(os.getenv('NOTIFICACOES_PARALELAS', '4'))
+# Máximo de e-mails por chamada a POST /emails/batch da Resend
+RESEND_LOTE_MAX = 100
+RESEND_TENTATIVAS = 3
+
+DIAS_SESSOES_PROXIMAS = 3
+DIAS_CONTRATOS_PROXIMOS = 30
+# Sessões pendentes: só avisa acima deste total e lista as mais recentes
+LIMITE_SESSOES_ABERTAS = 10
+
+# (tipo no log, assunto, título, estilo do HTML) dos resumos enviados aos destinatários da empresa
+_RESUMOS = [
+    ('sessao_atrasada', "🚨 {N} Sessões Atrasadas",
+     "🚨 Sessões Atrasadas - Ação Necessária!", 'sessoes_atrasadas'),
+    ('sessoes_abertas', "📝 {N} Sessões em Aberto",
+     "📝 Muitas Sessões em Aberto", 'sessoes_abertas'),
+    ('contrato_proximo', "📄 {N} Contrato(s) Vencendo em 30 Dias",
+     "📄 Contratos Próximos do Vencimento", 'contratos_proximos'),
+    ('contrato_vencido', "🚨 {N} Contrato(s) Vencido(s)",
+     "🚨 Contratos Vencidos", 'contratos_vencidos'),
+]
+
+_COLUNAS_SESSAO = """
+    s.id, s.cliente_id, s.contrato_id, s.data, s.endereco,
+    s.descricao, s.prazo_entrega, s.observacoes, s.dados_json,
+    s.empresa_id, s.status, s.numero_nf, s.horas_trabalhadas,
+    s.finalizada_em, s.concluida_em, s.google_event_id,
+    COALESCE(c.razao_social, c.nome) AS cliente_nome,
+    c.nome_fantasia AS cliente_nome_fantasia,
+    ct.numero AS contrato_numero, ct.descricao AS contrato_nome
+"""
+
+# Item x (empresa_id, id, tipo_notificacao) ainda não enviado com sucesso hoje
+_NAO_NOTIFICADO_HOJE = """
+    NOT EXISTS (
+        SELECT 1 FROM notificacoes_log nl
+        WHERE nl.empresa_id    = x.empresa_id
+          AND nl.tipo          = x.tipo_notificacao
+          AND nl.referencia_id = x.id
+          AND nl.status        = 'enviado'
+          AND nl.enviado_em   >= CURRENT_DATE
+          AND nl.enviado_em   <  CURRENT_DATE + INTERVAL '1 day'
+    )
+"""
+
+_SQL_SESSOES = """
+    SELECT x.* FROM (
+        SELECT {colunas},
+               CASE WHEN s.data >= %(hoje)s THEN 'lembrete_sessao_equipe'
+                    ELSE 'sessao_atrasada' END AS tipo_notificacao
+        FROM sessoes s
+        JOIN empresas e ON e.id = s.empresa_id
+        LEFT JOIN clientes c ON s.cliente_id = c.id
+        LEFT JOIN contratos ct ON s.contrato_id = ct.id
+        WHERE {filtro_empresas}
+          AND ((s.data BETWEEN %(hoje)s AND %(limite_sessoes)s
+                AND s.status IS DISTINCT FROM 'cancelada')
+               OR (s.data < %(hoje)s
+                   AND COALESCE(s.status, '') NOT IN ('finalizada', 'cancelada')))
+    ) x
+    WHERE {nao_notificado}
+    ORDER BY x.empresa_id, x.data DESC, x.id DESC
+"""
+
+_SQL_SESSOES_ABERTAS = """
+    SELECT x.* FROM (
+        SELECT {colunas},
+               'sessoes_abertas' AS tipo_notificacao,
+               ROW_NUMBER() OVER (PARTITION BY s.empresa_id ORDER BY s.data DESC, s.id DESC) AS ordem,
+               COUNT(*) OVER (PARTITION BY s.empresa_id) AS total_empresa
+        FROM sessoes s
+        JOIN empresas e ON e.id = s.empresa_id
+        LEFT JOIN clientes c ON s.cliente_id = c.id
+        LEFT JOIN contratos ct ON s.contrato_id = ct.id
+        WHERE {filtro_empresas}
+          AND s.status = 'pendente'
+    ) x
+    WHERE x.total_empresa > %(limite_abertas)s
+      AND x.ordem <= %(limite_abertas)s
+      AND {nao_notificado}
+    ORDER BY x.empresa_id, x.ordem
+"""
+
+_SQL_CONTRATOS = """
+    SELECT x.* FROM (
+        SELECT ct.*,
+               COALESCE(cl.razao_social, cl.nome) AS cliente_nome,
+               CASE WHEN ct.data_fim < %(hoje)s THEN 'contrato_vencido'
+                    ELSE 'contrato_proximo' END AS tipo_notificacao
+        FROM contratos ct
+        JOIN empresas e ON e.id = ct.empresa_id
+        LEFT JOIN clientes cl ON ct.cliente_id = cl.id
+        WHERE {filtro_empresas}
+          AND ct.status = 'ativo'
+          AND ct.data_fim <= %(limite_contratos)s
+    ) x
+    WHERE {nao_notificado}
+    ORDER BY x.empresa_id, x.created_at DESC
+"""
+
+
+def _filtro_empresas(alias: str, empresa_ids) -> str:
+    """Empresas informadas, ou todas as ativas quando empresa_ids é None."""
+    if empresa_ids is None:
+        return "e.ativo IS NOT FALSE"
+    return f"{alias}.empresa_id = ANY(%(empresas)s)"
+
+
+def _agrupar_pendencias(linhas, converter) -> Dict[int, Dict[str, List[Dict]]]:
+    """{empresa_id: {tipo_notificacao: [itens]}} mantendo a ordem das linhas."""
+    pendencias = {}
+    for row in linhas:
+        item = converter(row)
+        tipo = row['tipo_notificacao']
+        pendencias.setdefault(row['empresa_id'], {}).setdefault(tipo, []).append(item)
+    return pendencias
+
+
+def _linha_para_contrato(row) -> Dict:
+    contrato = {k: v for k, v in dict(row).items() if k != 'tipo_notificacao'}
+    if contrato.get('data_fim'):
+        contrato['data_fim'] = contrato['data_fim'].isoformat()
+    return contrato
+
+
+def coletar_pendencias(empresa_ids: List[int] = None, hoje=None) -> Dict[int, Dict[str, List[Dict]]]:
     """
-    Enviar lote de notificações para uma empresa.
-    Usa deduplicação por sessão/contrato (não reenvía o mesmo item no mesmo dia).
-    Registra cada envio na tabela notificacoes_log.
+    Sessões e contratos a notificar de todas as empresas ativas (ou das
+    informadas), já sem os itens enviados com sucesso hoje.
+
+    Três consultas no total, qualquer que seja o número de empresas.
     """
-    _ensure_log_table()
-    settings = load_email_settings()
-    recipients = settings.get('notification_emails', [])
+    hoje = hoje or datetime.now().date()
+    params = {
+        'hoje': hoje,
+        'limite_sessoes': hoje + timedelta(days=DIAS_SESSOES_PROXIMAS),
+        'limite_contratos': hoje + timedelta(days=DIAS_CONTRATOS_PROXIMOS),
+        'limite_abertas': LIMITE_SESSOES_ABERTAS,
+        'empresas': list(empresa_ids) if empresa_ids is not None else None,
+    }
+    consultas = [
+        (_SQL_SESSOES, 's', db._linha_para_sessao),
+        (_SQL_SESSOES_ABERTAS, 's', db._linha_para_sessao),
+        (_SQL_CONTRATOS, 'ct', _linha_para_contrato),
+    ]
+
+    from database_postgresql import get_db_connection
+    pendencias = {}
+    with get_db_connection(allow_global=True) as conn:
+        cur = conn.cursor()
+        for sql, alias, converter in consultas:
+            cur.execute(sql.format(colunas=_COLUNAS_SESSAO,
+                                   filtro_empresas=_filtro_empresas(alias, empresa_ids),
+                                   nao_notificado=_NAO_NOTIFICADO_HOJE), params)
+            for empresa_id, por_tipo in _agrupar_pendencias(cur.fetchall(), converter).items():
+                pendencias.setdefault(empresa_id, {}).update(por_tipo)
+    return pendencias
+
+
+def _ids_equipe(equipe, prefixo: str) -> List[int]:
+    """IDs dos itens da equipe do tipo 'forn' ou 'func' (tipo_pessoa ou pessoa_id 'forn_N')."""
+    ids = []
+    for item in equipe or []:
+        if not isinstance(item, dict):
+            continue
+        pessoa_id = str(item.get('pessoa_id', ''))
+        if item.get('tipo_pessoa', '') == prefixo or pessoa_id.startswith(f'{prefixo}_'):
+            try:
+                id_pessoa = item.get('id_pessoa')
+                ids.append(int(id_pessoa) if id_pessoa is not None else int(pessoa_id.replace(f'{prefixo}_', '')))
+            except (ValueError, TypeError):
+                pass
+    return ids
 
-    if not recipients:
-        print(f"⚠️ Nenhum e-mail configurado para empresa {empresa_id}")
+
+def _emails_equipes(sessoes: List[Dict]) -> Dict[tuple, List[str]]:
+    """
+    E-mails (fornecedores, depois funcionários) da equipe de cada sessão,
+    por (empresa_id, sessao_id) - uma consulta por tabela para todas as sessões.
+    """
+    pares = {'forn': set(), 'func': set()}
+    for sessao in sessoes:
+        for prefixo in pares:
+            pares[prefixo].update((sessao['empresa_id'], i) for i in _ids_equipe(sessao.get('equipe'), prefixo))
+
+    emails = {'forn': {}, 'func': {}}
+    tabelas = {'forn': 'fornecedores', 'func': 'funcionarios'}
+    try:
+        from database_postgresql import get_db_connection
+        with get_db_connection(allow_global=True) as conn:
+            cur = conn.cursor()
+            for prefixo, chaves in pares.items():
+                if not chaves:
+                    continue
+                empresas, ids = zip(*chaves)
+                cur.execute(f"""
+                    SELECT empresa_id, id, email FROM {tabelas[prefixo]}
+                    WHERE (empresa_id, id) IN (SELECT * FROM unnest(%s::int[], %s::int[]))
+                      AND email IS NOT NULL AND email <> ''
+                """, (list(empresas), list(ids)))
+                for row in cur.fetchall():
+                    emails[prefixo][(row['empresa_id'], row['id'])] = row['email'].strip()
+    except Exception as e:
+        print(f"⚠️ Erro ao buscar e-mails das equipes: {e}")
+
+    resultado = {}
+    for sessao in sessoes:
+        lista = []
+        for prefixo in ('forn', 'func'):
+            for pessoa in _ids_equipe(sessao.get('equipe'), prefixo):
+                email = emails[prefixo].get((sessao['empresa_id'], pessoa))
+                if email and email not in lista:
+                    lista.append(email)
+        resultado[(sessao['empresa_id'], sessao['id'])] = lista
+    return resultado
+
+
+def _resolver_kits(sessoes: List[Dict]) -> None:
+    """
+    Troca IDs de equipamentos pelos nomes (uma consulta para todas as sessões),
+    para create_notification_html não consultar kit a kit.
+    """
+    por_sessao = [(s, s.get('equipamentos') or []) for s in sessoes]
+    ids = {int(e) for _, equip in por_sessao for e in equip if str(e).isdigit()}
+    if not ids:
         return
+    nomes = {}
+    from database_postgresql import get_db_connection
+    for tabela in ('kits_equipamentos', 'kits'):
+        faltando = list(ids - nomes.keys())
+        if not faltando:
+            break
+        try:
+            with get_db_connection(allow_global=True) as conn:
+                cur = conn.cursor()
+                cur.execute(f"SELECT id, nome FROM {tabela} WHERE id = ANY(%s)", (faltando,))
+                nomes.update({r['id']: r['nome'] for r in cur.fetchall()})
+        except Exception as e:
+            print(f"⚠️ Erro ao resolver nomes de kits ({tabela}): {e}")
+    for sessao, equip in por_sessao:
+        if equip and all(str(e).isdigit() for e in equip):
+            sessao['equipamentos'] = [{'nome': nomes.get(int(e), f'Kit #{e}')} for e in equip]
 
-    print(f"🔍 Verificando notificações para empresa {empresa_id}...")
 
-    def _send_and_log(items, tipo, assunto, titulo, notif_type):
-        """Filtra itens ainda não notificados hoje, envia e registra."""
-        novos = [i for i in items
-                 if not was_notified_today(empresa_id, tipo, i.get('id'))]
-        if not novos:
-            print(f"  ⏭️ {tipo}: todos os {len(items)} já notificados hoje")
-            return
-        html = create_notification_html(titulo, novos, notif_type)
-        ok   = send_email_notification(recipients, assunto.format(N=len(novos)), html)
-        status = 'enviado' if ok else 'erro'
-        erro   = None if ok else 'Falha ao enviar via Resend/SMTP'
-        for item in novos:
-            log_notification_sent(
-                empresa_id, tipo, item.get('id'),
-                item.get('data') or item.get('data_fim'),
-                recipients, assunto.format(N=len(novos)), status, erro,
-            )
-        print(f"  {'✅' if ok else '❌'} {tipo}: {len(novos)} enviado(s)")
-
-    # Sessões próximas (3 dias) — notifica SOMENTE equipe (fornecedores + funcionários)
-    upcoming_sessions = check_upcoming_sessions(empresa_id, days_ahead=3)
-    if upcoming_sessions:
-        for sessao in upcoming_sessions:
-            sessao_id = sessao.get('id')
-            if was_notified_today(empresa_id, 'lembrete_sessao_equipe', sessao_id):
-                print(f"  ⏭️ Equipe da sessão {sessao_id} já notificada hoje")
-                continue
-            equipe_emails = _get_equipe_emails(sessao.get('equipe', []), empresa_id)
-            if not equipe_emails:
+def montar_mensagens(pendencias: Dict[int, Dict[str, List[Dict]]], destinatarios: Dict[int, List[str]],
+                     emails_equipe: Dict[tuple, List[str]]) -> List[Dict]:
+    """
+    Um e-mail por sessão próxima (para a equipe) e um resumo por empresa e tipo
+    (para os destinatários daquela empresa), com os mesmos assuntos do envio
+    por empresa. Empresa sem destinatários não recebe resumo.
+    """
+    mensagens = []
+    for empresa_id in sorted(pendencias):
+        por_tipo = pendencias[empresa_id]
+
+        for sessao in por_tipo.get('lembrete_sessao_equipe', []):
+            emails = emails_equipe.get((empresa_id, sessao['id']))
+            if not emails:
                 continue
             data_fmt = _fmt_date(sessao.get('data'))
-            assunto = (
-                f"\U0001f4c5 Lembrete de Sessão — "
-                f"{sessao.get('cliente_nome', 'Cliente')} em "
-                f"{data_fmt}"
-            )
-            html = create_notification_html(
-                f"\U0001f4c5 Lembrete: Sessão em {data_fmt}",
-                [sessao],
-                'sessoes_proximas'
-            )
-            ok = send_email_notification(equipe_emails, assunto, html)
-            status = 'enviado' if ok else 'erro'
-            erro = None if ok else 'Falha ao enviar via Resend/SMTP'
-            log_notification_sent(
-                empresa_id, 'lembrete_sessao_equipe', sessao_id,
-                sessao.get('data'), equipe_emails, assunto, status, erro,
-            )
-            print(f"  {'✅' if ok else '❌'} Equipe notificada para sessão "
-                  f"{sessao_id}: {equipe_emails}")
-
-    # Sessões atrasadas
-    overdue_sessions = check_overdue_sessions(empresa_id)
-    if overdue_sessions:
-        _send_and_log(
-            overdue_sessions, 'sessao_atrasada',
-            "🚨 {N} Sessões Atrasadas",
-            "🚨 Sessões Atrasadas - Ação Necessária!", 'sessoes_atrasadas',
-        )
+            mensagens.append({
+                'empresa_id': empresa_id,
+                'tipo': 'lembrete_sessao_equipe',
+                'itens': [sessao],
+                'destinatarios': emails,
+                'assunto': (f"\U0001f4c5 Lembrete de Sessão — "
+                            f"{sessao.get('cliente_nome', 'Cliente')} em {data_fmt}"),
+                'html': create_notification_html(f"\U0001f4c5 Lembrete: Sessão em {data_fmt}",
+                                                 [sessao], 'sessoes_proximas'),
+            })
 
-    # Sessões em aberto (> 10)
-    open_sessions = check_open_sessions(empresa_id)
-    if open_sessions and len(open_sessions) > 10:
-        _send_and_log(
-            open_sessions[:10], 'sessoes_abertas',
-            "📝 {N} Sessões em Aberto",
-            "📝 Muitas Sessões em Aberto", 'sessoes_abertas',
-        )
+        emails_empresa = destinatarios.get(empresa_id)
+        if not emails_empresa:
+            continue
+        for tipo, assunto, titulo, estilo in _RESUMOS:
+            itens = por_tipo.get(tipo)
+            if not itens:
+                continue
+            mensagens.append({
+                'empresa_id': empresa_id,
+                'tipo': tipo,
+                'itens': itens,
+                'destinatarios': emails_empresa,
+                'assunto': assunto.format(N=len(itens)),
+                'html': create_notification_html(titulo, itens, estilo),
+            })
+    return mensagens
 
-    # Contratos próximos do vencimento (30 dias)
-    upcoming_contracts = check_upcoming_contracts(empresa_id, days_ahead=30)
-    if upcoming_contracts:
-        _send_and_log(
-            upcoming_contracts, 'contrato_proximo',
-            "📄 {N} Contrato(s) Vencendo em 30 Dias",
-            "📄 Contratos Próximos do Vencimento", 'contratos_proximos',
-        )
 
-    # Contratos vencidos
-    expired_contracts = check_expired_contracts(empresa_id)
-    if expired_contracts:
-        _send_and_log(
-            expired_contracts, 'contrato_vencido',
-            "🚨 {N} Contrato(s) Vencido(s)",
-            "🚨 Contratos Vencidos", 'contratos_vencidos',
-        )
+def _enviar_lote_resend(sessao_http, lote: List[Dict], remetente: str) -> List[bool]:
+    """Um POST /emails/batch (até RESEND_LOTE_MAX e-mails); repete em HTTP 429."""
+    payload = [{'from': remetente, 'to': m['destinatarios'], 'subject': m['assunto'], 'html': m['html']}
+               for m in lote]
+    for tentativa in range(RESEND_TENTATIVAS):
+        try:
+            resp = sessao_http.post('https://api.resend.com/emails/batch', json=payload, timeout=30)
+        except Exception as e:
+            print(f"❌ Erro ao enviar lote via Resend: {e}")
+            return [False] * len(lote)
+        if resp.status_code == 429 and tentativa < RESEND_TENTATIVAS - 1:
+            time.sleep(float(resp.headers.get('retry-after') or 1))
+            continue
+        if resp.status_code in (200, 201):
+            return [True] * len(lote)
+        print(f"❌ Erro ao enviar lote via Resend: HTTP {resp.status_code} | body={resp.text}")
+        return [False] * len(lote)
+    return [False] * len(lote)
+
+
+def enviar_mensagens(mensagens: List[Dict], settings: Dict) -> List[bool]:
+    """
+    Envia as mensagens em paralelo (NOTIFICACOES_PARALELAS).
+
+    Com RESEND_API_KEY: lotes de até RESEND_LOTE_MAX por chamada, todos pela
+    mesma sessão HTTP (conexões keep-alive reaproveitadas). Sem ela: SMTP,
+    um e-mail por vez em cada thread, com as configurações já carregadas.
+
+    Returns:
+        Sucesso de cada mensagem, na mesma ordem
+    """
+    if not mensagens:
+        return []
 
+    if os.getenv('RESEND_API_KEY') and _REQUESTS_AVAILABLE:
+        remetente = (f"{os.getenv('RESEND_FROM_NAME', settings.get('smtp_from_name', 'Sistema Financeiro DWM'))} "
+                     f"<{os.getenv('RESEND_FROM_EMAIL', settings.get('smtp_from_email', ''))}>")
+        lotes = [mensagens[i:i + RESEND_LOTE_MAX] for i in range(0, len(mensagens), RESEND_LOTE_MAX)]
+        with _requests.Session() as sessao_http:
+            sessao_http.headers['Authorization'] = f"Bearer {os.getenv('RESEND_API_KEY')}"
+            sessao_http.mount('https://', _requests.adapters.HTTPAdapter(pool_maxsize=NOTIFICACOES_PARALELAS))
+            with ThreadPoolExecutor(max_workers=min(NOTIFICACOES_PARALELAS, len(lotes))) as pool:
+                resultados = pool.map(lambda lote: _enviar_lote_resend(sessao_http, lote, remetente), lotes)
+                return [ok for lote in resultados for ok in lote]
+
+    with ThreadPoolExecutor(max_workers=min(NOTIFICACOES_PARALELAS, len(mensagens))) as pool:
+        return list(pool.map(
+            lambda m: bool(send_email_notification(m['destinatarios'], m['assunto'], m['html'], settings=settings)),
+            mensagens,
+        ))
+
+
+def registrar_envios(mensagens: List[Dict], resultados: List[bool]) -> None:
+    """Uma linha de notificacoes_log por item notificado, num único INSERT."""
+    linhas = []
+    for mensagem, ok in zip(mensagens, resultados):
+        destinatarios = json.dumps(mensagem['destinatarios'], ensure_ascii=False)
+        for item in mensagem['itens']:
+            linhas.append((
+                mensagem['empresa_id'], mensagem['tipo'], item.get('id'),
+                item.get('data') or item.get('data_fim') or None,
+                destinatarios, mensagem['assunto'],
+                'enviado' if ok else 'erro',
+                None if ok else 'Falha ao enviar via Resend/SMTP',
+            ))
+    if not linhas:
+        return
+    try:
+        from database_postgresql import get_db_connection
+        with get_db_connection(allow_global=True) as conn:
+            cur = conn.cursor()
+            execute_values(cur, """
+                INSERT INTO notificacoes_log
+                    (empresa_id, tipo, referencia_id, referencia_data,
+                     destinatarios, assunto, status, erro_detalhe)
+                VALUES %s
+            """, linhas, page_size=1000)
+    except Exception as e:
+        print(f"⚠️ Erro ao registrar log de notificações: {e}")
+
+
+def processar_notificacoes(empresa_ids: List[int] = None) -> Dict:
+    """
+    Verifica e envia as notificações das empresas informadas (None = todas as ativas).
+    Usa deduplicação por sessão/contrato (não reenvia o mesmo item no mesmo dia).
+    Cada empresa recebe os resumos só nos próprios destinatários; empresa sem
+    destinatários configurados fica sem resumo (os lembretes da equipe seguem).
+
+    Returns:
+        Resumo: empresas, mensagens, enviadas, erros, duracao_s
+    """
+    inicio = time.time()
+    _ensure_log_table()
+    settings = load_email_settings()
+    resumo = {'empresas': 0, 'mensagens': 0, 'enviadas': 0, 'erros': 0}
+
+    pendencias = coletar_pendencias(empresa_ids)
+    destinatarios = carregar_destinatarios(list(pendencias))
+    sem_destinatarios = sorted(set(pendencias) - destinatarios.keys())
+    if sem_destinatarios:
+        print(f"⚠️ Nenhum e-mail configurado para notificações (empresas {sem_destinatarios})")
+    proximas = [s for por_tipo in pendencias.values() for s in por_tipo.get('lembrete_sessao_equipe', [])]
+    sessoes = proximas + [s for por_tipo in pendencias.values()
+                          for tipo in ('sessao_atrasada', 'sessoes_abertas') for s in por_tipo.get(tipo, [])]
+    _resolver_kits(sessoes)
+
+    mensagens = montar_mensagens(pendencias, destinatarios, _emails_equipes(proximas))
+    resultados = enviar_mensagens(mensagens, settings)
+    registrar_envios(mensagens, resultados)
+
+    resumo.update({
+        'empresas': len(pendencias),
+        'mensagens': len(mensagens),
+        'enviadas': sum(1 for ok in resultados if ok),
+        'erros': sum(1 for ok in resultados if not ok),
+        'duracao_s': round(time.time() - inicio, 2),
+    })
+    print(f"  📬 {resumo['empresas']} empresa(s) com pendências, {resumo['enviadas']} e-mail(s) enviado(s), "
+          f"{resumo['erros']} erro(s) em {resumo['duracao_s']}s")
+    return resumo
+
+
+def send_notification_batch(empresa_id: int):
+    """
+    Enviar lote de notificações para uma empresa.
+    Usa deduplicação por sessão/contrato (não reenvía o mesmo item no mesmo dia).
+    Registra cada envio na tabela notificacoes_log.
+    """
+    print(f"🔍 Verificando notificações para empresa {empresa_id}...")
+    processar_notificacoes([empresa_id])
     print(f"✅ Verificação concluída para empresa {empresa_id}")
 
 def run_notifications_for_all_companies():
     """
-    Executar verificação de notificações para todas as empresas
+    Executar verificação de notificações para todas as empresas ativas
     """
     print("🔔 Iniciando verificação de notificações para todas as empresas...")
     
     try:
-        # Buscar todas as empresas
-        # TODO: Implementar função para listar todas as empresas
-        # Por enquanto, usar empresa ID 1 como exemplo
-        empresas = [1]
-        
-        for empresa_id in empresas:
-            try:
-                send_notification_batch(empresa_id)
-            except Exception as e:
-                print(f"❌ Erro ao processar empresa {empresa_id}: {e}")
-        
-        print("✅ Verificação conclu��da para todas as empresas")
+        processar_notificacoes()
+        print("✅ Verificação concluída para todas as empresas")
     
     except Exception as e:
         print(f"❌ Erro ao executar notificações: {e}")
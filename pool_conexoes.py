@@ -0,0 +1,272 @@
+"""
+🚦 Pool de Conexões com Espera Justa
+====================================
+
+Camada sobre o ThreadedConnectionPool do psycopg2, que falha na hora com
+"connection pool exhausted" quando as maxconn conexões estão em uso.
+
+    - Espera limitada: quem pede conexão entra em uma fila FIFO e aguarda
+      até `timeout` segundos (PoolError ao estourar o prazo)
+    - Quota por empresa (opcional): no máximo `quota_empresa` conexões
+      simultâneas por empresa; uma exportação SPED não esgota o pool
+      das demais empresas
+    - Saúde: conexão parada há mais de `idle_check` segundos é testada com
+      SELECT 1 antes de ser entregue; conexões com mais de `max_lifetime`
+      segundos são recicladas
+    - Métricas: histogramas de tempo de espera, tempo de retenção e
+      profundidade da fila (/api/health/pool)
+
+Data: 16/10/2026
+"""
+
+import threading
+import time
+import weakref
+from collections import deque
+from typing import Dict, Optional, Sequence
+
+from psycopg2 import pool  # type: ignore
+from psycopg2 import extensions  # type: ignore
+
+
+class Histograma:
+    """Histograma cumulativo com limites fixos (não thread-safe; use sob lock)"""
+
+    def __init__(self, limites: Sequence[float]):
+        self.limites = tuple(limites)
+        self.contagens = [0] * (len(self.limites) + 1)
+        self.total = 0
+        self.soma = 0.0
+        self.maximo = 0.0
+
+    def registrar(self, valor: float):
+        for i, limite in enumerate(self.limites):
+            if valor <= limite:
+                self.contagens[i] += 1
+                break
+        else:
+            self.contagens[-1] += 1
+        self.total += 1
+        self.soma += valor
+        if valor > self.maximo:
+            self.maximo = valor
+
+    def resumo(self) -> Dict:
+        buckets = {f'<={limite:g}': n for limite, n in zip(self.limites, self.contagens)}
+        buckets['+inf'] = self.contagens[-1]
+        return {
+            'count': self.total,
+            'sum': round(self.soma, 4),
+            'avg': round(self.soma / self.total, 4) if self.total else 0,
+            'max': round(self.maximo, 4),
+            'buckets': buckets
+        }
+
+
+class _Espera:
+    """Entrada da fila de espera"""
+    __slots__ = ('empresa_id',)
+
+    def __init__(self, empresa_id):
+        self.empresa_id = empresa_id
+
+
+class PoolConexoesJusto(pool.ThreadedConnectionPool):
+    """
+    ThreadedConnectionPool com fila de espera justa, quota por empresa,
+    verificação de saúde e métricas
+
+    Args extras (demais args vão para psycopg2.connect):
+        timeout: Segundos máximos de espera por uma conexão
+        quota_empresa: Máximo de conexões simultâneas por empresa (None = sem limite)
+        max_lifetime: Idade máxima da conexão em segundos (0 = sem limite)
+        idle_check: Segundos parada a partir dos quais a conexão é testada (0 = nunca)
+    """
+
+    LIMITES_ESPERA = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10)
+    LIMITES_RETENCAO = (0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30, 60)
+    LIMITES_FILA = (0, 1, 2, 5, 10, 20, 50, 100)
+
+    def __init__(self, minconn, maxconn, *args, timeout: float = 10.0,
+                 quota_empresa: Optional[int] = None, max_lifetime: float = 1800,
+                 idle_check: float = 60, **kwargs):
+        self.timeout = timeout
+        self.quota_empresa = quota_empresa or None
+        self.max_lifetime = max_lifetime
+        self.idle_check = idle_check
+
+        self._criada_em = weakref.WeakKeyDictionary()
+        self._devolvida_em = weakref.WeakKeyDictionary()
+        self._em_uso: Dict[int, tuple] = {}  # id(conn) -> (empresa_id, inicio)
+        self._uso_empresa: Dict[int, int] = {}
+        self._fila = deque()
+
+        self._hist_espera = Histograma(self.LIMITES_ESPERA)
+        self._hist_retencao = Histograma(self.LIMITES_RETENCAO)
+        self._hist_fila = Histograma(self.LIMITES_FILA)
+        self._timeouts = 0
+        self._recicladas = 0
+        self._descartadas = 0
+
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        self._cond = threading.Condition(self._lock)
+
+    # ------------------------------------------------------------------
+    # Aquisição / devolução
+    # ------------------------------------------------------------------
+
+    def getconn(self, key=None):
+        """Obtém uma conexão, aguardando até `timeout` segundos"""
+        return self._obter(None, key)
+
+    def putconn(self, conn=None, key=None, close=False):
+        """Devolve a conexão (reciclando se passou de max_lifetime)"""
+        with self._cond:
+            agora = time.monotonic()
+            uso = self._em_uso.pop(id(conn), None)
+            if uso is not None:
+                empresa_id, inicio = uso
+                self._hist_retencao.registrar(agora - inicio)
+                if empresa_id is not None:
+                    restantes = self._uso_empresa.get(empresa_id, 1) - 1
+                    if restantes > 0:
+                        self._uso_empresa[empresa_id] = restantes
+                    else:
+                        self._uso_empresa.pop(empresa_id, None)
+
+            if not close and not conn.closed and self._expirada(conn, agora):
+                close = True
+                self._recicladas += 1
+
+            try:
+                self._putconn(conn, key, close)
+            finally:
+                if not conn.closed:
+                    self._devolvida_em[conn] = agora
+                self._cond.notify_all()
+
+    def _obter(self, empresa_id, key=None):
+        """Aguarda a vez na fila e entrega uma conexão saudável"""
+        while True:
+            conn = self._adquirir(empresa_id, key)
+            if self._utilizavel(conn):
+                return conn
+            with self._cond:
+                self._descartadas += 1
+            self.putconn(conn, key, close=True)
+
+    def _adquirir(self, empresa_id, key=None):
+        inicio = time.monotonic()
+        prazo = inicio + self.timeout
+        espera = _Espera(empresa_id)
+
+        with self._cond:
+            self._hist_fila.registrar(len(self._fila))
+            self._fila.append(espera)
+            try:
+                while not self._chegou_a_vez(espera):
+                    restante = prazo - time.monotonic()
+                    if restante <= 0:
+                        self._timeouts += 1
+                        raise pool.PoolError(
+                            f"connection pool exhausted (sem conexão livre em {self.timeout:g}s)"
+                        )
+                    self._cond.wait(restante)
+
+                self._antes_de_adquirir(empresa_id)
+                conn = self._getconn(key)
+            finally:
+                self._fila.remove(espera)
+                # A cabeça da fila mudou: os demais reavaliam a vez
+                self._cond.notify_all()
+
+            agora = time.monotonic()
+            self._em_uso[id(conn)] = (empresa_id, agora)
+            if empresa_id is not None:
+                self._uso_empresa[empresa_id] = self._uso_empresa.get(empresa_id, 0) + 1
+            self._hist_espera.registrar(agora - inicio)
+            return conn
+
+    def _chegou_a_vez(self, espera) -> bool:
+        """True se há conexão livre, a quota permite e ninguém apto está à frente"""
+        if self.closed:
+            raise pool.PoolError("connection pool is closed")
+        if not self._pool and len(self._used) >= self.maxconn:
+            return False
+        for outra in self._fila:
+            if outra is espera:
+                return self._dentro_da_quota(espera.empresa_id)
+            if self._dentro_da_quota(outra.empresa_id):
+                return False
+        return False
+
+    def _dentro_da_quota(self, empresa_id) -> bool:
+        if empresa_id is None or self.quota_empresa is None:
+            return True
+        return self._uso_empresa.get(empresa_id, 0) < self.quota_empresa
+
+    def _antes_de_adquirir(self, empresa_id):
+        """Gancho executado sob o lock antes de retirar uma conexão livre"""
+        pass
+
+    # ------------------------------------------------------------------
+    # Saúde das conexões
+    # ------------------------------------------------------------------
+
+    def _connect(self, key=None):
+        conn = super()._connect(key)
+        self._criada_em[conn] = time.monotonic()
+        return conn
+
+    def _expirada(self, conn, agora) -> bool:
+        criada = self._criada_em.get(conn)
+        return bool(self.max_lifetime) and criada is not None and agora - criada > self.max_lifetime
+
+    def _utilizavel(self, conn) -> bool:
+        """Descarta conexão fechada, velha ou que não responde após ficar parada"""
+        if conn.closed:
+            return False
+        agora = time.monotonic()
+        if self._expirada(conn, agora):
+            with self._cond:
+                self._recicladas += 1
+            return False
+
+        devolvida = self._devolvida_em.get(conn)
+        if not self.idle_check or devolvida is None or agora - devolvida <= self.idle_check:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    # ------------------------------------------------------------------
+    # Métricas
+    # ------------------------------------------------------------------
+
+    def metricas(self) -> Dict:
+        """Estado atual e histogramas do pool"""
+        with self._cond:
+            return {
+                'minconn': self.minconn,
+                'maxconn': self.maxconn,
+                'closed': self.closed,
+                'in_use': len(self._used),
+                'idle': len(self._pool),
+                'available': self.maxconn - len(self._used),
+                'waiting': len(self._fila),
+                'timeout_s': self.timeout,
+                'quota_empresa': self.quota_empresa,
+                'in_use_por_empresa': dict(self._uso_empresa),
+                'timeouts': self._timeouts,
+                'recicladas': self._recicladas,
+                'descartadas': self._descartadas,
+                'wait_time_s': self._hist_espera.resumo(),
+                'hold_time_s': self._hist_retencao.resumo(),
+                'queue_depth': self._hist_fila.resumo()
+            }
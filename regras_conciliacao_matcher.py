@@ -0,0 +1,171 @@
+"""
+🎯 Matcher compilado de Regras de Auto-Conciliação
+==================================================
+
+Compila as palavras-chave ativas de regras_conciliacao de uma empresa em um
+autômato Aho-Corasick, permitindo detectar a regra aplicável a centenas de
+descrições de extrato em uma única passada, sem uma query por transação.
+
+Semântica idêntica à query de DatabaseManager.buscar_regra_aplicavel:
+    UPPER(descricao) LIKE '%' || UPPER(palavra_chave) || '%'
+    ORDER BY LENGTH(palavra_chave) DESC LIMIT 1
+(empate de tamanho resolvido pelo menor id, para resultado determinístico)
+
+Cache:
+    Um matcher por empresa, em memória do processo, com TTL de segurança.
+    criar/atualizar/excluir_regra_conciliacao invalidam a empresa na hora.
+
+Data: 16/10/2026
+"""
+
+import re
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional
+
+
+# CPF na descrição do extrato (11 dígitos consecutivos)
+RE_CPF = re.compile(r'\b(\d{11})\b')
+
+# TTL de segurança: outros workers gunicorn não recebem a invalidação
+_CACHE_TIMEOUT = 300  # 5 minutos
+
+_matcher_cache: Dict[int, tuple] = {}
+_matcher_geracao = 0  # evita gravar matcher carregado antes de uma invalidação
+_matcher_lock = threading.Lock()
+
+
+class RegrasMatcher:
+    """Autômato Aho-Corasick sobre as palavras-chave das regras ativas"""
+
+    def __init__(self, regras: Iterable[Dict]):
+        """
+        Compila as regras
+
+        Args:
+            regras: Regras ativas (dicts com ao menos id e palavra_chave)
+        """
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._saida: List[Optional[Dict]] = [None]
+        self._regra_vazia: Optional[Dict] = None
+        self.total_regras = 0
+
+        for regra in regras:
+            self._adicionar(dict(regra))
+        self._construir_falhas()
+
+    @staticmethod
+    def _prioridade(regra: Dict) -> tuple:
+        """Maior palavra-chave vence (LENGTH do valor gravado); empate pelo menor id"""
+        return (len(regra.get('palavra_chave') or ''), -(regra.get('id') or 0))
+
+    def _melhor(self, a: Optional[Dict], b: Optional[Dict]) -> Optional[Dict]:
+        if a is None:
+            return b
+        if b is None:
+            return a
+        return a if self._prioridade(a) >= self._prioridade(b) else b
+
+    def _adicionar(self, regra: Dict):
+        # Só o autômato usa a versão em maiúsculas; a regra devolvida fica como no banco
+        palavra = (regra.get('palavra_chave') or '').upper()
+        self.total_regras += 1
+
+        # LIKE '%%' casa qualquer descrição
+        if not palavra:
+            self._regra_vazia = self._melhor(self._regra_vazia, regra)
+            return
+
+        no = 0
+        for ch in palavra:
+            proximo = self._goto[no].get(ch)
+            if proximo is None:
+                proximo = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._saida.append(None)
+                self._goto[no][ch] = proximo
+            no = proximo
+        self._saida[no] = self._melhor(self._saida[no], regra)
+
+    def _construir_falhas(self):
+        """BFS: links de falha e propagação da melhor saída pelo sufixo"""
+        fila = deque(self._goto[0].values())
+        while fila:
+            no = fila.popleft()
+            for ch, filho in self._goto[no].items():
+                fila.append(filho)
+                f = self._fail[no]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                destino = self._goto[f].get(ch, 0)
+                self._fail[filho] = destino if destino != filho else 0
+                self._saida[filho] = self._melhor(self._saida[filho], self._saida[self._fail[filho]])
+
+    def buscar(self, descricao: str) -> Optional[Dict]:
+        """
+        Retorna a regra aplicável à descrição (cópia) ou None
+
+        Args:
+            descricao: Descrição da transação do extrato
+        """
+        if not descricao:
+            return dict(self._regra_vazia) if self._regra_vazia else None
+
+        melhor = self._regra_vazia
+        goto, fail, saida = self._goto, self._fail, self._saida
+        no = 0
+        for ch in descricao.upper():
+            while no and ch not in goto[no]:
+                no = fail[no]
+            no = goto[no].get(ch, 0)
+            if saida[no] is not None:
+                melhor = self._melhor(saida[no], melhor)
+        return dict(melhor) if melhor else None
+
+
+def obter_matcher(empresa_id: int, carregar_regras: Callable[[int], List[Dict]]) -> RegrasMatcher:
+    """
+    Obtém o matcher compilado da empresa (com cache)
+
+    Args:
+        empresa_id: ID da empresa [OBRIGATÓRIO]
+        carregar_regras: Função que retorna as regras ativas da empresa
+
+    Returns:
+        RegrasMatcher da empresa
+    """
+    if empresa_id is None:
+        raise ValueError("🚨 ERRO DE SEGURANÇA: empresa_id é obrigatório no matcher de regras!")
+
+    agora = time.time()
+    with _matcher_lock:
+        cached = _matcher_cache.get(empresa_id)
+        if cached and agora - cached[1] < _CACHE_TIMEOUT:
+            return cached[0]
+        geracao = _matcher_geracao
+
+    matcher = RegrasMatcher(carregar_regras(empresa_id))
+    with _matcher_lock:
+        if _matcher_geracao == geracao:
+            _matcher_cache[empresa_id] = (matcher, agora)
+    return matcher
+
+
+def invalidar_matcher(empresa_id: int = None):
+    """Descarta o matcher da empresa (ou de todas, se None)"""
+    global _matcher_geracao
+    with _matcher_lock:
+        _matcher_geracao += 1
+        if empresa_id is None:
+            _matcher_cache.clear()
+        else:
+            _matcher_cache.pop(empresa_id, None)
+
+
+def extrair_cpf(descricao: str) -> Optional[str]:
+    """Extrai o primeiro CPF (11 dígitos) da descrição, se houver"""
+    match = RE_CPF.search(descricao or '')
+    return match.group(1) if match else None
@@ -19,6 +19,7 @@ import traceback
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 from cryptography.fernet import Fernet
+from psycopg2.extras import execute_values
 
 # Logger
 logger = logging.getLogger(__name__)
@@ -396,6 +397,53 @@ def _ensure_cancelado_columns(conn) -> None:
 # BUSCA E PROCESSAMENTO DE DOCUMENTOS
 # ============================================================================
 
+def carregar_dados_certificado(certificado_id: int) -> Optional[Dict[str, any]]:
+    """
+    Dados de busca do certificado (empresa, CNPJ, UF, ambiente e último NSU).
+    
+    Returns:
+        Dict com id, empresa_id, cnpj, ultimo_nsu, cuf, ambiente ou None
+    """
+    # allow_global pois buscamos o certificado diretamente pelo ID
+    with get_db_connection(allow_global=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, empresa_id, cnpj, ultimo_nsu, cuf, ambiente
+            FROM certificados_digitais
+            WHERE id = %s
+        """, (certificado_id,))
+        row = cursor.fetchone()
+    return dict(row) if row else None
+
+
+def cnpj_para_soap(cert: nfe_busca.CertificadoA1, cnpj: str) -> str:
+    """
+    CNPJ a enviar no distDFeInt.
+    
+    A SEFAZ autentica via mTLS usando o certificado; se o CNPJ no <CNPJ>
+    do XML diferir do CNPJ do certificado → NullReferenceException.
+    Por isso o CNPJ gravado no PFX tem prioridade sobre o do banco.
+    """
+    cnpj_cert = cert.cert_data.get('cnpj') if cert.cert_data else None
+    cnpj_banco = ''.join(filter(str.isdigit, str(cnpj or '')))
+
+    if cnpj_cert:
+        if cnpj_cert != cnpj_banco:
+            logger.warning(
+                f"[SEFAZ] ⚠️ CNPJ DIVERGENTE: banco={cnpj_banco!r} vs certificado={cnpj_cert!r}. "
+                "Usando o CNPJ do certificado (obrigatório para autenticação mTLS)."
+            )
+        else:
+            logger.info(f"[SEFAZ] ✅ CNPJ confirmado (banco == certificado): {cnpj_cert}")
+        return cnpj_cert   # Sempre usa o CNPJ gravado no PFX
+
+    logger.warning(
+        f"[SEFAZ] ⚠️ Não foi possível extrair CNPJ do certificado. "
+        f"Usando CNPJ do banco: {cnpj_banco!r}"
+    )
+    return cnpj_banco
+
+
 def buscar_e_processar_novos_documentos(certificado_id: int, usuario_id: int = None,
                                         nsu_override: str = None) -> Dict[str, any]:
     """
@@ -410,6 +458,9 @@ def buscar_e_processar_novos_documentos(certificado_id: int, usuario_id: int = N
     6. Salva dados no banco
     7. Atualiza NSU do certificado
     
+    Para buscar de todos os certificados ativos de uma vez (em paralelo e
+    em vários lotes de NSU), ver nfe_orquestrador.iniciar_busca_lote().
+    
     Args:
         certificado_id: ID do certificado
         usuario_id: ID do usuário (para auditoria)
@@ -427,25 +478,16 @@ def buscar_e_processar_novos_documentos(certificado_id: int, usuario_id: int = N
                 'erro': 'Certificado não encontrado ou senha inválida. Acesse "🏢 Dados da Empresa e Certificado Digital" para cadastrar ou atualizar o certificado.'
             }
         
-        # Busca dados do certificado no banco (allow_global pois buscamos cert diretamente)
-        with get_db_connection(allow_global=True) as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT empresa_id, cnpj, ultimo_nsu, cuf, ambiente
-                FROM certificados_digitais
-                WHERE id = %s
-            """, (certificado_id,))
-            
-            row = cursor.fetchone()
-            if not row:
-                return {'sucesso': False, 'erro': 'Certificado não encontrado'}
-            
-            empresa_id  = row['empresa_id']
-            cnpj        = row['cnpj']
-            ultimo_nsu  = row['ultimo_nsu']
-            cuf         = row['cuf']
-            ambiente    = row['ambiente']
+        # Busca dados do certificado no banco
+        dados_cert = carregar_dados_certificado(certificado_id)
+        if not dados_cert:
+            return {'sucesso': False, 'erro': 'Certificado não encontrado'}
+        
+        empresa_id  = dados_cert['empresa_id']
+        cnpj        = dados_cert['cnpj']
+        ultimo_nsu  = dados_cert['ultimo_nsu']
+        cuf         = dados_cert['cuf']
+        ambiente    = dados_cert['ambiente']
 
         # Permite forçar um NSU específico (ex: re-busca desde o início)
         if nsu_override is not None:
@@ -453,26 +495,7 @@ def buscar_e_processar_novos_documentos(certificado_id: int, usuario_id: int = N
             ultimo_nsu = nsu_override
 
         # ── Valida CNPJ: o CNPJ no SOAP DEVE ser o mesmo gravado no PFX ──────
-        # A SEFAZ autentica via mTLS usando o certificado; se o CNPJ no <CNPJ>
-        # do XML diferir do CNPJ do certificado → NullReferenceException.
-        cnpj_cert = cert.cert_data.get('cnpj') if cert.cert_data else None
-        cnpj_banco = ''.join(filter(str.isdigit, str(cnpj or '')))
-
-        if cnpj_cert:
-            if cnpj_cert != cnpj_banco:
-                logger.warning(
-                    f"[SEFAZ] ⚠️ CNPJ DIVERGENTE: banco={cnpj_banco!r} vs certificado={cnpj_cert!r}. "
-                    "Usando o CNPJ do certificado (obrigatório para autenticação mTLS)."
-                )
-            else:
-                logger.info(f"[SEFAZ] ✅ CNPJ confirmado (banco == certificado): {cnpj_cert}")
-            cnpj_soap = cnpj_cert   # Sempre usa o CNPJ gravado no PFX
-        else:
-            logger.warning(
-                f"[SEFAZ] ⚠️ Não foi possível extrair CNPJ do certificado. "
-                f"Usando CNPJ do banco: {cnpj_banco!r}"
-            )
-            cnpj_soap = cnpj_banco
+        cnpj_soap = cnpj_para_soap(cert, cnpj)
 
         logger.info(
             f"[SEFAZ] Iniciando busca: empresa_id={empresa_id}, "
@@ -495,115 +518,16 @@ def buscar_e_processar_novos_documentos(certificado_id: int, usuario_id: int = N
                 'erro': f"Erro SEFAZ: {resultado_busca.get('erro', 'Desconhecido')}"
             }
         
-        # Estatísticas
-        stats = {
-            'total_baixados': 0,
-            'nfes_processadas': 0,
-            'ctes_processados': 0,
-            'eventos_processados': 0,
-            'erros': 0,
-            'documentos_detalhes': []
-        }
-        
-        documentos = resultado_busca.get('documentos', [])
-        novo_nsu = resultado_busca.get('ultNSU', ultimo_nsu)
-        
-        # Processa cada documento usando uma conexão com empresa_id
-        with get_db_connection(empresa_id=empresa_id) as conn:
-            cursor = conn.cursor()
-            
-            # Garante que as colunas de cancelamento existam (idempotente)
-            _ensure_cancelado_columns(conn)
-            
-            # Processa todos os documentos retornados pela SEFAZ (sem limite artificial)
-            for doc in documentos:
-                nsu = doc['nsu']
-                schema = doc['schema']
-                xml_content = doc.get('xml')
-                
-                if not xml_content:
-                    stats['erros'] += 1
-                    stats['documentos_detalhes'].append({
-                        'sucesso': False, 'nsu': nsu, 'schema': schema,
-                        'erro': 'XML vazio ou erro ao descomprimir'
-                    })
-                    continue
-                
-                # Detecta schema
-                schema_info = nfe_processor.detectar_schema_nfe(xml_content)
-                
-                if not schema_info['sucesso']:
-                    stats['erros'] += 1
-                    stats['documentos_detalhes'].append({
-                        'sucesso': False, 'nsu': nsu, 'schema': schema,
-                        'erro': schema_info.get('erro', 'Erro ao detectar schema')
-                    })
-                    continue
-                
-                # Processa de acordo com o tipo
-                if schema_info['categoria'] == 'NFe':
-                    resultado_proc = _processar_nfe(
-                        empresa_id, certificado_id, cnpj, nsu, schema, 
-                        xml_content, usuario_id, cursor
-                    )
-                    resultado_proc.setdefault('nsu', nsu)
-                    resultado_proc.setdefault('schema', schema)
-                    if resultado_proc['sucesso']:
-                        stats['nfes_processadas'] += 1
-                    else:
-                        stats['erros'] += 1
-                    
-                    stats['documentos_detalhes'].append(resultado_proc)
-                    
-                elif schema_info['categoria'] == 'CTe':
-                    resultado_proc = _processar_cte(
-                        empresa_id, certificado_id, cnpj, nsu, schema,
-                        xml_content, usuario_id, cursor
-                    )
-                    resultado_proc.setdefault('nsu', nsu)
-                    resultado_proc.setdefault('schema', schema)
-                    if resultado_proc['sucesso']:
-                        stats['ctes_processados'] += 1
-                    else:
-                        stats['erros'] += 1
-                    
-                    stats['documentos_detalhes'].append(resultado_proc)
-                    
-                elif schema_info['categoria'] == 'Evento':
-                    resultado_proc = _processar_evento(
-                        empresa_id, certificado_id, nsu, schema,
-                        xml_content, usuario_id, cursor
-                    )
-                    resultado_proc.setdefault('nsu', nsu)
-                    resultado_proc.setdefault('schema', schema)
-                    if resultado_proc['sucesso']:
-                        stats['eventos_processados'] += 1
-                    else:
-                        stats['erros'] += 1
-                    stats['documentos_detalhes'].append(resultado_proc)
-                
-                else:
-                    stats['erros'] += 1
-                    stats['documentos_detalhes'].append({
-                        'sucesso': False, 'nsu': nsu, 'schema': schema,
-                        'erro': f'Tipo não suportado: {schema_info.get("categoria", "?")} ({schema_info.get("tag_raiz", "??")})'
-                    })
-                
-                stats['total_baixados'] += 1
-            
-            # Atualiza NSU do certificado
-            cursor.execute("""
-                UPDATE certificados_digitais
-                SET ultimo_nsu = %s,
-                    max_nsu = %s,
-                    data_ultima_busca = NOW()
-                WHERE id = %s
-            """, (novo_nsu, resultado_busca.get('maxNSU'), certificado_id))
-            
-            conn.commit()
+        stats = processar_documentos_dfe(
+            empresa_id, certificado_id, cnpj,
+            resultado_busca.get('documentos', []),
+            novo_nsu=resultado_busca.get('ultNSU', ultimo_nsu),
+            max_nsu=resultado_busca.get('maxNSU'),
+            usuario_id=usuario_id
+        )
         
         stats['sucesso'] = True
-        stats['novo_nsu'] = novo_nsu
+        stats['novo_nsu'] = resultado_busca.get('ultNSU', ultimo_nsu)
         stats['max_nsu'] = resultado_busca.get('maxNSU')
         
         return stats
@@ -615,212 +539,275 @@ def buscar_e_processar_novos_documentos(certificado_id: int, usuario_id: int = N
         }
 
 
-def _processar_nfe(empresa_id: int, certificado_id: int, cnpj_empresa: str,
-                  nsu: str, schema: str, xml_content: str, 
-                  usuario_id: int, cursor) -> Dict[str, any]:
-    """Processa uma NF-e e salva no banco."""
-    try:
-        # Extrai dados
-        dados = nfe_processor.extrair_dados_nfe(xml_content, cnpj_empresa)
-        
-        if not dados['sucesso']:
-            return {'sucesso': False, 'erro': dados['erro']}
-        
-        chave = dados['chave']
-        
-        # Salva XML no storage
-        resultado_storage = nfe_storage.salvar_xml_nfe(
-            cnpj_certificado=cnpj_empresa,
-            chave=chave,
-            xml_content=xml_content,
-            tipo_xml=dados.get('tipo_xml', 'procNFe'),
-            data_emissao=dados.get('data_emissao')
-        )
-        
-        if not resultado_storage['sucesso']:
-            return {'sucesso': False, 'erro': 'Erro ao salvar XML'}
+# Colunas de cancelamento conferidas uma vez por processo (ALTER TABLE trava a tabela)
+_colunas_cancelamento_ok = False
+
+# Colunas gravadas em documentos_fiscais_log por documento do lote
+_SQL_INSERIR_DOCUMENTOS = """
+    INSERT INTO documentos_fiscais_log
+    (empresa_id, certificado_id, nsu, chave, tipo_documento, schema_name,
+     numero_documento, serie, valor_total, cnpj_emitente, nome_emitente,
+     cnpj_destinatario, nome_destinatario, data_emissao,
+     caminho_xml, tamanho_bytes, hash_md5, busca_por, processado, xml_content)
+    VALUES %s
+    ON CONFLICT DO NOTHING
+    RETURNING tipo_documento, chave
+"""
+_TEMPLATE_DOCUMENTO = '(' + ', '.join(['%s'] * 18) + ', TRUE, %s)'
+
+
+def preparar_lote_dfe(empresa_id: int, certificado_id: int, cnpj: str,
+                      documentos: List[Dict], usuario_id: int = None) -> Dict[str, any]:
+    """
+    Primeira fase do processamento de um lote da DistDFe (sem banco).
+    
+    Analisa todos os XMLs de uma vez (em processos paralelos, ver
+    nfe_processor.analisar_documentos_lote) e grava os XMLs de NF-e/CT-e
+    no storage numa única passada.
+    
+    Returns:
+        Dict com:
+            - stats: estatísticas no formato de processar_documentos_dfe()
+            - linhas: [{'valores', 'categoria', 'detalhe'}] para documentos_fiscais_log
+            - cancelamentos: {chave: (motivo, data)} dos eventos de cancelamento
+    """
+    stats = {
+        'total_baixados': 0,
+        'nfes_processadas': 0,
+        'ctes_processados': 0,
+        'eventos_processados': 0,
+        'erros': 0,
+        'documentos_detalhes': []
+    }
+    contadores = {'NFe': 'nfes_processadas', 'CTe': 'ctes_processados', 'Evento': 'eventos_processados'}
+    
+    def falha(doc, erro):
+        stats['erros'] += 1
+        stats['documentos_detalhes'].append({
+            'sucesso': False, 'nsu': doc['nsu'], 'schema': doc['schema'], 'erro': erro
+        })
+    
+    # Parse do lote inteiro (um parse por XML)
+    com_xml = [doc for doc in documentos if doc.get('xml')]
+    analises = iter(nfe_processor.analisar_documentos_lote([doc['xml'] for doc in com_xml], cnpj))
+    
+    fiscais = []        # (doc, categoria, dados, detalhe) de NF-e/CT-e a gravar no storage
+    linhas = []
+    cancelamentos = {}
+    
+    for doc in documentos:
+        if not doc.get('xml'):
+            falha(doc, 'XML vazio ou erro ao descomprimir')
+            continue
         
-        # Salva log no banco (inclui xml_content para persistencia no Railway)
-        cursor.execute("""
-            INSERT INTO documentos_fiscais_log 
-            (empresa_id, certificado_id, nsu, chave, tipo_documento, schema_name,
-             numero_documento, serie, valor_total, cnpj_emitente, nome_emitente,
-             cnpj_destinatario, nome_destinatario, data_emissao, 
-             caminho_xml, tamanho_bytes, hash_md5, busca_por, processado, xml_content)
-            VALUES 
-            (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, TRUE, %s)
-            ON CONFLICT DO NOTHING
-        """, (
-            empresa_id, certificado_id, nsu, chave, 'NFe', schema,
-            dados.get('numero'), dados.get('serie'), dados.get('valor_total'),
-            dados.get('cnpj_emitente'), dados.get('nome_emitente'),
-            dados.get('cnpj_destinatario'), dados.get('nome_destinatario'),
-            dados.get('data_emissao'),
-            resultado_storage['caminho'], resultado_storage['tamanho'],
-            resultado_storage['hash_md5'], usuario_id, xml_content
-        ))
-        # Backfill xml_content para documentos inseridos antes da coluna existir
-        if xml_content and chave:
-            cursor.execute("""
-                UPDATE documentos_fiscais_log
-                SET xml_content = %s
-                WHERE empresa_id = %s AND chave = %s AND tipo_documento = 'NFe'
-                  AND xml_content IS NULL
-            """, (xml_content, empresa_id, chave))
+        schema_info, dados = next(analises)
+        if not schema_info['sucesso']:
+            falha(doc, schema_info.get('erro', 'Erro ao detectar schema'))
+            continue
         
-        # Atualiza contadores do certificado
-        cursor.execute("""
-            UPDATE certificados_digitais
-            SET total_documentos_baixados = total_documentos_baixados + 1,
-                total_nfes = total_nfes + 1
-            WHERE id = %s
-        """, (certificado_id,))
+        stats['total_baixados'] += 1
+        categoria = schema_info['categoria']
+        if dados is None:
+            falha(doc, f'Tipo não suportado: {categoria or "?"} ({schema_info.get("tag_raiz", "??")})')
+            continue
+        if not dados['sucesso']:
+            falha(doc, dados['erro'])
+            continue
         
-        return {
-            'sucesso': True,
-            'chave': chave,
-            'numero': dados.get('numero'),
-            'valor': dados.get('valor_total'),
-            'direção': dados.get('direcao')
-        }
+        nsu, schema = doc['nsu'], doc['schema']
+        if categoria == 'Evento':
+            chave = dados.get('chave')
+            eh_cancelamento = dados.get('cancelamento', False) or dados.get('tipo_evento') == '110111'
+            if eh_cancelamento and chave:
+                cancelamentos[chave] = (dados.get('nome_evento', 'Evento'), dados.get('data_evento'))
+            detalhe = {'sucesso': True, 'tipo': 'Evento', 'cancelamento': eh_cancelamento,
+                       'nsu': nsu, 'schema': schema}
+            linhas.append({
+                'categoria': categoria,
+                'detalhe': detalhe,
+                'valores': (empresa_id, certificado_id, nsu, chave, 'Evento', schema,
+                            None, None, None, None, None, None, None, None,
+                            None, None, None, usuario_id, None),
+            })
+        else:
+            detalhe = {'sucesso': True, 'chave': dados.get('chave', ''), 'numero': dados.get('numero'),
+                       'valor': dados.get('valor_total'), 'direção': dados.get('direcao')}
+            if categoria == 'CTe':
+                detalhe['tipo'] = 'CTe'
+            detalhe.update({'nsu': nsu, 'schema': schema})
+            fiscais.append((doc, categoria, dados, detalhe))
         
-    except Exception as e:
-        return {'sucesso': False, 'erro': str(e)}
+        stats['documentos_detalhes'].append(detalhe)
+        stats[contadores[categoria]] += 1
+    
+    # Storage: todos os XMLs de NF-e/CT-e numa passada
+    salvos = nfe_storage.salvar_xmls_lote(cnpj, [{
+        'chave': dados.get('chave', ''),
+        'xml_content': doc['xml'],
+        'tipo_xml': dados.get('tipo_xml', 'procCTe' if categoria == 'CTe' else 'procNFe'),
+        'data_emissao': dados.get('data_emissao'),
+    } for doc, categoria, dados, _ in fiscais])
+    
+    for (doc, categoria, dados, detalhe), storage in zip(fiscais, salvos):
+        if not storage['sucesso']:
+            detalhe.clear()
+            detalhe.update({'sucesso': False, 'nsu': doc['nsu'], 'schema': doc['schema'],
+                            'erro': 'Erro ao salvar XML do CT-e' if categoria == 'CTe' else 'Erro ao salvar XML'})
+            stats[contadores[categoria]] -= 1
+            stats['erros'] += 1
+            continue
+        linhas.append({
+            'categoria': categoria,
+            'detalhe': detalhe,
+            'valores': (
+                empresa_id, certificado_id, doc['nsu'], dados.get('chave', ''), categoria, doc['schema'],
+                dados.get('numero'), dados.get('serie'), dados.get('valor_total'),
+                dados.get('cnpj_emitente'), dados.get('nome_emitente'),
+                dados.get('cnpj_destinatario'), dados.get('nome_destinatario'),
+                dados.get('data_emissao'),
+                storage['caminho'], storage['tamanho'], storage['hash_md5'],
+                usuario_id, doc['xml']
+            ),
+        })
+    
+    return {'stats': stats, 'linhas': linhas, 'cancelamentos': cancelamentos}
 
 
-def _processar_cte(empresa_id: int, certificado_id: int, cnpj_empresa: str,
-                  nsu: str, schema: str, xml_content: str,
-                  usuario_id: int, cursor) -> Dict[str, any]:
-    """Processa um CT-e e salva no banco."""
+def _inserir_documentos_log(cursor, linhas: List[Dict]) -> set:
+    """
+    INSERT multi-linha em documentos_fiscais_log.
+    
+    Se o lote falhar (ex: um campo maior que a coluna), grava linha a linha
+    para não perder os demais; a linha com problema recebe 'erro'.
+    
+    Returns:
+        Set de (tipo_documento, chave) efetivamente inseridos
+    """
     try:
-        # Extrai dados
-        dados = nfe_processor.extrair_dados_nfe(xml_content, cnpj_empresa)
-        
-        if not dados['sucesso']:
-            return {'sucesso': False, 'erro': dados['erro']}
-        
-        chave = dados.get('chave', '')
-        
-        # Salva XML no storage (reutiliza o storage de NF-e)
-        resultado_storage = nfe_storage.salvar_xml_nfe(
-            cnpj_certificado=cnpj_empresa,
-            chave=chave,
-            xml_content=xml_content,
-            tipo_xml=dados.get('tipo_xml', 'procCTe'),
-            data_emissao=dados.get('data_emissao')
-        )
-        
-        if not resultado_storage['sucesso']:
-            return {'sucesso': False, 'erro': 'Erro ao salvar XML do CT-e'}
-        
-        # Salva log no banco (inclui xml_content para persistencia no Railway)
-        cursor.execute("""
-            INSERT INTO documentos_fiscais_log 
-            (empresa_id, certificado_id, nsu, chave, tipo_documento, schema_name,
-             numero_documento, serie, valor_total, cnpj_emitente, nome_emitente,
-             cnpj_destinatario, nome_destinatario, data_emissao, 
-             caminho_xml, tamanho_bytes, hash_md5, busca_por, processado, xml_content)
-            VALUES 
-            (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, TRUE, %s)
-            ON CONFLICT DO NOTHING
-        """, (
-            empresa_id, certificado_id, nsu, chave, 'CTe', schema,
-            dados.get('numero'), dados.get('serie'), dados.get('valor_total'),
-            dados.get('cnpj_emitente'), dados.get('nome_emitente'),
-            dados.get('cnpj_destinatario'), dados.get('nome_destinatario'),
-            dados.get('data_emissao'),
-            resultado_storage['caminho'], resultado_storage['tamanho'],
-            resultado_storage['hash_md5'], usuario_id, xml_content
-        ))
-        # Backfill xml_content para documentos inseridos antes da coluna existir
-        if xml_content and chave:
-            cursor.execute("""
-                UPDATE documentos_fiscais_log
-                SET xml_content = %s
-                WHERE empresa_id = %s AND chave = %s AND tipo_documento = 'CTe'
-                  AND xml_content IS NULL
-            """, (xml_content, empresa_id, chave))
-        
-        # Atualiza contadores do certificado
-        cursor.execute("""
-            UPDATE certificados_digitais
-            SET total_documentos_baixados = total_documentos_baixados + 1,
-                total_ctes = total_ctes + 1
-            WHERE id = %s
-        """, (certificado_id,))
-        
-        return {
-            'sucesso': True,
-            'chave': chave,
-            'numero': dados.get('numero'),
-            'valor': dados.get('valor_total'),
-            'direção': dados.get('direcao'),
-            'tipo': 'CTe'
-        }
-        
+        inseridos = execute_values(cursor, _SQL_INSERIR_DOCUMENTOS, [l['valores'] for l in linhas],
+                                   template=_TEMPLATE_DOCUMENTO, fetch=True)
+        return {(r['tipo_documento'], r['chave']) for r in inseridos}
     except Exception as e:
-        return {'sucesso': False, 'erro': str(e)}
+        logger.warning(f"[DFE] INSERT em lote falhou ({e}); gravando documento a documento")
+    
+    inseridos = set()
+    for linha in linhas:
+        try:
+            for r in execute_values(cursor, _SQL_INSERIR_DOCUMENTOS, [linha['valores']],
+                                    template=_TEMPLATE_DOCUMENTO, fetch=True):
+                inseridos.add((r['tipo_documento'], r['chave']))
+        except Exception as e:
+            linha['erro'] = str(e)
+    return inseridos
 
 
-def _processar_evento(empresa_id: int, certificado_id: int, nsu: str, 
-                     schema: str, xml_content: str, usuario_id: int, cursor) -> Dict[str, any]:
-    """Processa um evento de NF-e. Eventos de cancelamento (tpEvento=110111)
-    atualizam automaticamente o status da NF-e/CT-e vinculada."""
-    try:
-        # Extrai dados do evento
-        dados = nfe_processor.extrair_dados_nfe(xml_content, '')  # CNPJ não importa para evento
+def processar_documentos_dfe(empresa_id: int, certificado_id: int, cnpj: str,
+                             documentos: List[Dict], novo_nsu: str, max_nsu: str = None,
+                             usuario_id: int = None) -> Dict[str, any]:
+    """
+    Processa um lote de documentos da DistDFe e avança o NSU do certificado.
+    
+    Analisa o lote inteiro e grava o storage antes de tocar no banco
+    (preparar_lote_dfe); depois grava tudo com um número fixo de comandos,
+    independente do tamanho do lote:
+    1. INSERT multi-linha em documentos_fiscais_log (ON CONFLICT DO NOTHING)
+    2. Backfill de xml_content das NF-e/CT-e que já existiam sem XML
+    3. Cancelamento das NF-e/CT-e citadas em eventos 110111 (após o INSERT,
+       para valer também para notas do mesmo lote)
+    4. NSU e contadores do certificado num único UPDATE
+    
+    Args:
+        empresa_id: ID da empresa do certificado
+        certificado_id: ID do certificado
+        cnpj: CNPJ do certificado (banco)
+        documentos: Lista de {'nsu', 'schema', 'xml'} de baixar_documentos_dfe
+        novo_nsu: ultNSU devolvido pela SEFAZ
+        max_nsu: maxNSU devolvido pela SEFAZ
+        usuario_id: ID do usuário (para auditoria)
         
-        if not dados['sucesso']:
-            return {'sucesso': False, 'erro': dados['erro']}
+    Returns:
+        Dict com as estatísticas do lote
+    """
+    global _colunas_cancelamento_ok
+    
+    lote = preparar_lote_dfe(empresa_id, certificado_id, cnpj, documentos, usuario_id)
+    stats, linhas = lote['stats'], lote['linhas']
+    contadores = {'NFe': 'nfes_processadas', 'CTe': 'ctes_processados', 'Evento': 'eventos_processados'}
+    
+    with get_db_connection(empresa_id=empresa_id) as conn:
+        cursor = conn.cursor()
         
-        chave = dados.get('chave')
-        tipo_evento = dados.get('tipo_evento')
-        nome_evento = dados.get('nome_evento', 'Evento')
-        data_evento = dados.get('data_evento')
-        eh_cancelamento = dados.get('cancelamento', False) or tipo_evento == '110111'
+        # Garante que as colunas de cancelamento existam (idempotente)
+        if not _colunas_cancelamento_ok:
+            _ensure_cancelado_columns(conn)
+            _colunas_cancelamento_ok = True
         
-        # Salva log
-        cursor.execute("""
-            INSERT INTO documentos_fiscais_log 
-            (empresa_id, certificado_id, nsu, chave, tipo_documento, schema_name,
-             busca_por, processado)
-            VALUES 
-            (%s, %s, %s, %s, %s, %s, %s, TRUE)
-            ON CONFLICT DO NOTHING
-        """, (
-            empresa_id, certificado_id, nsu, chave, 'Evento', schema,
-            usuario_id
-        ))
+        inseridos = _inserir_documentos_log(cursor, linhas) if linhas else set()
+        
+        for linha in linhas:
+            if 'erro' in linha:
+                detalhe = linha['detalhe']
+                nsu, schema = detalhe['nsu'], detalhe['schema']
+                detalhe.clear()
+                detalhe.update({'sucesso': False, 'nsu': nsu, 'schema': schema, 'erro': linha['erro']})
+                stats[contadores[linha['categoria']]] -= 1
+                stats['erros'] += 1
         
-        # Se for cancelamento, marca a NF-e/CT-e vinculada como cancelada
-        if eh_cancelamento and chave:
+        # Backfill xml_content para documentos inseridos antes da coluna existir
+        backfill = {}
+        for linha in linhas:
+            _, _, _, chave, tipo = linha['valores'][:5]
+            xml_content = linha['valores'][-1]
+            if xml_content and chave and 'erro' not in linha and (tipo, chave) not in inseridos:
+                backfill.setdefault((tipo, chave), xml_content)
+        if backfill:
+            execute_values(cursor, """
+                UPDATE documentos_fiscais_log AS d
+                SET xml_content = v.xml_content
+                FROM (VALUES %s) AS v(empresa_id, tipo_documento, chave, xml_content)
+                WHERE d.empresa_id = v.empresa_id AND d.chave = v.chave
+                  AND d.tipo_documento = v.tipo_documento AND d.xml_content IS NULL
+            """, [(empresa_id, tipo, chave, xml) for (tipo, chave), xml in backfill.items()],
+                template='(%s::int, %s::text, %s::text, %s::text)')
+        
+        # Eventos de cancelamento marcam a NF-e/CT-e vinculada como cancelada
+        if lote['cancelamentos']:
             try:
-                cursor.execute("""
-                    UPDATE documentos_fiscais_log
+                execute_values(cursor, """
+                    UPDATE documentos_fiscais_log AS d
                     SET cancelado = TRUE,
-                        cancelamento_motivo = %s,
-                        cancelamento_data = %s
-                    WHERE empresa_id = %s
-                      AND chave = %s
-                      AND tipo_documento IN ('NFe', 'CTe')
-                """, (nome_evento, data_evento, empresa_id, chave))
-                logger.info(f"[EVENTO] Cancelamento aplicado à chave {chave}")
+                        cancelamento_motivo = v.motivo,
+                        cancelamento_data = v.data
+                    FROM (VALUES %s) AS v(empresa_id, chave, motivo, data)
+                    WHERE d.empresa_id = v.empresa_id
+                      AND d.chave = v.chave
+                      AND d.tipo_documento IN ('NFe', 'CTe')
+                """, [(empresa_id, chave, motivo, data)
+                      for chave, (motivo, data) in lote['cancelamentos'].items()],
+                    template='(%s::int, %s::text, %s::text, %s::timestamp)')
+                logger.info(f"[EVENTO] Cancelamento aplicado a {len(lote['cancelamentos'])} chave(s)")
             except Exception as ce:
                 # Colunas cancelado/cancelamento_* podem não existir ainda
                 logger.warning(f"[EVENTO] Não foi possível marcar cancelamento: {ce}")
         
-        # Atualiza contadores
+        # Atualiza NSU e contadores do certificado
+        processados = stats['nfes_processadas'] + stats['ctes_processados'] + stats['eventos_processados']
         cursor.execute("""
             UPDATE certificados_digitais
-            SET total_documentos_baixados = total_documentos_baixados + 1,
-                total_eventos = total_eventos + 1
+            SET ultimo_nsu = %s,
+                max_nsu = %s,
+                data_ultima_busca = NOW(),
+                total_documentos_baixados = total_documentos_baixados + %s,
+                total_nfes = total_nfes + %s,
+                total_ctes = total_ctes + %s,
+                total_eventos = total_eventos + %s
             WHERE id = %s
-        """, (certificado_id,))
+        """, (novo_nsu, max_nsu, processados, stats['nfes_processadas'],
+              stats['ctes_processados'], stats['eventos_processados'], certificado_id))
         
-        return {'sucesso': True, 'tipo': 'Evento', 'cancelamento': eh_cancelamento}
-        
-    except Exception as e:
-        return {'sucesso': False, 'erro': str(e)}
+        conn.commit()
+    
+    return stats
 
 
 # ============================================================================
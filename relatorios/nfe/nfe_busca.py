@@ -94,6 +94,11 @@ class CertificadoA1:
         self.cert_data = None
         self.pfx_bytes = None  # bytes brutos guardados para zeep/requests_pkcs12
         
+        # Reaproveitados entre chamadas: o handshake mTLS e o download/parse do
+        # WSDL acontecem uma vez por certificado, nao uma vez por lote de NSU
+        self._session = None
+        self._zeep_clients = {}
+        
         self._carregar_certificado()
     
     def _carregar_certificado(self):
@@ -194,7 +199,9 @@ class CertificadoA1:
         return (self.cert_data['valido_de'] <= agora <= self.cert_data['valido_ate'])
     
     def get_session_requests(self) -> requests.Session:
-        """Retorna uma sessão requests configurada com o certificado (PEM)."""
+        """Retorna a sessão requests do certificado (PEM), criada na primeira chamada."""
+        if self._session is not None:
+            return self._session
         session = requests.Session()
         
         with tempfile.NamedTemporaryFile(mode='wb', delete=False, suffix='.pem') as cert_file:
@@ -208,6 +215,7 @@ class CertificadoA1:
         session.cert = (cert_path, key_path)
         session.verify = True
         
+        self._session = session
         return session
 
     def get_zeep_dist_client(self, wsdl_url: str):
@@ -215,7 +223,11 @@ class CertificadoA1:
         Retorna um cliente zeep para NFeDistribuicaoDFe autenticado via PKCS12.
         Usa requests_pkcs12.Pkcs12Adapter — não extrai PEM, usa o .pfx diretamente.
         SSL verify=False necessário pela infra da SEFAZ (certificado intermediário gov.br).
+        O cliente é criado uma vez por WSDL e reaproveitado nas chamadas seguintes.
         """
+        if wsdl_url in self._zeep_clients:
+            return self._zeep_clients[wsdl_url]
+
         from requests_pkcs12 import Pkcs12Adapter
         from zeep import Client
         from zeep.transports import Transport
@@ -237,7 +249,9 @@ class CertificadoA1:
         ))
 
         transport = Transport(session=sess, timeout=120)
-        return Client(wsdl_url, transport=transport)
+        client = Client(wsdl_url, transport=transport)
+        self._zeep_clients[wsdl_url] = client
+        return client
 
 
 # ============================================================================
@@ -0,0 +1,480 @@
+"""
+Orquestrador de busca DF-e em lote (vários certificados em paralelo)
+
+buscar_e_processar_novos_documentos() atende um certificado e um lote de
+NSU (até 50 documentos) por chamada, e empresas com vários CNPJs precisavam
+disparar a busca certificado a certificado pela tela. Este módulo:
+
+- Busca todos os certificados ativos da empresa ao mesmo tempo, num pool de
+  threads limitado (MAX_CERTIFICADOS_PARALELOS)
+- Reaproveita a sessão mTLS/cliente zeep de cada CertificadoA1 em todos os
+  lotes de NSU do certificado, até alcançar o maxNSU da SEFAZ
+- Respeita um intervalo mínimo entre chamadas para a mesma UF (LimitadorPorUF)
+- Encadeia download e gravação: enquanto o lote N é processado e gravado
+  (pool de persistência), o lote N+1 já está sendo baixado
+- Registra o andamento em dfe_buscas_lote, consultável por qualquer worker
+  (GET /api/relatorios/buscar-documentos/lote/<job_id>)
+
+Autor: Sistema Financeiro DWM
+Data: 16/10/2026
+"""
+
+import logging
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from psycopg2.extras import Json
+
+from . import nfe_api, nfe_busca
+from database_postgresql import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================================
+# CONFIGURAÇÕES
+# ============================================================================
+
+# Certificados buscados ao mesmo tempo
+MAX_CERTIFICADOS_PARALELOS = int(os.getenv('NFE_BUSCA_CERTIFICADOS_PARALELOS', '4'))
+# Lotes gravados no banco ao mesmo tempo (cada um usa uma conexão do pool)
+MAX_PERSISTENCIAS_PARALELAS = int(os.getenv('NFE_BUSCA_PERSISTENCIAS_PARALELAS', '2'))
+# Segundos mínimos entre duas chamadas DistDFe para a mesma UF
+INTERVALO_MINIMO_UF = float(os.getenv('NFE_BUSCA_INTERVALO_UF', '1.0'))
+# Lotes de NSU (50 documentos cada) por certificado em uma execução
+MAX_LOTES_POR_CERTIFICADO = int(os.getenv('NFE_BUSCA_MAX_LOTES', '20'))
+# Job sem atualização há mais tempo que isso é considerado abandonado
+JOB_ABANDONADO_MINUTOS = 15
+
+NSU_ZERO = '000000000000000'
+# 137 = nenhum documento localizado; 656 = consumo indevido (SEFAZ pede 1h de espera)
+CSTAT_ENCERRA_BUSCA = {'137', '656'}
+
+
+# ============================================================================
+# LIMITE DE CHAMADAS POR UF
+# ============================================================================
+
+class LimitadorPorUF:
+    """Garante um intervalo mínimo entre chamadas à SEFAZ para a mesma UF."""
+
+    def __init__(self, intervalo: float = INTERVALO_MINIMO_UF,
+                 relogio: Callable[[], float] = time.monotonic,
+                 dormir: Callable[[float], None] = time.sleep):
+        self.intervalo = intervalo
+        self._relogio = relogio
+        self._dormir = dormir
+        self._lock = threading.Lock()
+        self._proximo_horario: Dict[int, float] = {}
+
+    def aguardar(self, cuf) -> float:
+        """
+        Reserva o próximo horário livre da UF e dorme até ele.
+
+        A reserva é feita sob lock e a espera fora dele: threads de UFs
+        diferentes não se bloqueiam, e as da mesma UF saem espaçadas.
+
+        Returns:
+            Segundos esperados
+        """
+        with self._lock:
+            agora = self._relogio()
+            horario = max(agora, self._proximo_horario.get(cuf, agora))
+            self._proximo_horario[cuf] = horario + self.intervalo
+        espera = horario - agora
+        if espera > 0:
+            self._dormir(espera)
+        return espera
+
+
+# ============================================================================
+# ORQUESTRADOR
+# ============================================================================
+
+def _carregar_certificado_padrao(info: Dict) -> Tuple[Optional[nfe_busca.CertificadoA1], str]:
+    """CertificadoA1 do banco e o CNPJ a enviar no SOAP"""
+    cert = nfe_api.obter_certificado(info['id'])
+    if not cert:
+        return None, ''
+    return cert, nfe_api.cnpj_para_soap(cert, info['cnpj'])
+
+
+class OrquestradorDFe:
+    """Executa a busca DistDFe de vários certificados com download e gravação encadeados."""
+
+    def __init__(self, certificados: List[Dict],
+                 persistir: Callable[[Dict, Dict], Dict],
+                 carregar_certificado: Callable[[Dict], Tuple] = _carregar_certificado_padrao,
+                 baixar: Callable[..., Dict] = nfe_busca.baixar_documentos_dfe,
+                 limitador: Optional[LimitadorPorUF] = None,
+                 max_paralelos: int = MAX_CERTIFICADOS_PARALELOS,
+                 max_persistencias: int = MAX_PERSISTENCIAS_PARALELAS,
+                 max_lotes: int = MAX_LOTES_POR_CERTIFICADO,
+                 ao_atualizar: Optional[Callable[[List[Dict]], None]] = None):
+        """
+        Args:
+            certificados: Dicts com id, empresa_id, cnpj, cuf, ambiente, ultimo_nsu
+            persistir: (info_certificado, resultado_lote) -> estatísticas do lote;
+                deve gravar os documentos e avançar o NSU do certificado
+            carregar_certificado: info_certificado -> (CertificadoA1 ou None, cnpj_soap)
+            baixar: Mesma assinatura de nfe_busca.baixar_documentos_dfe
+            limitador: Intervalo mínimo por UF (padrão: INTERVALO_MINIMO_UF)
+            max_paralelos: Certificados buscados ao mesmo tempo
+            max_persistencias: Lotes gravados ao mesmo tempo
+            max_lotes: Lotes de NSU por certificado nesta execução
+            ao_atualizar: Chamado com o andamento de todos os certificados a cada lote
+        """
+        self.certificados = certificados
+        self.persistir = persistir
+        self.carregar_certificado = carregar_certificado
+        self.baixar = baixar
+        self.limitador = limitador or LimitadorPorUF()
+        self.max_paralelos = max(1, max_paralelos)
+        self.max_persistencias = max(1, max_persistencias)
+        self.max_lotes = max_lotes
+        self.ao_atualizar = ao_atualizar
+
+        self._lock = threading.Lock()
+        self._lock_notificacao = threading.Lock()
+        self._pool_persistencia = None
+        self.progresso: Dict[int, Dict] = {
+            info['id']: {
+                'certificado_id': info['id'],
+                'empresa_id': info.get('empresa_id'),
+                'cnpj': info.get('cnpj'),
+                'status': 'pendente',
+                'lotes': 0,
+                'total_baixados': 0,
+                'nfes_processadas': 0,
+                'ctes_processados': 0,
+                'eventos_processados': 0,
+                'erros': 0,
+                'nsu_inicial': info.get('ultimo_nsu') or NSU_ZERO,
+                'ultimo_nsu': info.get('ultimo_nsu') or NSU_ZERO,
+                'max_nsu': None,
+                'mensagem': None,
+            }
+            for info in certificados
+        }
+
+    def instantaneo(self) -> List[Dict]:
+        """Cópia do andamento de cada certificado"""
+        with self._lock:
+            return [dict(estado) for estado in self.progresso.values()]
+
+    def _atualizar(self, certificado_id: int, **campos):
+        with self._lock:
+            estado = self.progresso[certificado_id]
+            for campo, valor in campos.items():
+                if campo in ('lotes', 'total_baixados', 'nfes_processadas', 'ctes_processados',
+                             'eventos_processados', 'erros'):
+                    estado[campo] += valor
+                else:
+                    estado[campo] = valor
+        self._notificar()
+
+    def _notificar(self):
+        if self.ao_atualizar is None:
+            return
+        with self._lock_notificacao:  # gravações de andamento em ordem
+            try:
+                self.ao_atualizar(self.instantaneo())
+            except Exception as e:
+                logger.warning(f"[DFE-LOTE] Falha ao registrar andamento: {e}")
+
+    def _gravar_lote(self, info: Dict, resultado: Dict) -> Dict:
+        """Estágio de persistência: roda no pool de gravação"""
+        stats = self.persistir(info, resultado)
+        self._atualizar(
+            info['id'],
+            lotes=1,
+            total_baixados=stats.get('total_baixados', 0),
+            nfes_processadas=stats.get('nfes_processadas', 0),
+            ctes_processados=stats.get('ctes_processados', 0),
+            eventos_processados=stats.get('eventos_processados', 0),
+            erros=stats.get('erros', 0),
+            ultimo_nsu=resultado.get('ultNSU'),
+            max_nsu=resultado.get('maxNSU'),
+        )
+        return stats
+
+    def _buscar_certificado(self, info: Dict):
+        """Estágio de download de um certificado: lote a lote até o maxNSU"""
+        certificado_id = info['id']
+        self._atualizar(certificado_id, status='executando')
+        gravacao = None
+        try:
+            cert, cnpj_soap = self.carregar_certificado(info)
+            if not cert:
+                self._atualizar(certificado_id, status='erro',
+                                mensagem='Certificado não encontrado, inativo ou com senha inválida')
+                return
+
+            nsu = info.get('ultimo_nsu') or NSU_ZERO
+            mensagem = None
+            for _ in range(self.max_lotes):
+                self.limitador.aguardar(info['cuf'])
+                resultado = self.baixar(cert, cnpj_soap, info['cuf'], nsu, info.get('ambiente') or 'producao')
+                if not resultado.get('sucesso'):
+                    mensagem = resultado.get('erro') or (
+                        f"SEFAZ {resultado.get('codigo_sefaz')}: {resultado.get('mensagem_sefaz')}"
+                    )
+                    break
+
+                # Lote anterior precisa estar gravado antes do próximo: mantém o NSU
+                # do banco em ordem e no máximo um lote em memória por certificado
+                if gravacao is not None:
+                    gravacao.result()
+                gravacao = self._pool_persistencia.submit(self._gravar_lote, info, resultado)
+
+                novo_nsu = resultado.get('ultNSU') or nsu
+                max_nsu = resultado.get('maxNSU') or NSU_ZERO
+                if (resultado.get('codigo_sefaz') in CSTAT_ENCERRA_BUSCA
+                        or not resultado.get('documentos')
+                        or novo_nsu == nsu
+                        or int(novo_nsu) >= int(max_nsu)):
+                    if resultado.get('codigo_sefaz') == '656':
+                        mensagem = 'SEFAZ 656: consumo indevido, nova busca após 1 hora'
+                    break
+                nsu = novo_nsu
+            else:
+                mensagem = f'Limite de {self.max_lotes} lotes atingido; continua na próxima busca'
+
+            if gravacao is not None:
+                gravacao.result()
+            # Falha antes de qualquer lote gravado é erro; depois, o que foi gravado vale
+            status = 'erro' if mensagem and gravacao is None else 'concluido'
+            self._atualizar(certificado_id, status=status, mensagem=mensagem)
+        except Exception as e:
+            logger.error(f"[DFE-LOTE] Certificado {certificado_id}: {type(e).__name__}: {e}")
+            logger.error(traceback.format_exc())
+            self._atualizar(certificado_id, status='erro', mensagem=f'{type(e).__name__}: {e}')
+
+    def executar(self) -> Dict:
+        """
+        Busca todos os certificados e devolve o resumo.
+
+        Returns:
+            Dict com totais e o andamento final de cada certificado
+        """
+        inicio = time.monotonic()
+        with ThreadPoolExecutor(self.max_persistencias, thread_name_prefix='dfe-gravacao') as pool_persistencia, \
+                ThreadPoolExecutor(self.max_paralelos, thread_name_prefix='dfe-busca') as pool_busca:
+            self._pool_persistencia = pool_persistencia
+            for futuro in [pool_busca.submit(self._buscar_certificado, info) for info in self.certificados]:
+                futuro.result()
+
+        certificados = self.instantaneo()
+        resumo = {
+            'total_certificados': len(certificados),
+            'certificados_com_erro': sum(1 for c in certificados if c['status'] == 'erro'),
+            'duracao_segundos': round(time.monotonic() - inicio, 2),
+        }
+        for campo in ('lotes', 'total_baixados', 'nfes_processadas', 'ctes_processados',
+                      'eventos_processados', 'erros'):
+            resumo[campo] = sum(c[campo] for c in certificados)
+        return {'resumo': resumo, 'certificados': certificados}
+
+
+# ============================================================================
+# JOBS (dfe_buscas_lote)
+# ============================================================================
+
+_tabela_jobs_ok = False
+
+
+def _garantir_tabela_jobs(conn) -> None:
+    global _tabela_jobs_ok
+    if _tabela_jobs_ok:
+        return
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS dfe_buscas_lote (
+            id VARCHAR(36) PRIMARY KEY,
+            empresa_id INTEGER,
+            usuario_id INTEGER,
+            status VARCHAR(20) NOT NULL DEFAULT 'executando',
+            total_certificados INTEGER NOT NULL DEFAULT 0,
+            certificados JSONB,
+            resumo JSONB,
+            erro TEXT,
+            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            concluido_em TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_dfe_buscas_lote_empresa
+        ON dfe_buscas_lote(empresa_id, criado_em DESC)
+    """)
+    conn.commit()
+    _tabela_jobs_ok = True
+
+
+def listar_certificados_ativos(empresa_id: Optional[int] = None) -> List[Dict]:
+    """Certificados ativos (de uma empresa ou de todas) com os dados de busca"""
+    query = """
+        SELECT id, empresa_id, cnpj, nome_certificado, ultimo_nsu, cuf, ambiente
+        FROM certificados_digitais
+        WHERE ativo = TRUE
+    """
+    params = []
+    if empresa_id is not None:
+        query += " AND empresa_id = %s"
+        params.append(empresa_id)
+    query += " ORDER BY empresa_id, id"
+    with get_db_connection(allow_global=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        return [dict(row) for row in cursor.fetchall()]
+
+
+def _registrar_andamento(job_id: str, certificados: List[Dict], status: str = None,
+                         resumo: Dict = None, erro: str = None) -> None:
+    with get_db_connection(allow_global=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE dfe_buscas_lote
+            SET certificados = %s,
+                status = COALESCE(%s, status),
+                resumo = COALESCE(%s, resumo),
+                erro = COALESCE(%s, erro),
+                atualizado_em = NOW(),
+                concluido_em = CASE WHEN %s IS NULL THEN concluido_em ELSE NOW() END
+            WHERE id = %s
+        """, (Json(certificados), status, Json(resumo) if resumo else None, erro, status, job_id))
+        conn.commit()
+
+
+def persistidor_dfe(usuario_id: Optional[int]) -> Callable[[Dict, Dict], Dict]:
+    """Função `persistir` do OrquestradorDFe: grava o lote via processar_documentos_dfe"""
+    def persistir(info: Dict, resultado: Dict) -> Dict:
+        return nfe_api.processar_documentos_dfe(
+            info['empresa_id'], info['id'], info['cnpj'],
+            resultado.get('documentos', []),
+            novo_nsu=resultado.get('ultNSU'),
+            max_nsu=resultado.get('maxNSU'),
+            usuario_id=usuario_id
+        )
+    return persistir
+
+
+def _executar_job(job_id: str, certificados: List[Dict], usuario_id: Optional[int]) -> None:
+    """Corpo da thread do job: roda o orquestrador e grava o resultado"""
+    orquestrador = OrquestradorDFe(
+        certificados,
+        persistir=persistidor_dfe(usuario_id),
+        ao_atualizar=lambda andamento: _registrar_andamento(job_id, andamento),
+    )
+    try:
+        resultado = orquestrador.executar()
+        _registrar_andamento(job_id, resultado['certificados'], status='concluido', resumo=resultado['resumo'])
+        logger.info(f"[DFE-LOTE] Job {job_id} concluído: {resultado['resumo']}")
+    except Exception as e:
+        logger.error(f"[DFE-LOTE] Job {job_id} falhou: {type(e).__name__}: {e}")
+        logger.error(traceback.format_exc())
+        try:
+            _registrar_andamento(job_id, orquestrador.instantaneo(), status='erro', erro=str(e))
+        except Exception as e2:
+            logger.error(f"[DFE-LOTE] Não foi possível registrar a falha do job {job_id}: {e2}")
+
+
+def iniciar_busca_lote(empresa_id: Optional[int] = None, usuario_id: Optional[int] = None) -> Dict[str, any]:
+    """
+    Inicia, em segundo plano, a busca DF-e de todos os certificados ativos.
+
+    Se já houver uma busca em andamento para a empresa, devolve o job dela.
+
+    Args:
+        empresa_id: Empresa dos certificados (None = todas, para agendamentos)
+        usuario_id: ID do usuário (para auditoria)
+
+    Returns:
+        Dict com sucesso, job_id e total_certificados
+    """
+    try:
+        certificados = listar_certificados_ativos(empresa_id)
+        if not certificados:
+            return {'sucesso': False, 'erro': 'Nenhum certificado digital ativo cadastrado.'}
+
+        job_id = str(uuid.uuid4())
+        with get_db_connection(allow_global=True) as conn:
+            _garantir_tabela_jobs(conn)
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id FROM dfe_buscas_lote
+                WHERE empresa_id IS NOT DISTINCT FROM %s
+                  AND status = 'executando'
+                  AND atualizado_em > NOW() - (%s * INTERVAL '1 minute')
+                ORDER BY criado_em DESC
+                LIMIT 1
+            """, (empresa_id, JOB_ABANDONADO_MINUTOS))
+            em_andamento = cursor.fetchone()
+            if em_andamento:
+                return {'sucesso': True, 'job_id': em_andamento['id'], 'ja_em_andamento': True,
+                        'total_certificados': len(certificados)}
+
+            cursor.execute("""
+                INSERT INTO dfe_buscas_lote (id, empresa_id, usuario_id, total_certificados, certificados)
+                VALUES (%s, %s, %s, %s, %s)
+            """, (job_id, empresa_id, usuario_id, len(certificados),
+                  Json([{'certificado_id': c['id'], 'cnpj': c['cnpj'], 'status': 'pendente'}
+                        for c in certificados])))
+            conn.commit()
+
+        threading.Thread(
+            target=_executar_job, args=(job_id, certificados, usuario_id),
+            name=f'dfe-lote-{job_id[:8]}', daemon=True
+        ).start()
+        logger.info(f"[DFE-LOTE] Job {job_id} iniciado: empresa_id={empresa_id}, {len(certificados)} certificado(s)")
+        return {'sucesso': True, 'job_id': job_id, 'total_certificados': len(certificados)}
+
+    except Exception as e:
+        logger.error(f"[DFE-LOTE] Erro ao iniciar busca em lote: {e}")
+        return {'sucesso': False, 'erro': f'Erro ao iniciar busca em lote: {str(e)}'}
+
+
+def obter_status_busca_lote(job_id: str, empresa_id: Optional[int] = None) -> Optional[Dict[str, any]]:
+    """
+    Andamento de um job de busca em lote.
+
+    Args:
+        job_id: ID devolvido por iniciar_busca_lote()
+        empresa_id: Se informado, só devolve jobs desta empresa
+
+    Returns:
+        Dict com status, certificados (andamento de cada um) e resumo, ou None
+    """
+    with get_db_connection(allow_global=True) as conn:
+        _garantir_tabela_jobs(conn)
+        cursor = conn.cursor()
+        query = """
+            SELECT id, empresa_id, status, total_certificados, certificados, resumo, erro,
+                   criado_em, atualizado_em, concluido_em,
+                   (status = 'executando'
+                    AND atualizado_em < NOW() - (%s * INTERVAL '1 minute')) AS abandonado
+            FROM dfe_buscas_lote
+            WHERE id = %s
+        """
+        params = [JOB_ABANDONADO_MINUTOS, job_id]
+        if empresa_id is not None:
+            query += " AND empresa_id = %s"
+            params.append(empresa_id)
+        cursor.execute(query, params)
+        row = cursor.fetchone()
+    if not row:
+        return None
+
+    job = dict(row)
+    if job.pop('abandonado'):
+        job['status'] = 'abandonado'  # processo que executava o job foi encerrado
+    for campo in ('criado_em', 'atualizado_em', 'concluido_em'):
+        if job[campo]:
+            job[campo] = job[campo].isoformat()
+    job['job_id'] = job.pop('id')
+    return job
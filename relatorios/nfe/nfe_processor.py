@@ -7,6 +7,7 @@ Este módulo é responsável por:
 - Validar chave de acesso
 - Determinar direção (ENTRADA/SAIDA)
 - Parse estruturado de XMLs fiscais
+- Parse de lotes da DistDFe em processos paralelos (analisar_documentos_lote)
 
 Autor: Sistema Financeiro DWM
 Data: Janeiro 2026
@@ -15,7 +16,16 @@ Data: Janeiro 2026
 from lxml import etree
 from datetime import datetime
 from typing import Dict, Optional, Tuple, List
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+import logging
+import multiprocessing
+import os
 import re
+import threading
+
+logger = logging.getLogger(__name__)
 
 
 # ============================================================================
@@ -136,61 +146,7 @@ def detectar_schema_nfe(xml_content: str) -> Dict[str, any]:
     """
     try:
         root = etree.fromstring(xml_content.encode('utf-8'))
-        
-        # Verifica tag raiz
-        tag_raiz = etree.QName(root.tag).localname
-        namespace = etree.QName(root.tag).namespace
-        
-        # Identifica o tipo
-        tipo = None
-        categoria = None
-        
-        if tag_raiz == 'nfeProc':
-            tipo = 'procNFe'
-            categoria = 'NFe'
-        elif tag_raiz == 'resNFe':
-            tipo = 'resNFe'
-            categoria = 'NFe'
-        elif tag_raiz == 'procEventoNFe':
-            tipo = 'procEvento'
-            categoria = 'Evento'
-        elif tag_raiz == 'evento':
-            tipo = 'evento'
-            categoria = 'Evento'
-        elif tag_raiz == 'resEvento':
-            tipo = 'resEvento'
-            categoria = 'Evento'
-        # CT-e schemas
-        elif tag_raiz == 'cteProc':
-            tipo = 'procCTe'
-            categoria = 'CTe'
-        elif tag_raiz == 'CTeOS':
-            tipo = 'procCTeOS'
-            categoria = 'CTe'
-        elif tag_raiz == 'resCTe':
-            tipo = 'resCTe'
-            categoria = 'CTe'
-        elif tag_raiz == 'procEventoCTe':
-            tipo = 'procEventoCTe'
-            categoria = 'Evento'
-        elif 'CTe' in tag_raiz or 'cte' in tag_raiz:
-            tipo = 'CTe'
-            categoria = 'CTe'
-        elif 'NFe' in tag_raiz:
-            tipo = 'NFe'
-            categoria = 'NFe'
-        else:
-            tipo = 'desconhecido'
-            categoria = 'desconhecido'
-        
-        return {
-            'sucesso': True,
-            'tipo': tipo,
-            'categoria': categoria,
-            'tag_raiz': tag_raiz,
-            'namespace': namespace,
-            'versao': root.get('versao', 'N/A')
-        }
+        return _classificar_raiz(root)
         
     except etree.XMLSyntaxError as e:
         return {
@@ -208,6 +164,64 @@ def detectar_schema_nfe(xml_content: str) -> Dict[str, any]:
         }
 
 
+def _classificar_raiz(root: etree._Element) -> Dict[str, any]:
+    """Tipo/categoria do XML a partir do elemento raiz já parseado."""
+    # Verifica tag raiz
+    tag_raiz = etree.QName(root.tag).localname
+    namespace = etree.QName(root.tag).namespace
+    
+    # Identifica o tipo
+    tipo = None
+    categoria = None
+    
+    if tag_raiz == 'nfeProc':
+        tipo = 'procNFe'
+        categoria = 'NFe'
+    elif tag_raiz == 'resNFe':
+        tipo = 'resNFe'
+        categoria = 'NFe'
+    elif tag_raiz == 'procEventoNFe':
+        tipo = 'procEvento'
+        categoria = 'Evento'
+    elif tag_raiz == 'evento':
+        tipo = 'evento'
+        categoria = 'Evento'
+    elif tag_raiz == 'resEvento':
+        tipo = 'resEvento'
+        categoria = 'Evento'
+    # CT-e schemas
+    elif tag_raiz == 'cteProc':
+        tipo = 'procCTe'
+        categoria = 'CTe'
+    elif tag_raiz == 'CTeOS':
+        tipo = 'procCTeOS'
+        categoria = 'CTe'
+    elif tag_raiz == 'resCTe':
+        tipo = 'resCTe'
+        categoria = 'CTe'
+    elif tag_raiz == 'procEventoCTe':
+        tipo = 'procEventoCTe'
+        categoria = 'Evento'
+    elif 'CTe' in tag_raiz or 'cte' in tag_raiz:
+        tipo = 'CTe'
+        categoria = 'CTe'
+    elif 'NFe' in tag_raiz:
+        tipo = 'NFe'
+        categoria = 'NFe'
+    else:
+        tipo = 'desconhecido'
+        categoria = 'desconhecido'
+    
+    return {
+        'sucesso': True,
+        'tipo': tipo,
+        'categoria': categoria,
+        'tag_raiz': tag_raiz,
+        'namespace': namespace,
+        'versao': root.get('versao', 'N/A')
+    }
+
+
 # ============================================================================
 # EXTRAÇÃO DE DADOS - procNFe (XML COMPLETO)
 # ============================================================================
@@ -225,30 +239,7 @@ def extrair_dados_nfe(xml_content: str, cnpj_empresa: str) -> Dict[str, any]:
     """
     try:
         root = etree.fromstring(xml_content.encode('utf-8'))
-        
-        # Detecta schema primeiro
-        schema_info = detectar_schema_nfe(xml_content)
-        if not schema_info['sucesso']:
-            return {'sucesso': False, 'erro': schema_info['erro']}
-        
-        tipo_xml = schema_info['tipo']
-        
-        # Roteamento para função específica
-        if tipo_xml == 'procNFe':
-            return _extrair_procnfe(root, cnpj_empresa)
-        elif tipo_xml == 'resNFe':
-            return _extrair_resnfe(root, cnpj_empresa)
-        elif tipo_xml in ['procEvento', 'evento', 'resEvento', 'procEventoCTe']:
-            return _extrair_evento(root, cnpj_empresa)
-        elif tipo_xml in ['procCTe', 'procCTeOS', 'CTe']:
-            return _extrair_proccte(root, cnpj_empresa)
-        elif tipo_xml == 'resCTe':
-            return _extrair_rescte(root, cnpj_empresa)
-        else:
-            return {
-                'sucesso': False,
-                'erro': f'Tipo de XML não suportado: {tipo_xml}'
-            }
+        return _extrair_por_tipo(root, _classificar_raiz(root)['tipo'], cnpj_empresa)
             
     except Exception as e:
         return {
@@ -257,6 +248,25 @@ def extrair_dados_nfe(xml_content: str, cnpj_empresa: str) -> Dict[str, any]:
         }
 
 
+def _extrair_por_tipo(root: etree._Element, tipo_xml: str, cnpj_empresa: str) -> Dict[str, any]:
+    """Roteamento para a função de extração específica do tipo."""
+    if tipo_xml == 'procNFe':
+        return _extrair_procnfe(root, cnpj_empresa)
+    elif tipo_xml == 'resNFe':
+        return _extrair_resnfe(root, cnpj_empresa)
+    elif tipo_xml in ['procEvento', 'evento', 'resEvento', 'procEventoCTe']:
+        return _extrair_evento(root, cnpj_empresa)
+    elif tipo_xml in ['procCTe', 'procCTeOS', 'CTe']:
+        return _extrair_proccte(root, cnpj_empresa)
+    elif tipo_xml == 'resCTe':
+        return _extrair_rescte(root, cnpj_empresa)
+    else:
+        return {
+            'sucesso': False,
+            'erro': f'Tipo de XML não suportado: {tipo_xml}'
+        }
+
+
 def _extrair_procnfe(root: etree._Element, cnpj_empresa: str) -> Dict[str, any]:
     """Extrai dados de procNFe (NF-e completa com protocolo)"""
     try:
@@ -996,6 +1006,131 @@ def extrair_resumo_nfe(xml_content: str) -> Dict[str, any]:
         }
 
 
+# ============================================================================
+# ANÁLISE EM LOTE (DistDFe)
+# ============================================================================
+
+# Lotes menores que isso são analisados no próprio processo (o custo de
+# enviar os XMLs aos workers supera o ganho)
+MIN_DOCUMENTOS_POOL = 8
+
+_pool_parse = None
+_processos_parse = 0
+_pool_lock = threading.Lock()
+
+
+def analisar_documento(xml_content: str, cnpj_empresa: str) -> Tuple[Dict[str, any], Optional[Dict[str, any]]]:
+    """
+    Detecta o schema e extrai os dados de um XML com um único parse.
+    
+    Equivale a detectar_schema_nfe() + extrair_dados_nfe(), que fariam três
+    parses do mesmo XML.
+    
+    Args:
+        xml_content: Conteúdo XML do documento
+        cnpj_empresa: CNPJ da empresa para determinar direção
+        
+    Returns:
+        Tuple (schema_info, dados); dados é None se o schema falhar ou a
+        categoria não for NFe, CTe ou Evento
+    """
+    try:
+        root = etree.fromstring(xml_content.encode('utf-8'))
+        schema_info = _classificar_raiz(root)
+    except etree.XMLSyntaxError as e:
+        return {'sucesso': False, 'erro': f'Erro de parser XML: {str(e)}',
+                'tipo': None, 'categoria': None}, None
+    except Exception as e:
+        return {'sucesso': False, 'erro': f'Erro ao detectar schema: {str(e)}',
+                'tipo': None, 'categoria': None}, None
+    
+    if schema_info['categoria'] not in ('NFe', 'CTe', 'Evento'):
+        return schema_info, None
+    
+    try:
+        return schema_info, _extrair_por_tipo(root, schema_info['tipo'], cnpj_empresa)
+    except Exception as e:
+        return schema_info, {'sucesso': False, 'erro': f'Erro ao extrair dados: {str(e)}'}
+
+
+def iniciar_pool_parse() -> Optional[ProcessPoolExecutor]:
+    """
+    Cria o pool de processos para parse, uma vez, no startup do processo.
+    
+    Desligado por padrão: NFE_PROCESSOS_PARSE com 2 ou mais liga o pool com
+    esse número de processos; vazio, 0 ou 1 mantém o parse no processo.
+    
+    Usa fork: spawn/forkserver reimportariam o módulo principal
+    (web_server.py) em cada worker. Por isso todos os workers são criados
+    aqui, de uma vez, e a função deve ser chamada antes de o processo ter threads
+    trabalhando (fork com um lock de logging, libxml2 ou psycopg2 preso por
+    outra thread trava o filho). Nada é criado depois: se o pool quebrar, o
+    parse volta para o processo principal.
+    """
+    global _pool_parse, _processos_parse
+    with _pool_lock:
+        if _pool_parse is not None or _processos_parse != 0:
+            return _pool_parse
+        _processos_parse = -1
+        try:
+            processos = int(os.getenv('NFE_PROCESSOS_PARSE', '0') or 0)
+        except ValueError:
+            logger.warning("[NFE] NFE_PROCESSOS_PARSE inválido, parse no processo principal")
+            return None
+        try:
+            contexto = multiprocessing.get_context('fork')
+        except ValueError:
+            return None
+        if processos < 2:
+            return None
+        pool = ProcessPoolExecutor(max_workers=processos, mp_context=contexto)
+        # Com fork o executor cria todos os workers na primeira tarefa
+        pool.submit(os.getpid).result()
+        _pool_parse = pool
+        _processos_parse = processos
+        logger.info(f"[NFE] Pool de parse iniciado com {processos} processos")
+        return _pool_parse
+
+
+def _descartar_pool_parse(pool: ProcessPoolExecutor) -> None:
+    """Descarta um pool quebrado; os próximos lotes são analisados no processo."""
+    global _pool_parse
+    with _pool_lock:
+        if _pool_parse is pool:
+            _pool_parse = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def analisar_documentos_lote(xmls: List[str], cnpj_empresa: str) -> List[Tuple[Dict[str, any], Optional[Dict[str, any]]]]:
+    """
+    Aplica analisar_documento() a um lote inteiro, na mesma ordem.
+    
+    O parse com lxml é CPU-bound e segura o GIL, então lotes grandes são
+    divididos entre processos quando o pool foi iniciado no startup
+    (iniciar_pool_parse); lotes pequenos, ou sem pool, são analisados aqui
+    mesmo.
+    
+    Args:
+        xmls: Conteúdos XML do lote
+        cnpj_empresa: CNPJ da empresa para determinar direção
+        
+    Returns:
+        Lista de (schema_info, dados), um por XML
+    """
+    if len(xmls) >= MIN_DOCUMENTOS_POOL:
+        pool = _pool_parse
+        if pool is not None:
+            # Poucos chunks por worker: cada envio custa um pickle do lote
+            chunksize = max(1, -(-len(xmls) // (_processos_parse * 2)))
+            try:
+                return list(pool.map(analisar_documento, xmls, repeat(cnpj_empresa), chunksize=chunksize))
+            except BrokenProcessPool as e:
+                logger.warning(f"[NFE] Pool de parse quebrado, analisando no processo principal: {e}")
+                _descartar_pool_parse(pool)
+    
+    return [analisar_documento(xml, cnpj_empresa) for xml in xmls]
+
+
 # ============================================================================
 # TESTE
 # ============================================================================
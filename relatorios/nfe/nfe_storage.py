@@ -160,6 +160,67 @@ def salvar_xml_nfe(
         }
 
 
+def salvar_xmls_lote(cnpj_certificado: str, itens: List[Dict[str, any]]) -> List[Dict[str, any]]:
+    """
+    Salva vários XMLs de uma vez (lote da DistDFe)
+    
+    Mesma estrutura de pastas de salvar_xml_nfe(), mas cada pasta
+    {CNPJ}/{ANO}/{MES} é criada uma única vez por lote.
+    
+    Args:
+        cnpj_certificado: CNPJ do certificado (usado para organização)
+        itens: Lista de dicts com chave, xml_content, tipo_xml e data_emissao (opcional)
+    
+    Returns:
+        Lista de resultados no formato de salvar_xml_nfe(), na mesma ordem dos itens
+    """
+    resultados = []
+    pastas_criadas = set()
+    salvos = 0
+    
+    for item in itens:
+        chave = item.get('chave')
+        try:
+            if not chave or len(chave) != 44:
+                resultados.append({'sucesso': False, 'erro': f'Chave inválida: {chave}'})
+                continue
+            
+            data_emissao = item.get('data_emissao')
+            if data_emissao:
+                ano = str(data_emissao.year)
+                mes = f"{data_emissao.month:02d}"
+            else:
+                ano, mes = _extrair_ano_mes_da_chave(chave)
+            
+            pasta = STORAGE_BASE / cnpj_certificado / ano / mes
+            if pasta not in pastas_criadas:
+                _garantir_pasta_existe(pasta)
+                pastas_criadas.add(pasta)
+            
+            xml_content = item['xml_content']
+            dados = xml_content.encode('utf-8')
+            caminho_completo = pasta / f"{item.get('tipo_xml') or 'procNFe'}_{chave}.xml"
+            with open(caminho_completo, 'wb') as f:
+                f.write(dados)
+            
+            resultados.append({
+                'sucesso': True,
+                'caminho': str(caminho_completo),
+                'tamanho': len(dados),
+                'hash_md5': hashlib.md5(dados).hexdigest()
+            })
+            salvos += 1
+            
+        except Exception as e:
+            logger.error(f"❌ Erro ao salvar XML {chave}: {e}")
+            resultados.append({'sucesso': False, 'erro': str(e)})
+    
+    if salvos:
+        logger.info(f"✓ {salvos} XMLs salvos em {len(pastas_criadas)} pasta(s)")
+    
+    return resultados
+
+
 def recuperar_xml_nfe(
     chave: str,
     cnpj_certificado: Optional[str] = None,
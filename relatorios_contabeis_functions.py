@@ -15,38 +15,148 @@ from typing import Dict, List, Optional, Tuple
 from decimal import Decimal
 
 
-def gerar_balancete_verificacao(
+# ===== MOTOR DE SALDOS (BALANCETE / BALANÇO / RAZÃO) =====
+
+def _codigos_ancestrais(codigo: str) -> List[str]:
+    """Códigos das contas superiores pela hierarquia do código ('1.1.01' -> ['1.1', '1'])"""
+    partes = codigo.split('.')
+    return ['.'.join(partes[:i]) for i in range(len(partes) - 1, 0, -1)]
+
+
+def _saldo_por_natureza(natureza: str, debito: float, credito: float) -> float:
+    """Saldo com sinal: positivo quando está do lado da natureza da conta"""
+    if natureza == 'devedora':
+        return debito - credito
+    return credito - debito
+
+
+def _somar_movimentos(
+    cur,
+    empresa_id: int,
+    data_inicio: Optional[date],
+    data_fim: date,
+    plano_contas_ids: Optional[List[int]] = None
+) -> Dict[int, Dict[str, float]]:
+    """
+    Débitos/créditos por conta em uma única passada agrupada.
+    
+    Somas condicionais separam o que é anterior a data_inicio do que está no
+    período [data_inicio, data_fim]. Com data_inicio None tudo até data_fim
+    entra no período.
+    
+    Returns:
+        Dict {plano_contas_id: {'debito_anterior', 'credito_anterior',
+                                'debito_periodo', 'credito_periodo'}}
+    """
+    query = """
+        SELECT 
+            lci.plano_contas_id,
+            COALESCE(SUM(lci.valor) FILTER (WHERE lci.tipo = 'debito' AND lc.data_lancamento < %(inicio)s), 0) AS debito_anterior,
+            COALESCE(SUM(lci.valor) FILTER (WHERE lci.tipo = 'credito' AND lc.data_lancamento < %(inicio)s), 0) AS credito_anterior,
+            COALESCE(SUM(lci.valor) FILTER (WHERE lci.tipo = 'debito' AND lc.data_lancamento >= %(inicio)s), 0) AS debito_periodo,
+            COALESCE(SUM(lci.valor) FILTER (WHERE lci.tipo = 'credito' AND lc.data_lancamento >= %(inicio)s), 0) AS credito_periodo
+        FROM lancamentos_contabeis_itens lci
+        INNER JOIN lancamentos_contabeis lc ON lc.id = lci.lancamento_id
+        WHERE lc.empresa_id = %(empresa_id)s
+          AND lc.data_lancamento <= %(fim)s
+          AND lc.is_estornado = FALSE
+    """
+    params = {
+        'empresa_id': empresa_id,
+        # Sem data_inicio: nada é "anterior"
+        'inicio': data_inicio or date.min,
+        'fim': data_fim
+    }
+    
+    if plano_contas_ids is not None:
+        query += " AND lci.plano_contas_id = ANY(%(contas)s)"
+        params['contas'] = list(plano_contas_ids)
+    
+    query += " GROUP BY lci.plano_contas_id"
+    
+    cur.execute(query, params)
+    return {
+        row['plano_contas_id']: {
+            'debito_anterior': float(row['debito_anterior']),
+            'credito_anterior': float(row['credito_anterior']),
+            'debito_periodo': float(row['debito_periodo']),
+            'credito_periodo': float(row['credito_periodo'])
+        }
+        for row in cur.fetchall()
+    }
+
+
+def _consolidar_sinteticas(contas: List[Dict]) -> List[Dict]:
+    """
+    Soma débitos/créditos de cada conta em todas as suas superiores (por código)
+    e calcula os saldos pela natureza de cada conta.
+    
+    Args:
+        contas: Contas do plano com codigo, natureza e os 4 totais de
+            _somar_movimentos (lançamentos diretos na conta)
+    
+    Returns:
+        Novas dicts, na mesma ordem, com os totais consolidados, 'saldo_anterior'
+        e 'saldo_atual' (com sinal) e 'folha' (conta sem subcontas no plano)
+    """
+    campos = ('debito_anterior', 'credito_anterior', 'debito_periodo', 'credito_periodo')
+    consolidadas = {}
+    for conta in contas:
+        item = dict(conta)
+        item['folha'] = True
+        consolidadas[conta['codigo']] = item
+    
+    for conta in contas:
+        ancestrais = [consolidadas[c] for c in _codigos_ancestrais(conta['codigo']) if c in consolidadas]
+        for superior in ancestrais:
+            superior['folha'] = False
+        if not any(conta[campo] for campo in campos):
+            continue
+        for superior in ancestrais:
+            for campo in campos:
+                superior[campo] += conta[campo]
+    
+    resultado = []
+    for conta in contas:
+        item = consolidadas[conta['codigo']]
+        item['saldo_anterior'] = _saldo_por_natureza(
+            item['natureza'], item['debito_anterior'], item['credito_anterior'])
+        item['saldo_atual'] = _saldo_por_natureza(
+            item['natureza'],
+            item['debito_anterior'] + item['debito_periodo'],
+            item['credito_anterior'] + item['credito_periodo'])
+        resultado.append(item)
+    return resultado
+
+
+def calcular_saldos_contas(
     conn,
     empresa_id: int,
-    data_inicio: date,
+    data_inicio: Optional[date],
     data_fim: date,
-    versao_plano_id: Optional[int] = None,
-    nivel_minimo: Optional[int] = None,
-    nivel_maximo: Optional[int] = None,
-    classificacao: Optional[str] = None,
-    apenas_com_movimento: bool = False
-) -> Dict:
+    versao_plano_id: Optional[int] = None
+) -> List[Dict]:
     """
-    Gera Balancete de Verificação para um período.
+    Motor de saldos contábeis: plano de contas inteiro com saldo anterior,
+    movimento do período e saldo atual, consolidados nas contas sintéticas.
+    
+    Uma query para as contas e uma passada agrupada sobre
+    lancamentos_contabeis_itens, independente do tamanho do plano.
+    Usado pelo balancete, balanço patrimonial e exportações Speed.
     
     Args:
         conn: Conexão com o banco
         empresa_id: ID da empresa
-        data_inicio: Data inicial do período
-        data_fim: Data final do período
+        data_inicio: Início do período (None = tudo até data_fim é movimento)
+        data_fim: Fim do período
         versao_plano_id: ID da versão do plano de contas
-        nivel_minimo: Nível mínimo de conta (1, 2, 3...)
-        nivel_maximo: Nível máximo de conta
-        classificacao: Filtrar por classificação (ativo, passivo, etc)
-        apenas_com_movimento: Mostrar apenas contas com movimentação
     
     Returns:
-        Dict com balancete completo
+        Lista de contas ordenada por código (ver _consolidar_sinteticas)
     """
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
     try:
-        # Query base para buscar contas
         query_contas = """
             SELECT 
                 pc.id,
@@ -59,92 +169,81 @@ def gerar_balancete_verificacao(
             FROM plano_contas pc
             WHERE pc.empresa_id = %s
         """
-        
         params_contas = [empresa_id]
         
         if versao_plano_id:
             query_contas += " AND pc.versao_id = %s"
             params_contas.append(versao_plano_id)
         
-        if nivel_minimo:
-            query_contas += " AND pc.nivel >= %s"
-            params_contas.append(nivel_minimo)
-        
-        if nivel_maximo:
-            query_contas += " AND pc.nivel <= %s"
-            params_contas.append(nivel_maximo)
-        
-        if classificacao:
-            query_contas += " AND pc.classificacao = %s"
-            params_contas.append(classificacao)
-        
         query_contas += " ORDER BY pc.codigo"
         
         cur.execute(query_contas, params_contas)
         contas = [dict(row) for row in cur.fetchall()]
         
-        # Para cada conta, calcular saldos
+        movimentos = _somar_movimentos(cur, empresa_id, data_inicio, data_fim)
+        
+        vazio = {'debito_anterior': 0.0, 'credito_anterior': 0.0, 'debito_periodo': 0.0, 'credito_periodo': 0.0}
+        for conta in contas:
+            conta.update(movimentos.get(conta['id'], vazio))
+        
+        return _consolidar_sinteticas(contas)
+    finally:
+        cur.close()
+
+
+def gerar_balancete_verificacao(
+    conn,
+    empresa_id: int,
+    data_inicio: date,
+    data_fim: date,
+    versao_plano_id: Optional[int] = None,
+    nivel_minimo: Optional[int] = None,
+    nivel_maximo: Optional[int] = None,
+    classificacao: Optional[str] = None,
+    apenas_com_movimento: bool = False
+) -> Dict:
+    """
+    Gera Balancete de Verificação para um período.
+    
+    Args:
+        conn: Conexão com o banco
+        empresa_id: ID da empresa
+        data_inicio: Data inicial do período
+        data_fim: Data final do período
+        versao_plano_id: ID da versão do plano de contas
+        nivel_minimo: Nível mínimo de conta (1, 2, 3...)
+        nivel_maximo: Nível máximo de conta
+        classificacao: Filtrar por classificação (ativo, passivo, etc)
+        apenas_com_movimento: Mostrar apenas contas com movimentação
+    
+    Returns:
+        Dict com balancete completo
+    """
+    try:
+        # Saldos de todo o plano em uma passada; filtros aplicados depois
+        # para que as sintéticas consolidem também as contas não exibidas
+        contas = calcular_saldos_contas(conn, empresa_id, data_inicio, data_fim, versao_plano_id)
+        
         balancete = []
         
         for conta in contas:
-            # Saldo anterior (antes do período)
-            cur.execute("""
-                SELECT 
-                    COALESCE(SUM(CASE WHEN lci.tipo = 'debito' THEN lci.valor ELSE 0 END), 0) AS total_debito,
-                    COALESCE(SUM(CASE WHEN lci.tipo = 'credito' THEN lci.valor ELSE 0 END), 0) AS total_credito
-                FROM lancamentos_contabeis_itens lci
-                INNER JOIN lancamentos_contabeis lc ON lc.id = lci.lancamento_id
-                WHERE lci.plano_contas_id = %s
-                  AND lc.empresa_id = %s
-                  AND lc.data_lancamento < %s
-                  AND lc.is_estornado = FALSE
-            """, (conta['id'], empresa_id, data_inicio))
-            
-            saldo_ant = cur.fetchone()
-            debito_anterior = float(saldo_ant['total_debito'])
-            credito_anterior = float(saldo_ant['total_credito'])
-            
-            # Movimentação no período
-            cur.execute("""
-                SELECT 
-                    COALESCE(SUM(CASE WHEN lci.tipo = 'debito' THEN lci.valor ELSE 0 END), 0) AS total_debito,
-                    COALESCE(SUM(CASE WHEN lci.tipo = 'credito' THEN lci.valor ELSE 0 END), 0) AS total_credito
-                FROM lancamentos_contabeis_itens lci
-                INNER JOIN lancamentos_contabeis lc ON lc.id = lci.lancamento_id
-                WHERE lci.plano_contas_id = %s
-                  AND lc.empresa_id = %s
-                  AND lc.data_lancamento >= %s
-                  AND lc.data_lancamento <= %s
-                  AND lc.is_estornado = FALSE
-            """, (conta['id'], empresa_id, data_inicio, data_fim))
-            
-            movimento = cur.fetchone()
-            debito_periodo = float(movimento['total_debito'])
-            credito_periodo = float(movimento['total_credito'])
-            
-            # Calcular saldo anterior
-            if conta['natureza'] == 'devedora':
-                saldo_anterior = debito_anterior - credito_anterior
-            else:
-                saldo_anterior = credito_anterior - debito_anterior
-            
-            # Calcular saldo atual
-            debito_total = debito_anterior + debito_periodo
-            credito_total = credito_anterior + credito_periodo
-            
-            if conta['natureza'] == 'devedora':
-                saldo_atual = debito_total - credito_total
-            else:
-                saldo_atual = credito_total - debito_total
+            if nivel_minimo and conta['nivel'] < nivel_minimo:
+                continue
+            if nivel_maximo and conta['nivel'] > nivel_maximo:
+                continue
+            if classificacao and conta['classificacao'] != classificacao:
+                continue
             
-            # Determinar tipo de saldo
-            tipo_saldo_anterior = 'devedor' if saldo_anterior >= 0 else 'credor'
-            tipo_saldo_atual = 'devedor' if saldo_atual >= 0 else 'credor'
+            debito_periodo = conta['debito_periodo']
+            credito_periodo = conta['credito_periodo']
             
             # Filtro: apenas com movimento
             if apenas_com_movimento and debito_periodo == 0 and credito_periodo == 0:
                 continue
             
+            saldo_anterior = conta['saldo_anterior']
+            saldo_atual = conta['saldo_atual']
+            
             balancete.append({
                 'codigo': conta['codigo'],
                 'descricao': conta['descricao'],
@@ -152,18 +251,28 @@ def gerar_balancete_verificacao(
                 'classificacao': conta['classificacao'],
                 'tipo_conta': conta['tipo_conta'],
                 'saldo_anterior': abs(saldo_anterior),
-                'tipo_saldo_anterior': tipo_saldo_anterior,
+                'tipo_saldo_anterior': 'devedor' if saldo_anterior >= 0 else 'credor',
                 'debito_periodo': debito_periodo,
                 'credito_periodo': credito_periodo,
                 'saldo_atual': abs(saldo_atual),
-                'tipo_saldo_atual': tipo_saldo_atual
+                'tipo_saldo_atual': 'devedor' if saldo_atual >= 0 else 'credor'
             })
         
+        # Totais só nas contas exibidas mais profundas (as sintéticas já as contêm)
+        codigos_exibidos = {item['codigo'] for item in balancete}
+        com_subconta_exibida = {
+            ancestral
+            for item in balancete
+            for ancestral in _codigos_ancestrais(item['codigo'])
+            if ancestral in codigos_exibidos
+        }
+        folhas = [item for item in balancete if item['codigo'] not in com_subconta_exibida]
+        
         # Calcular totais
-        total_debito_periodo = sum(item['debito_periodo'] for item in balancete)
-        total_credito_periodo = sum(item['credito_periodo'] for item in balancete)
-        total_saldo_devedor = sum(item['saldo_atual'] for item in balancete if item['tipo_saldo_atual'] == 'devedor')
-        total_saldo_credor = sum(item['saldo_atual'] for item in balancete if item['tipo_saldo_atual'] == 'credor')
+        total_debito_periodo = sum(item['debito_periodo'] for item in folhas)
+        total_credito_periodo = sum(item['credito_periodo'] for item in folhas)
+        total_saldo_devedor = sum(item['saldo_atual'] for item in folhas if item['tipo_saldo_atual'] == 'devedor')
+        total_saldo_credor = sum(item['saldo_atual'] for item in folhas if item['tipo_saldo_atual'] == 'credor')
         
         return {
             'success': True,
@@ -184,6 +293,245 @@ def gerar_balancete_verificacao(
         
     except Exception as e:
         return {'success': False, 'error': str(e)}
+
+
+# ===== ESTRUTURA DO DRE =====
+# Seções do DRE: (chave, prefixo do código da conta, prefixo excluído)
+SECOES_DRE = [
+    ('receitas_brutas', '4', '4.9'),
+    ('deducoes', '4.9', None),
+    ('custos', '5', None),
+    ('despesas_operacionais', '6', None),
+    ('receitas_financeiras', '7.1', None),
+    ('despesas_financeiras', '7.2', None),
+]
+
+
+def _separar_secoes_dre(contas: List[Dict]) -> Dict[str, List[Dict]]:
+    """
+    Distribui saldos por conta nas seções do DRE (mesmos filtros LIKE das queries)
+    
+    Args:
+        contas: Lista de dicts com codigo, descricao e valor (saldo com sinal),
+            ordenada por código
+    
+    Returns:
+        Dict {secao: [{'codigo', 'descricao', 'valor' (absoluto)}]}
+    """
+    secoes = {chave: [] for chave, _, _ in SECOES_DRE}
+    for conta in contas:
+        valor = float(conta['valor'])
+        if valor == 0:
+            continue
+        codigo = conta['codigo']
+        for chave, prefixo, excluir in SECOES_DRE:
+            if codigo.startswith(prefixo) and not (excluir and codigo.startswith(excluir)):
+                secoes[chave].append({
+                    'codigo': codigo,
+                    'descricao': conta['descricao'],
+                    'valor': abs(valor)  # Valor absoluto, sinal tratado na lógica do DRE
+                })
+    return secoes
+
+
+def _montar_estrutura_dre(
+    receitas_brutas: List[Dict],
+    deducoes: List[Dict],
+    custos: List[Dict],
+    despesas_operacionais: List[Dict],
+    receitas_financeiras: List[Dict],
+    despesas_financeiras: List[Dict]
+) -> Dict:
+    """Monta as linhas do DRE (totais, resultados e percentuais) a partir das seções"""
+    receita_bruta = sum(item['valor'] for item in receitas_brutas)
+    total_deducoes = sum(item['valor'] for item in deducoes)
+    
+    # 3. RECEITA LÍQUIDA
+    receita_liquida = receita_bruta - abs(total_deducoes)
+    
+    # 5. LUCRO BRUTO
+    total_custos = sum(item['valor'] for item in custos)
+    lucro_bruto = receita_liquida - total_custos
+    
+    # 7. RESULTADO OPERACIONAL
+    total_despesas_operacionais = sum(item['valor'] for item in despesas_operacionais)
+    resultado_operacional = lucro_bruto - total_despesas_operacionais
+    
+    # 8. RESULTADO FINANCEIRO
+    total_receitas_financeiras = sum(item['valor'] for item in receitas_financeiras)
+    total_despesas_financeiras = sum(item['valor'] for item in despesas_financeiras)
+    
+    resultado_financeiro = total_receitas_financeiras - total_despesas_financeiras
+    
+    # 9. LUCRO LÍQUIDO DO EXERCÍCIO
+    lucro_liquido = resultado_operacional + resultado_financeiro
+    
+    # Cálculo de percentuais sobre receita bruta
+    def percentual(valor, base):
+        return (valor / base * 100) if base != 0 else 0
+    
+    return {
+        'receita_bruta': {
+            'itens': receitas_brutas,
+            'total': receita_bruta,
+            'percentual': 100.0
+        },
+        'deducoes': {
+            'itens': deducoes,
+            'total': abs(total_deducoes),
+            'percentual': percentual(abs(total_deducoes), receita_bruta)
+        },
+        'receita_liquida': {
+            'total': receita_liquida,
+            'percentual': percentual(receita_liquida, receita_bruta)
+        },
+        'custos': {
+            'itens': custos,
+            'total': total_custos,
+            'percentual': percentual(total_custos, receita_bruta)
+        },
+        'lucro_bruto': {
+            'total': lucro_bruto,
+            'percentual': percentual(lucro_bruto, receita_bruta)
+        },
+        'despesas_operacionais': {
+            'itens': despesas_operacionais,
+            'total': total_despesas_operacionais,
+            'percentual': percentual(total_despesas_operacionais, receita_bruta)
+        },
+        'resultado_operacional': {
+            'total': resultado_operacional,
+            'percentual': percentual(resultado_operacional, receita_bruta)
+        },
+        'resultado_financeiro': {
+            'receitas_financeiras': {
+                'itens': receitas_financeiras,
+                'total': total_receitas_financeiras
+            },
+            'despesas_financeiras': {
+                'itens': despesas_financeiras,
+                'total': total_despesas_financeiras
+            },
+            'total': resultado_financeiro,
+            'percentual': percentual(resultado_financeiro, receita_bruta)
+        },
+        'lucro_liquido': {
+            'total': lucro_liquido,
+            'percentual': percentual(lucro_liquido, receita_bruta)
+        }
+    }
+
+
+def gerar_dre_multi_periodo(
+    conn,
+    empresa_id: int,
+    periodos: List[Tuple[date, date]],
+    versao_plano_id: Optional[int] = None
+) -> Dict:
+    """
+    Calcula o DRE de N períodos com uma única query agrupada.
+    
+    Mesma lógica de saldo de gerar_dre (lançamentos pagos -> subcategoria ->
+    dre_mapeamento_subcategoria -> plano_contas), agrupada por período e conta;
+    as seções (4, 4.9, 5, 6, 7.1, 7.2) são separadas pelo prefixo do código.
+    Períodos podem se sobrepor.
+    
+    Args:
+        conn: Conexão com o banco
+        empresa_id: ID da empresa
+        periodos: Lista de tuplas (data_inicio, data_fim)
+        versao_plano_id: ID da versão do plano de contas
+    
+    Returns:
+        Dict com 'periodos': lista (na ordem recebida) de
+        {'data_inicio': date, 'data_fim': date, 'dre': estrutura do DRE}
+    """
+    if not periodos:
+        return {'success': True, 'periodos': []}
+    
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    
+    try:
+        query = """
+            SELECT 
+                p.idx,
+                pc.codigo,
+                pc.descricao,
+                SUM(
+                    CASE 
+                        WHEN l.tipo = 'receita' AND l.data_pagamento IS NOT NULL THEN l.valor
+                        WHEN l.tipo = 'despesa' AND l.data_pagamento IS NOT NULL THEN -l.valor
+                        ELSE 0
+                    END
+                ) AS valor_total
+            FROM unnest(%s::int[], %s::date[], %s::date[]) AS p(idx, data_inicio, data_fim)
+            INNER JOIN lancamentos l
+                ON l.data_pagamento >= p.data_inicio
+                AND l.data_pagamento <= p.data_fim
+            INNER JOIN subcategorias s ON LOWER(TRIM(l.subcategoria)) = LOWER(TRIM(s.nome))
+            INNER JOIN dre_mapeamento_subcategoria m 
+                ON m.subcategoria_id = s.id 
+                AND m.empresa_id = %s
+                AND m.ativo = TRUE
+            INNER JOIN plano_contas pc 
+                ON pc.id = m.plano_contas_id
+                AND pc.empresa_id = %s
+            WHERE l.empresa_id = %s
+              AND l.status = 'pago'
+              AND pc.codigo LIKE ANY(%s)
+        """
+        
+        params = [
+            list(range(len(periodos))),
+            [di for di, _ in periodos],
+            [df for _, df in periodos],
+            empresa_id, empresa_id, empresa_id,
+            # '4' já cobre '4.9'; a separação fina fica em _separar_secoes_dre
+            sorted({f"{prefixo}%" for _, prefixo, _ in SECOES_DRE if prefixo != '4.9'})
+        ]
+        
+        if versao_plano_id:
+            query += " AND pc.versao_id = %s"
+            params.append(versao_plano_id)
+        
+        query += """
+            GROUP BY p.idx, pc.codigo, pc.descricao
+            HAVING SUM(
+                CASE 
+                    WHEN l.tipo = 'receita' AND l.data_pagamento IS NOT NULL THEN l.valor
+                    WHEN l.tipo = 'despesa' AND l.data_pagamento IS NOT NULL THEN -l.valor
+                    ELSE 0
+                END
+            ) != 0
+            ORDER BY p.idx, pc.codigo
+        """
+        
+        cur.execute(query, params)
+        contas_por_periodo = [[] for _ in periodos]
+        for row in cur.fetchall():
+            contas_por_periodo[row['idx']].append({
+                'codigo': row['codigo'],
+                'descricao': row['descricao'],
+                'valor': row['valor_total']
+            })
+        
+        return {
+            'success': True,
+            'periodos': [
+                {
+                    'data_inicio': di,
+                    'data_fim': df,
+                    'dre': _montar_estrutura_dre(**_separar_secoes_dre(contas))
+                }
+                for (di, df), contas in zip(periodos, contas_por_periodo)
+            ]
+        }
+        
+    except Exception as e:
+        import traceback
+        print(f"ERRO em gerar_dre_multi_periodo: {e}")
+        print(traceback.format_exc())
+        return {'success': False, 'error': str(e)}
     finally:
         cur.close()
 
@@ -223,310 +571,24 @@ def gerar_dre(
     Returns:
         Dict com DRE estruturada e indicadores
     """
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    
     try:
-        # ===== NOVA FUNÇÃO: Buscar saldos de lançamentos financeiros via mapeamento DRE =====
-        def buscar_saldo_lancamentos_financeiros(
-            prefixo_codigo: str,
-            excluir_prefixo: Optional[str] = None,
-            data_ini: date = None,
-            data_fi: date = None
-        ):
-            """
-            Busca saldo de lançamentos financeiros usando mapeamento DRE.
-            
-            Lógica:
-            1. Busca lançamentos da tabela 'lancamentos' no período
-            2. Faz JOIN com subcategorias pelo nome
-            3. Faz JOIN com dre_mapeamento_subcategoria para pegar conta DRE
-            4. Filtra por prefixo de código da conta DRE (4.x, 5.x, etc)
-            5. Agrupa e retorna totais por conta
-            
-            Args:
-                prefixo_codigo: Código deve começar com (ex: '4', '5', '6')
-                excluir_prefixo: Código NÃO deve começar com (ex: '4.9')
-                data_ini, data_fi: Período customizado
-            
-            Returns:
-                Lista de dicts com código, descricao e valor
-            """
-            di = data_ini or data_inicio
-            df = data_fi or data_fim
-            
-            query = """
-                SELECT 
-                    pc.codigo,
-                    pc.descricao,
-                    SUM(
-                        CASE 
-                            WHEN l.tipo = 'receita' AND l.data_pagamento IS NOT NULL THEN l.valor
-                            WHEN l.tipo = 'despesa' AND l.data_pagamento IS NOT NULL THEN -l.valor
-                            ELSE 0
-                        END
-                    ) AS valor_total
-                FROM lancamentos l
-                INNER JOIN subcategorias s ON LOWER(TRIM(l.subcategoria)) = LOWER(TRIM(s.nome))
-                INNER JOIN dre_mapeamento_subcategoria m 
-                    ON m.subcategoria_id = s.id 
-                    AND m.empresa_id = %s
-                    AND m.ativo = TRUE
-                INNER JOIN plano_contas pc 
-                    ON pc.id = m.plano_contas_id
-                    AND pc.empresa_id = %s
-                WHERE l.empresa_id = %s
-                  AND l.data_pagamento >= %s
-                  AND l.data_pagamento <= %s
-                  AND l.status = 'pago'
-                  AND pc.codigo LIKE %s
-            """
-            
-            params = [empresa_id, empresa_id, empresa_id, di, df, f"{prefixo_codigo}%"]
-            
-            if excluir_prefixo:
-                query += " AND pc.codigo NOT LIKE %s"
-                params.append(f"{excluir_prefixo}%")
-            
-            if versao_plano_id:
-                query += " AND pc.versao_id = %s"
-                params.append(versao_plano_id)
-            
-            query += """
-                GROUP BY pc.codigo, pc.descricao
-                HAVING SUM(
-                    CASE 
-                        WHEN l.tipo = 'receita' AND l.data_pagamento IS NOT NULL THEN l.valor
-                        WHEN l.tipo = 'despesa' AND l.data_pagamento IS NOT NULL THEN -l.valor
-                        ELSE 0
-                    END
-                ) != 0
-                ORDER BY pc.codigo
-            """
-            
-            cur.execute(query, params)
-            resultados = []
-            
-            for row in cur.fetchall():
-                valor = float(row['valor_total'])
-                if valor != 0:
-                    resultados.append({
-                        'codigo': row['codigo'],
-                        'descricao': row['descricao'],
-                        'valor': abs(valor)  # Valor absoluto, sinal tratado na lógica do DRE
-                    })
-            
-            return resultados
-        
-        # Função auxiliar para buscar saldo de contas por classificação e prefixo
-        def buscar_saldo_grupo(
-            classificacao_conta: Optional[str] = None, 
-            prefixo_codigo: Optional[str] = None,
-            excluir_prefixo: Optional[str] = None,
-            data_ini: date = None,
-            data_fi: date = None
-        ):
-            """
-            Busca saldo de grupo de contas com filtros flexíveis
-            
-            Args:
-                classificacao_conta: 'receita' ou 'despesa'
-                prefixo_codigo: Código deve começar com (ex: '4', '5', '6')
-                excluir_prefixo: Código NÃO deve começar com (ex: '4.9')  
-                data_ini, data_fi: Período customizado (se None, usa data_inicio/data_fim)
-            """
-            di = data_ini or data_inicio
-            df = data_fi or data_fim
-            
-            query = """
-                SELECT 
-                    pc.codigo,
-                    pc.descricao,
-                    pc.classificacao,
-                    pc.natureza,
-                    COALESCE(SUM(CASE WHEN lci.tipo = 'debito' THEN lci.valor ELSE 0 END), 0) AS total_debito,
-                    COALESCE(SUM(CASE WHEN lci.tipo = 'credito' THEN lci.valor ELSE 0 END), 0) AS total_credito
-                FROM plano_contas pc
-                LEFT JOIN lancamentos_contabeis_itens lci ON lci.plano_contas_id = pc.id
-                LEFT JOIN lancamentos_contabeis lc ON lc.id = lci.lancamento_id
-                    AND lc.data_lancamento >= %s
-                    AND lc.data_lancamento <= %s
-                    AND lc.is_estornado = FALSE
-                    AND lc.empresa_id = %s
-                WHERE pc.empresa_id = %s
-                  AND pc.tipo_conta = 'analitica'
-                  AND pc.deleted_at IS NULL
-            """
-            
-            params = [di, df, empresa_id, empresa_id]
-            
-            if classificacao_conta:
-                query += " AND pc.classificacao = %s"
-                params.append(classificacao_conta)
-            
-            if versao_plano_id:
-                query += " AND pc.versao_id = %s"
-                params.append(versao_plano_id)
-            
-            if prefixo_codigo:
-                query += " AND pc.codigo LIKE %s"
-                params.append(f"{prefixo_codigo}%")
-            
-            if excluir_prefixo:
-                query += " AND pc.codigo NOT LIKE %s"
-                params.append(f"{excluir_prefixo}%")
-            
-            query += " GROUP BY pc.id, pc.codigo, pc.descricao, pc.classificacao, pc.natureza"
-            query += " HAVING (COALESCE(SUM(CASE WHEN lci.tipo = 'debito' THEN lci.valor ELSE 0 END), 0) > 0"
-            query += "     OR COALESCE(SUM(CASE WHEN lci.tipo = 'credito' THEN lci.valor ELSE 0 END), 0) > 0)"
-            query += " ORDER BY pc.codigo"
-            
-            cur.execute(query, params)
-            resultados = []
-            
-            for row in cur.fetchall():
-                debito = float(row['total_debito'])
-                credito = float(row['total_credito'])
-                
-                # Lógica de saldo baseada na natureza da conta
-                natureza = row['natureza']
-                if natureza == 'credora':  # Receitas
-                    valor = credito - debito
-                else:  # Devedora - Despesas/Custos
-                    valor = debito - credito
-                
-                if valor != 0:
-                    resultados.append({
-                        'codigo': row['codigo'],
-                        'descricao': row['descricao'],
-                        'valor': valor
-                    })
+        # Período solicitado + (opcional) período anterior com o mesmo intervalo de dias
+        periodos = [(data_inicio, data_fim)]
+        if comparar_periodo_anterior:
+            from dateutil.relativedelta import relativedelta
             
-            return resultados
+            dias_periodo = (data_fim - data_inicio).days
+            data_inicio_anterior = data_inicio - relativedelta(days=dias_periodo + 1)
+            data_fim_anterior = data_inicio - relativedelta(days=1)
+            periodos.append((data_inicio_anterior, data_fim_anterior))
         
-        def calcular_dre_periodo(di: date, df: date):
-            """Calcula DRE para um período específico usando lançamentos financeiros + mapeamento"""
-            
-            # 1. RECEITA BRUTA (grupo 4, excluindo 4.9 - deduções)
-            receitas_brutas = buscar_saldo_lancamentos_financeiros(
-                prefixo_codigo='4',
-                excluir_prefixo='4.9',
-                data_ini=di,
-                data_fi=df
-            )
-            receita_bruta = sum(item['valor'] for item in receitas_brutas)
-            
-            # 2. DEDUÇÕES DA RECEITA (grupo 4.9)
-            deducoes = buscar_saldo_lancamentos_financeiros(
-                prefixo_codigo='4.9',
-                data_ini=di,
-                data_fi=df
-            )
-            total_deducoes = sum(item['valor'] for item in deducoes)
-            
-            # 3. RECEITA LÍQUIDA
-            receita_liquida = receita_bruta - abs(total_deducoes)
-            
-            # 4. CUSTOS (grupo 5)
-            custos = buscar_saldo_lancamentos_financeiros(
-                prefixo_codigo='5',
-                data_ini=di,
-                data_fi=df
-            )
-            total_custos = sum(item['valor'] for item in custos)
-            
-            # 5. LUCRO BRUTO
-            lucro_bruto = receita_liquida - total_custos
-            
-            # 6. DESPESAS OPERACIONAIS (grupo 6)
-            despesas_operacionais = buscar_saldo_lancamentos_financeiros(
-                prefixo_codigo='6',
-                data_ini=di,
-                data_fi=df
-            )
-            total_despesas_operacionais = sum(item['valor'] for item in despesas_operacionais)
-            
-            # 7. RESULTADO OPERACIONAL
-            resultado_operacional = lucro_bruto - total_despesas_operacionais
-            
-            # 8. RESULTADO FINANCEIRO
-            # 8.1 Receitas Financeiras (7.1)
-            receitas_financeiras = buscar_saldo_lancamentos_financeiros(
-                prefixo_codigo='7.1',
-                data_ini=di,
-                data_fi=df
-            )
-            total_receitas_financeiras = sum(item['valor'] for item in receitas_financeiras)
-            
-            # 8.2 Despesas Financeiras (7.2)
-            despesas_financeiras = buscar_saldo_lancamentos_financeiros(
-                prefixo_codigo='7.2',
-                data_ini=di,
-                data_fi=df
-            )
-            total_despesas_financeiras = sum(item['valor'] for item in despesas_financeiras)
-            
-            resultado_financeiro = total_receitas_financeiras - total_despesas_financeiras
-            
-            # 9. LUCRO LÍQUIDO DO EXERCÍCIO
-            lucro_liquido = resultado_operacional + resultado_financeiro
-            
-            # Cálculo de percentuais sobre receita bruta
-            def percentual(valor, base):
-                return (valor / base * 100) if base != 0 else 0
-            
-            return {
-                'receita_bruta': {
-                    'itens': receitas_brutas,
-                    'total': receita_bruta,
-                    'percentual': 100.0
-                },
-                'deducoes': {
-                    'itens': deducoes,
-                    'total': abs(total_deducoes),
-                    'percentual': percentual(abs(total_deducoes), receita_bruta)
-                },
-                'receita_liquida': {
-                    'total': receita_liquida,
-                    'percentual': percentual(receita_liquida, receita_bruta)
-                },
-                'custos': {
-                    'itens': custos,
-                    'total': total_custos,
-                    'percentual': percentual(total_custos, receita_bruta)
-                },
-                'lucro_bruto': {
-                    'total': lucro_bruto,
-                    'percentual': percentual(lucro_bruto, receita_bruta)
-                },
-                'despesas_operacionais': {
-                    'itens': despesas_operacionais,
-                    'total': total_despesas_operacionais,
-                    'percentual': percentual(total_despesas_operacionais, receita_bruta)
-                },
-                'resultado_operacional': {
-                    'total': resultado_operacional,
-                    'percentual': percentual(resultado_operacional, receita_bruta)
-                },
-                'resultado_financeiro': {
-                    'receitas_financeiras': {
-                        'itens': receitas_financeiras,
-                        'total': total_receitas_financeiras
-                    },
-                    'despesas_financeiras': {
-                        'itens': despesas_financeiras,
-                        'total': total_despesas_financeiras
-                    },
-                    'total': resultado_financeiro,
-                    'percentual': percentual(resultado_financeiro, receita_bruta)
-                },
-                'lucro_liquido': {
-                    'total': lucro_liquido,
-                    'percentual': percentual(lucro_liquido, receita_bruta)
-                }
-            }
+        # Todas as seções de todos os períodos em uma única query
+        multi = gerar_dre_multi_periodo(conn, empresa_id, periodos, versao_plano_id)
+        if not multi['success']:
+            return multi
         
         # Calcular DRE do período solicitado
-        dre_atual = calcular_dre_periodo(data_inicio, data_fim)
+        dre_atual = multi['periodos'][0]['dre']
         
         resultado = {
             'success': True,
@@ -546,14 +608,7 @@ def gerar_dre(
         
         # Se solicitado comparativo com período anterior
         if comparar_periodo_anterior:
-            from dateutil.relativedelta import relativedelta
-            
-            # Calcular período anterior (mesmo intervalo de dias)
-            dias_periodo = (data_fim - data_inicio).days
-            data_inicio_anterior = data_inicio - relativedelta(days=dias_periodo + 1)
-            data_fim_anterior = data_inicio - relativedelta(days=1)
-            
-            dre_anterior = calcular_dre_periodo(data_inicio_anterior, data_fim_anterior)
+            dre_anterior = multi['periodos'][1]['dre']
             
             # Calcular variações
             def calcular_variacao(atual, anterior):
@@ -582,10 +637,139 @@ def gerar_dre(
         print(f"ERRO em gerar_dre: {e}")
         print(traceback.format_exc())
         return {'success': False, 'error': str(e)}
+
+
+
+def dre_mensal_agregado_disponivel(conn) -> bool:
+    """Indica se a migration do agregado mensal (dre_mensal_agregado) já foi aplicada"""
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    try:
+        cur.execute("SELECT to_regclass('dre_mensal_agregado') IS NOT NULL AS existe")
+        return bool(cur.fetchone()['existe'])
     finally:
         cur.close()
 
 
+def gerar_evolucao_mensal_dre(
+    conn,
+    empresa_id: int,
+    mes_inicio: date,
+    mes_fim: date,
+    versao_plano_id: Optional[int] = None
+) -> Dict:
+    """
+    Gera o DRE de cada mês do intervalo em uma única query.
+    
+    Lê dre_mensal_agregado (mantido por trigger em lancamentos) e resolve o
+    mapeamento subcategoria -> plano de contas na leitura, com os mesmos JOINs
+    de gerar_dre. Sem a migration aplicada, usa gerar_dre_multi_periodo.
+    
+    Args:
+        conn: Conexão com o banco
+        empresa_id: ID da empresa
+        mes_inicio: Qualquer dia do primeiro mês
+        mes_fim: Qualquer dia do último mês
+        versao_plano_id: ID da versão do plano de contas
+    
+    Returns:
+        Dict com 'meses': lista (ordem cronológica) de {'mes': date, 'dre': estrutura do DRE}
+    """
+    mes_inicio = mes_inicio.replace(day=1)
+    mes_fim = mes_fim.replace(day=1)
+    
+    meses = []
+    mes = mes_inicio
+    while mes <= mes_fim:
+        meses.append(mes)
+        mes = date(mes.year + mes.month // 12, mes.month % 12 + 1, 1)
+    
+    try:
+        if not dre_mensal_agregado_disponivel(conn):
+            from calendar import monthrange
+            multi = gerar_dre_multi_periodo(
+                conn,
+                empresa_id,
+                [(mes, mes.replace(day=monthrange(mes.year, mes.month)[1])) for mes in meses],
+                versao_plano_id
+            )
+            if not multi['success']:
+                return multi
+            return {
+                'success': True,
+                'meses': [{'mes': p['data_inicio'], 'dre': p['dre']} for p in multi['periodos']]
+            }
+        
+        query = """
+            SELECT
+                a.mes,
+                pc.codigo,
+                pc.descricao,
+                SUM(a.valor) AS valor_total
+            FROM dre_mensal_agregado a
+            INNER JOIN subcategorias s ON LOWER(TRIM(s.nome)) = a.subcategoria_chave
+            INNER JOIN dre_mapeamento_subcategoria m 
+                ON m.subcategoria_id = s.id 
+                AND m.empresa_id = %s
+                AND m.ativo = TRUE
+            INNER JOIN plano_contas pc 
+                ON pc.id = m.plano_contas_id
+                AND pc.empresa_id = %s
+            WHERE a.empresa_id = %s
+              AND a.mes >= %s
+              AND a.mes <= %s
+        """
+        params = [empresa_id, empresa_id, empresa_id, mes_inicio, mes_fim]
+        
+        if versao_plano_id:
+            query += " AND pc.versao_id = %s"
+            params.append(versao_plano_id)
+        
+        query += """
+            GROUP BY a.mes, pc.codigo, pc.descricao
+            HAVING SUM(a.valor) != 0
+            ORDER BY a.mes, pc.codigo
+        """
+        
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        try:
+            cur.execute(query, params)
+            contas_por_mes = {mes: [] for mes in meses}
+            for row in cur.fetchall():
+                contas_por_mes[row['mes']].append({
+                    'codigo': row['codigo'],
+                    'descricao': row['descricao'],
+                    'valor': row['valor_total']
+                })
+        finally:
+            cur.close()
+        
+        return {
+            'success': True,
+            'meses': [
+                {'mes': mes, 'dre': _montar_estrutura_dre(**_separar_secoes_dre(contas_por_mes[mes]))}
+                for mes in meses
+            ]
+        }
+        
+    except Exception as e:
+        import traceback
+        print(f"ERRO em gerar_evolucao_mensal_dre: {e}")
+        print(traceback.format_exc())
+        return {'success': False, 'error': str(e)}
+
+
+def resumir_mes_dre(mes: date, dre: Dict) -> Dict:
+    """Linha da evolução mensal usada nos gráficos (receita, despesas, lucro, margem)"""
+    return {
+        'mes': mes.strftime('%m/%Y'),
+        'mes_nome': mes.strftime('%b/%Y'),
+        'receita': dre['receita_bruta']['total'],
+        'despesas': dre['custos']['total'] + dre['despesas_operacionais']['total'],
+        'lucro_liquido': dre['lucro_liquido']['total'],
+        'margem': dre['lucro_liquido']['percentual']
+    }
+
+
 def gerar_balanco_patrimonial(
     conn,
     empresa_id: int,
@@ -611,63 +795,32 @@ def gerar_balanco_patrimonial(
     Returns:
         Dict com Balanço Patrimonial estruturado
     """
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    
     try:
-        # Função auxiliar para buscar saldo acumulado até a data
-        def buscar_saldo_classificacao(classificacao_conta: str, nivel: Optional[int] = None):
-            query = """
-                SELECT 
-                    pc.codigo,
-                    pc.descricao,
-                    pc.nivel,
-                    pc.tipo_conta,
-                    pc.natureza,
-                    COALESCE(SUM(CASE WHEN lci.tipo = 'debito' THEN lci.valor ELSE 0 END), 0) AS total_debito,
-                    COALESCE(SUM(CASE WHEN lci.tipo = 'credito' THEN lci.valor ELSE 0 END), 0) AS total_credito
-                FROM plano_contas pc
-                LEFT JOIN lancamentos_contabeis_itens lci ON lci.plano_contas_id = pc.id
-                LEFT JOIN lancamentos_contabeis lc ON lc.id = lci.lancamento_id
-                    AND lc.data_lancamento <= %s
-                    AND lc.is_estornado = FALSE
-                    AND lc.empresa_id = %s
-                WHERE pc.empresa_id = %s
-                  AND pc.classificacao = %s
-            """
-            
-            params = [data_referencia, empresa_id, empresa_id, classificacao_conta]
-            
-            if versao_plano_id:
-                query += " AND pc.versao_id = %s"
-                params.append(versao_plano_id)
-            
-            if nivel:
-                query += " AND pc.nivel = %s"
-                params.append(nivel)
-            
-            query += " GROUP BY pc.id, pc.codigo, pc.descricao, pc.nivel, pc.tipo_conta, pc.natureza"
-            query += " ORDER BY pc.codigo"
-            
-            cur.execute(query, params)
+        # Saldos acumulados até a data (motor do balancete), já consolidados nas sintéticas
+        contas = calcular_saldos_contas(conn, empresa_id, None, data_referencia, versao_plano_id)
+        
+        # Totais somam só as contas sem subcontas: as sintéticas já as contêm
+        folhas = {conta['codigo'] for conta in contas if conta['folha']}
+        
+        def total_positivo(itens):
+            return sum(item['saldo'] for item in itens if item['saldo'] > 0 and item['codigo'] in folhas)
+        
+        def buscar_saldo_classificacao(classificacao_conta: str):
             resultados = []
             
-            for row in cur.fetchall():
-                debito = float(row['total_debito'])
-                credito = float(row['total_credito'])
+            for conta in contas:
+                if conta['classificacao'] != classificacao_conta:
+                    continue
                 
-                # Calcular saldo baseado na natureza
-                if row['natureza'] == 'devedora':
-                    saldo = debito - credito
-                else:
-                    saldo = credito - debito
+                saldo = conta['saldo_atual']
                 
                 # Incluir apenas contas com saldo ou sintéticas
-                if saldo != 0 or row['tipo_conta'] == 'sintetica':
+                if saldo != 0 or conta['tipo_conta'] == 'sintetica':
                     resultados.append({
-                        'codigo': row['codigo'],
-                        'descricao': row['descricao'],
-                        'nivel': row['nivel'],
-                        'tipo_conta': row['tipo_conta'],
+                        'codigo': conta['codigo'],
+                        'descricao': conta['descricao'],
+                        'nivel': conta['nivel'],
+                        'tipo_conta': conta['tipo_conta'],
                         'saldo': saldo
                     })
             
@@ -675,29 +828,29 @@ def gerar_balanco_patrimonial(
         
         # 1. ATIVO (grupo 1)
         ativo = buscar_saldo_classificacao('ativo')
-        total_ativo = sum(item['saldo'] for item in ativo if item['saldo'] > 0)
+        total_ativo = total_positivo(ativo)
         
         # Separar Ativo Circulante e Não Circulante
         ativo_circulante = [item for item in ativo if item['codigo'].startswith('1.1')]
         ativo_nao_circulante = [item for item in ativo if item['codigo'].startswith('1.2')]
         
-        total_ativo_circulante = sum(item['saldo'] for item in ativo_circulante if item['saldo'] > 0)
-        total_ativo_nao_circulante = sum(item['saldo'] for item in ativo_nao_circulante if item['saldo'] > 0)
+        total_ativo_circulante = total_positivo(ativo_circulante)
+        total_ativo_nao_circulante = total_positivo(ativo_nao_circulante)
         
         # 2. PASSIVO (grupo 2)
         passivo = buscar_saldo_classificacao('passivo')
-        total_passivo_obrigacoes = sum(item['saldo'] for item in passivo if item['saldo'] > 0)
+        total_passivo_obrigacoes = total_positivo(passivo)
         
         # Separar Passivo Circulante e Não Circulante
         passivo_circulante = [item for item in passivo if item['codigo'].startswith('2.1')]
         passivo_nao_circulante = [item for item in passivo if item['codigo'].startswith('2.2')]
         
-        total_passivo_circulante = sum(item['saldo'] for item in passivo_circulante if item['saldo'] > 0)
-        total_passivo_nao_circulante = sum(item['saldo'] for item in passivo_nao_circulante if item['saldo'] > 0)
+        total_passivo_circulante = total_positivo(passivo_circulante)
+        total_passivo_nao_circulante = total_positivo(passivo_nao_circulante)
         
         # 3. PATRIMÔNIO LÍQUIDO (grupo 3)
         patrimonio_liquido = buscar_saldo_classificacao('patrimonio_liquido')
-        total_patrimonio_liquido = sum(item['saldo'] for item in patrimonio_liquido if item['saldo'] > 0)
+        total_patrimonio_liquido = total_positivo(patrimonio_liquido)
         
         # 4. VALIDAÇÃO: Ativo = Passivo + PL
         total_passivo_mais_pl = total_passivo_obrigacoes + total_patrimonio_liquido
@@ -745,8 +898,6 @@ def gerar_balanco_patrimonial(
         
     except Exception as e:
         return {'success': False, 'error': str(e)}
-    finally:
-        cur.close()
 
 
 def gerar_razao_contabil(
@@ -785,27 +936,14 @@ def gerar_razao_contabil(
         
         conta = dict(conta)
         
-        # Saldo anterior
-        cur.execute("""
-            SELECT 
-                COALESCE(SUM(CASE WHEN lci.tipo = 'debito' THEN lci.valor ELSE 0 END), 0) AS total_debito,
-                COALESCE(SUM(CASE WHEN lci.tipo = 'credito' THEN lci.valor ELSE 0 END), 0) AS total_credito
-            FROM lancamentos_contabeis_itens lci
-            INNER JOIN lancamentos_contabeis lc ON lc.id = lci.lancamento_id
-            WHERE lci.plano_contas_id = %s
-              AND lc.empresa_id = %s
-              AND lc.data_lancamento < %s
-              AND lc.is_estornado = FALSE
-        """, (conta_id, empresa_id, data_inicio))
-        
-        saldo_ant = cur.fetchone()
-        debito_anterior = float(saldo_ant['total_debito'])
-        credito_anterior = float(saldo_ant['total_credito'])
-        
-        if conta['natureza'] == 'devedora':
-            saldo_anterior = debito_anterior - credito_anterior
-        else:
-            saldo_anterior = credito_anterior - debito_anterior
+        # Saldo anterior (mesma soma agrupada do motor do balancete)
+        movimentos = _somar_movimentos(cur, empresa_id, data_inicio, data_fim, [conta_id])
+        saldo_ant = movimentos.get(conta_id, {})
+        saldo_anterior = _saldo_por_natureza(
+            conta['natureza'],
+            saldo_ant.get('debito_anterior', 0.0),
+            saldo_ant.get('credito_anterior', 0.0)
+        )
         
         # Movimentações do período
         cur.execute("""
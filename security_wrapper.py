@@ -24,6 +24,15 @@ from contextlib import contextmanager
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def _esquecer_empresa_no_pool(connection):
+    """Avisa o pool que app.current_empresa_id foi alterado nesta conexão"""
+    try:
+        from database_postgresql import esquecer_empresa_conexao
+        esquecer_empresa_conexao(connection)
+    except Exception:
+        pass
+
+
 class SecurityViolationError(Exception):
     """Exceção lançada quando há tentativa de acesso indevido entre empresas"""
     pass
@@ -136,6 +145,7 @@ def secure_connection(connection, empresa_id: int):
         raise EmpresaNotSetError("empresa_id é obrigatório")
     
     cursor = connection.cursor()
+    _esquecer_empresa_no_pool(connection)
     
     try:
         # Definir empresa na sessão PostgreSQL
@@ -321,6 +331,7 @@ def testar_isolamento(connection, empresa_id_1: int, empresa_id_2: int) -> dict:
     """
     cursor = connection.cursor()
     resultados = {}
+    _esquecer_empresa_no_pool(connection)
     
     try:
         # Teste 1: Definir empresa 1 e contar lançamentos
@@ -8,6 +8,12 @@ from datetime import datetime
 from decimal import Decimal
 from database_postgresql import get_connection
 import hashlib
+import io
+import psycopg2.extensions  # type: ignore
+
+
+# Linhas buscadas por ida ao servidor no cursor de I200/I250
+ITERSIZE_I200_I250 = 5000
 
 
 def formatar_valor(valor):
@@ -469,85 +475,84 @@ def gerar_registros_I200_I250(empresa_id, data_inicio, data_fim):
     05 - IND_DC: Indicador D/C
     06 - NUM_PART: Número participante
     07 - HIST_PART: Histórico partida
+    
+    Gerador: uma única query (lançamentos + partidas) em cursor server-side,
+    ordenada por lançamento; os registros saem à medida que as linhas chegam.
     """
     conn = get_connection()
-    cursor = conn.cursor()
-    
-    registros = []
+    # Cursor nomeado (server-side) exige transação
+    conn.autocommit = False
+    cursor = conn.cursor(name='ecd_i200_i250', cursor_factory=psycopg2.extensions.cursor)
+    cursor.itersize = ITERSIZE_I200_I250
     
     try:
-        # Buscar lançamentos do período
         cursor.execute("""
             SELECT 
                 lc.id,
                 lc.numero_lancamento,
                 lc.data,
                 lc.historico,
-                lc.valor_total
+                lc.valor_total,
+                pc.codigo,
+                lci.tipo,
+                lci.valor,
+                lci.historico
             FROM lancamentos_contabeis lc
+            LEFT JOIN (
+                lancamentos_contabeis_itens lci
+                JOIN plano_contas pc ON pc.id = lci.plano_contas_id
+            ) ON lci.lancamento_id = lc.id
             WHERE lc.empresa_id = %s
                 AND lc.data >= %s
                 AND lc.data <= %s
                 AND lc.is_estornado = false
-            ORDER BY lc.data, lc.numero_lancamento
+            ORDER BY lc.data, lc.numero_lancamento, lc.id, lci.tipo DESC, lci.id
         """, (empresa_id, data_inicio, data_fim))
         
-        lancamentos = cursor.fetchall()
+        lanc_atual = None
         
-        for lancamento in lancamentos:
-            lanc_id, num_lanc, data_lanc, historico, valor_total = lancamento
+        for linha in cursor:
+            lanc_id, num_lanc, data_lanc, historico, valor_total, codigo_cta, tipo, valor, hist_part = linha
             
-            # Registro I200 (cabeçalho do lançamento)
-            registro_i200 = (
-                f"|I200|"
-                f"{num_lanc}|"
-                f"{formatar_data(data_lanc)}|"
-                f"{formatar_valor(valor_total)}|"
-                f"N|"  # N=Normal
-                f"|"  # DT_LCTO_EXT
-                f"|"  # VL_DC_LCTO
-                f"|"  # IND_DC_EXT
-                f"{historico[:200]}|"  # Histórico limitado a 200 caracteres
-            )
-            registros.append(registro_i200)
+            if lanc_id != lanc_atual:
+                lanc_atual = lanc_id
+                
+                # Registro I200 (cabeçalho do lançamento)
+                yield (
+                    f"|I200|"
+                    f"{num_lanc}|"
+                    f"{formatar_data(data_lanc)}|"
+                    f"{formatar_valor(valor_total)}|"
+                    f"N|"  # N=Normal
+                    f"|"  # DT_LCTO_EXT
+                    f"|"  # VL_DC_LCTO
+                    f"|"  # IND_DC_EXT
+                    f"{(historico or '')[:200]}|"  # Histórico limitado a 200 caracteres
+                )
             
-            # Buscar itens do lançamento (partidas)
-            cursor.execute("""
-                SELECT 
-                    pc.codigo,
-                    lci.tipo,
-                    lci.valor,
-                    lci.historico
-                FROM lancamentos_contabeis_itens lci
-                JOIN plano_contas pc ON pc.id = lci.plano_contas_id
-                WHERE lci.lancamento_id = %s
-                ORDER BY lci.tipo DESC, lci.id
-            """, (lanc_id,))
+            if codigo_cta is None:
+                continue  # Lançamento sem partidas
             
-            itens = cursor.fetchall()
+            ind_dc = 'D' if tipo == 'debito' else 'C'
             
-            for item in itens:
-                codigo_cta, tipo, valor, hist_part = item
-                
-                ind_dc = 'D' if tipo == 'debito' else 'C'
-                
-                # Registro I250 (partida)
-                registro_i250 = (
-                    f"|I250|"
-                    f"{codigo_cta}|"
-                    f"|"  # COD_CCUS
-                    f"{formatar_valor(valor)}|"
-                    f"{ind_dc}|"
-                    f"|"  # NUM_PART
-                    f"{(hist_part or '')[:200]}|"  # Histórico partida
-                )
-                registros.append(registro_i250)
-        
-        return registros
+            # Registro I250 (partida)
+            yield (
+                f"|I250|"
+                f"{codigo_cta}|"
+                f"|"  # COD_CCUS
+                f"{formatar_valor(valor)}|"
+                f"{ind_dc}|"
+                f"|"  # NUM_PART
+                f"{(hist_part or '')[:200]}|"  # Histórico partida
+            )
         
     finally:
-        cursor.close()
-        conn.close()
+        try:
+            cursor.close()
+            conn.rollback()  # Somente leitura: encerra a transação do cursor
+            conn.autocommit = True
+        finally:
+            conn.close()
 
 
 def gerar_registro_I990(qtd_linhas):
@@ -865,120 +870,178 @@ def gerar_registro_9999(qtd_total):
     return f"|9999|{qtd_total}|"
 
 
-# ==================== FUNÇÃO PRINCIPAL ====================
+# ==================== ESCRITA EM STREAMING ====================
 
-def gerar_arquivo_ecd(empresa_id, data_inicio, data_fim, versao_plano_id=None):
+class EscritorECD:
     """
-    Gera arquivo ECD completo
+    Escreve os registros do ECD à medida que são gerados
+    
+    Mantém incrementalmente o hash MD5 (mesmo valor de gerar_hash_arquivo
+    sobre as linhas unidas por '\\n'), o total de linhas e a contagem por
+    tipo de registro usada no 9900 - sem acumular o arquivo em memória.
+    
+    Args:
+        destino: Arquivo binário aberto para escrita (None = só calcula hash/contagens)
+        linhas_preview: Quantidade de linhas iniciais guardadas em self.preview
+    """
+    
+    def __init__(self, destino=None, linhas_preview=0):
+        self.destino = destino
+        self.linhas_preview = linhas_preview
+        self.preview = []
+        self.total_linhas = 0
+        self.contagem_registros = {}
+        self._md5 = hashlib.md5()
+    
+    def adicionar(self, registro, tipo_reg=None):
+        if not registro:
+            return
+        dados = (registro if self.total_linhas == 0 else '\n' + registro).encode('utf-8')
+        self._md5.update(dados)
+        if self.destino is not None:
+            self.destino.write(dados)
+        if len(self.preview) < self.linhas_preview:
+            self.preview.append(registro)
+        self.total_linhas += 1
+        if tipo_reg:
+            self.contagem_registros[tipo_reg] = self.contagem_registros.get(tipo_reg, 0) + 1
+    
+    @property
+    def hash(self):
+        return self._md5.hexdigest().upper()
+
+
+def _escrever_registros_ecd(escritor, empresa_id, data_inicio, data_fim, versao_plano_id=None):
+    """Gera todos os blocos do ECD no escritor, na ordem do layout"""
+    adicionar_registro = escritor.adicionar
+    
+    # ===== BLOCO 0 - ABERTURA =====
+    bloco_0_inicio = escritor.total_linhas
+    
+    adicionar_registro(gerar_registro_0000(empresa_id, data_inicio, data_fim), '0000')
+    adicionar_registro(gerar_registro_0001(), '0001')
+    adicionar_registro(gerar_registro_0020(empresa_id, data_inicio, data_fim), '0020')
+    
+    qtd_bloco_0 = escritor.total_linhas - bloco_0_inicio + 1  # +1 para o 0990
+    adicionar_registro(gerar_registro_0990(qtd_bloco_0), '0990')
+    
+    # ===== BLOCO I - LANÇAMENTOS =====
+    bloco_i_inicio = escritor.total_linhas
+    
+    adicionar_registro(gerar_registro_I001(), 'I001')
+    adicionar_registro(gerar_registro_I010(empresa_id, data_inicio, data_fim), 'I010')
+    adicionar_registro(gerar_registro_I030(empresa_id, data_inicio), 'I030')
+    
+    # I050 - Plano de contas
+    for reg in gerar_registros_I050(empresa_id, versao_plano_id):
+        adicionar_registro(reg, 'I050')
+    
+    # I150/I155 - Saldos periódicos
+    for reg in gerar_registros_I150_I155(empresa_id, data_inicio, data_fim, versao_plano_id):
+        adicionar_registro(reg, reg[1:5])  # Extrai I150 ou I155
+    
+    # I200/I250 - Lançamentos e partidas (streaming do cursor server-side)
+    for reg in gerar_registros_I200_I250(empresa_id, data_inicio, data_fim):
+        adicionar_registro(reg, reg[1:5])  # Extrai I200 ou I250
+    
+    qtd_bloco_i = escritor.total_linhas - bloco_i_inicio + 1
+    adicionar_registro(gerar_registro_I990(qtd_bloco_i), 'I990')
+    
+    # ===== BLOCO J - DEMONSTRAÇÕES =====
+    bloco_j_inicio = escritor.total_linhas
+    
+    adicionar_registro(gerar_registro_J001(), 'J001')
+    adicionar_registro(gerar_registro_J005(empresa_id, data_fim), 'J005')
+    
+    # J100 - Balanço Patrimonial
+    for reg in gerar_registros_J100(empresa_id, data_fim, versao_plano_id):
+        adicionar_registro(reg, 'J100')
+    
+    # J150 - DRE
+    for reg in gerar_registros_J150(empresa_id, data_inicio, data_fim, versao_plano_id):
+        adicionar_registro(reg, 'J150')
+    
+    adicionar_registro(gerar_registro_J900(empresa_id, data_inicio, data_fim), 'J900')
+    
+    qtd_bloco_j = escritor.total_linhas - bloco_j_inicio + 1
+    adicionar_registro(gerar_registro_J990(qtd_bloco_j), 'J990')
+    
+    # ===== BLOCO 9 - ENCERRAMENTO =====
+    bloco_9_inicio = escritor.total_linhas
+    
+    adicionar_registro(gerar_registro_9001(), '9001')
+    
+    # 9900 - Contagem de registros (um 9900 por tipo já escrito)
+    for reg in gerar_registros_9900(escritor.contagem_registros):
+        adicionar_registro(reg, '9900')
+    
+    qtd_bloco_9 = escritor.total_linhas - bloco_9_inicio + 2  # +2 para 9990 e 9999
+    adicionar_registro(gerar_registro_9990(qtd_bloco_9), '9990')
+    
+    qtd_total = escritor.total_linhas + 1  # +1 para o 9999
+    adicionar_registro(gerar_registro_9999(qtd_total), '9999')
+
+
+def escrever_arquivo_ecd(destino, empresa_id, data_inicio, data_fim, versao_plano_id=None, linhas_preview=0):
+    """
+    Gera o ECD escrevendo direto em um arquivo (sem montar o conteúdo em memória)
+    
+    Args:
+        destino: Arquivo binário aberto para escrita (UTF-8) ou None
+        linhas_preview: Quantidade de linhas iniciais devolvidas em 'preview'
     
     Returns:
         dict: {
             'success': bool,
-            'conteudo': str (conteúdo do arquivo),
             'total_linhas': int,
             'hash': str,
-            'data_geracao': str
+            'data_geracao': str,
+            'periodo': str,
+            'preview': list (se linhas_preview > 0)
         }
     """
     try:
-        linhas = []
-        contagem_registros = {}
-        
-        def adicionar_registro(registro, tipo_reg=None):
-            if registro:
-                linhas.append(registro)
-                if tipo_reg:
-                    contagem_registros[tipo_reg] = contagem_registros.get(tipo_reg, 0) + 1
-        
-        # ===== BLOCO 0 - ABERTURA =====
-        bloco_0_inicio = len(linhas)
-        
-        adicionar_registro(gerar_registro_0000(empresa_id, data_inicio, data_fim), '0000')
-        adicionar_registro(gerar_registro_0001(), '0001')
-        adicionar_registro(gerar_registro_0020(empresa_id, data_inicio, data_fim), '0020')
-        
-        qtd_bloco_0 = len(linhas) - bloco_0_inicio + 1  # +1 para o 0990
-        adicionar_registro(gerar_registro_0990(qtd_bloco_0), '0990')
-        
-        # ===== BLOCO I - LANÇAMENTOS =====
-        bloco_i_inicio = len(linhas)
-        
-        adicionar_registro(gerar_registro_I001(), 'I001')
-        adicionar_registro(gerar_registro_I010(empresa_id, data_inicio, data_fim), 'I010')
-        adicionar_registro(gerar_registro_I030(empresa_id, data_inicio), 'I030')
-        
-        # I050 - Plano de contas
-        registros_i050 = gerar_registros_I050(empresa_id, versao_plano_id)
-        for reg in registros_i050:
-            adicionar_registro(reg, 'I050')
-        
-        # I150/I155 - Saldos periódicos
-        registros_i150 = gerar_registros_I150_I155(empresa_id, data_inicio, data_fim, versao_plano_id)
-        for reg in registros_i150:
-            tipo = reg[1:5]  # Extrai I150 ou I155
-            adicionar_registro(reg, tipo)
-        
-        # I200/I250 - Lançamentos e partidas
-        registros_i200 = gerar_registros_I200_I250(empresa_id, data_inicio, data_fim)
-        for reg in registros_i200:
-            tipo = reg[1:5]  # Extrai I200 ou I250
-            adicionar_registro(reg, tipo)
-        
-        qtd_bloco_i = len(linhas) - bloco_i_inicio + 1
-        adicionar_registro(gerar_registro_I990(qtd_bloco_i), 'I990')
-        
-        # ===== BLOCO J - DEMONSTRAÇÕES =====
-        bloco_j_inicio = len(linhas)
-        
-        adicionar_registro(gerar_registro_J001(), 'J001')
-        adicionar_registro(gerar_registro_J005(empresa_id, data_fim), 'J005')
-        
-        # J100 - Balanço Patrimonial
-        registros_j100 = gerar_registros_J100(empresa_id, data_fim, versao_plano_id)
-        for reg in registros_j100:
-            adicionar_registro(reg, 'J100')
-        
-        # J150 - DRE
-        registros_j150 = gerar_registros_J150(empresa_id, data_inicio, data_fim, versao_plano_id)
-        for reg in registros_j150:
-            adicionar_registro(reg, 'J150')
-        
-        adicionar_registro(gerar_registro_J900(empresa_id, data_inicio, data_fim), 'J900')
-        
-        qtd_bloco_j = len(linhas) - bloco_j_inicio + 1
-        adicionar_registro(gerar_registro_J990(qtd_bloco_j), 'J990')
+        escritor = EscritorECD(destino, linhas_preview)
+        _escrever_registros_ecd(escritor, empresa_id, data_inicio, data_fim, versao_plano_id)
         
-        # ===== BLOCO 9 - ENCERRAMENTO =====
-        bloco_9_inicio = len(linhas)
-        
-        adicionar_registro(gerar_registro_9001(), '9001')
-        
-        # 9900 - Contagem de registros
-        registros_9900 = gerar_registros_9900(contagem_registros)
-        for reg in registros_9900:
-            adicionar_registro(reg, '9900')
-        
-        qtd_bloco_9 = len(linhas) - bloco_9_inicio + 2  # +2 para 9990 e 9999
-        adicionar_registro(gerar_registro_9990(qtd_bloco_9), '9990')
-        
-        qtd_total = len(linhas) + 1  # +1 para o 9999
-        adicionar_registro(gerar_registro_9999(qtd_total), '9999')
-        
-        # Montar conteúdo final
-        conteudo = '\n'.join(linhas)
-        hash_arquivo = gerar_hash_arquivo(conteudo)
-        
-        return {
+        resultado = {
             'success': True,
-            'conteudo': conteudo,
-            'total_linhas': len(linhas),
-            'hash': hash_arquivo,
+            'total_linhas': escritor.total_linhas,
+            'hash': escritor.hash,
             'data_geracao': datetime.now().strftime('%d/%m/%Y %H:%M:%S'),
             'periodo': f"{formatar_data(data_inicio)} a {formatar_data(data_fim)}"
         }
+        if linhas_preview:
+            resultado['preview'] = escritor.preview
+        return resultado
         
     except Exception as e:
         return {
             'success': False,
             'error': str(e)
         }
+
+
+# ==================== FUNÇÃO PRINCIPAL ====================
+
+def gerar_arquivo_ecd(empresa_id, data_inicio, data_fim, versao_plano_id=None):
+    """
+    Gera arquivo ECD completo
+    
+    Para arquivos grandes prefira escrever_arquivo_ecd(), que não mantém
+    o conteúdo inteiro em memória.
+    
+    Returns:
+        dict: {
+            'success': bool,
+            'conteudo': str (conteúdo do arquivo),
+            'total_linhas': int,
+            'hash': str,
+            'data_geracao': str
+        }
+    """
+    buffer = io.BytesIO()
+    resultado = escrever_arquivo_ecd(buffer, empresa_id, data_inicio, data_fim, versao_plano_id)
+    if resultado['success']:
+        resultado['conteudo'] = buffer.getvalue().decode('utf-8')
+    return resultado
@@ -0,0 +1,107 @@
+-- ============================================================================
+-- MIGRATION: DRE - Agregado mensal incremental
+-- ============================================================================
+-- Descrição: Mantém por empresa/mês/subcategoria o total dos lançamentos PAGOS
+--            (receita soma, despesa subtrai), atualizado por trigger sempre que
+--            um lançamento é pago, editado ou excluído.
+--            A evolução mensal do DRE (dashboard gerencial e /api/relatorios/dre)
+--            passa a ser uma única query sobre esta tabela.
+--
+--            O vínculo subcategoria -> conta do DRE NÃO é gravado aqui: ele é
+--            resolvido na leitura (dre_mapeamento_subcategoria + plano_contas),
+--            então alterar o mapeamento não exige reprocessar o agregado.
+-- Data: 16/10/2026
+-- Autor: Sistema
+-- ============================================================================
+
+-- 1. CRIAR TABELA DO AGREGADO
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS dre_mensal_agregado (
+    empresa_id INTEGER NOT NULL,
+    mes DATE NOT NULL,                          -- primeiro dia do mês de data_pagamento
+    subcategoria_chave VARCHAR(255) NOT NULL,   -- LOWER(TRIM(lancamentos.subcategoria))
+    valor NUMERIC(18,2) NOT NULL DEFAULT 0,     -- receitas - despesas pagas no mês
+    updated_at TIMESTAMP DEFAULT NOW(),
+
+    CONSTRAINT pk_dre_mensal_agregado PRIMARY KEY (empresa_id, mes, subcategoria_chave)
+);
+
+COMMENT ON TABLE dre_mensal_agregado IS 'Total mensal de lançamentos pagos por subcategoria (base da evolução mensal do DRE)';
+COMMENT ON COLUMN dre_mensal_agregado.subcategoria_chave IS 'Nome da subcategoria normalizado (LOWER/TRIM), mesma chave do JOIN do DRE';
+
+-- 2. FUNÇÃO DO TRIGGER (desfaz a contribuição antiga e aplica a nova)
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION trg_dre_mensal_agregado()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        IF OLD.empresa_id IS NOT NULL AND OLD.status = 'pago' AND OLD.data_pagamento IS NOT NULL
+           AND OLD.subcategoria IS NOT NULL AND OLD.tipo IN ('receita', 'despesa') THEN
+            INSERT INTO dre_mensal_agregado AS a (empresa_id, mes, subcategoria_chave, valor)
+            VALUES (
+                OLD.empresa_id,
+                date_trunc('month', OLD.data_pagamento)::date,
+                LOWER(TRIM(OLD.subcategoria)),
+                CASE WHEN OLD.tipo = 'receita' THEN -OLD.valor ELSE OLD.valor END
+            )
+            ON CONFLICT (empresa_id, mes, subcategoria_chave)
+            DO UPDATE SET valor = a.valor + EXCLUDED.valor, updated_at = NOW();
+        END IF;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        IF NEW.empresa_id IS NOT NULL AND NEW.status = 'pago' AND NEW.data_pagamento IS NOT NULL
+           AND NEW.subcategoria IS NOT NULL AND NEW.tipo IN ('receita', 'despesa') THEN
+            INSERT INTO dre_mensal_agregado AS a (empresa_id, mes, subcategoria_chave, valor)
+            VALUES (
+                NEW.empresa_id,
+                date_trunc('month', NEW.data_pagamento)::date,
+                LOWER(TRIM(NEW.subcategoria)),
+                CASE WHEN NEW.tipo = 'receita' THEN NEW.valor ELSE -NEW.valor END
+            )
+            ON CONFLICT (empresa_id, mes, subcategoria_chave)
+            DO UPDATE SET valor = a.valor + EXCLUDED.valor, updated_at = NOW();
+        END IF;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 3. TRIGGER EM LANÇAMENTOS (apenas colunas que afetam o DRE)
+-- ============================================================================
+
+DROP TRIGGER IF EXISTS trg_lancamentos_dre_mensal ON lancamentos;
+
+CREATE TRIGGER trg_lancamentos_dre_mensal
+AFTER INSERT OR DELETE OR UPDATE OF empresa_id, tipo, valor, status, data_pagamento, subcategoria
+ON lancamentos
+FOR EACH ROW
+EXECUTE FUNCTION trg_dre_mensal_agregado();
+
+-- 4. CARGA INICIAL (bloqueia escritas em lançamentos só durante a carga)
+-- ============================================================================
+
+LOCK TABLE lancamentos IN SHARE MODE;
+
+DELETE FROM dre_mensal_agregado;
+
+INSERT INTO dre_mensal_agregado (empresa_id, mes, subcategoria_chave, valor)
+SELECT
+    empresa_id,
+    date_trunc('month', data_pagamento)::date,
+    LOWER(TRIM(subcategoria)),
+    SUM(CASE WHEN tipo = 'receita' THEN valor ELSE -valor END)
+FROM lancamentos
+WHERE empresa_id IS NOT NULL
+  AND status = 'pago'
+  AND data_pagamento IS NOT NULL
+  AND subcategoria IS NOT NULL
+  AND tipo IN ('receita', 'despesa')
+GROUP BY empresa_id, date_trunc('month', data_pagamento)::date, LOWER(TRIM(subcategoria));
+
+-- ============================================================================
+-- MIGRATION COMPLETO ✅
+-- ============================================================================
@@ -0,0 +1,88 @@
+-- ============================================================================
+-- MIGRATION: Versão dos lançamentos por empresa
+-- ============================================================================
+-- Descrição: Contador incrementado a cada escrita em lancamentos, por empresa.
+--            O snapshot colunar dos relatórios financeiros
+--            (app/utils/livro_colunar.py) compara esta versão com a do cache
+--            e só relê os lançamentos quando ela muda.
+--
+--            Triggers por instrução (FOR EACH STATEMENT) com transition tables:
+--            uma importação de OFX com milhares de linhas incrementa a versão
+--            uma vez por empresa, e não uma vez por linha.
+-- Data: 16/10/2026
+-- Autor: Sistema
+-- ============================================================================
+
+-- 1. CRIAR TABELA DE VERSÕES
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS lancamentos_versao (
+    empresa_id INTEGER PRIMARY KEY,
+    versao BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+COMMENT ON TABLE lancamentos_versao IS 'Versão dos lançamentos por empresa (invalidação do snapshot dos relatórios)';
+
+-- 2. FUNÇÃO DO TRIGGER (incrementa a versão das empresas afetadas)
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION trg_lancamentos_versao()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO lancamentos_versao (empresa_id, versao, updated_at)
+        SELECT DISTINCT empresa_id, 1, NOW() FROM novos WHERE empresa_id IS NOT NULL
+        ON CONFLICT (empresa_id) DO UPDATE
+            SET versao = lancamentos_versao.versao + 1, updated_at = NOW();
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO lancamentos_versao (empresa_id, versao, updated_at)
+        SELECT DISTINCT empresa_id, 1, NOW() FROM antigos WHERE empresa_id IS NOT NULL
+        ON CONFLICT (empresa_id) DO UPDATE
+            SET versao = lancamentos_versao.versao + 1, updated_at = NOW();
+    ELSE
+        INSERT INTO lancamentos_versao (empresa_id, versao, updated_at)
+        SELECT empresa_id, 1, NOW() FROM (
+            SELECT empresa_id FROM novos
+            UNION
+            SELECT empresa_id FROM antigos
+        ) afetadas
+        WHERE empresa_id IS NOT NULL
+        ON CONFLICT (empresa_id) DO UPDATE
+            SET versao = lancamentos_versao.versao + 1, updated_at = NOW();
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 3. TRIGGERS EM LANÇAMENTOS (um por operação: transition tables exigem evento único)
+-- ============================================================================
+
+DROP TRIGGER IF EXISTS trg_lancamentos_versao_ins ON lancamentos;
+DROP TRIGGER IF EXISTS trg_lancamentos_versao_upd ON lancamentos;
+DROP TRIGGER IF EXISTS trg_lancamentos_versao_del ON lancamentos;
+
+CREATE TRIGGER trg_lancamentos_versao_ins
+AFTER INSERT ON lancamentos
+REFERENCING NEW TABLE AS novos
+FOR EACH STATEMENT
+EXECUTE FUNCTION trg_lancamentos_versao();
+
+CREATE TRIGGER trg_lancamentos_versao_upd
+AFTER UPDATE ON lancamentos
+REFERENCING OLD TABLE AS antigos NEW TABLE AS novos
+FOR EACH STATEMENT
+EXECUTE FUNCTION trg_lancamentos_versao();
+
+CREATE TRIGGER trg_lancamentos_versao_del
+AFTER DELETE ON lancamentos
+REFERENCING OLD TABLE AS antigos
+FOR EACH STATEMENT
+EXECUTE FUNCTION trg_lancamentos_versao();
+
+-- 4. CARGA INICIAL (uma linha por empresa existente)
+-- ============================================================================
+
+INSERT INTO lancamentos_versao (empresa_id, versao)
+SELECT DISTINCT empresa_id, 1 FROM lancamentos WHERE empresa_id IS NOT NULL
+ON CONFLICT (empresa_id) DO NOTHING;
@@ -0,0 +1,207 @@
+-- ============================================================================
+-- MIGRATION: Checkpoints mensais de saldo do extrato mantidos por trigger
+-- ============================================================================
+-- Descrição: saldos_extrato_mensais guarda, por (empresa, conta, mês), a soma,
+--            a quantidade e o último saldo das transações do extrato. O
+--            saldo_anterior da listagem do extrato soma esses checkpoints.
+--
+--            Triggers por instrução (FOR EACH STATEMENT) com transition tables
+--            recalculam os meses tocados por qualquer INSERT, UPDATE ou DELETE
+--            em transacoes_extrato - inclusive os scripts de limpeza que
+--            apagam direto na tabela. UPDATE que não muda empresa, conta,
+--            data, valor nem saldo (conciliação, categoria, pessoa) não
+--            recalcula nada.
+--
+--            Aplicada automaticamente por DatabaseManager.criar_tabelas quando
+--            os triggers não existem; pode ser reaplicada a qualquer momento
+--            (aplicar_migration_saldos_extrato_mensais.py) para reconstruir
+--            todos os checkpoints.
+-- Data: 17/10/2026
+-- Autor: Sistema
+-- ============================================================================
+
+-- Escritas em transacoes_extrato esperam a migration; duas aplicações
+-- simultâneas (workers subindo juntos) rodam uma depois da outra
+LOCK TABLE transacoes_extrato IN SHARE ROW EXCLUSIVE MODE;
+
+-- 1. CRIAR TABELA DOS CHECKPOINTS
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS saldos_extrato_mensais (
+    empresa_id INTEGER NOT NULL,
+    conta_bancaria VARCHAR(255) NOT NULL,
+    mes DATE NOT NULL,
+    soma DECIMAL(15,2) NOT NULL,
+    quantidade INTEGER NOT NULL,
+    ultima_data DATE NOT NULL,
+    ultimo_saldo DECIMAL(15,2),
+    atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (empresa_id, conta_bancaria, mes)
+);
+
+COMMENT ON TABLE saldos_extrato_mensais IS 'Soma e último saldo do extrato por empresa/conta/mês (mantida por trigger em transacoes_extrato)';
+
+-- 2. RECÁLCULO DE MESES (usado pelo trigger)
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION recalcular_saldos_extrato_mensais(
+    p_empresas INTEGER[], p_contas TEXT[], p_meses DATE[]
+)
+RETURNS VOID AS $$
+DECLARE
+    v_empresa INTEGER;
+BEGIN
+    -- Serializa a manutenção por empresa (em ordem, sem deadlock entre
+    -- instruções que tocam várias empresas): o recálculo de uma importação
+    -- concorrente só lê o mês depois do commit desta e enxerga as linhas dela
+    FOR v_empresa IN SELECT DISTINCT e FROM unnest(p_empresas) AS e ORDER BY e LOOP
+        PERFORM pg_advisory_xact_lock(hashtext('saldos_extrato_mensais'), v_empresa);
+    END LOOP;
+
+    DELETE FROM saldos_extrato_mensais s
+    USING unnest(p_empresas, p_contas, p_meses) AS m(empresa_id, conta_bancaria, mes)
+    WHERE s.empresa_id = m.empresa_id AND s.conta_bancaria = m.conta_bancaria AND s.mes = m.mes;
+
+    -- Cada mês é recalculado só com as suas linhas; mês que ficou vazio some
+    INSERT INTO saldos_extrato_mensais
+        (empresa_id, conta_bancaria, mes, soma, quantidade, ultima_data, ultimo_saldo)
+    SELECT m.empresa_id, m.conta_bancaria, m.mes, t.soma, t.quantidade, t.ultima_data, t.ultimo_saldo
+    FROM unnest(p_empresas, p_contas, p_meses) AS m(empresa_id, conta_bancaria, mes)
+    CROSS JOIN LATERAL (
+        SELECT SUM(valor) AS soma, COUNT(*) AS quantidade, MAX(data) AS ultima_data,
+               (ARRAY_AGG(saldo ORDER BY data DESC, id DESC))[1] AS ultimo_saldo
+        FROM transacoes_extrato
+        WHERE empresa_id = m.empresa_id AND conta_bancaria = m.conta_bancaria
+          AND data >= m.mes AND data < (m.mes + INTERVAL '1 month')::date
+    ) t
+    WHERE t.quantidade > 0;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 3. RECONSTRUÇÃO COMPLETA (uma empresa ou todas)
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION reconstruir_saldos_extrato_mensais(p_empresa_id INTEGER DEFAULT NULL)
+RETURNS INTEGER AS $$
+DECLARE
+    v_empresa INTEGER;
+    v_meses INTEGER;
+BEGIN
+    FOR v_empresa IN
+        SELECT empresa_id FROM transacoes_extrato
+        WHERE empresa_id IS NOT NULL AND (p_empresa_id IS NULL OR empresa_id = p_empresa_id)
+        UNION
+        SELECT empresa_id FROM saldos_extrato_mensais
+        WHERE p_empresa_id IS NULL OR empresa_id = p_empresa_id
+        ORDER BY 1
+    LOOP
+        PERFORM pg_advisory_xact_lock(hashtext('saldos_extrato_mensais'), v_empresa);
+    END LOOP;
+
+    DELETE FROM saldos_extrato_mensais
+    WHERE p_empresa_id IS NULL OR empresa_id = p_empresa_id;
+
+    INSERT INTO saldos_extrato_mensais
+        (empresa_id, conta_bancaria, mes, soma, quantidade, ultima_data, ultimo_saldo)
+    SELECT empresa_id, conta_bancaria, date_trunc('month', data)::date,
+           SUM(valor), COUNT(*), MAX(data),
+           (ARRAY_AGG(saldo ORDER BY data DESC, id DESC))[1]
+    FROM transacoes_extrato
+    WHERE empresa_id IS NOT NULL AND conta_bancaria IS NOT NULL AND data IS NOT NULL
+      AND (p_empresa_id IS NULL OR empresa_id = p_empresa_id)
+    GROUP BY empresa_id, conta_bancaria, date_trunc('month', data);
+    GET DIAGNOSTICS v_meses = ROW_COUNT;
+
+    RETURN v_meses;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 4. FUNÇÃO DO TRIGGER (meses das linhas inseridas, apagadas ou alteradas)
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION trg_saldos_extrato_mensais()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_empresas INTEGER[];
+    v_contas TEXT[];
+    v_meses DATE[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(empresa_id), array_agg(conta_bancaria), array_agg(mes)
+        INTO v_empresas, v_contas, v_meses
+        FROM (
+            SELECT DISTINCT empresa_id, conta_bancaria, date_trunc('month', data)::date AS mes
+            FROM novos
+        ) afetados
+        WHERE empresa_id IS NOT NULL AND conta_bancaria IS NOT NULL AND mes IS NOT NULL;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(empresa_id), array_agg(conta_bancaria), array_agg(mes)
+        INTO v_empresas, v_contas, v_meses
+        FROM (
+            SELECT DISTINCT empresa_id, conta_bancaria, date_trunc('month', data)::date AS mes
+            FROM antigos
+        ) afetados
+        WHERE empresa_id IS NOT NULL AND conta_bancaria IS NOT NULL AND mes IS NOT NULL;
+    ELSE
+        -- Só linhas em que mudou algo que entra no checkpoint: mês antigo e novo
+        WITH alteradas AS (
+            SELECT a.empresa_id AS empresa_antiga, a.conta_bancaria AS conta_antiga, a.data AS data_antiga,
+                   n.empresa_id AS empresa_nova, n.conta_bancaria AS conta_nova, n.data AS data_nova
+            FROM antigos a
+            JOIN novos n ON n.id = a.id
+            WHERE (a.empresa_id, a.conta_bancaria, a.data, a.valor, a.saldo)
+                  IS DISTINCT FROM (n.empresa_id, n.conta_bancaria, n.data, n.valor, n.saldo)
+        )
+        SELECT array_agg(empresa_id), array_agg(conta_bancaria), array_agg(mes)
+        INTO v_empresas, v_contas, v_meses
+        FROM (
+            SELECT empresa_antiga AS empresa_id, conta_antiga AS conta_bancaria,
+                   date_trunc('month', data_antiga)::date AS mes
+            FROM alteradas
+            UNION
+            SELECT empresa_nova, conta_nova, date_trunc('month', data_nova)::date
+            FROM alteradas
+        ) afetados
+        WHERE empresa_id IS NOT NULL AND conta_bancaria IS NOT NULL AND mes IS NOT NULL;
+    END IF;
+
+    IF v_empresas IS NOT NULL THEN
+        PERFORM recalcular_saldos_extrato_mensais(v_empresas, v_contas, v_meses);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 5. TRIGGERS EM TRANSACOES_EXTRATO (um por operação: transition tables exigem evento único)
+-- ============================================================================
+
+DROP TRIGGER IF EXISTS trg_saldos_extrato_mensais_ins ON transacoes_extrato;
+DROP TRIGGER IF EXISTS trg_saldos_extrato_mensais_upd ON transacoes_extrato;
+DROP TRIGGER IF EXISTS trg_saldos_extrato_mensais_del ON transacoes_extrato;
+
+CREATE TRIGGER trg_saldos_extrato_mensais_ins
+AFTER INSERT ON transacoes_extrato
+REFERENCING NEW TABLE AS novos
+FOR EACH STATEMENT
+EXECUTE FUNCTION trg_saldos_extrato_mensais();
+
+CREATE TRIGGER trg_saldos_extrato_mensais_upd
+AFTER UPDATE ON transacoes_extrato
+REFERENCING OLD TABLE AS antigos NEW TABLE AS novos
+FOR EACH STATEMENT
+EXECUTE FUNCTION trg_saldos_extrato_mensais();
+
+CREATE TRIGGER trg_saldos_extrato_mensais_del
+AFTER DELETE ON transacoes_extrato
+REFERENCING OLD TABLE AS antigos
+FOR EACH STATEMENT
+EXECUTE FUNCTION trg_saldos_extrato_mensais();
+
+-- 6. RECONSTRUÇÃO (corrige checkpoints desatualizados por exclusões anteriores)
+-- ============================================================================
+
+SELECT reconstruir_saldos_extrato_mensais() AS meses;
+
+-- ============================================================================
+-- MIGRATION COMPLETO ✅
+-- ============================================================================
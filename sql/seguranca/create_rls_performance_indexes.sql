@@ -195,6 +195,12 @@ COMMENT ON INDEX idx_kits_equipamentos_empresa_ativo_nome IS
 CREATE INDEX IF NOT EXISTS idx_lancamentos_empresa_vencimento_status
 ON lancamentos(empresa_id, data_vencimento DESC, status);
 
+-- Índice da listagem paginada por cursor (keyset)
+-- Uso: WHERE empresa_id = X AND (data_vencimento, id) < (D, N) ORDER BY data_vencimento DESC, id DESC LIMIT 50
+-- Benefício: cada página lê só as linhas que devolve, em qualquer profundidade
+CREATE INDEX IF NOT EXISTS idx_lancamentos_empresa_vencimento_id
+ON lancamentos(empresa_id, data_vencimento DESC, id DESC);
+
 -- Índice para dashboard: empresa_id + tipo + status + data
 -- Uso: WHERE empresa_id = X AND tipo = 'receita' AND status = 'pago' ORDER BY data_pagamento DESC
 CREATE INDEX IF NOT EXISTS idx_lancamentos_empresa_tipo_status_data
@@ -210,6 +216,11 @@ ON lancamentos(empresa_id, categoria, status, data_pagamento DESC);
 CREATE INDEX IF NOT EXISTS idx_lancamentos_empresa_conta_data
 ON lancamentos(empresa_id, conta_bancaria, data_pagamento DESC);
 
+-- Índice das sugestões de conciliação em lote
+-- Uso: WHERE empresa_id = X AND conta_bancaria = ANY(...) AND data_vencimento BETWEEN A AND B
+CREATE INDEX IF NOT EXISTS idx_lancamentos_empresa_conta_vencimento
+ON lancamentos(empresa_id, conta_bancaria, data_vencimento);
+
 -- Índice para lançamentos pendentes/vencidos
 -- Uso: WHERE empresa_id = X AND status = 'pendente' AND data_vencimento < hoje
 CREATE INDEX IF NOT EXISTS idx_lancamentos_empresa_pendentes_vencidos
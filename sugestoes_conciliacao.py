@@ -0,0 +1,224 @@
+"""
+🔎 Sugestões de Conciliação em Lote
+===================================
+
+Índice em memória dos lançamentos em aberto de uma janela de contas/datas,
+usado para sugerir a conciliação de uma página inteira do extrato de uma vez,
+em vez de uma query por transação (com filtro de data sem índice).
+
+    - Faixas de valor logarítmicas: cada faixa cobre TOLERANCIA_VALOR, então
+      os candidatos de uma transação estão em no máximo 4 faixas vizinhas
+    - Dentro da faixa, lançamentos ordenados por data: a janela de
+      ±JANELA_DIAS sai por busca binária
+    - Pontuação (0 a 1) combinando proximidade de valor, de data, semelhança
+      da descrição e CPF/CNPJ do extrato igual ao do cliente/fornecedor
+
+Uso:
+    indice = IndiceCandidatos(lancamentos, documentos_por_pessoa)
+    for transacao in transacoes:
+        sugestoes = indice.sugerir(transacao)
+
+Data: 16/10/2026
+"""
+
+import math
+import re
+import unicodedata
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+
+# Diferença de valor aceita, relativa ao valor da transação (±5%)
+TOLERANCIA_VALOR = 0.05
+# Distância máxima entre a data do extrato e o vencimento do lançamento
+JANELA_DIAS = 7
+# Sugestões devolvidas por transação
+MAX_SUGESTOES = 10
+
+# Pesos da pontuação (somam 1)
+PESO_VALOR = 0.45
+PESO_DATA = 0.25
+PESO_TEXTO = 0.15
+PESO_DOCUMENTO = 0.15
+
+# Palavras de extrato que não identificam a contraparte
+_PALAVRAS_IGNORADAS = frozenset({
+    'PIX', 'TED', 'DOC', 'TEF', 'PAG', 'PGTO', 'PAGTO', 'PAGAMENTO', 'RECEBIDO',
+    'RECEBIMENTO', 'ENVIADO', 'TRANSF', 'TRANSFERENCIA', 'DEB', 'CRED', 'DEBITO',
+    'CREDITO', 'COMPRA', 'CARTAO', 'BOLETO', 'TARIFA', 'LTDA', 'EIRELI', 'COM',
+    'DOS', 'DAS', 'PARA',
+})
+
+# Pontuação entre dígitos de CPF/CNPJ formatado (123.456.789-01, 12.345.678/0001-90)
+_RE_PONTUACAO_DOCUMENTO = re.compile(r'(?<=\d)[./-](?=\d)')
+_RE_DOCUMENTO = re.compile(r'(?<!\d)(\d{14}|\d{11})(?!\d)')
+_RE_PALAVRA = re.compile(r'[A-Z0-9]+')
+
+
+def normalizar_texto(texto: Optional[str]) -> str:
+    """Maiúsculas sem acentos"""
+    texto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in texto if not unicodedata.combining(c)).upper()
+
+
+def palavras(texto: Optional[str]) -> FrozenSet[str]:
+    """Palavras significativas (3+ caracteres, sem jargão bancário nem números)"""
+    return frozenset(
+        p for p in _RE_PALAVRA.findall(normalizar_texto(texto))
+        if len(p) >= 3 and not p.isdigit() and p not in _PALAVRAS_IGNORADAS
+    )
+
+
+def extrair_documentos(texto: Optional[str]) -> Set[str]:
+    """CPFs (11 dígitos) e CNPJs (14 dígitos) citados no texto, só dígitos"""
+    return set(_RE_DOCUMENTO.findall(_RE_PONTUACAO_DOCUMENTO.sub('', texto or '')))
+
+
+def similaridade(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """Fração das palavras do menor conjunto presentes no outro (0 a 1)"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def _ordinal(valor) -> int:
+    if isinstance(valor, datetime):
+        valor = valor.date()
+    if isinstance(valor, str):
+        valor = date.fromisoformat(valor[:10])
+    return valor.toordinal()
+
+
+def _tipo_transacao(transacao: Dict) -> str:
+    """Débito casa com despesa, crédito com receita; tipo desconhecido usa o sinal"""
+    tipo = normalizar_texto(transacao.get('tipo'))
+    if tipo == 'DEBITO':
+        return 'despesa'
+    if tipo == 'CREDITO':
+        return 'receita'
+    return 'receita' if float(transacao.get('valor') or 0) >= 0 else 'despesa'
+
+
+def _json(valor):
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if hasattr(valor, 'isoformat'):
+        return valor.isoformat()
+    return valor
+
+
+class IndiceCandidatos:
+    """Lançamentos em aberto indexados por (conta, tipo, faixa de valor) e data"""
+
+    def __init__(self, lancamentos: Iterable[Dict],
+                 documentos_por_pessoa: Optional[Dict[str, str]] = None,
+                 tolerancia: float = TOLERANCIA_VALOR, janela_dias: int = JANELA_DIAS):
+        """
+        Monta o índice
+
+        Args:
+            lancamentos: Lançamentos candidatos (id, tipo, valor, data_vencimento,
+                conta_bancaria, descricao, pessoa, ...)
+            documentos_por_pessoa: {nome normalizado: cpf/cnpj só dígitos}
+            tolerancia: Diferença relativa de valor aceita
+            janela_dias: Distância máxima de datas aceita
+        """
+        self.tolerancia = tolerancia
+        self.janela_dias = janela_dias
+        self._passo = math.log1p(tolerancia)
+        documentos_por_pessoa = documentos_por_pessoa or {}
+
+        self._lancamentos: List[Dict] = []
+        self._valores: List[float] = []
+        self._ordinais: List[int] = []
+        self._palavras: List[FrozenSet[str]] = []
+        self._documentos: List[Optional[str]] = []
+        # (conta, tipo, faixa) -> ([ordinal], [posição]) ordenados por data
+        self._faixas: Dict[Tuple[str, str, int], Tuple[List[int], List[int]]] = {}
+
+        agrupados = defaultdict(list)
+        for lancamento in lancamentos:
+            valor = abs(float(lancamento.get('valor') or 0))
+            if not valor or not lancamento.get('data_vencimento'):
+                continue
+            posicao = len(self._lancamentos)
+            self._lancamentos.append(lancamento)
+            self._valores.append(valor)
+            self._ordinais.append(_ordinal(lancamento['data_vencimento']))
+            self._palavras.append(palavras(f"{lancamento.get('descricao') or ''} {lancamento.get('pessoa') or ''}"))
+            self._documentos.append(documentos_por_pessoa.get(normalizar_texto(lancamento.get('pessoa')).strip()))
+            chave = (lancamento.get('conta_bancaria') or '', (lancamento.get('tipo') or '').lower(),
+                     self._faixa(valor))
+            agrupados[chave].append((self._ordinais[-1], posicao))
+
+        for chave, itens in agrupados.items():
+            itens.sort()
+            self._faixas[chave] = ([o for o, _ in itens], [p for _, p in itens])
+
+    def __len__(self) -> int:
+        return len(self._lancamentos)
+
+    def _faixa(self, valor: float) -> int:
+        return math.floor(math.log(valor) / self._passo)
+
+    def _candidatos(self, conta: str, tipo: str, valor: float, ordinal: int) -> Iterable[int]:
+        """Posições dos lançamentos dentro da tolerância de valor e da janela de datas"""
+        faixa = self._faixa(valor)
+        # log(1 - t) > -1.06 * log(1 + t) para t <= 10%: duas faixas abaixo, uma acima
+        for f in range(faixa - 2, faixa + 2):
+            indice = self._faixas.get((conta, tipo, f))
+            if indice is None:
+                continue
+            ordinais, posicoes = indice
+            inicio = bisect_left(ordinais, ordinal - self.janela_dias)
+            fim = bisect_right(ordinais, ordinal + self.janela_dias)
+            for posicao in posicoes[inicio:fim]:
+                if abs(self._valores[posicao] - valor) <= valor * self.tolerancia + 0.005:
+                    yield posicao
+
+    def sugerir(self, transacao: Dict, limite: int = MAX_SUGESTOES) -> List[Dict]:
+        """
+        Lançamentos sugeridos para uma transação do extrato, do mais provável ao menos
+
+        Returns:
+            Lista de dicts do lançamento (valores JSON-safe) com score (0 a 1),
+            dias_diferenca, diferenca_valor e documento_confere
+        """
+        valor = abs(float(transacao.get('valor') or 0))
+        if not valor or not transacao.get('data'):
+            return []
+        ordinal = _ordinal(transacao['data'])
+        texto = f"{transacao.get('descricao') or ''} {transacao.get('memo') or ''}"
+        palavras_transacao = palavras(texto)
+        documentos_transacao = extrair_documentos(texto)
+
+        pontuados = []
+        for posicao in self._candidatos(transacao.get('conta_bancaria') or '',
+                                        _tipo_transacao(transacao), valor, ordinal):
+            diferenca_valor = abs(self._valores[posicao] - valor)
+            dias = abs(self._ordinais[posicao] - ordinal)
+            documento_confere = self._documentos[posicao] in documentos_transacao
+            score = (
+                PESO_VALOR * max(0.0, 1 - diferenca_valor / (valor * self.tolerancia))
+                + PESO_DATA * (1 - dias / (self.janela_dias + 1))
+                + PESO_TEXTO * similaridade(palavras_transacao, self._palavras[posicao])
+                + PESO_DOCUMENTO * documento_confere
+            )
+            pontuados.append((-score, dias, diferenca_valor, self._lancamentos[posicao]['id'], posicao,
+                              documento_confere))
+
+        pontuados.sort()
+        sugestoes = []
+        for score, dias, diferenca_valor, _, posicao, documento_confere in pontuados[:limite]:
+            sugestao = {k: _json(v) for k, v in self._lancamentos[posicao].items()}
+            sugestao.update({
+                'score': round(-score, 4),
+                'dias_diferenca': dias,
+                'diferenca_valor': round(diferenca_valor, 2),
+                'documento_confere': documento_confere,
+            })
+            sugestoes.append(sugestao)
+        return sugestoes
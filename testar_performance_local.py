@@ -48,11 +48,10 @@ print(f"   chave_inexistente: {valor_inexistente}")
 
 print("\n3. Estatísticas do cache:")
 stats = get_cache_stats()
-print(f"   Total de chaves: {stats['total_keys']}")
-print(f"   Chaves válidas: {stats['valid_keys']}")
-print(f"   Chaves expiradas: {stats['expired_keys']}")
+print(f"   Backend: {stats['backend']} ({stats['workers']} worker(s))")
+print(f"   Entradas no backend: {stats['cache_size']}")
+print(f"   Hits/misses: {stats['cache_hits']}/{stats['cache_misses']}")
 print(f"   Taxa de hit: {stats['hit_rate']:.2f}%")
-print(f"   Memória usada: {stats['memory_usage']}")
 
 print()
 print("=" * 80)
@@ -0,0 +1,118 @@
+"""
+Testes para auth_cache.py
+"""
+
+import pytest
+import auth_cache
+from auth_cache import (
+    obter_sessao,
+    obter_acesso_empresa,
+    invalidar_sessao_cache,
+    invalidar_usuario_cache,
+    invalidar_empresa_cache
+)
+
+
+@pytest.fixture(autouse=True)
+def cache_limpo():
+    invalidar_usuario_cache()
+    yield
+    invalidar_usuario_cache()
+
+
+def carregador(retorno):
+    chamadas = []
+
+    def carregar(*args):
+        chamadas.append(args)
+        return retorno
+
+    return carregar, chamadas
+
+
+class TestCacheSessao:
+    """Testes para obter_sessao()"""
+
+    def test_cache_e_logout(self):
+        carregar, chamadas = carregador({'usuario_id': 1, 'empresas': [1]})
+        obter_sessao('tok', carregar)
+        obter_sessao('tok', carregar)
+        assert len(chamadas) == 1
+
+        invalidar_sessao_cache('tok')
+        obter_sessao('tok', carregar)
+        assert len(chamadas) == 2
+
+    def test_sessao_invalida_nao_cacheada(self):
+        carregar, chamadas = carregador(None)
+        assert obter_sessao('tok', carregar) is None
+        assert obter_sessao('tok', carregar) is None
+        assert len(chamadas) == 2
+
+    def test_retorna_copia(self):
+        carregar, _ = carregador({'usuario_id': 1})
+        obter_sessao('tok', carregar)['usuario_id'] = 99
+        assert obter_sessao('tok', carregar)['usuario_id'] == 1
+
+    def test_ttl(self, monkeypatch):
+        carregar, chamadas = carregador({'usuario_id': 1})
+        obter_sessao('tok', carregar)
+        monkeypatch.setattr(auth_cache, '_CACHE_TIMEOUT', 0)
+        obter_sessao('tok', carregar)
+        assert len(chamadas) == 2
+
+
+class TestCacheAcesso:
+    """Testes para obter_acesso_empresa()"""
+
+    def test_chave_usuario_empresa(self):
+        carregar, chamadas = carregador({'tem_acesso': True, 'permissoes': ['a']})
+        obter_acesso_empresa(1, 10, carregar)
+        obter_acesso_empresa(1, 10, carregar)
+        obter_acesso_empresa(1, 20, carregar)
+        assert chamadas == [(1, 10), (1, 20)]
+
+    def test_permissoes_retornam_copia(self):
+        carregar, _ = carregador({'tem_acesso': True, 'permissoes': ['a']})
+        obter_acesso_empresa(1, 10, carregar)['permissoes'].append('b')
+        assert obter_acesso_empresa(1, 10, carregar)['permissoes'] == ['a']
+
+    def test_suspensao_da_empresa(self):
+        carregar, chamadas = carregador({'tem_acesso': True, 'permissoes': []})
+        obter_acesso_empresa(1, 10, carregar)
+        obter_acesso_empresa(2, 10, carregar)
+        obter_acesso_empresa(1, 20, carregar)
+
+        invalidar_empresa_cache(10)
+        obter_acesso_empresa(1, 10, carregar)
+        obter_acesso_empresa(2, 10, carregar)
+        obter_acesso_empresa(1, 20, carregar)
+        assert len(chamadas) == 5
+
+    def test_alteracao_do_usuario(self):
+        sessao, chamadas_sessao = carregador({'usuario_id': 1})
+        acesso, chamadas_acesso = carregador({'tem_acesso': True, 'permissoes': []})
+        obter_sessao('tok1', sessao)
+        obter_acesso_empresa(1, 10, acesso)
+        obter_acesso_empresa(2, 10, acesso)
+
+        invalidar_usuario_cache(1)
+        obter_sessao('tok1', sessao)
+        obter_acesso_empresa(1, 10, acesso)
+        obter_acesso_empresa(2, 10, acesso)
+        assert len(chamadas_sessao) == 2
+        assert chamadas_acesso == [(1, 10), (2, 10), (1, 10)]
+
+    def test_invalidacao_durante_carga_nao_grava(self):
+        """Resultado carregado antes de uma invalidação não entra no cache"""
+        chamadas = []
+
+        def carregar(usuario_id, empresa_id):
+            chamadas.append(1)
+            if len(chamadas) == 1:
+                invalidar_empresa_cache(empresa_id)
+            return {'tem_acesso': True, 'permissoes': []}
+
+        obter_acesso_empresa(1, 10, carregar)
+        obter_acesso_empresa(1, 10, carregar)
+        assert len(chamadas) == 2
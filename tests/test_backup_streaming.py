@@ -0,0 +1,207 @@
+"""
+Testes do backup em streaming (backup_email.py) sem banco
+"""
+
+import json
+import zipfile
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+import backup_email
+
+
+def coluna(tabela, nome, tipo='integer'):
+    return {'table_name': tabela, 'column_name': nome, 'data_type': tipo}
+
+
+ESTRUTURA = backup_email._estrutura_tabelas([
+    coluna('usuarios', 'id'), coluna('usuarios', 'username', 'character varying'),
+    coluna('usuarios', 'password_hash', 'character varying'),
+    coluna('usuarios', 'created_at', 'timestamp without time zone'),
+    coluna('usuarios', 'updated_at', 'timestamp without time zone'),
+    coluna('lancamentos', 'id'), coluna('lancamentos', 'empresa_id'),
+    coluna('lancamentos', 'valor', 'numeric'), coluna('lancamentos', 'data_vencimento', 'date'),
+    coluna('lancamentos', 'atualizado_em', 'timestamp with time zone'),
+    coluna('permissoes', 'codigo', 'character varying'),
+    coluna('transacoes_extrato', 'id'), coluna('transacoes_extrato', 'created_at', 'timestamp without time zone'),
+    coluna('contratos', 'id'), coluna('contratos', 'updated_at', 'timestamp without time zone'),
+], [
+    {'table_name': 'usuarios', 'fonte': 'BEGIN NEW.updated_at = CURRENT_TIMESTAMP; RETURN NEW; END;'},
+    {'table_name': 'lancamentos', 'fonte': 'begin new.atualizado_em := now(); return new; end'},
+    {'table_name': 'contratos', 'fonte': 'BEGIN NEW.versao := OLD.versao + 1; RETURN NEW; END;'},
+])
+
+
+class CursorFalso:
+    """fetchmany sobre uma lista, registrando o tamanho de cada lote pedido"""
+
+    def __init__(self, linhas):
+        self.linhas = list(linhas)
+        self.lotes = []
+        self.executados = []
+
+    def execute(self, sql, params=None):
+        self.executados.append(sql)
+
+    def fetchmany(self, tamanho):
+        self.lotes.append(tamanho)
+        lote, self.linhas = self.linhas[:tamanho], self.linhas[tamanho:]
+        return lote
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class TestConsultas:
+    """Colunas, máscara e filtro incremental"""
+
+    def test_coluna_de_alteracao_por_preferencia(self):
+        assert ESTRUTURA['usuarios']['alteracao'] == 'updated_at'
+        assert ESTRUTURA['lancamentos']['alteracao'] == 'atualizado_em'
+        assert ESTRUTURA['permissoes']['alteracao'] is None
+
+    def test_so_coluna_mantida_por_trigger(self):
+        # created_at não muda no UPDATE; updated_at sem trigger depende de cada UPDATE lembrar dela
+        assert ESTRUTURA['transacoes_extrato']['alteracao'] is None
+        assert ESTRUTURA['contratos']['alteracao'] is None
+
+    def test_senha_mascarada_no_proprio_select(self):
+        sql, params, incremental = backup_email._montar_consulta('usuarios', ESTRUTURA['usuarios'])
+        assert sql == ('SELECT "id", "username", \'*** REDACTED ***\' AS "password_hash", "created_at", '
+                       '"updated_at" FROM "usuarios" ORDER BY id')
+        assert params == [] and incremental is False
+
+    def test_incremental_filtra_empresa_e_alteracao(self):
+        desde = datetime(2026, 10, 15, 23, 55)
+        sql, params, incremental = backup_email._montar_consulta(
+            'lancamentos', ESTRUTURA['lancamentos'], empresa_id=4, desde=desde)
+        assert sql.endswith('FROM "lancamentos" WHERE empresa_id = %s '
+                            'AND ("atualizado_em" > %s OR "atualizado_em" IS NULL) ORDER BY id')
+        assert params == [4, desde] and incremental is True
+
+        # Sem coluna de alteração a tabela vai completa
+        sql, params, incremental = backup_email._montar_consulta('permissoes', ESTRUTURA['permissoes'], desde=desde)
+        assert sql == 'SELECT "codigo" FROM "permissoes"' and incremental is False
+
+
+class TestEscrita:
+    """Membros do ZIP gravados lote a lote"""
+
+    def test_jsonl_em_lotes_direto_no_zip(self, tmp_path):
+        linhas = [{'id': i, 'valor': Decimal('10.50'), 'data': datetime(2026, 1, i)} for i in range(1, 6)]
+        cursor = CursorFalso(linhas)
+        caminho = tmp_path / 'b.zip'
+        with zipfile.ZipFile(caminho, 'w', zipfile.ZIP_DEFLATED) as zf:
+            with zf.open('empresa_1/lancamentos.jsonl', 'w', force_zip64=True) as destino:
+                assert backup_email._escrever_jsonl(cursor, destino, linhas_por_lote=2) == 5
+
+        assert cursor.lotes == [2, 2, 2, 2]
+        with zipfile.ZipFile(caminho) as zf:
+            registros = [json.loads(l) for l in zf.read('empresa_1/lancamentos.jsonl').decode().splitlines()]
+        assert registros[0] == {'id': 1, 'valor': '10.50', 'data': '2026-01-01T00:00:00'}
+        assert [r['id'] for r in registros] == [1, 2, 3, 4, 5]
+
+    def test_tabela_com_erro_volta_ao_savepoint(self, tmp_path):
+        comandos = []
+
+        class Controle(CursorFalso):
+            def execute(self, sql, params=None):
+                comandos.append(sql)
+
+        class CursorQuebrado(CursorFalso):
+            def execute(self, sql, params=None):
+                raise RuntimeError('coluna inexistente')
+
+        class Conexao:
+            def cursor(self, name=None, cursor_factory=None):
+                return CursorQuebrado([]) if name else Controle([])
+
+        with zipfile.ZipFile(tmp_path / 'b.zip', 'w') as zf:
+            with pytest.raises(RuntimeError):
+                backup_email._exportar_tabela(Conexao(), zf, 'x/t.jsonl', 'SELECT 1', [], 'jsonl', 1)
+            assert zf.namelist() == []
+        assert comandos == ['SAVEPOINT backup_tabela', 'ROLLBACK TO SAVEPOINT backup_tabela']
+
+    def test_formato_invalido(self, tmp_path):
+        with pytest.raises(ValueError):
+            backup_email.gerar_backup_arquivo(tmp_path / 'b.zip', formato='xml')
+
+
+class ConexaoBackupFalsa:
+    """psycopg2.connect() do backup: responde às consultas de estrutura e registra o resto"""
+
+    def __init__(self, tabela_quebrada=None):
+        self.tabela_quebrada = tabela_quebrada
+        self.comandos = []
+        self.autocommit = False
+
+    def cursor(self, name=None, cursor_factory=None):
+        conexao = self
+
+        class Cursor(CursorFalso):
+            def execute(self, sql, params=None):
+                sql = ' '.join(sql.split())
+                conexao.comandos.append(sql)
+                if name and conexao.tabela_quebrada and f'FROM "{conexao.tabela_quebrada}"' in sql:
+                    raise RuntimeError('permission denied')
+                if 'MAX(marca_dagua)' in sql:
+                    self.linhas = [{'marca': datetime(2026, 10, 16, 12, 0)}]
+                elif 'transaction_timestamp' in sql:
+                    self.linhas = [{'marca': datetime(2026, 10, 17, 12, 0)}]
+                elif 'information_schema.columns' in sql:
+                    self.linhas = [coluna('clientes', 'id'), coluna('empresas', 'id')]
+                elif 'FROM empresas' in sql and not name:
+                    self.linhas = [{'id': 1, 'razao_social': 'Alfa', 'nome_fantasia': None}]
+                else:
+                    self.linhas = []
+
+            def fetchone(self):
+                return self.linhas[0] if self.linhas else None
+
+            def fetchall(self):
+                return self.linhas
+
+        return Cursor([])
+
+    def set_session(self, **kwargs):
+        if 'autocommit' in kwargs:
+            self.autocommit = kwargs['autocommit']
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class TestMarcaDagua:
+    """A marca d'água só avança quando todas as tabelas foram exportadas"""
+
+    @pytest.fixture
+    def backup(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(backup_email, 'TABELAS_POR_EMPRESA', ['clientes'])
+        monkeypatch.setattr(backup_email, 'TABELAS_GLOBAIS', ['empresas'])
+
+        def gerar(conexao):
+            monkeypatch.setattr(backup_email.psycopg2, 'connect', lambda url: conexao)
+            info = backup_email.gerar_backup_arquivo(tmp_path / 'b.zip', incremental=True)
+            return info, [c for c in conexao.comandos if c.startswith('INSERT INTO backup_execucoes')]
+        return gerar
+
+    def test_backup_sem_erros_registra_marca(self, backup):
+        info, registros = backup(ConexaoBackupFalsa())
+        assert info['modo'] == 'incremental' and info['tabelas_com_erro'] == []
+        assert len(registros) == 1
+
+    def test_tabela_com_erro_nao_registra_marca(self, backup):
+        info, registros = backup(ConexaoBackupFalsa(tabela_quebrada='clientes'))
+        assert info['tabelas_com_erro'] == ['empresa_1_Alfa/clientes']
+        assert registros == []
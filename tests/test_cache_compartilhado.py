@@ -0,0 +1,186 @@
+"""
+Testes para cache_compartilhado.py e o backend em memória do cache_manager
+"""
+
+import os
+import time
+
+import pytest
+
+import cache_manager
+from app.utils import cache_manager as cache_app
+from cache_compartilhado import CacheCompartilhado, diretorio_padrao
+from cache_manager import LRUCache, cached
+
+
+@pytest.fixture
+def workers(tmp_path):
+    """Dois 'workers' apontando para o mesmo diretório compartilhado"""
+    return CacheCompartilhado(str(tmp_path)), CacheCompartilhado(str(tmp_path))
+
+
+class TestCacheCompartilhado:
+    """Testes para CacheCompartilhado"""
+
+    def test_entrada_vista_por_outro_worker(self, workers):
+        a, b = workers
+        a.set(1, 'listar', (1,), {}, ['x'])
+        assert b.get(1, 'listar', (1,), {}) == (True, ['x'])
+        assert b.get(2, 'listar', (1,), {}) == (False, None)
+
+    def test_invalidacao_propagada(self, workers):
+        a, b = workers
+        a.set(1, 'listar', (1,), {}, ['x'])
+        a.set(2, 'listar', (2,), {}, ['y'])
+        b.invalidate_empresa(1)
+        assert a.get(1, 'listar', (1,), {}) == (False, None)
+        assert a.get(2, 'listar', (2,), {}) == (True, ['y'])
+
+    def test_invalidacao_por_tag(self, workers):
+        a, b = workers
+        a.set(1, 'listar_clientes', (1,), {}, 'c', tags=('clientes',))
+        a.set(1, 'listar_contas', (1,), {}, 'k', tags=('contas',))
+        b.invalidate_empresa(1, 'clientes')
+        assert a.get(1, 'listar_clientes', (1,), {})[0] is False
+        assert a.get(1, 'listar_contas', (1,), {})[0] is True
+
+    def test_valor_calculado_antes_da_invalidacao(self, workers):
+        a, b = workers
+        inicio = time.time()
+        b.invalidate_empresa(1)
+        a.set(1, 'listar', (1,), {}, 'velho', inicio=inicio - 1)
+        assert a.get(1, 'listar', (1,), {}) == (False, None)
+
+    def test_estatisticas_somadas(self, workers):
+        a, b = workers
+        b.PUBLICAR_STATS_A_CADA = 0  # publica a cada operação
+        a.set(1, 'listar', (1,), {}, 'x')
+        a.get(1, 'listar', (1,), {})
+        b.get(1, 'listar', (1,), {})
+        b.get(1, 'outra', (1,), {})
+        stats = a.get_stats()
+        assert stats['workers'] == 2
+        assert (stats['hits'], stats['misses']) == (2, 1)
+        assert stats['per_empresa'][1]['hit_rate'] == pytest.approx(66.67)
+
+    def test_limite_de_tamanho(self, tmp_path):
+        cache = CacheCompartilhado(str(tmp_path), max_size=3)
+        cache.VERIFICAR_TAMANHO_A_CADA = 1
+        for i in range(5):
+            cache.set(1, 'f', (i,), {}, i)
+        assert cache.get_stats()['cache_size'] == 3
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='permissões POSIX')
+class TestDiretorioSeguro:
+    """Diretório que outro usuário possa gravar nunca é usado (entradas em pickle)"""
+
+    def test_diretorio_criado_privado(self, tmp_path):
+        cache = CacheCompartilhado(str(tmp_path / 'novo'))
+        for caminho in (cache.diretorio, cache._dir_entradas):
+            assert os.stat(caminho).st_mode & 0o777 == 0o700
+        assert os.path.basename(diretorio_padrao()) == f'dwm_cache-{os.getuid()}'
+
+    def test_recusa_diretorio_aberto_ou_link(self, tmp_path):
+        aberto = tmp_path / 'aberto'
+        aberto.mkdir()
+        aberto.chmod(0o777)
+        with pytest.raises(PermissionError):
+            CacheCompartilhado(str(aberto))
+
+        privado = tmp_path / 'privado'
+        privado.mkdir(mode=0o700)
+        (privado / 'entradas').mkdir(mode=0o755)
+        with pytest.raises(PermissionError):
+            CacheCompartilhado(str(privado))
+
+        alvo = tmp_path / 'alvo'
+        alvo.mkdir(mode=0o700)
+        (tmp_path / 'link').symlink_to(alvo)
+        with pytest.raises(PermissionError):
+            CacheCompartilhado(str(tmp_path / 'link'))
+
+    @pytest.mark.skipif(not hasattr(os, 'getuid') or os.getuid() != 0, reason='chown exige root')
+    def test_recusa_diretorio_de_outro_usuario(self, tmp_path):
+        alheio = tmp_path / 'alheio'
+        alheio.mkdir(mode=0o700)
+        os.chown(alheio, 12345, 12345)
+        with pytest.raises(PermissionError):
+            CacheCompartilhado(str(alheio))
+
+    def test_backend_cai_para_memoria(self, tmp_path, monkeypatch):
+        aberto = tmp_path / 'aberto'
+        aberto.mkdir()
+        aberto.chmod(0o777)
+        monkeypatch.setenv('CACHE_BACKEND', 'compartilhado')
+        monkeypatch.setenv('CACHE_DIR', str(aberto))
+        cache = cache_manager.criar_cache_global()
+        assert type(cache) is LRUCache
+        assert os.listdir(aberto) == []
+
+
+class TestCacheApp:
+    """app/utils/cache_manager sobre o backend global"""
+
+    def test_chaves_e_decorator_compartilhados_entre_workers(self, tmp_path, monkeypatch):
+        a, b = CacheCompartilhado(str(tmp_path)), CacheCompartilhado(str(tmp_path))
+        chamadas = []
+
+        @cache_app.cached(ttl=60, prefix='dashboard')
+        def dashboard(usuario_id):
+            chamadas.append(usuario_id)
+            return {'usuario': usuario_id}
+
+        monkeypatch.setattr(cache_manager, '_global_cache', a)
+        cache_app.set_cached('chave', [1, 2])
+        assert dashboard(7) == {'usuario': 7}
+
+        monkeypatch.setattr(cache_manager, '_global_cache', b)
+        assert cache_app.get_cached('chave') == [1, 2]
+        assert dashboard(7) == {'usuario': 7} and chamadas == [7]
+
+        cache_app.invalidate_cache('dashboard')
+        monkeypatch.setattr(cache_manager, '_global_cache', a)
+        assert cache_app.get_cached('chave') == [1, 2]
+        dashboard(7)
+        assert chamadas == [7, 7]
+
+        cache_app.invalidate_cache()
+        assert cache_app.get_cached('chave') is None
+
+    def test_nao_mistura_com_cache_das_empresas(self, monkeypatch):
+        cache = LRUCache()
+        monkeypatch.setattr(cache_manager, '_global_cache', cache)
+        cache.set(1, 'listar', (1,), {}, 'empresa 1')
+        cache_app.set_cached('listar', 'app')
+        cache_app.invalidate_cache()
+        assert cache.get(1, 'listar', (1,), {}) == (True, 'empresa 1')
+        stats = cache_app.get_cache_stats()
+        assert (stats['cache_hits'], stats['cache_misses'], stats['backend']) == (0, 0, 'memoria')
+
+
+class TestLRUCache:
+    """Testes do backend em memória"""
+
+    def test_invalidacao_da_empresa(self):
+        cache = LRUCache()
+        cache.set(1, 'f', (1,), {}, 'a')
+        cache.set(2, 'f', (2,), {}, 'b')
+        cache.invalidate_empresa(1)
+        assert cache.get(1, 'f', (1,), {}) == (False, None)
+        assert cache.get(2, 'f', (2,), {}) == (True, 'b')
+
+    def test_decorator_nao_grava_resultado_invalidado(self):
+        cache = LRUCache()
+        chamadas = []
+
+        @cached(cache_instance=cache)
+        def listar(empresa_id):
+            chamadas.append(1)
+            if len(chamadas) == 1:
+                cache.invalidate_empresa(empresa_id)
+            return len(chamadas)
+
+        assert listar(1) == 1
+        assert listar(1) == 2
+        assert listar(1) == 2
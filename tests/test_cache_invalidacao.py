@@ -0,0 +1,66 @@
+"""
+Testes para cache_invalidacao.py
+"""
+
+import pytest
+from psycopg2.extras import RealDictCursor
+
+import cache_manager
+from cache_invalidacao import (
+    _CursorRastreado,
+    _fabrica_rastreada,
+    invalidar_tabelas,
+    tabelas_escritas
+)
+from cache_manager import LRUCache
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = LRUCache()
+    monkeypatch.setattr(cache_manager, '_global_cache', cache)
+    return cache
+
+
+class TestTabelasEscritas:
+    """Testes para tabelas_escritas()"""
+
+    @pytest.mark.parametrize('sql, esperado', [
+        ("INSERT INTO contas_bancarias (nome) VALUES (%s)", {'contas_bancarias'}),
+        ("update public.\"clientes\" set ativo = false", {'clientes'}),
+        ("DELETE FROM categorias WHERE UPPER(TRIM(nome)) = %s", {'categorias'}),
+        ("UPDATE categorias SET nome = %s; UPDATE lancamentos SET categoria = %s", {'categorias'}),
+        ("SELECT * FROM contas_bancarias", set()),
+        ("INSERT INTO lancamentos (descricao) VALUES ('UPDATE clientes')", {'clientes'}),
+    ])
+    def test_deteccao(self, sql, esperado):
+        assert tabelas_escritas(sql) == esperado
+
+    def test_fabrica_rastreada(self):
+        fabrica = _fabrica_rastreada(RealDictCursor)
+        assert issubclass(fabrica, _CursorRastreado) and issubclass(fabrica, RealDictCursor)
+        assert _fabrica_rastreada(fabrica) is fabrica
+        assert _fabrica_rastreada(RealDictCursor) is fabrica
+
+
+class TestInvalidarTabelas:
+    """Testes para invalidar_tabelas()"""
+
+    def popular(self, cache):
+        for empresa_id in (1, 2):
+            cache.set(empresa_id, 'listar_contas', (empresa_id,), {}, 'contas', tags=('listar_contas',))
+            cache.set(empresa_id, 'listar_clientes', (empresa_id,), {}, 'clientes', tags=('listar_clientes',))
+
+    def test_invalida_so_funcoes_dependentes_da_empresa(self, cache):
+        self.popular(cache)
+        invalidar_tabelas(1, {'contas_bancarias'})
+        assert cache.get(1, 'listar_contas', (1,), {})[0] is False
+        assert cache.get(1, 'listar_clientes', (1,), {})[0] is True
+        assert cache.get(2, 'listar_contas', (2,), {})[0] is True
+
+    def test_sem_empresa_invalida_todas(self, cache):
+        self.popular(cache)
+        invalidar_tabelas(None, {'contas_bancarias'})
+        assert cache.get(1, 'listar_contas', (1,), {})[0] is False
+        assert cache.get(2, 'listar_contas', (2,), {})[0] is False
+        assert cache.get(2, 'listar_clientes', (2,), {})[0] is True
@@ -0,0 +1,162 @@
+"""
+Testes da conciliação geral em lote (extrato_functions.conciliar_transacoes_lote)
+"""
+
+from contextlib import contextmanager
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+import extrato_functions
+from extrato_functions import conciliar_transacoes_lote
+
+
+class CursorFalso:
+    """Responde às leituras do lote e registra o resto"""
+
+    def __init__(self, banco):
+        self.banco = banco
+        self.resultado = []
+
+    def execute(self, query, params=None):
+        query = ' '.join(query.split())
+        self.banco.comandos.append(query)
+        if self.banco.falhar_em and self.banco.falhar_em in query:
+            raise RuntimeError(f'falha em {self.banco.falhar_em}')
+        if 'FROM transacoes_extrato' in query and query.startswith('SELECT'):
+            self.resultado = [t for t in self.banco.transacoes if t['id'] in params[0]]
+        elif 'FROM contas_bancarias' in query:
+            self.resultado = self.banco.contas
+        elif 'nextval' in query:
+            self.resultado = [{'id': 500 + i} for i in range(params[0])]
+        else:
+            self.resultado = []
+
+    def fetchall(self):
+        return self.resultado
+
+    def close(self):
+        pass
+
+
+class BancoFalso:
+    RealDictCursor = object()
+
+    def __init__(self, transacoes, contas=None, falhar_em=None):
+        self.transacoes = transacoes
+        self.contas = contas if contas is not None else [{'nome': 'BB', 'ativa': True}]
+        self.falhar_em = falhar_em
+        self.comandos = []
+        self.lotes = {}
+        self.conexoes = 0
+        self.autocommit = True
+        self.commits = 0
+        self.rollbacks = 0
+
+    @contextmanager
+    def get_db_connection(self, empresa_id=None, allow_global=False):
+        self.conexoes += 1
+        yield self
+
+    def cursor(self, cursor_factory=None):
+        return CursorFalso(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+@pytest.fixture(autouse=True)
+def execute_values_gravador(monkeypatch):
+    def execute_values(cursor, query, linhas, template=None, page_size=100):
+        tabela = next(t for t in ('lancamentos', 'conciliacoes', 'transacoes_extrato') if t in query)
+        if cursor.banco.falhar_em == tabela:
+            raise RuntimeError(f'falha em {tabela}')
+        cursor.banco.lotes[tabela] = list(linhas)
+    monkeypatch.setattr(extrato_functions, 'execute_values', execute_values)
+
+
+def transacao(id, valor, tipo='DEBITO', descricao='PIX ENVIADO', conta='BB'):
+    return {'id': id, 'valor': Decimal(valor), 'tipo': tipo, 'descricao': descricao,
+            'data': date(2026, 10, id), 'conta_bancaria': conta,
+            'categoria': None, 'subcategoria': None, 'pessoa': None}
+
+
+class TestConciliarTransacoesLote:
+    """Uma transação para o pedido inteiro e erros por item"""
+
+    def test_lote_em_uma_unica_transacao(self):
+        banco = BancoFalso([transacao(1, '-80.00', descricao='PIX 123.456.789-01'),
+                            transacao(2, '250.00', tipo='CREDITO')])
+        resultado = conciliar_transacoes_lote(
+            banco, 7,
+            [{'transacao_id': 1, 'categoria': 'Fornecedores'},
+             {'transacao_id': '2', 'descricao': 'Recebimento contrato', 'razao_social': 'Cliente SA'}],
+            fornecedores_por_documento={'12345678901': 'João Serviços'})
+
+        assert resultado == {'success': True, 'criados': 2, 'erros': [], 'lancamentos': {1: 500, 2: 501}}
+        assert banco.conexoes == 1 and banco.commits == 1 and banco.rollbacks == 0
+        assert banco.autocommit is False
+
+        lancamentos = banco.lotes['lancamentos']
+        assert [(l[0], l[2], l[4], l[7], l[11]) for l in lancamentos] == [
+            (500, 'despesa', 80.0, 'pago', 'João Serviços'),
+            (501, 'receita', 250.0, 'pago', 'Cliente SA'),
+        ]
+        assert lancamentos[1][3] == 'Recebimento contrato'
+        assert banco.lotes['conciliacoes'] == [(7, 1, 500), (7, 2, 501)]
+        # Escolhas do usuário voltam para o extrato; campo vazio mantém o atual
+        assert banco.lotes['transacoes_extrato'] == [(1, 7, 'Fornecedores', None, 'João Serviços'),
+                                                     (2, 7, None, None, 'Cliente SA')]
+
+    def test_erros_por_item_nao_impedem_os_demais(self):
+        banco = BancoFalso([transacao(1, '-10.00'), transacao(2, '-20.00', conta='ITAU'),
+                            transacao(3, '-30.00', conta='SICOOB')],
+                           contas=[{'nome': 'BB', 'ativa': True}, {'nome': 'ITAU', 'ativa': False}])
+        resultado = conciliar_transacoes_lote(banco, 7, [
+            {'transacao_id': 1}, {'transacao_id': 1}, {'transacao_id': 'x'},
+            {'transacao_id': 2}, {'transacao_id': 3}, {'transacao_id': 9},
+        ])
+
+        assert resultado['success'] is True and resultado['criados'] == 1
+        assert resultado['lancamentos'] == {1: 500}
+        erros = resultado['erros']
+        assert erros[0] == 'Transação 1: enviada mais de uma vez na mesma conciliação'
+        assert erros[1] == 'Transação x não encontrada'
+        assert erros[2].startswith("Transação 2: A conta bancária 'ITAU' está inativa")
+        assert erros[3].startswith("Transação 3: A conta bancária 'SICOOB' não está cadastrada")
+        assert erros[4] == 'Transação 9 não encontrada'
+        assert banco.commits == 1
+
+    def test_nenhum_item_valido_nao_grava(self):
+        banco = BancoFalso([])
+        resultado = conciliar_transacoes_lote(banco, 7, [{'transacao_id': 9}])
+        assert resultado == {'success': False, 'criados': 0, 'erros': ['Transação 9 não encontrada'],
+                             'lancamentos': {}}
+        assert banco.commits == 0 and banco.rollbacks == 1 and 'lancamentos' not in banco.lotes
+
+        assert conciliar_transacoes_lote(banco, 7, [{'transacao_id': None}])['erros'] == \
+            ['Transação None não encontrada']
+        assert banco.conexoes == 1
+
+    def test_falha_em_um_passo_desfaz_o_lote_inteiro(self):
+        banco = BancoFalso([transacao(1, '-10.00'), transacao(2, '-20.00')], falhar_em='conciliacoes')
+        resultado = conciliar_transacoes_lote(banco, 7, [{'transacao_id': 1}, {'transacao_id': 2}])
+
+        # Os lançamentos já enviados não sobrevivem: rollback e nenhum commit
+        assert 'lancamentos' in banco.lotes
+        assert banco.rollbacks == 1 and banco.commits == 0
+        assert resultado == {
+            'success': False, 'criados': 0, 'lancamentos': {},
+            'erros': ['Erro na transação 1: falha em conciliacoes', 'Erro na transação 2: falha em conciliacoes'],
+        }
+
+    def test_falha_no_historico_nao_desfaz_a_conciliacao(self):
+        banco = BancoFalso([transacao(1, '-10.00')], falhar_em='INSERT INTO historico_conciliacoes')
+        resultado = conciliar_transacoes_lote(banco, 7, [{'transacao_id': 1}])
+        assert resultado['success'] is True and resultado['criados'] == 1
+        assert 'ROLLBACK TO SAVEPOINT historico_lote' in banco.comandos
+        assert banco.commits == 1 and banco.rollbacks == 0
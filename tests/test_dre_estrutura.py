@@ -0,0 +1,121 @@
+"""
+Testes para a montagem do DRE em relatorios_contabeis_functions.py
+"""
+
+import pytest
+from datetime import date
+from relatorios_contabeis_functions import (
+    _separar_secoes_dre,
+    _montar_estrutura_dre,
+    dre_mensal_agregado_disponivel,
+    gerar_evolucao_mensal_dre,
+    resumir_mes_dre
+)
+
+
+CONTAS = [
+    {'codigo': '4.1.01', 'descricao': 'Vendas', 'valor': 1000},
+    {'codigo': '4.9.01', 'descricao': 'Impostos s/ vendas', 'valor': -100},
+    {'codigo': '5.1.01', 'descricao': 'CMV', 'valor': -300},
+    {'codigo': '6.1.01', 'descricao': 'Aluguel', 'valor': -200},
+    {'codigo': '6.1.02', 'descricao': 'Zerada', 'valor': 0},
+    {'codigo': '7.1.01', 'descricao': 'Rendimentos', 'valor': 50},
+    {'codigo': '7.2.01', 'descricao': 'Juros', 'valor': -30},
+    {'codigo': '2.1.01', 'descricao': 'Fora do DRE', 'valor': 999},
+]
+
+
+class TestSepararSecoesDre:
+    """Testes para _separar_secoes_dre()"""
+
+    def test_prefixos_iguais_aos_filtros_like(self):
+        secoes = _separar_secoes_dre(CONTAS)
+        assert [i['codigo'] for i in secoes['receitas_brutas']] == ['4.1.01']
+        assert [i['codigo'] for i in secoes['deducoes']] == ['4.9.01']
+        assert [i['codigo'] for i in secoes['custos']] == ['5.1.01']
+        assert [i['codigo'] for i in secoes['despesas_operacionais']] == ['6.1.01']
+        assert [i['codigo'] for i in secoes['receitas_financeiras']] == ['7.1.01']
+        assert [i['codigo'] for i in secoes['despesas_financeiras']] == ['7.2.01']
+
+    def test_valores_absolutos(self):
+        secoes = _separar_secoes_dre(CONTAS)
+        assert secoes['custos'][0]['valor'] == 300
+
+
+class TestMontarEstruturaDre:
+    """Testes para _montar_estrutura_dre()"""
+
+    def test_resultados(self):
+        dre = _montar_estrutura_dre(**_separar_secoes_dre(CONTAS))
+        assert dre['receita_bruta']['total'] == 1000
+        assert dre['receita_liquida']['total'] == 900
+        assert dre['lucro_bruto']['total'] == 600
+        assert dre['resultado_operacional']['total'] == 400
+        assert dre['resultado_financeiro']['total'] == 20
+        assert dre['lucro_liquido']['total'] == 420
+        assert dre['lucro_liquido']['percentual'] == pytest.approx(42.0)
+
+    def test_mes_sem_movimento(self):
+        dre = _montar_estrutura_dre(**_separar_secoes_dre([]))
+        assert dre['lucro_liquido']['total'] == 0
+        assert dre['lucro_liquido']['percentual'] == 0
+
+
+def test_resumir_mes_dre():
+    dre = _montar_estrutura_dre(**_separar_secoes_dre(CONTAS))
+    resumo = resumir_mes_dre(date(2026, 3, 1), dre)
+    assert resumo['mes'] == '03/2026'
+    assert resumo['despesas'] == 500
+    assert resumo['lucro_liquido'] == 420
+
+
+class CursorDict:
+    """Linhas como dict, igual ao RealDictCursor das conexões do pool"""
+
+    def __init__(self, conexao):
+        self.conexao = conexao
+        self.linhas = []
+
+    def execute(self, query, params=None):
+        if 'to_regclass' in query:
+            self.linhas = [{'existe': self.conexao.agregado}]
+        else:
+            self.linhas = self.conexao.linhas
+
+    def fetchone(self):
+        return self.linhas[0]
+
+    def fetchall(self):
+        return self.linhas
+
+    def close(self):
+        pass
+
+
+class ConexaoDict:
+    def __init__(self, agregado, linhas=()):
+        self.agregado = agregado
+        self.linhas = list(linhas)
+
+    def cursor(self, cursor_factory=None):
+        return CursorDict(self)
+
+
+class TestEvolucaoMensalDre:
+    """Leitura do agregado mensal com linhas em dict"""
+
+    def test_agregado_disponivel(self):
+        assert dre_mensal_agregado_disponivel(ConexaoDict(True)) is True
+        assert dre_mensal_agregado_disponivel(ConexaoDict(False)) is False
+
+    def test_meses_do_agregado(self):
+        conexao = ConexaoDict(True, [
+            {'mes': date(2026, 1, 1), 'codigo': '4.1.01', 'descricao': 'Vendas', 'valor_total': 1000},
+            {'mes': date(2026, 1, 1), 'codigo': '6.1.01', 'descricao': 'Aluguel', 'valor_total': -200},
+        ])
+        resultado = gerar_evolucao_mensal_dre(conexao, 7, date(2026, 1, 15), date(2026, 2, 10))
+
+        assert resultado['success'] is True
+        assert [m['mes'] for m in resultado['meses']] == [date(2026, 1, 1), date(2026, 2, 1)]
+        assert resultado['meses'][0]['dre']['lucro_liquido']['total'] == 800
+        assert resultado['meses'][1]['dre']['lucro_liquido']['total'] == 0
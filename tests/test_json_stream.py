@@ -0,0 +1,154 @@
+"""
+Testes para app/utils/json_stream.py
+"""
+
+import gzip
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from flask import Flask
+
+from app.utils.json_stream import gerar_json, linhas_cursor, resposta_json_stream
+
+
+@pytest.fixture
+def app():
+    return Flask(__name__)
+
+
+class CursorFalso:
+    def __init__(self, conexao, linhas):
+        self.conexao = conexao
+        self.linhas = linhas
+        self.itersize = None
+
+    def execute(self, query, params=None):
+        assert not self.conexao.autocommit  # cursor nomeado exige transação
+        self.conexao.executou = True
+
+    def __iter__(self):
+        return iter(self.linhas)
+
+    def close(self):
+        self.conexao.cursor_fechado = True
+
+
+class ConexaoFalsa:
+    def __init__(self, linhas=(), autocommit=True):
+        self.autocommit = autocommit
+        self.linhas = list(linhas)
+        self.rollbacks = 0
+        self.nome_cursor = None
+
+    def cursor(self, name=None, cursor_factory=None):
+        self.nome_cursor = name
+        return CursorFalso(self, self.linhas)
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def texto(partes):
+    return ''.join(partes)
+
+
+class TestGerarJson:
+    """Testes da codificação em blocos"""
+
+    def test_objeto_com_tipos_do_banco(self):
+        linhas = [{'valor': Decimal('10.50'), 'data': date(2026, 10, 16)},
+                  {'valor': Decimal('-1'), 'data': datetime(2026, 1, 2, 3, 4, 5)}]
+        saida = json.loads(texto(gerar_json(iter(linhas), chave='transacoes', campos={'saldo_anterior': 5.0})))
+        assert saida == {
+            'saldo_anterior': 5.0,
+            'transacoes': [{'valor': 10.5, 'data': '2026-10-16'},
+                           {'valor': -1.0, 'data': '2026-01-02T03:04:05'}],
+            'total': 2,
+            'success': True
+        }
+
+    def test_blocos(self):
+        partes = list(gerar_json(({'i': i} for i in range(7)), linhas_por_bloco=3))
+        assert len(partes) == 5  # abertura + 3 blocos + fechamento
+        assert [l['i'] for l in json.loads(texto(partes))['data']] == list(range(7))
+
+    def test_vazio_e_array_puro(self):
+        assert json.loads(texto(gerar_json(iter([])))) == {'data': [], 'total': 0, 'success': True}
+        assert json.loads(texto(gerar_json(iter([1, 2]), chave=None))) == [1, 2]
+
+    def test_sem_total(self):
+        saida = json.loads(texto(gerar_json(iter([1]), campos={'total': 99}, chave_total=None)))
+        assert saida == {'total': 99, 'data': [1], 'success': True}
+
+    def test_erro_no_meio(self):
+        def linhas():
+            yield {'i': 1}
+            raise RuntimeError('conexão perdida')
+
+        saida = json.loads(texto(gerar_json(linhas())))
+        assert saida['success'] is False
+        assert saida['total'] == 1 and saida['error'] == 'conexão perdida'
+
+        # Array puro fica inválido em vez de parecer completo
+        with pytest.raises(json.JSONDecodeError):
+            json.loads(texto(gerar_json(linhas(), chave=None)))
+
+
+class TestRespostaJsonStream:
+    """Testes da Response Flask"""
+
+    def test_gzip_quando_aceito(self, app):
+        with app.test_request_context(headers={'Accept-Encoding': 'gzip, deflate'}):
+            resposta = resposta_json_stream(iter([{'a': Decimal('1.5')}]))
+            corpo = b''.join(resposta.response)
+        assert resposta.headers['Content-Encoding'] == 'gzip'
+        assert json.loads(gzip.decompress(corpo))['data'] == [{'a': 1.5}]
+
+    def test_sem_gzip(self, app):
+        with app.test_request_context():
+            resposta = resposta_json_stream(iter([]), chave=None)
+            corpo = b''.join(resposta.response)
+        assert 'Content-Encoding' not in resposta.headers
+        assert json.loads(corpo) == []
+
+    def test_erro_antes_da_primeira_linha_sobe(self, app):
+        def linhas():
+            raise ValueError('SQL inválido')
+            yield
+
+        with app.test_request_context(), pytest.raises(ValueError):
+            resposta_json_stream(linhas())
+
+    def test_fecha_gerador_de_linhas(self, app):
+        fechado = []
+
+        def linhas():
+            try:
+                yield from range(10)
+            finally:
+                fechado.append(True)
+
+        with app.test_request_context():
+            resposta = resposta_json_stream(linhas())
+            iterador = iter(resposta.response)
+            next(iterador)
+            resposta.close()  # cliente desconectou
+        assert fechado == [True]
+
+
+class TestLinhasCursor:
+    """Testes do cursor nomeado"""
+
+    def test_transacao_aberta_e_desfeita(self):
+        conn = ConexaoFalsa([{'id': 1}, {'id': 2}])
+        assert list(linhas_cursor(conn, 'SELECT 1')) == [{'id': 1}, {'id': 2}]
+        assert conn.nome_cursor.startswith('json_stream_')
+        assert conn.autocommit is True and conn.rollbacks == 1
+        assert conn.cursor_fechado
+
+    def test_transacao_do_chamador_preservada(self):
+        conn = ConexaoFalsa([{'id': 1}], autocommit=False)
+        list(linhas_cursor(conn, 'SELECT 1'))
+        assert conn.autocommit is False and conn.rollbacks == 0
@@ -0,0 +1,79 @@
+"""
+Testes para app/utils/livro_colunar.py
+"""
+
+from datetime import date, datetime
+from decimal import Decimal
+
+from app.utils.livro_colunar import (
+    LivroColunar, RECEITA, DESPESA, TRANSFERENCIA, PAGO, PENDENTE
+)
+
+
+def linha(id_, tipo, status, valor, vencimento, pagamento=None,
+          categoria=None, subcategoria=None, pessoa=None):
+    return (id_, tipo, status, Decimal(valor), vencimento, pagamento,
+            categoria, subcategoria, pessoa, None, f'lanc {id_}')
+
+
+def livro_exemplo():
+    return LivroColunar.de_linhas([
+        linha(1, 'receita', 'pago', '100.10', date(2026, 9, 5), date(2026, 9, 5), 'Vendas', 'Serviços', 'Ana'),
+        linha(2, 'RECEITA', 'pago', '50.20', date(2026, 10, 1), datetime(2026, 10, 2, 9), 'Vendas', 'Produtos', 'Ana'),
+        linha(3, 'despesa', 'pago', '30.00', date(2026, 10, 3), date(2026, 10, 3), None, None, 'Bia'),
+        linha(4, 'despesa', 'pendente', '40.00', date(2026, 10, 1)),
+        linha(5, 'receita', None, '70.00', date(2026, 11, 1)),
+        linha(6, 'transferencia', 'pendente', '999.00', date(2026, 10, 1)),
+        linha(7, 'desconhecido', 'pago', '1.00', date(2026, 10, 1)),
+    ])
+
+
+class TestConstrucao:
+    """Testes para LivroColunar.de_linhas()"""
+
+    def test_defaults_e_descartes(self):
+        livro = livro_exemplo()
+        assert len(livro) == 6  # tipo desconhecido descartado
+        assert livro.status[livro.ids == 5][0] == PENDENTE
+        assert livro.valor_centavos[livro.ids == 2][0] == 5020
+
+    def test_linhas_convertem_de_volta(self):
+        livro = livro_exemplo()
+        [l] = livro.linhas(livro.ids == 2)
+        assert l['data_pagamento'] == date(2026, 10, 2)
+        assert l['tipo'] == 'receita' and l['valor'] == 50.2 and l['pessoa'] == 'Ana'
+
+
+class TestAgregacoes:
+    """Testes para as agregações vetorizadas"""
+
+    def test_somar_por_tipo(self):
+        livro = livro_exemplo()
+        totais = livro.somar_por_tipo(livro.mascara(status=(PAGO,)))
+        assert totais == {RECEITA: 150.3, DESPESA: 30.0, TRANSFERENCIA: 0.0}
+
+    def test_vencidos(self):
+        livro = livro_exemplo()
+        m = livro.mascara(tipos=(RECEITA, DESPESA), status=(PENDENTE,), vencimento_antes=date(2026, 10, 16))
+        assert livro.ids[m].tolist() == [4]
+
+    def test_somar_por_grupos(self):
+        livro = livro_exemplo()
+        grupos = livro.somar_por(livro.mascara(status=(PAGO,)), 'tipo', 'categoria', 'subcategoria')
+        assert grupos == {
+            (RECEITA, 'Vendas', 'Serviços'): (100.1, 1),
+            (RECEITA, 'Vendas', 'Produtos'): (50.2, 1),
+            (DESPESA, '', ''): (30.0, 1),
+        }
+
+    def test_somar_por_mes(self):
+        livro = livro_exemplo()
+        pagos = livro.mascara(status=(PAGO,))
+        por_mes = livro.somar_por_mes(pagos, [(2026, 9), (2026, 10), (2026, 11)])
+        assert por_mes[RECEITA] == [100.1, 50.2, 0.0]
+        assert por_mes[DESPESA] == [0.0, 30.0, 0.0]
+
+    def test_pago_entre(self):
+        livro = livro_exemplo()
+        m = livro.mascara(pago_entre=(date(2026, 10, 1), date(2026, 10, 31)))
+        assert sorted(livro.ids[m].tolist()) == [2, 3]
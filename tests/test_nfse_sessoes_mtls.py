@@ -0,0 +1,72 @@
+"""
+Testes do cache de sessões mTLS por certificado em nfse_service.py
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.serialization import pkcs12
+from cryptography.x509.oid import NameOID
+
+import nfse_service
+from nfse_service import NFSeAmbienteNacional, obter_sessao_mtls, obter_sessao_mtls_arquivo
+
+
+def gerar_pfx(nome, senha):
+    chave = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    sujeito = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, nome)])
+    agora = datetime.now(timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(sujeito).issuer_name(sujeito)
+            .public_key(chave.public_key()).serial_number(x509.random_serial_number())
+            .not_valid_before(agora - timedelta(days=1)).not_valid_after(agora + timedelta(days=30))
+            .sign(chave, hashes.SHA256()))
+    return pkcs12.serialize_key_and_certificates(
+        nome.encode(), chave, cert, None, serialization.BestAvailableEncryption(senha.encode()))
+
+
+@pytest.fixture(autouse=True)
+def cache_limpo():
+    nfse_service.fechar_sessoes_mtls()
+    yield
+    nfse_service.fechar_sessoes_mtls()
+
+
+class TestSessoesMTLS:
+    """Uma sessão por certificado, compartilhada entre clientes"""
+
+    def test_mesmo_pfx_em_arquivos_diferentes_compartilha_sessao(self, tmp_path):
+        pfx = gerar_pfx('EMPRESA A', 'segredo')
+        (tmp_path / 'a.pfx').write_bytes(pfx)
+        (tmp_path / 'b.pfx').write_bytes(pfx)
+
+        sessao = obter_sessao_mtls_arquivo(str(tmp_path / 'a.pfx'), 'segredo')
+        assert obter_sessao_mtls_arquivo(str(tmp_path / 'b.pfx'), 'segredo') is sessao
+        assert obter_sessao_mtls(gerar_pfx('EMPRESA B', 'segredo'), 'segredo') is not sessao
+
+        # Loop de NSU e DANFSe de clientes diferentes usam a mesma sessão
+        cliente_nsu = NFSeAmbienteNacional(str(tmp_path / 'a.pfx'), 'segredo')
+        cliente_danfse = NFSeAmbienteNacional(str(tmp_path / 'b.pfx'), 'segredo', ambiente='homologacao')
+        assert cliente_nsu._obter_sessao() is sessao is cliente_danfse._obter_sessao()
+        assert 'https://' in sessao.adapters and sessao.adapters['https://']._pool_maxsize == nfse_service.CONEXOES_POR_HOST
+
+    def test_senha_errada_nao_reaproveita_sessao(self):
+        pfx = gerar_pfx('EMPRESA A', 'segredo')
+        obter_sessao_mtls(pfx, 'segredo')
+        with pytest.raises(ValueError):
+            obter_sessao_mtls(pfx, 'chute')
+
+    def test_lru_fecha_a_sessao_mais_antiga(self, monkeypatch):
+        monkeypatch.setattr(nfse_service, 'MAX_SESSOES_MTLS', 2)
+        fechadas = []
+        pfxs = [gerar_pfx(f'EMPRESA {i}', 's') for i in range(3)]
+        primeira = obter_sessao_mtls(pfxs[0], 's')
+        monkeypatch.setattr(primeira, 'close', lambda: fechadas.append(primeira))
+        segunda = obter_sessao_mtls(pfxs[1], 's')
+        obter_sessao_mtls(pfxs[0], 's')          # renova a primeira
+        monkeypatch.setattr(segunda, 'close', lambda: fechadas.append(segunda))
+        obter_sessao_mtls(pfxs[2], 's')
+        assert fechadas == [segunda]
+        assert obter_sessao_mtls(pfxs[0], 's') is primeira
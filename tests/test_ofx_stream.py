@@ -0,0 +1,202 @@
+"""
+Testes para app/utils/ofx_stream.py
+"""
+
+import io
+import pytest
+from datetime import date, datetime
+from decimal import Decimal
+from app.utils.ofx_stream import (
+    parse_ofx_datetime,
+    parse_ofx_valor,
+    classificar_transacao,
+    iter_tokens_ofx,
+    resumir_ofx,
+    iter_transacoes_ofx
+)
+
+
+OFX_SGML = (
+    "OFXHEADER:100\r\n"
+    "DATA:OFXSGML\r\n"
+    "VERSION:102\r\n"
+    "ENCODING:USASCII\r\n"
+    "CHARSET:1252\r\n"
+    "\r\n"
+    "<OFX>\r\n"
+    "<BANKMSGSRSV1><STMTTRNRS><STMTRS>\r\n"
+    "<CURDEF>BRL\r\n"
+    "<BANKACCTFROM><BANKID>001<ACCTID>12345-6<ACCTTYPE>CHECKING</BANKACCTFROM>\r\n"
+    "<BANKTRANLIST>\r\n"
+    "<DTSTART>20260201000000[-3:BRT]\r\n"
+    "<DTEND>20260228000000[-3:BRT]\r\n"
+    "<STMTTRN>\r\n"
+    "<TRNTYPE>DEBIT\r\n"
+    "<DTPOSTED>20260210000000[-3:BRT]\r\n"
+    "<TRNAMT>1.234,56\r\n"
+    "<FITID>A1\r\n"
+    "<MEMO>PAGAMENTO BOLETO\r\n"
+    "</STMTTRN>\r\n"
+    "<STMTTRN>\r\n"
+    "<TRNTYPE>CREDIT\r\n"
+    "<DTPOSTED>20260205\r\n"
+    "<TRNAMT>+500.00\r\n"
+    "<FITID>A2\r\n"
+    "<NAME>PIX RECEBIDO JOS\xc9 &amp; CIA\r\n"
+    "<MEMO>PIX\x01\r\n"
+    "</STMTTRN>\r\n"
+    "<STMTTRN>\r\n"
+    "<TRNTYPE>FEE\r\n"
+    "<DTPOSTED>20260211000000[-3:BRT]\r\n"
+    "<TRNAMT>9.90\r\n"
+    "<FITID>A3\r\n"
+    "<MEMO>TARIFA PACOTE\r\n"
+    "</STMTTRN>\r\n"
+    "</BANKTRANLIST>\r\n"
+    "<LEDGERBAL><BALAMT>10000.00<DTASOF>20260228</LEDGERBAL>\r\n"
+    "<AVAILBAL><BALAMT>1.00<DTASOF>20260228</AVAILBAL>\r\n"
+    "</STMTRS></STMTTRNRS></BANKMSGSRSV1>\r\n"
+    "</OFX>\r\n"
+).encode('latin-1')
+
+
+OFX_XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<?OFX OFXHEADER="200" VERSION="211"?>
+<OFX>
+  <BANKMSGSRSV1><STMTTRNRS><STMTRS>
+    <BANKACCTFROM><ACCTID>999</ACCTID></BANKACCTFROM>
+    <BANKTRANLIST>
+      <STMTTRN>
+        <TRNTYPE>OTHER</TRNTYPE>
+        <DTPOSTED>20260223000000[-3:GMT]</DTPOSTED>
+        <TRNAMT>-42.10</TRNAMT>
+        <FITID>X1</FITID>
+        <MEMO></MEMO>
+      </STMTTRN>
+    </BANKTRANLIST>
+  </STMTRS></STMTTRNRS></BANKMSGSRSV1>
+</OFX>
+"""
+
+
+class TestParseOfxDatetime:
+    """Testes para parse_ofx_datetime()"""
+
+    def test_aplica_offset_como_ofxparse(self):
+        """Offset [-3:BRT] é subtraído (mesmo comportamento do ofxparse)"""
+        assert parse_ofx_datetime('20260223000000[-3:BRT]') == datetime(2026, 2, 23, 3, 0)
+
+    def test_apenas_data(self):
+        """Data sem hora"""
+        assert parse_ofx_datetime('20260205') == datetime(2026, 2, 5)
+
+    def test_data_zerada(self):
+        """Datas 00000000 retornam None"""
+        assert parse_ofx_datetime('00000000') is None
+
+
+class TestParseOfxValor:
+    """Testes para parse_ofx_valor()"""
+
+    @pytest.mark.parametrize('entrada,esperado', [
+        ('1.234,56', Decimal('1234.56')),
+        ('10,000.50', Decimal('10000.50')),
+        ('1234,56', Decimal('1234.56')),
+        ('+10.00', Decimal('10.00')),
+        ('-42.10', Decimal('-42.10')),
+        ('null', Decimal('0')),
+    ])
+    def test_formatos(self, entrada, esperado):
+        assert parse_ofx_valor(entrada) == esperado
+
+    def test_valor_invalido(self):
+        with pytest.raises(ValueError):
+            parse_ofx_valor('abc')
+
+
+class TestClassificarTransacao:
+    """Testes para classificar_transacao()"""
+
+    def test_debito_sempre_negativo(self):
+        assert classificar_transacao('debit', Decimal('10')) == ('debito', Decimal('-10'))
+
+    def test_credito_sempre_positivo(self):
+        assert classificar_transacao('credit', Decimal('-10')) == ('credito', Decimal('10'))
+
+    def test_tipo_desconhecido_usa_sinal(self):
+        assert classificar_transacao('xyz', Decimal('-5')) == ('debito', Decimal('-5'))
+        assert classificar_transacao(None, Decimal('5')) == ('credito', Decimal('5'))
+
+
+class TestIterTokensOfx:
+    """Testes para iter_tokens_ofx()"""
+
+    @pytest.mark.parametrize('chunk_size', [1, 7, 64, 65536])
+    def test_tokens_independem_do_tamanho_do_bloco(self, chunk_size):
+        """Tags quebradas entre blocos geram os mesmos tokens"""
+        esperado = list(iter_tokens_ofx(io.BytesIO(OFX_SGML), 65536))
+        assert list(iter_tokens_ofx(io.BytesIO(OFX_SGML), chunk_size)) == esperado
+
+    def test_remove_caracteres_de_controle(self):
+        tokens = list(iter_tokens_ofx(io.BytesIO(b'<MEMO>A\x01B\x9d<X>')))
+        assert ('texto', 'AB') in tokens
+
+
+class TestResumirOfx:
+    """Testes para resumir_ofx()"""
+
+    def test_resumo_sgml(self):
+        resumos = resumir_ofx(io.BytesIO(OFX_SGML))
+        assert len(resumos) == 1
+        resumo = resumos[0]
+        assert resumo['numero'] == '12345-6'
+        assert resumo['saldo_final'] == Decimal('10000.00')  # LEDGERBAL, não AVAILBAL
+        assert resumo['total_transacoes'] == 3
+        assert resumo['soma_valores'] == Decimal('-1234.56') + Decimal('500.00') - Decimal('9.90')
+        assert resumo['data_primeira_transacao'] == date(2026, 2, 5)
+
+    def test_filtro_de_memo(self):
+        resumos = resumir_ofx(io.BytesIO(OFX_SGML), {'TARIFA PACOTE'})
+        assert resumos[0]['total_transacoes'] == 2
+        assert resumos[0]['ignoradas_memo'] == 1
+
+
+class TestIterTransacoesOfx:
+    """Testes para iter_transacoes_ofx()"""
+
+    def test_transacoes_sgml(self):
+        transacoes = list(iter_transacoes_ofx(io.BytesIO(OFX_SGML), chunk_size=5))
+        assert [t['fitid'] for t in transacoes] == ['A1', 'A2', 'A3']
+
+        debito = transacoes[0]
+        assert debito['tipo'] == 'DEBITO'
+        assert debito['valor'] == -1234.56
+        assert debito['data'] == date(2026, 2, 10)
+        assert debito['descricao'] == 'PAGAMENTO BOLETO'
+
+        credito = transacoes[1]
+        assert credito['tipo'] == 'CREDITO'
+        assert credito['descricao'] == 'PIX RECEBIDO JOS\xc9 & CIA'  # latin-1 + entidades
+        assert credito['memo'] == 'PIX'
+        assert credito['grupo'] == 0
+
+    def test_transacoes_xml(self):
+        transacoes = list(iter_transacoes_ofx(io.BytesIO(OFX_XML)))
+        assert len(transacoes) == 1
+        assert transacoes[0]['valor'] == 42.10  # OTHER conta como crédito
+        assert transacoes[0]['descricao'] == 'Sem descricao'
+        assert transacoes[0]['data'] == date(2026, 2, 23)
+
+    def test_transacao_sem_valor(self):
+        conteudo = b'<OFX><STMTRS><STMTTRN><DTPOSTED>20260101<FITID>1</STMTTRN></STMTRS></OFX>'
+        with pytest.raises(ValueError):
+            list(iter_transacoes_ofx(io.BytesIO(conteudo)))
+
+    def test_mesmo_resultado_que_ofxparse(self):
+        """Campos extraídos batem com o parser antigo (ofxparse)"""
+        ofxparse = pytest.importorskip('ofxparse')
+        ofx = ofxparse.OfxParser.parse(io.BytesIO(OFX_XML))
+        antigas = ofx.accounts[0].statement.transactions
+        novas = list(iter_transacoes_ofx(io.BytesIO(OFX_XML)))
+        assert [t.id for t in antigas] == [t['fitid'] for t in novas]
+        assert [t.date.date() for t in antigas] == [t['data'] for t in novas]
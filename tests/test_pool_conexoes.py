@@ -0,0 +1,200 @@
+"""
+Testes para pool_conexoes.py
+"""
+
+import threading
+import time
+
+import pytest
+from psycopg2 import extensions, pool
+
+from pool_conexoes import Histograma, PoolConexoesJusto
+
+
+class _Info:
+    transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+
+class ConexaoFalsa:
+    """Conexão mínima: conta SELECT 1 e pode simular queda"""
+
+    def __init__(self):
+        self.closed = 0
+        self.viva = True
+        self.pings = 0
+        self.info = _Info()
+
+    def cursor(self):
+        conexao = self
+
+        class Cursor:
+            def execute(self, sql, params=None):
+                if not conexao.viva:
+                    raise Exception('server closed the connection unexpectedly')
+                conexao.pings += 1
+
+            def close(self):
+                pass
+
+        return Cursor()
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+class PoolFalso(PoolConexoesJusto):
+    def _connect(self, key=None):
+        conn = ConexaoFalsa()
+        self._criada_em[conn] = time.monotonic()
+        if key is not None:
+            self._used[key] = conn
+            self._rused[id(conn)] = key
+        else:
+            self._pool.append(conn)
+        return conn
+
+
+def criar_pool(minconn=1, maxconn=2, **kwargs):
+    kwargs.setdefault('timeout', 1.0)
+    return PoolFalso(minconn, maxconn, **kwargs)
+
+
+def aguardar_fila(p, tamanho):
+    limite = time.monotonic() + 2
+    while len(p._fila) < tamanho and time.monotonic() < limite:
+        time.sleep(0.005)
+    assert len(p._fila) == tamanho
+
+
+class TestEspera:
+    """Testes da fila de espera"""
+
+    def test_timeout_quando_esgotado(self):
+        p = criar_pool(maxconn=1, timeout=0.05)
+        p.getconn()
+        with pytest.raises(pool.PoolError, match='exhausted'):
+            p.getconn()
+        assert p.metricas()['timeouts'] == 1
+
+    def test_aguarda_devolucao(self):
+        p = criar_pool(maxconn=1)
+        conn = p.getconn()
+        obtidas = []
+        t = threading.Thread(target=lambda: obtidas.append(p.getconn()))
+        t.start()
+        aguardar_fila(p, 1)
+        p.putconn(conn)
+        t.join(2)
+        assert obtidas == [conn]
+
+    def test_ordem_fifo(self):
+        p = criar_pool(maxconn=1)
+        conn = p.getconn()
+        ordem = []
+
+        def pedir(nome):
+            c = p.getconn()
+            ordem.append(nome)
+            p.putconn(c)
+
+        threads = []
+        for i, nome in enumerate(['a', 'b', 'c']):
+            t = threading.Thread(target=pedir, args=(nome,))
+            t.start()
+            aguardar_fila(p, i + 1)
+            threads.append(t)
+        p.putconn(conn)
+        for t in threads:
+            t.join(2)
+        assert ordem == ['a', 'b', 'c']
+
+
+class TestQuotaEmpresa:
+    """Testes da quota de conexões por empresa"""
+
+    def test_empresa_no_limite_nao_bloqueia_outras(self):
+        p = criar_pool(maxconn=3, quota_empresa=1, timeout=0.05)
+        p._obter(10)
+        with pytest.raises(pool.PoolError):
+            p._obter(10)
+        # A empresa 20 ainda consegue conexão
+        p._obter(20)
+        assert p.metricas()['in_use_por_empresa'] == {10: 1, 20: 1}
+
+    def test_espera_da_empresa_nao_trava_a_fila(self):
+        p = criar_pool(maxconn=3, quota_empresa=1)
+        c10 = p._obter(10)
+        obtidas = []
+        t10 = threading.Thread(target=lambda: obtidas.append(('10', p._obter(10))))
+        t10.start()
+        aguardar_fila(p, 1)
+        # A cabeça da fila está barrada pela quota; a empresa 20 passa na frente
+        p._obter(20)
+        assert obtidas == []
+        p.putconn(c10)
+        t10.join(2)
+        assert [e for e, _ in obtidas] == ['10']
+
+    def test_getconn_cru_fora_da_quota(self):
+        p = criar_pool(maxconn=3, quota_empresa=1)
+        p._obter(10)
+        p.getconn()
+        p.getconn()
+        assert p.metricas()['in_use_por_empresa'] == {10: 1}
+
+
+class TestSaude:
+    """Testes de reciclagem e verificação das conexões"""
+
+    def test_recicla_por_idade(self):
+        p = criar_pool(max_lifetime=1)
+        conn = p.getconn()
+        p._criada_em[conn] -= 5
+        p.putconn(conn)
+        assert conn.closed
+        assert p.metricas()['recicladas'] == 1
+        assert p.getconn() is not conn
+
+    def test_conexao_parada_e_testada(self):
+        p = criar_pool(idle_check=10)
+        conn = p.getconn()
+        p.putconn(conn)
+        assert p.getconn() is conn and conn.pings == 0
+        p.putconn(conn)
+        p._devolvida_em[conn] -= 60
+        assert p.getconn() is conn and conn.pings == 1
+
+    def test_conexao_morta_descartada(self):
+        p = criar_pool(idle_check=10)
+        conn = p.getconn()
+        p.putconn(conn)
+        conn.viva = False
+        p._devolvida_em[conn] -= 60
+        nova = p.getconn()
+        assert nova is not conn
+        assert conn.closed
+        assert p.metricas()['descartadas'] == 1
+
+
+class TestMetricas:
+    """Testes para metricas()/Histograma"""
+
+    def test_histogramas(self):
+        p = criar_pool(maxconn=2)
+        conn = p.getconn()
+        p.putconn(conn)
+        m = p.metricas()
+        assert m['wait_time_s']['count'] == 1
+        assert m['hold_time_s']['count'] == 1
+        assert m['queue_depth']['buckets']['<=0'] == 1
+        assert m['in_use'] == 0 and m['waiting'] == 0
+
+    def test_histograma_buckets(self):
+        h = Histograma((1, 5))
+        for valor in (0.5, 1, 3, 10):
+            h.registrar(valor)
+        assert h.resumo()['buckets'] == {'<=1': 2, '<=5': 1, '+inf': 1}
+        assert h.resumo()['max'] == 10
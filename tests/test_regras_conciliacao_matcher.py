@@ -0,0 +1,114 @@
+"""
+Testes para regras_conciliacao_matcher.py
+"""
+
+import pytest
+from regras_conciliacao_matcher import (
+    RegrasMatcher,
+    obter_matcher,
+    invalidar_matcher,
+    extrair_cpf
+)
+
+
+REGRAS = [
+    {'id': 1, 'palavra_chave': 'PIX', 'categoria': 'Transferências'},
+    {'id': 2, 'palavra_chave': 'PIX RECEBIDO', 'categoria': 'Receitas'},
+    {'id': 3, 'palavra_chave': 'tarifa', 'categoria': 'Tarifas'},
+    {'id': 4, 'palavra_chave': 'SALARIO', 'categoria': 'Folha', 'usa_integracao_folha': True},
+    {'id': 5, 'palavra_chave': 'CEMIG', 'categoria': 'Energia'},
+    {'id': 6, 'palavra_chave': 'EMIG', 'categoria': 'Outros'},
+]
+
+
+class TestRegrasMatcher:
+    """Testes para RegrasMatcher"""
+
+    def test_palavra_mais_longa_vence(self):
+        """Equivalente ao ORDER BY LENGTH(palavra_chave) DESC"""
+        matcher = RegrasMatcher(REGRAS)
+        assert matcher.buscar('PIX RECEBIDO FULANO')['id'] == 2
+        assert matcher.buscar('PIX ENVIADO FULANO')['id'] == 1
+
+    def test_case_insensitive(self):
+        matcher = RegrasMatcher(REGRAS)
+        assert matcher.buscar('Tarifa Pacote Serviços')['id'] == 3
+
+    def test_regra_devolvida_como_no_banco(self):
+        """palavra_chave volta como gravada, sem o UPPER usado no autômato"""
+        matcher = RegrasMatcher(REGRAS)
+        assert matcher.buscar('TARIFA PACOTE')['palavra_chave'] == 'tarifa'
+        assert REGRAS[2]['palavra_chave'] == 'tarifa'
+
+    def test_sobreposicao_de_sufixos(self):
+        """Palavra contida em outra (EMIG dentro de CEMIG) não mascara a maior"""
+        matcher = RegrasMatcher(REGRAS)
+        assert matcher.buscar('DEBITO AUTOMATICO CEMIG')['id'] == 5
+        assert matcher.buscar('XEMIGX')['id'] == 6
+
+    def test_sem_regra(self):
+        matcher = RegrasMatcher(REGRAS)
+        assert matcher.buscar('COMPRA CARTAO') is None
+        assert matcher.buscar('') is None
+
+    def test_empate_pelo_menor_id(self):
+        matcher = RegrasMatcher([
+            {'id': 9, 'palavra_chave': 'ABC'},
+            {'id': 7, 'palavra_chave': 'XYZ'},
+        ])
+        assert matcher.buscar('ABC XYZ')['id'] == 7
+
+    def test_retorna_copia(self):
+        """Alterar o resultado não corrompe o matcher em cache"""
+        matcher = RegrasMatcher(REGRAS)
+        regra = matcher.buscar('SALARIO JOAO')
+        regra['categoria'] = 'alterada'
+        assert matcher.buscar('SALARIO JOAO')['categoria'] == 'Folha'
+
+    def test_mesmo_resultado_que_busca_linear(self):
+        """Confere contra a semântica do LIKE '%palavra%' da query antiga"""
+        descricoes = ['PIX RECEBIDO CEMIG', 'TARIFA PIX', 'EMIGRACAO', 'SALARIO 12345678901', 'NADA']
+        matcher = RegrasMatcher(REGRAS)
+        for descricao in descricoes:
+            candidatas = [r for r in REGRAS if r['palavra_chave'].upper() in descricao.upper()]
+            candidatas.sort(key=lambda r: (-len(r['palavra_chave']), r['id']))
+            esperado = candidatas[0]['id'] if candidatas else None
+            encontrada = matcher.buscar(descricao)
+            assert (encontrada['id'] if encontrada else None) == esperado
+
+
+class TestCacheMatcher:
+    """Testes para obter_matcher() / invalidar_matcher()"""
+
+    def test_cache_e_invalidacao(self):
+        chamadas = []
+
+        def carregar(empresa_id):
+            chamadas.append(empresa_id)
+            return REGRAS
+
+        invalidar_matcher()
+        obter_matcher(1, carregar)
+        obter_matcher(1, carregar)
+        assert chamadas == [1]
+
+        invalidar_matcher(1)
+        obter_matcher(1, carregar)
+        assert chamadas == [1, 1]
+
+    def test_isolamento_por_empresa(self):
+        invalidar_matcher()
+        m1 = obter_matcher(1, lambda e: [{'id': 1, 'palavra_chave': 'A'}])
+        m2 = obter_matcher(2, lambda e: [])
+        assert m1.buscar('A') is not None
+        assert m2.buscar('A') is None
+
+    def test_empresa_obrigatoria(self):
+        with pytest.raises(ValueError):
+            obter_matcher(None, lambda e: [])
+
+
+def test_extrair_cpf():
+    assert extrair_cpf('PIX SALARIO 12345678901 JOAO') == '12345678901'
+    assert extrair_cpf('PIX 123456789012') is None
+    assert extrair_cpf(None) is None
@@ -0,0 +1,59 @@
+"""
+Testes para o motor de saldos do balancete em relatorios_contabeis_functions.py
+"""
+
+from relatorios_contabeis_functions import _codigos_ancestrais, _consolidar_sinteticas
+
+
+def conta(codigo, natureza='devedora', da=0.0, ca=0.0, dp=0.0, cp=0.0):
+    return {
+        'codigo': codigo,
+        'natureza': natureza,
+        'debito_anterior': da,
+        'credito_anterior': ca,
+        'debito_periodo': dp,
+        'credito_periodo': cp
+    }
+
+
+def test_codigos_ancestrais():
+    assert _codigos_ancestrais('1.1.01') == ['1.1', '1']
+    assert _codigos_ancestrais('1') == []
+
+
+class TestConsolidarSinteticas:
+    """Testes para _consolidar_sinteticas()"""
+
+    def test_soma_nas_superiores(self):
+        contas = _consolidar_sinteticas([
+            conta('1'),
+            conta('1.1'),
+            conta('1.1.01', da=100, dp=50),
+            conta('1.1.02', cp=30),
+            conta('1.2'),
+            conta('1.2.01', dp=10),
+        ])
+        por_codigo = {c['codigo']: c for c in contas}
+        assert por_codigo['1.1']['saldo_anterior'] == 100
+        assert por_codigo['1.1']['saldo_atual'] == 120
+        assert por_codigo['1']['debito_periodo'] == 60
+        assert por_codigo['1']['credito_periodo'] == 30
+        assert por_codigo['1']['saldo_atual'] == 130
+
+    def test_saldo_pela_natureza_da_sintetica(self):
+        contas = _consolidar_sinteticas([
+            conta('2', natureza='credora'),
+            conta('2.1.01', natureza='credora', cp=80, dp=20),
+        ])
+        # Sem a conta '2.1' no plano, a consolidação segue para '2'
+        assert contas[0]['saldo_atual'] == 60
+        assert contas[1]['saldo_atual'] == 60
+
+    def test_folhas(self):
+        contas = _consolidar_sinteticas([conta('1'), conta('1.1'), conta('1.1.01'), conta('3')])
+        assert [c['codigo'] for c in contas if c['folha']] == ['1.1.01', '3']
+
+    def test_nao_altera_entrada(self):
+        entrada = [conta('1'), conta('1.1', dp=10)]
+        _consolidar_sinteticas(entrada)
+        assert entrada[0]['debito_periodo'] == 0
@@ -0,0 +1,72 @@
+"""
+Testes para os checkpoints mensais de saldo do extrato em extrato_functions.py
+"""
+
+from datetime import date, datetime
+
+from extrato_functions import reconstruir_saldos_mensais, somar_extrato_ate
+
+
+class CursorGravador:
+    """Cursor que só registra as consultas executadas"""
+
+    def __init__(self, soma=0):
+        self.execucoes = []
+        self.soma = soma
+
+    def execute(self, query, params=None):
+        self.execucoes.append((' '.join(query.split()), list(params or [])))
+
+    def fetchone(self):
+        return {'soma': self.soma, 'meses': 4}
+
+
+class TestSomarExtratoAte:
+    """Divisão do período entre checkpoints e soma direta"""
+
+    def test_todo_historico(self):
+        cursor = CursorGravador(soma=150)
+        assert somar_extrato_ate(cursor, 7, '2026-10-16', 'Conta BB') == 150.0
+        query, params = cursor.execucoes[0]
+        assert 'saldos_extrato_mensais' in query and 'mes < %s' in query and 'mes >= %s' not in query
+        # checkpoints até setembro + linhas de 01/10 a 15/10
+        assert params == [7, date(2026, 10, 1), 'Conta BB',
+                          7, 'Conta BB', date(2026, 10, 1), date(2026, 10, 16)]
+
+    def test_desde_no_meio_do_mes(self):
+        cursor = CursorGravador()
+        somar_extrato_ate(cursor, 7, date(2026, 10, 16), desde=datetime(2026, 3, 10, 8, 0))
+        query, params = cursor.execucoes[0]
+        assert 'conta_bancaria' not in query
+        # checkpoints de abril a setembro + pontas 01/10-16/10 e 10/03-01/04
+        assert params == [7, date(2026, 10, 1), date(2026, 4, 1),
+                          7, date(2026, 10, 1), date(2026, 10, 16), date(2026, 3, 10), date(2026, 4, 1)]
+
+    def test_primeiro_dia_do_mes_so_usa_checkpoints(self):
+        cursor = CursorGravador()
+        somar_extrato_ate(cursor, 7, '2026-10-01', desde='2026-01-01')
+        query, params = cursor.execucoes[0]
+        assert 'transacoes_extrato' not in query
+        assert params == [7, date(2026, 10, 1), date(2026, 1, 1)]
+
+    def test_periodo_dentro_de_um_mes(self):
+        cursor = CursorGravador()
+        somar_extrato_ate(cursor, 7, '2026-10-16', desde='2026-10-05')
+        query, params = cursor.execucoes[0]
+        assert 'saldos_extrato_mensais' not in query
+        assert params == [7, date(2026, 10, 5), date(2026, 10, 16)]
+
+    def test_periodo_vazio(self):
+        cursor = CursorGravador()
+        assert somar_extrato_ate(cursor, 7, '2026-10-01', desde='2026-10-01') == 0.0
+        assert cursor.execucoes == []
+
+
+def test_reconstruir_saldos_mensais_por_empresa_ou_todas():
+    cursor = CursorGravador()
+    assert reconstruir_saldos_mensais(cursor, 7) == 4
+    assert reconstruir_saldos_mensais(cursor) == 4
+    assert cursor.execucoes == [
+        ('SELECT reconstruir_saldos_extrato_mensais(%s) AS meses', [7]),
+        ('SELECT reconstruir_saldos_extrato_mensais(%s) AS meses', [None]),
+    ]
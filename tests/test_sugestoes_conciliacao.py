@@ -0,0 +1,78 @@
+"""
+Testes para sugestoes_conciliacao.py
+"""
+
+from datetime import date
+from decimal import Decimal
+
+from sugestoes_conciliacao import (IndiceCandidatos, extrair_documentos, palavras,
+                                   similaridade)
+
+
+def lancamento(id, valor, vencimento, tipo='despesa', conta='BB', descricao='', pessoa=''):
+    return {'id': id, 'tipo': tipo, 'valor': Decimal(str(valor)), 'data_vencimento': vencimento,
+            'conta_bancaria': conta, 'descricao': descricao, 'pessoa': pessoa, 'status': 'pendente'}
+
+
+def transacao(valor, data, tipo='DEBITO', conta='BB', descricao='', memo=''):
+    return {'id': 1, 'valor': Decimal(str(valor)), 'data': data, 'tipo': tipo,
+            'conta_bancaria': conta, 'descricao': descricao, 'memo': memo}
+
+
+class TestTexto:
+    """Testes de documentos e palavras"""
+
+    def test_extrair_documentos(self):
+        texto = 'PIX ENVIADO 12.345.678/0001-90 REF 123.456.789-01 NSU 123456'
+        assert extrair_documentos(texto) == {'12345678000190', '12345678901'}
+        assert extrair_documentos(None) == set()
+
+    def test_palavras_ignoram_jargao_bancario(self):
+        assert palavras('PIX ENVIADO Energética São João 123') == {'ENERGETICA', 'SAO', 'JOAO'}
+        assert similaridade(palavras('TED Padaria Pão Quente'), palavras('Padaria Pao Quente Ltda')) == 1.0
+
+
+class TestIndiceCandidatos:
+    """Testes do casamento e da pontuação"""
+
+    def test_tolerancia_de_valor_e_janela_de_datas(self):
+        indice = IndiceCandidatos([
+            lancamento(1, 100, date(2026, 10, 10)),
+            lancamento(2, 104.9, date(2026, 10, 17)),   # +4,9% e +7 dias: entra
+            lancamento(3, 95.2, date(2026, 10, 3)),     # -4,8% e -7 dias: entra
+            lancamento(4, 106, date(2026, 10, 10)),     # +6%: fora
+            lancamento(5, 100, date(2026, 10, 18)),     # +8 dias: fora
+            lancamento(6, 100, date(2026, 10, 10), conta='ITAU'),
+            lancamento(7, 100, date(2026, 10, 10), tipo='receita'),
+        ])
+        sugestoes = indice.sugerir(transacao(-100, date(2026, 10, 10)))
+        assert [s['id'] for s in sugestoes] == [1, 3, 2]
+        assert sugestoes[0]['score'] > sugestoes[1]['score']
+        assert sugestoes[0]['valor'] == 100.0 and sugestoes[0]['data_vencimento'] == '2026-10-10'
+
+    def test_credito_casa_com_receita(self):
+        indice = IndiceCandidatos([lancamento(1, 50, date(2026, 1, 5), tipo='receita'),
+                                   lancamento(2, 50, date(2026, 1, 5), tipo='despesa')])
+        assert [s['id'] for s in indice.sugerir(transacao(50, '2026-01-05', tipo='CRÉDITO'))] == [1]
+
+    def test_documento_e_descricao_desempatam(self):
+        indice = IndiceCandidatos(
+            [lancamento(1, 300, date(2026, 3, 1), pessoa='Outra Empresa'),
+             lancamento(2, 300, date(2026, 3, 1), pessoa='Fornecedor Alfa')],
+            documentos_por_pessoa={'FORNECEDOR ALFA': '12345678000190'},
+        )
+        sugestoes = indice.sugerir(transacao(-300, date(2026, 3, 1),
+                                             descricao='PIX ENVIADO 12.345.678/0001-90'))
+        assert [s['id'] for s in sugestoes] == [2, 1]
+        assert sugestoes[0]['documento_confere'] is True
+
+        sugestoes = indice.sugerir(transacao(-300, date(2026, 3, 1), descricao='PAGAMENTO OUTRA EMPRESA'))
+        assert sugestoes[0]['id'] == 1
+
+    def test_limite_e_entradas_invalidas(self):
+        indice = IndiceCandidatos([lancamento(i, 10, date(2026, 5, 1)) for i in range(1, 21)]
+                                  + [lancamento(99, 0, date(2026, 5, 1)),
+                                     lancamento(98, 10, None)])
+        assert len(indice) == 20
+        assert len(indice.sugerir(transacao(-10, date(2026, 5, 1)), limite=5)) == 5
+        assert indice.sugerir(transacao(0, date(2026, 5, 1))) == []
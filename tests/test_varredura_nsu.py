@@ -0,0 +1,136 @@
+"""
+Testes da varredura adaptativa de NSU (nfse_service.VarreduraNSU e BaldeTokens)
+"""
+
+import threading
+
+from nfse_service import BaldeTokens, VarreduraNSU
+
+
+def nsu(n):
+    return str(n).zfill(15)
+
+
+class AmbienteNacionalFalso:
+    """GET /DFe/{NSU}: 404 se o NSU não existe; senão até `por_lote` documentos a partir dele"""
+
+    def __init__(self, existentes, por_lote=3, falhas=None):
+        self.existentes = sorted(existentes)
+        self.por_lote = por_lote
+        self.falhas = dict(falhas or {})   # nsu -> [status, ...] devolvidos antes do normal
+        self.consultados = []
+        self.lock = threading.Lock()
+
+    def __call__(self, n):
+        with self.lock:
+            self.consultados.append(n)
+            if self.falhas.get(n):
+                return self.falhas[n].pop(0), None
+        if n not in self.existentes:
+            return 404, None
+        lote = [x for x in self.existentes if x >= n][:self.por_lote]
+        return 200, {'LoteDFe': [{'NSU': nsu(x)} for x in lote],
+                     'ultNSU': nsu(lote[-1]), 'maxNSU': nsu(self.existentes[-1])}
+
+
+def sem_espera():
+    return BaldeTokens(taxa=1.0, relogio=lambda: 0.0, dormir=lambda segundos: None)
+
+
+def nsus_lidos(respostas):
+    return [int(d['NSU']) for r in respostas for d in r['LoteDFe']]
+
+
+class TestVarreduraNSU:
+    """Saltos por ultNSU/maxNSU, janela, 429 e checkpoint"""
+
+    def test_salta_pelo_ult_nsu_e_para_no_max_nsu(self):
+        sefaz = AmbienteNacionalFalso(range(1, 11))
+        checkpoints = []
+        varredura = VarreduraNSU(sefaz, 1, limitador=sem_espera(), janela=1, checkpoint=checkpoints.append)
+
+        assert nsus_lidos(varredura) == list(range(1, 11))
+        assert sefaz.consultados == [1, 4, 7, 10]
+        assert varredura.motivo_parada == 'max_nsu' and varredura.cursor == 10
+        assert checkpoints == [3, 6, 9, 10]
+
+    def test_retomada_pela_ancora_sem_novidades(self):
+        sefaz = AmbienteNacionalFalso([5, 6, 7])
+        varredura = VarreduraNSU(sefaz, 7, limitador=sem_espera())
+        assert nsus_lidos(varredura) == [7]
+        # Uma consulta: o maxNSU da âncora encerra (antes: 100 NSUs vazios)
+        assert sefaz.consultados == [7]
+
+    def test_lacunas_sondadas_em_janela_ate_o_max_nsu(self):
+        sefaz = AmbienteNacionalFalso([1, 2, 40], por_lote=2)
+        checkpoints = []
+        varredura = VarreduraNSU(sefaz, 1, limitador=sem_espera(), janela=4,
+                                 checkpoint=checkpoints.append, intervalo_checkpoint=10)
+
+        assert nsus_lidos(varredura) == [1, 2, 40]
+        assert 40 in sefaz.consultados and max(sefaz.consultados) == 40
+        assert varredura.cursor == 40 and varredura.vazios_total == 37
+        assert checkpoints == sorted(checkpoints) and checkpoints[0] == 2 and checkpoints[-1] == 40
+
+    def test_sem_max_nsu_para_apos_vazios_sem_avancar_cursor(self):
+        sefaz = AmbienteNacionalFalso([])
+        checkpoints = []
+        varredura = VarreduraNSU(sefaz, 50, limitador=sem_espera(), janela=3, max_vazios=10,
+                                 checkpoint=checkpoints.append)
+        assert list(varredura) == []
+        assert sorted(sefaz.consultados) == list(range(50, 60))
+        # NSUs acima do último conhecido podem receber documentos depois
+        assert varredura.motivo_parada == 'vazios' and varredura.cursor == 49 and checkpoints == []
+
+    def test_429_reduz_taxa_e_repete_o_nsu(self):
+        sefaz = AmbienteNacionalFalso([1, 2], falhas={1: [429], 2: [503, 503, 503]}, por_lote=1)
+        limitador = sem_espera()
+        checkpoints = []
+        varredura = VarreduraNSU(sefaz, 1, limitador=limitador, janela=1, checkpoint=checkpoints.append)
+
+        assert nsus_lidos(varredura) == [1]
+        assert sefaz.consultados.count(1) == 2
+        assert limitador.taxa < limitador.taxa_maxima
+        # 503 esgotou as tentativas: NSU 2 não é coberto e a varredura para
+        assert sefaz.consultados.count(2) == 3 and len(varredura.erros) == 1
+        assert varredura.motivo_parada == 'erro'
+        assert varredura.cursor == 1 and checkpoints == [1]
+
+    def test_falha_apos_a_ancora_nao_avanca_o_cursor(self):
+        sefaz = AmbienteNacionalFalso([5, 6, 7, 8, 9], por_lote=1,
+                                      falhas={n: [0, 0, 0] for n in (6, 7, 8)})
+        checkpoints = []
+        varredura = VarreduraNSU(sefaz, 5, limitador=sem_espera(), janela=3, checkpoint=checkpoints.append)
+
+        assert nsus_lidos(varredura) == [5]
+        assert varredura.motivo_parada == 'erro' and varredura.erros[0].startswith('NSU 6:')
+        assert varredura.cursor == 5 and checkpoints == [5]
+
+    def test_interrompida_nao_marca_o_lote_nao_processado(self):
+        sefaz = AmbienteNacionalFalso(range(1, 11))
+        checkpoints = []
+        varredura = VarreduraNSU(sefaz, 1, limitador=sem_espera(), janela=2, checkpoint=checkpoints.append)
+        for resposta in varredura:
+            if resposta['ultNSU'] == nsu(6):
+                break
+        assert varredura.cursor == 3 and checkpoints == [3]
+
+
+class TestBaldeTokens:
+    """Taxa, pausa após 429 e recuperação"""
+
+    def test_espaca_reservas_e_pausa_no_429(self):
+        agora = [0.0]
+        dormidas = []
+        balde = BaldeTokens(taxa=2.0, relogio=lambda: agora[0], dormir=dormidas.append)
+
+        assert balde.aguardar() == 0
+        assert balde.aguardar() == 0.5
+        balde.penalizar(espera=2.0)
+        assert balde.taxa == 1.0
+        # Dívida da reserva anterior + 2 s de pausa + o próprio token, à nova taxa
+        assert balde.aguardar() == 4.0
+        for _ in range(40):
+            balde.recompensar()
+        assert balde.taxa == 2.0
+        assert dormidas == [0.5, 4.0]
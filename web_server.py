@@ -79,7 +79,7 @@ except Exception as e:
     print(f"   Certifique-se de que DATABASE_URL est� configurado")
     raise
 
-from auth_middleware import require_auth, require_admin, require_permission, get_usuario_logado, filtrar_por_cliente, aplicar_filtro_cliente
+from auth_middleware import require_auth, require_admin, require_permission, get_usuario_logado, filtrar_por_cliente, aplicar_filtro_cliente, obter_acesso_empresa
 from database_postgresql import ContaBancaria, Lancamento, Categoria, TipoLancamento, StatusLancamento
 from decimal import Decimal
 from datetime import datetime, date, timedelta
@@ -109,6 +109,7 @@ from app.utils import (
     format_currency,
     parse_currency
 )
+from app.utils.json_stream import resposta_json_stream, linhas_cursor
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
 
@@ -301,6 +302,9 @@ CORS(app,
 app.config['COMPRESS_REGISTER'] = True
 app.config['COMPRESS_LEVEL'] = 6          # Nível 6 = melhor custo/benefício
 app.config['COMPRESS_MIN_SIZE'] = 1000    # Comprimir respostas > 1KB
+# Respostas em stream (app.utils.json_stream) se comprimem sozinhas em gzip;
+# o Flask-Compress juntaria o corpo inteiro em memoria antes de comprimir
+app.config['COMPRESS_STREAMS'] = False
 Compress(app)
 
 # ============================================================================
@@ -3812,14 +3816,20 @@ def importar_fornecedores_de_empresa():
 @require_permission('lancamentos_view')
 @aplicar_filtro_cliente
 def listar_lancamentos():
-    """Lista todos os lan�amentos com filtro de multi-tenancy e pagina��o"""
+    """
+    Lista os lancamentos da empresa com filtro de multi-tenancy
+
+    Paginacao por cursor (keyset): envie ?cursor= (vazio na primeira pagina)
+    e/ou ?limite=N; a resposta traz 'proximo_cursor' (null na ultima pagina)
+    e, com ?estimar_total=1, 'total_estimado' (estatisticas do planner).
+    Sem cursor/limite: page/per_page (OFFSET) ou, sem page, a lista completa
+    escrita em stream.
+    """
     try:
-        print("\n" + "="*80)
-        print("?? ROTA /api/lancamentos chamada")
-        
         # Obter empresa_id da sess�o
         empresa_id = session.get('empresa_id')
-        
+        filtro_cliente_id = getattr(request, 'filtro_cliente_id', None)
+
         # Par�metros de filtro
         tipo_filtro = request.args.get('tipo')
         status_filtro = request.args.get('status')
@@ -3833,30 +3843,7 @@ def listar_lancamentos():
         search_filtro = request.args.get('search')
         cliente_filtro = request.args.get('cliente')
         fornecedor_filtro = request.args.get('fornecedor')
-        filtro_cliente_id = getattr(request, 'filtro_cliente_id', None)
-        
-        # Par�metros de pagina��o
-        page = request.args.get('page', type=int)
-        per_page = request.args.get('per_page', default=300, type=int)
-        per_page = min(per_page, 300)  # M�ximo de 300 registros por p�gina
-        
-        print(f"?? Par�metros recebidos:")
-        print(f"   - empresa_id: {empresa_id}")
-        print(f"   - tipo_filtro: {tipo_filtro}")
-        print(f"   - status_filtro: {status_filtro}")
-        print(f"   - categoria_filtro: {categoria_filtro}")
-        print(f"   - conta_bancaria_filtro: {conta_bancaria_filtro}")
-        print(f"   - data_inicio_filtro: {data_inicio_filtro}")
-        print(f"   - data_fim_filtro: {data_fim_filtro}")
-        print(f"   - ano_filtro: {ano_filtro}")
-        print(f"   - mes_filtro: {mes_filtro}")
-        print(f"   - search_filtro: {search_filtro}")
-        print(f"   - cliente_filtro: {cliente_filtro}")
-        print(f"   - fornecedor_filtro: {fornecedor_filtro}")
-        print(f"   - filtro_cliente_id: {filtro_cliente_id}")
-        print(f"   - page: {page}")
-        print(f"   - per_page: {per_page}")
-        
+
         # Criar dicion�rio de filtros
         filtros = {}
         if tipo_filtro:
@@ -3873,116 +3860,118 @@ def listar_lancamentos():
             filtros['data_inicio'] = data_inicio_filtro
         if data_fim_filtro:
             filtros['data_fim'] = data_fim_filtro
-        
+
         # Filtros especiais: ano e m�s (converter para data_inicio/data_fim)
         if ano_filtro:
             from datetime import date
             ano = int(ano_filtro)
             if mes_filtro:
-                mes = int(mes_filtro)
-                # Filtrar por m�s espec�fico
                 import calendar
-                ultimo_dia = calendar.monthrange(ano, mes)[1]
+                mes = int(mes_filtro)
                 filtros['data_inicio'] = date(ano, mes, 1).isoformat()
-                filtros['data_fim'] = date(ano, mes, ultimo_dia).isoformat()
-                print(f"   ??? Filtro ano+m�s: {filtros['data_inicio']} at� {filtros['data_fim']}")
+                filtros['data_fim'] = date(ano, mes, calendar.monthrange(ano, mes)[1]).isoformat()
             else:
-                # Filtrar por ano inteiro
                 filtros['data_inicio'] = date(ano, 1, 1).isoformat()
                 filtros['data_fim'] = date(ano, 12, 31).isoformat()
-                print(f"   ??? Filtro ano: {filtros['data_inicio']} at� {filtros['data_fim']}")
-        
-        # Filtro de busca textual (search) - ser� aplicado ap�s consulta
-        # Filtro de cliente/fornecedor - ser� aplicado ap�s consulta
-        
-        print(f"?? Filtros montados: {filtros}")
-        
-        # Chamar m�todo com todos os par�metros
-        print(f"?? Chamando database.listar_lancamentos()...")
-        lancamentos = database.listar_lancamentos(
-            empresa_id=empresa_id,
-            filtros=filtros,
-            filtro_cliente_id=filtro_cliente_id,
-            page=page,
-            per_page=per_page
-        )
-        
-        print(f"? Retornaram {len(lancamentos)} lan�amentos")
-        
-        # VERIFICAR DUPLICATAS
-        if lancamentos:
-            ids = [l.id for l in lancamentos if hasattr(l, 'id')]
-            ids_unicos = set(ids)
-            if len(ids) != len(ids_unicos):
-                duplicados = [id for id in ids if ids.count(id) > 1]
-                print(f"?? ATEN��O: QUERY RETORNOU IDs DUPLICADOS!")
-                print(f"   Total IDs: {len(ids)}, �nicos: {len(ids_unicos)}")
-                print(f"   IDs duplicados: {set(duplicados)}")
-            else:
-                print(f"? Todos os IDs s�o �nicos ({len(ids_unicos)} registros)")
-        
-        # Converter para lista de dicts
-        lancamentos_list = []
-        for idx, l in enumerate(lancamentos):
-            try:
-                item = {
-                    'id': l.id if hasattr(l, 'id') else None,
-                    'tipo': l.tipo.value if hasattr(l.tipo, 'value') else str(l.tipo),
-                    'descricao': l.descricao,
-                    'valor': float(l.valor),
-                    'data_vencimento': l.data_vencimento.isoformat() if l.data_vencimento else None,
-                    'data_pagamento': l.data_pagamento.isoformat() if l.data_pagamento else None,
-                    'status': l.status.value if hasattr(l.status, 'value') else str(l.status),
-                    'categoria': l.categoria,
-                    'subcategoria': l.subcategoria,
-                    'conta_bancaria': l.conta_bancaria,
-                    'pessoa': l.pessoa,
-                    'observacoes': l.observacoes,
-                    'num_documento': getattr(l, 'num_documento', ''),
-                    'associacao': getattr(l, 'associacao', ''),
-                    'numero_documento': getattr(l, 'numero_documento', ''),
-                    'recorrente': getattr(l, 'recorrente', False),
-                    'frequencia_recorrencia': getattr(l, 'frequencia_recorrencia', ''),
-                    'cliente_id': getattr(l, 'pessoa', None)
-                }
-                lancamentos_list.append(item)
-            except Exception as e:
-                print(f"?? Erro ao converter lan�amento {idx} (ID: {getattr(l, 'id', '?')}): {e}")
-                continue
-        
-        # Aplicar filtros adicionais (search, cliente, fornecedor) em mem�ria
+
+        # Busca textual e cliente/fornecedor vao para o SQL (antes eram
+        # aplicados em memoria, o que quebraria o tamanho das paginas)
         if search_filtro:
-            search_lower = search_filtro.lower()
-            lancamentos_list = [
-                l for l in lancamentos_list 
-                if (search_lower in (l.get('descricao') or '').lower() or
-                    search_lower in (l.get('pessoa') or '').lower() or
-                    search_lower in (l.get('observacoes') or '').lower())
-            ]
-            print(f"?? Ap�s filtro search: {len(lancamentos_list)} registros")
-        
-        if cliente_filtro:
-            lancamentos_list = [l for l in lancamentos_list if l.get('pessoa') == cliente_filtro]
-            print(f"?? Ap�s filtro cliente: {len(lancamentos_list)} registros")
-        
-        if fornecedor_filtro:
-            lancamentos_list = [l for l in lancamentos_list if l.get('pessoa') == fornecedor_filtro]
-            print(f"?? Ap�s filtro fornecedor: {len(lancamentos_list)} registros")
-        
-        print(f"?? Retornando {len(lancamentos_list)} lan�amentos no JSON")
-        print("="*80 + "\n")
-        
-        return jsonify({
+            filtros['busca'] = search_filtro
+        pessoas = {p for p in (cliente_filtro, fornecedor_filtro) if p}
+        if len(pessoas) > 1:
+            return jsonify({'success': True, 'data': [], 'total': 0,
+                            'message': 'Nenhum lancamento encontrado'})
+        if pessoas:
+            filtros['pessoa'] = pessoas.pop()
+
+        def _para_dict(l):
+            return {
+                'id': l.id if hasattr(l, 'id') else None,
+                'tipo': l.tipo.value if hasattr(l.tipo, 'value') else str(l.tipo),
+                'descricao': l.descricao,
+                'valor': float(l.valor),
+                'data_vencimento': l.data_vencimento.isoformat() if l.data_vencimento else None,
+                'data_pagamento': l.data_pagamento.isoformat() if l.data_pagamento else None,
+                'status': l.status.value if hasattr(l.status, 'value') else str(l.status),
+                'categoria': l.categoria,
+                'subcategoria': l.subcategoria,
+                'conta_bancaria': l.conta_bancaria,
+                'pessoa': l.pessoa,
+                'observacoes': l.observacoes,
+                'num_documento': getattr(l, 'num_documento', ''),
+                'associacao': getattr(l, 'associacao', ''),
+                'numero_documento': getattr(l, 'numero_documento', ''),
+                'recorrente': getattr(l, 'recorrente', False),
+                'frequencia_recorrencia': getattr(l, 'frequencia_recorrencia', ''),
+                'cliente_id': getattr(l, 'pessoa', None)
+            }
+
+        def _converter(lancamentos):
+            for l in lancamentos:
+                try:
+                    yield _para_dict(l)
+                except Exception as e:
+                    print(f"Erro ao converter lancamento (ID: {getattr(l, 'id', '?')}): {e}")
+
+        paginado = 'cursor' in request.args or 'limite' in request.args
+        page = request.args.get('page', type=int)
+
+        if not paginado and page is None:
+            # Lista completa: escrita em stream a partir de um cursor
+            # server-side, sem montar a lista inteira em memoria
+            if not empresa_id and not filtro_cliente_id:
+                return jsonify({'success': True, 'data': [], 'total': 0,
+                                'message': 'Nenhum lancamento encontrado'})
+            return resposta_json_stream(_converter(database.iterar_lancamentos(
+                empresa_id=empresa_id or filtro_cliente_id,
+                filtros=filtros
+            )))
+
+        proximo_cursor = None
+        total_estimado = None
+        if paginado:
+            if not empresa_id:
+                return jsonify({'success': False, 'error': 'Empresa nao selecionada'}), 400
+            try:
+                pagina = database.listar_lancamentos_pagina(
+                    empresa_id=empresa_id,
+                    filtros=filtros,
+                    cursor_pagina=request.args.get('cursor') or None,
+                    limite=request.args.get('limite', default=50, type=int),
+                    estimar_total=request.args.get('estimar_total') in ('1', 'true')
+                )
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+            lancamentos = pagina['lancamentos']
+            proximo_cursor = pagina['proximo_cursor']
+            total_estimado = pagina['total_estimado']
+        else:
+            # Paginacao legada por pagina (OFFSET)
+            per_page = min(request.args.get('per_page', default=300, type=int), 300)
+            lancamentos = database.listar_lancamentos(
+                empresa_id=empresa_id,
+                filtros=filtros,
+                filtro_cliente_id=filtro_cliente_id,
+                page=page,
+                per_page=per_page
+            )
+
+        lancamentos_list = list(_converter(lancamentos))
+        resposta = {
             'success': True,
             'data': lancamentos_list,
             'total': len(lancamentos_list),
             'message': 'Nenhum lan�amento encontrado' if len(lancamentos_list) == 0 else None
-        })
+        }
+        if paginado:
+            resposta['proximo_cursor'] = proximo_cursor
+            resposta['total_estimado'] = total_estimado
+        return jsonify(resposta)
     except Exception as e:
-        print(f"? ERRO CR�TICO em listar_lancamentos: {e}")
+        print(f"ERRO em listar_lancamentos: {e}")
         import traceback
         traceback.print_exc()
-        print("="*80 + "\n")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
@@ -4635,45 +4624,6 @@ def upload_extrato_ofx():
         
         print(f"? Conta est� ativa, prosseguindo com o upload...")
         
-        # Parse OFX � ler bytes brutos e recodificar para evitar erros de charset
-        # Arquivos OFX de bancos brasileiros costumam usar CP1252/ISO-8859-1 com
-        # bytes invalidos (ex: 0x8d que nao existe no charmap/cp1252).
-        # Estrategia: latin-1 aceita TODOS os bytes 0x00-0xFF garantidamente,
-        # depois recodifica para UTF-8 limpo e normaliza o header CHARSET do OFX.
-        try:
-            import ofxparse
-            import io
-            import re as _re
-
-            raw_bytes = file.read()
-
-            # latin-1 (ISO-8859-1) mapeia 1:1 bytes ? unicode para 0x00-0xFF, nunca falha
-            decoded_content = raw_bytes.decode('latin-1', errors='replace')
-
-            # Normalizar header SGML do OFX para evitar que ofxparse tente
-            # redecodificar com charset errado (ex: CHARSET:1252 ? CHARSET:0 / UTF-8)
-            # O header fica antes da tag <OFX> e tem linhas KEY:VALUE
-            decoded_content = _re.sub(
-                r'(?im)^(CHARSET\s*:\s*).*$', r'\g<1>0', decoded_content
-            )
-            decoded_content = _re.sub(
-                r'(?im)^(ENCODING\s*:\s*).*$', r'\g<1>UTF-8', decoded_content
-            )
-            # Remover caracteres de controle invis�veis que quebram o parser
-            # (manter \t, \n, \r que s�o v�lidos em XML/SGML)
-            decoded_content = _re.sub(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f]', '', decoded_content)
-
-            # Recodificar para UTF-8 limpo e passar ao ofxparse via BytesIO
-            clean_bytes = decoded_content.encode('utf-8', errors='replace')
-            ofx = ofxparse.OfxParser.parse(io.BytesIO(clean_bytes))
-        except Exception as e:
-            return jsonify({'success': False, 'error': f'Erro ao processar OFX: {str(e)}'}), 400
-        
-        print(f"\n?? Importando OFX: deduplicacao por FITID ativa - transacoes ja existentes serao ignoradas")
-        
-        # Extrair transacoes
-        transacoes = []
-
         # --- Carregar filtros de MEMO (Ajuste de OFX) para esta empresa + conta ---
         _memos_ignorar = set()
         try:
@@ -4693,95 +4643,46 @@ def upload_extrato_ofx():
             logger.warning(f"?? N�o foi poss�vel carregar filtros de MEMO: {_fe}")
         # --------------------------------------------------------------------------
 
-        for account in ofx.accounts:
-            # Obter saldo final do OFX
-            saldo_final = float(account.statement.balance) if hasattr(account.statement, 'balance') else None
+        # Parse OFX em streaming (app/utils/ofx_stream): o arquivo e lido em blocos,
+        # decodificado como latin-1 (aceita todos os bytes 0x00-0xFF, entao o
+        # CHARSET declarado pelo banco e irrelevante) e com caracteres de controle
+        # removidos. Memoria constante, independente do tamanho do extrato:
+        #   1a passada: resumo por conta (saldo final, soma, primeira data)
+        #   2a passada: transacoes entregues uma a uma para a ingestao em massa
+        from app.utils import ofx_stream
+
+        ofx_file = file.stream
+        try:
+            resumos_contas = ofx_stream.resumir_ofx(ofx_file, _memos_ignorar)
+        except Exception as e:
+            return jsonify({'success': False, 'error': f'Erro ao processar OFX: {str(e)}'}), 400
+        
+        print(f"\n?? Importando OFX: deduplicacao por FITID ativa - transacoes ja existentes serao ignoradas")
+
+        saldos_iniciais = {}
+        for resumo in resumos_contas:
+            saldo_final = float(resumo['saldo_final']) if resumo['saldo_final'] is not None else None
             
             print(f"\n{'='*60}")
             print(f"?? AN�LISE DO ARQUIVO OFX")
             print(f"{'='*60}")
-            print(f"?? Conta: {account.number if hasattr(account, 'number') else 'N/A'}")
-            print(f"?? Per�odo: {account.statement.start_date} a {account.statement.end_date}")
+            print(f"?? Conta: {resumo['numero'] or 'N/A'}")
+            print(f"?? Per�odo: {resumo['data_inicio']} a {resumo['data_fim']}")
             print(f"?? Saldo Final (OFX): R$ {saldo_final:,.2f}" if saldo_final else "?? Saldo Final: N�O INFORMADO")
-            print(f"?? Total de transa��es: {len(account.statement.transactions)}")
-            
-            # Ordenar transa��es por data (mais antiga primeiro)
-            transactions_list = sorted(account.statement.transactions, key=lambda t: t.date)
+            print(f"?? Total de transa��es: {resumo['total_transacoes']}")
+            if resumo['ignoradas_memo']:
+                logger.info(f"?? Ajuste OFX: {resumo['ignoradas_memo']} transa��o(�es) ignorada(s) por filtro de MEMO")
+                print(f"?? Ajuste OFX: {resumo['ignoradas_memo']} transa��o(�es) ignorada(s) por filtro de MEMO")
             
-            # Aplicar filtros de MEMO (Ajuste de OFX) � remover transa��es ignoradas
-            if _memos_ignorar:
-                _antes = len(transactions_list)
-                transactions_list = [
-                    t for t in transactions_list
-                    if (t.memo or '').strip().upper() not in _memos_ignorar
-                    and (t.payee or '').strip().upper() not in _memos_ignorar
-                ]
-                _ignoradas = _antes - len(transactions_list)
-                if _ignoradas:
-                    logger.info(f"?? Ajuste OFX: {_ignoradas} transa��o(�es) ignorada(s) por filtro de MEMO")
-                    print(f"?? Ajuste OFX: {_ignoradas} transa��o(�es) ignorada(s) por filtro de MEMO")
-            
-            # PRIMEIRO: processar transa��es para corrigir sinais
-            transacoes_processadas = []
-            for trans in transactions_list:
-                valor_ofx = float(trans.amount)
-                trans_type = getattr(trans, 'type', None)
-                
-                # Determinar tipo e corrigir sinal
-                # Tipos OFX padrão de DÉBITO (saída de dinheiro)
-                _TIPOS_DEBITO = {'DEBIT', 'DEB', 'PAYMENT', 'ATM', 'DIRECTDEBIT', 'REPEATPMT',
-                                 'FEE', 'SRVCHG', 'CHECK', 'POS', 'DÉBITO', 'DEBITO'}
-                # Tipos OFX padrão de CRÉDITO (entrada de dinheiro)
-                _TIPOS_CREDITO = {'CREDIT', 'DIRECTDEP', 'DEP', 'INT', 'DIV', 'XFER',
-                                  'HOLD', 'OTHER', 'CASH', 'CRÉDITO', 'CREDITO'}
-                if trans_type:
-                    _tt = trans_type.upper()
-                    if _tt in _TIPOS_DEBITO:
-                        tipo = 'debito'
-                        valor_correto = -abs(valor_ofx)  # DÉBITO sempre negativo
-                    elif _tt in _TIPOS_CREDITO:
-                        tipo = 'credito'
-                        valor_correto = abs(valor_ofx)   # CRÉDITO sempre positivo
-                    else:
-                        # Tipo desconhecido: usar sinal do valor como desempate
-                        if valor_ofx < 0:
-                            tipo = 'debito'
-                            valor_correto = valor_ofx
-                        else:
-                            tipo = 'credito'
-                            valor_correto = valor_ofx
-                        print(f"⚠️  OFX: TRNTYPE desconhecido '{trans_type}' — usando sinal do valor ({valor_ofx:.2f} → {tipo})")
-                else:
-                    # Sem trans_type: usar sinal do valor
-                    if valor_ofx < 0:
-                        tipo = 'debito'
-                        valor_correto = valor_ofx
-                    else:
-                        tipo = 'credito'
-                        valor_correto = valor_ofx
-                
-                transacoes_processadas.append({
-                    'trans': trans,
-                    'valor_ofx': valor_ofx,
-                    'valor_correto': valor_correto,
-                    'tipo': tipo
-                })
+            if resumo['total_transacoes'] == 0:
+                continue
             
             # Calcular saldo inicial baseado no saldo final e soma correta das transa��es
             # OU usar saldo_inicial da conta se data_inicio for anterior �s transa��es
             if saldo_final is not None:
-                soma_transacoes = sum(t['valor_correto'] for t in transacoes_processadas)
+                soma_transacoes = float(resumo['soma_valores'])
                 saldo_inicial_calculado_ofx = saldo_final - soma_transacoes
-                
-                # ?? FIX: Extrair data da primeira transa��o ignorando timezone
-                if hasattr(transactions_list[0].date, 'year'):
-                    data_primeira_transacao = date(transactions_list[0].date.year, 
-                                                   transactions_list[0].date.month, 
-                                                   transactions_list[0].date.day)
-                elif hasattr(transactions_list[0].date, 'date'):
-                    data_primeira_transacao = transactions_list[0].date.date()
-                else:
-                    data_primeira_transacao = transactions_list[0].date
+                data_primeira_transacao = resumo['data_primeira_transacao']
                 
                 usar_saldo_conta = False
                 if hasattr(conta_info, 'data_inicio') and conta_info.data_inicio:
@@ -4814,54 +4715,23 @@ def upload_extrato_ofx():
                     saldo_atual = 0
                     print(f"   Iniciando em R$ 0,00")
             
-            print(f"\n?? PROCESSANDO TRANSA��ES (cronol�gica):")
-            print(f"{'Data':<12} {'Tipo':<15} {'Valor OFX':>15} {'Valor Correto':>15} {'Saldo Ap�s':>15}")
-            print(f"{'-'*72}")
-            
-            # Processar cada transa��o j� calculada e atualizar saldo
-            for t_proc in transacoes_processadas:
-                trans = t_proc['trans']
-                valor_ofx = t_proc['valor_ofx']
-                valor_correto = t_proc['valor_correto']
-                tipo = t_proc['tipo']
-                
-                # Atualizar saldo: saldo += valor (negativo diminui, positivo aumenta)
-                saldo_atual += valor_correto
-                
-                # ?? FIX: Extrair data ignorando timezone (previne bug -1 dia no Railway/UTC)
-                # Em vez de trans.date.date() que pode ser afetado por timezone do servidor,
-                # usar componentes year/month/day direto do datetime
-                if hasattr(trans.date, 'year'):
-                    data_transacao = date(trans.date.year, trans.date.month, trans.date.day)
-                elif hasattr(trans.date, 'date'):
-                    data_transacao = trans.date.date()
-                else:
-                    data_transacao = trans.date
-                
-                data_str = str(data_transacao)
-                tipo_label = '?? D�BITO' if tipo == 'debito' else '?? CR�DITO'
-                print(f"{data_str:<12} {tipo_label:<15} {valor_ofx:>+15.2f} {valor_correto:>+15.2f} {saldo_atual:>15.2f}")
-                
-                transacoes.append({
-                    'data': data_transacao,
-                    'descricao': trans.payee or trans.memo or 'Sem descricao',
-                    'valor': valor_correto,  # Guardar valor com sinal (negativo para d�bito, positivo para cr�dito)
-                    'tipo': tipo.upper(),  # DEBITO ou CREDITO (mai�sculo)
-                    'saldo': saldo_atual,  # Saldo ap�s esta transa��o
-                    'fitid': trans.id,
-                    'memo': trans.memo,
-                    'checknum': trans.checknum if hasattr(trans, 'checknum') else None
-                })
+            # Saldo apos cada transacao e calculado na ingestao (soma acumulada cronologica)
+            saldos_iniciais[resumo['conta_idx']] = saldo_atual
         
-        if not transacoes:
+        if not saldos_iniciais:
             return jsonify({'success': False, 'error': 'Nenhuma transacao encontrada no arquivo'}), 400
         
-        # Salvar no banco (empresa_id j� foi obtido no in�cio da fun��o)
-        resultado = extrato_functions.salvar_transacoes_extrato(
+        # 2a passada: transacoes em streaming direto para a ingestao
+        ofx_file.seek(0)
+        transacoes = ofx_stream.iter_transacoes_ofx(ofx_file, _memos_ignorar)
+        
+        # Importacao set-based: staging + dedup por FITID + INSERT unico
+        resultado = extrato_functions.salvar_transacoes_extrato_bulk(
             database, 
             empresa_id, 
             conta_bancaria, 
-            transacoes
+            transacoes,
+            saldos_iniciais=saldos_iniciais
         )
         
         if resultado['success']:
@@ -4944,39 +4814,19 @@ def listar_extratos():
         if filtros['conciliado'] is not None:
             filtros['conciliado'] = filtros['conciliado'].lower() == 'true'
         
-        # Fun��o agora retorna dict com 'transacoes' e 'saldo_anterior'
-        logger.info(f"?? Chamando extrato_functions.listar_transacoes_extrato...")
-        resultado = extrato_functions.listar_transacoes_extrato(
-            database,
-            empresa_id,
-            filtros
+        # Saldo anterior antes (valor unico); as transacoes vao direto do
+        # cursor server-side para o JSON, sem lista intermediaria
+        with database.get_db_connection(empresa_id=empresa_id) as conn:
+            cursor = conn.cursor()
+            saldo_anterior = extrato_functions.calcular_saldo_anterior_extrato(cursor, empresa_id, filtros)
+            cursor.close()
+
+        return resposta_json_stream(
+            extrato_functions.iterar_transacoes_extrato(database, empresa_id, filtros),
+            chave='transacoes',
+            campos={'saldo_anterior': saldo_anterior}
         )
         
-        # Log do resultado (evitar backslash em f-string)
-        if isinstance(resultado, dict):
-            qtd_transacoes = len(resultado.get('transacoes', []))
-            logger.info(f"?? Resultado tipo: dict com {qtd_transacoes} transa��es")
-        else:
-            logger.info(f"?? Resultado tipo: {type(resultado)}, conte�do: {resultado}")
-        
-        # Manter compatibilidade: se retornou lista (c�digo antigo), converter
-        if isinstance(resultado, list):
-            transacoes = resultado
-            saldo_anterior = None
-        else:
-            transacoes = resultado.get('transacoes', [])
-            saldo_anterior = resultado.get('saldo_anterior')
-        
-        logger.info(f"? Retornando {len(transacoes)} transa��o(�es) para o frontend")
-        
-        # Retornar no formato esperado pelo frontend
-        resposta = {
-            'transacoes': transacoes,
-            'saldo_anterior': saldo_anterior
-        }
-        
-        return jsonify(resposta), 200
-        
     except Exception as e:
         logger.error(f"? ERRO ao listar extratos: {e}")
         import traceback
@@ -5681,6 +5531,60 @@ def regerar_conciliacao():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/extratos/sugestoes', methods=['POST'])
+@require_permission('lancamentos_view')
+def sugerir_conciliacoes_extrato_lote():
+    """
+    Sugere lancamentos para varias transacoes do extrato numa unica chamada
+
+    Body JSON (um dos dois):
+        {"transacao_ids": [1, 2, 3]}  -> transacoes da pagina exibida
+        {"conta_bancaria": "...", "data_inicio": "YYYY-MM-DD", "data_fim": "YYYY-MM-DD"}
+                                      -> todas as nao conciliadas do filtro
+    Opcional: "limite" (sugestoes por transacao)
+
+    Returns:
+        {"success": true, "sugestoes": {"<transacao_id>": [...]}}
+    """
+    try:
+        empresa_id = session.get('empresa_id')
+        if not empresa_id:
+            return jsonify({'success': False, 'error': 'Empresa nao identificada'}), 403
+
+        dados = request.get_json(silent=True) or {}
+        transacao_ids = dados.get('transacao_ids')
+        if transacao_ids is not None and not isinstance(transacao_ids, list):
+            return jsonify({'success': False, 'error': 'transacao_ids deve ser uma lista'}), 400
+        if transacao_ids is not None and len(transacao_ids) > extrato_functions.LIMITE_TRANSACOES_EXTRATO:
+            return jsonify({
+                'success': False,
+                'error': f'Maximo de {extrato_functions.LIMITE_TRANSACOES_EXTRATO} transacoes por chamada'
+            }), 400
+
+        try:
+            limite = min(int(dados.get('limite') or 10), 50)
+            sugestoes = extrato_functions.sugerir_conciliacoes_lote(
+                database,
+                empresa_id,
+                transacao_ids=transacao_ids,
+                conta_bancaria=dados.get('conta_bancaria'),
+                data_inicio=dados.get('data_inicio'),
+                data_fim=dados.get('data_fim'),
+                limite=limite
+            )
+        except (TypeError, ValueError) as e:
+            return jsonify({'success': False, 'error': f'Parametros invalidos: {e}'}), 400
+
+        return jsonify({
+            'success': True,
+            'sugestoes': {str(transacao_id): lista for transacao_id, lista in sugestoes.items()}
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Erro ao sugerir conciliacoes em lote: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @app.route('/api/extratos/<int:transacao_id>/sugestoes', methods=['GET'])
 @require_permission('lancamentos_view')
 def sugerir_conciliacoes_extrato(transacao_id):
@@ -6392,157 +6296,18 @@ def conciliacao_geral_extrato():
                 cpf_cnpj_limpo = ''.join(filter(str.isdigit, str(cpf_cnpj)))
                 fornecedores_dict[cpf_cnpj_limpo] = fornecedor['nome']
         
-        criados = 0
-        erros = []
-        
-        for item in transacoes:
-            try:
-                transacao_id = item.get('transacao_id')
-                categoria = item.get('categoria')
-                subcategoria = item.get('subcategoria', '')
-                razao_social = item.get('razao_social', '')
-                descricao_personalizada = item.get('descricao', '')
-                
-                # Buscar transa��o do extrato
-                with db.get_connection() as conn:
-                    import psycopg2.extras
-                    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-                    cursor.execute(
-                        "SELECT * FROM transacoes_extrato WHERE id = %s AND empresa_id = %s",
-                        (transacao_id, empresa_id)
-                    )
-                    transacao = cursor.fetchone()
-                    cursor.close()
-                
-                if not transacao:
-                    erros.append(f"Transa��o {transacao_id} n�o encontrada")
-                    continue
-                
-                # Validar se a conta banc�ria est� ativa
-                conta_bancaria = transacao['conta_bancaria']
-                print(f"?? Validando conta banc�ria: {conta_bancaria}")
-                contas = db.listar_contas_por_empresa(empresa_id=empresa_id)
-                print(f"?? Total de contas encontradas: {len(contas)}")
-                
-                # Debug: listar todas as contas
-                for c in contas:
-                    print(f"   - Conta cadastrada: '{c.nome}' (ativa={c.ativa if hasattr(c, 'ativa') else 'N/A'})")
-                
-                conta = next((c for c in contas if c.nome == conta_bancaria), None)
-                
-                if not conta:
-                    erros.append(f"Transa��o {transacao_id}: A conta banc�ria '{conta_bancaria}' n�o est� cadastrada no sistema ou o nome n�o corresponde exatamente. Verifique o cadastro de contas.")
-                    print(f"? Concilia��o bloqueada: conta '{conta_bancaria}' n�o encontrada")
-                    logger.warning(f"? Tentativa de conciliar com conta n�o cadastrada: {conta_bancaria}")
-                    continue
-                
-                print(f"? Conta encontrada: {conta.nome}")
-                print(f"?? Campo ativa existe? {hasattr(conta, 'ativa')}")
-                print(f"?? Valor do campo ativa: {conta.ativa if hasattr(conta, 'ativa') else 'N/A'}")
-                
-                if hasattr(conta, 'ativa') and not conta.ativa:
-                    erros.append(f"Transa��o {transacao_id}: A conta banc�ria '{conta_bancaria}' est� inativa. Reative a conta antes de conciliar.")
-                    print(f"? Concilia��o bloqueada: conta {conta_bancaria} est� inativa")
-                    logger.warning(f"? Tentativa de conciliar com conta inativa: {conta_bancaria}")
-                    continue
-                
-                # Detectar CPF/CNPJ na descri��o (regex simples)
-                import re
-                descricao = transacao['descricao']
-                cpf_cnpj_encontrado = None
-                
-                # Buscar CPF (11 d�gitos) ou CNPJ (14 d�gitos)
-                numeros = ''.join(filter(str.isdigit, descricao))
-                if len(numeros) == 11 or len(numeros) == 14:
-                    cpf_cnpj_encontrado = numeros
-                
-                # Tentar matching autom�tico se n�o foi fornecida raz�o social
-                if not razao_social and cpf_cnpj_encontrado:
-                    if transacao['tipo'].upper() == 'CREDITO':
-                        razao_social = clientes_dict.get(cpf_cnpj_encontrado, '')
-                    else:
-                        razao_social = fornecedores_dict.get(cpf_cnpj_encontrado, '')
-                
-                # ?? CONCILIAR TRANSA��O E CRIAR LAN�AMENTO AUTOMATICAMENTE
-                # Usa a fun��o conciliar_transacao() que agora cria lan�amento com status='PAGO'
-                
-                print(f"?? Conciliando transa��o {transacao_id} (criando lan�amento)...")
-                logger.info(f"?? Conciliando transa��o {transacao_id} - empresa_id: {empresa_id}")
-                
-                # Importar fun��o de concilia��o
-                from extrato_functions import conciliar_transacao
-                
-                # Conciliar com cria��o autom�tica de lan�amento (lancamento_id='auto')
-                resultado = conciliar_transacao(
-                    database=db,
-                    empresa_id=empresa_id,
-                    transacao_id=transacao_id,
-                    lancamento_id='auto'  # Cria novo lan�amento automaticamente
-                )
-                
-                if resultado.get('success'):
-                    lancamento_id = resultado.get('lancamento_id')
-                    
-                    # Atualizar campos extras no LANÇAMENTO e na transação do extrato
-                    if lancamento_id and (categoria or subcategoria or razao_social or descricao_personalizada):
-                        with db.get_db_connection(empresa_id=empresa_id) as conn:
-                            cursor_update = conn.cursor()
-
-                            # ✅ FIX: Atualizar o LANÇAMENTO com os dados selecionados pelo usuário
-                            # (categoria, subcategoria, pessoa, descrição personalizada)
-                            cursor_update.execute("""
-                                UPDATE lancamentos
-                                SET
-                                    categoria    = COALESCE(NULLIF(%s, ''), categoria),
-                                    subcategoria = COALESCE(NULLIF(%s, ''), subcategoria),
-                                    pessoa       = COALESCE(NULLIF(%s, ''), pessoa),
-                                    descricao    = CASE WHEN %s != '' THEN %s ELSE descricao END
-                                WHERE id = %s AND empresa_id = %s
-                            """, (
-                                categoria or '',
-                                subcategoria or '',
-                                razao_social or '',
-                                descricao_personalizada or '',
-                                descricao_personalizada or '',
-                                lancamento_id,
-                                empresa_id
-                            ))
-
-                            # Atualizar também a transação do extrato para consistência
-                            cursor_update.execute("""
-                                UPDATE transacoes_extrato 
-                                SET 
-                                    categoria = COALESCE(%s, categoria),
-                                    subcategoria = COALESCE(%s, subcategoria),
-                                    pessoa = COALESCE(%s, pessoa)
-                                WHERE id = %s AND empresa_id = %s
-                            """, (
-                                categoria if categoria else None,
-                                subcategoria if subcategoria else None,
-                                razao_social if razao_social else None,
-                                transacao_id,
-                                empresa_id
-                            ))
-                            conn.commit()
-                            cursor_update.close()
-                    
-                    print(f"? Transa��o {transacao_id} conciliada ? lan�amento #{lancamento_id} criado com status PAGO")
-                    logger.info(f"? Transa��o {transacao_id} conciliada ? lan�amento #{lancamento_id}")
-                    criados += 1
-                else:
-                    erro_msg = resultado.get('error', 'Erro desconhecido')
-                    erros.append(f"Transa��o {transacao_id}: {erro_msg}")
-                    logger.error(f"? Falha ao conciliar transa��o {transacao_id}: {erro_msg}")
-                    continue
-                
-            except Exception as e:
-                erro_msg = f"Erro na transa��o {item.get('transacao_id')}: {str(e)}"
-                print(f"? {erro_msg}")
-                erros.append(erro_msg)
-                logger.error(f"Erro ao conciliar transa��o {item.get('transacao_id')}: {e}")
-                import traceback
-                print(traceback.format_exc())
-                traceback.print_exc()
+        # Conciliação em lote: uma conexão e uma transação para todo o pedido
+        from extrato_functions import conciliar_transacoes_lote
+        resultado = conciliar_transacoes_lote(
+            database=db,
+            empresa_id=empresa_id,
+            itens=transacoes,
+            clientes_por_documento=clientes_dict,
+            fornecedores_por_documento=fornecedores_dict
+        )
+        criados = resultado['criados']
+        erros = resultado['erros']
+        logger.info(f"Conciliacao geral: {criados} lancamento(s) criado(s), {len(erros)} erro(s)")
         
         # Determinar status de sucesso
         success = criados > 0
@@ -6976,49 +6741,43 @@ def detectar_regras_batch():
         if not transacoes or not isinstance(transacoes, list):
             return jsonify({'success': False, 'error': 'Lista de transa��es � obrigat�ria'}), 400
         
-        resultados = []
-        import re
+        from regras_conciliacao_matcher import extrair_cpf
+        
+        # Matcher compilado da empresa (1 query no cache miss, 0 no hit)
+        matcher = db.obter_matcher_regras(empresa_id)
         
-        # Processar cada transa��o
+        # 1a passada: regra de cada transacao + CPFs a resolver
+        resultados = []
+        cpfs_pendentes = {}
         for transacao in transacoes:
             transacao_id = transacao.get('id')
             descricao = transacao.get('descricao', '')
             
-            if not descricao:
-                resultados.append({
-                    'id': transacao_id,
-                    'regra_encontrada': False,
-                    'regra': None,
-                    'funcionario': None
-                })
-                continue
-            
-            # Buscar regra aplic�vel
-            regra = db.buscar_regra_aplicavel(empresa_id=empresa_id, descricao=descricao)
-            
+            regra = matcher.buscar(descricao) if descricao else None
             resultado = {
                 'id': transacao_id,
                 'regra_encontrada': regra is not None,
                 'regra': regra,
                 'funcionario': None
             }
+            resultados.append(resultado)
             
             # Se regra tem integra��o com folha, buscar CPF na descri��o
             if regra and regra.get('usa_integracao_folha'):
-                cpf_match = re.search(r'\b(\d{11})\b', descricao)
-                
-                if cpf_match:
-                    cpf = cpf_match.group(1)
-                    funcionario = db.buscar_funcionario_por_cpf(empresa_id=empresa_id, cpf=cpf)
-                    
-                    if funcionario:
-                        resultado['funcionario'] = {
-                            'nome': funcionario.get('nome'),
-                            'cpf': funcionario.get('cpf'),
-                            'cargo': funcionario.get('cargo')
-                        }
-            
-            resultados.append(resultado)
+                cpf = extrair_cpf(descricao)
+                if cpf:
+                    cpfs_pendentes.setdefault(cpf, []).append(resultado)
+        
+        # 2a passada: todos os funcionarios em uma unica query (cpf = ANY(...))
+        if cpfs_pendentes:
+            funcionarios = db.buscar_funcionarios_por_cpfs(empresa_id, list(cpfs_pendentes))
+            for cpf, funcionario in funcionarios.items():
+                for resultado in cpfs_pendentes.get(cpf, []):
+                    resultado['funcionario'] = {
+                        'nome': funcionario.get('nome'),
+                        'cpf': funcionario.get('cpf'),
+                        'cargo': funcionario.get('cargo')
+                    }
         
         return jsonify({
             'success': True,
@@ -10137,52 +9896,33 @@ def relatorio_fluxo_projetado():
             with get_db_connection(empresa_id=empresa_id) as conn:
                 cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
                 
+                # Saldo da ultima transacao de extrato de cada conta (checkpoints mensais)
+                saldos_extrato = extrato_functions.ultimos_saldos_extrato(cursor, empresa_id)
+                
+                # Receitas/despesas pagas por conta, numa unica consulta (fallback sem extrato)
+                cursor.execute("""
+                    SELECT conta_bancaria,
+                           COALESCE(SUM(valor) FILTER (WHERE tipo = 'receita'), 0) AS total_receitas,
+                           COALESCE(SUM(valor) FILTER (WHERE tipo = 'despesa'), 0) AS total_despesas
+                    FROM lancamentos
+                    WHERE empresa_id = %s
+                    AND status = 'pago'
+                    GROUP BY conta_bancaria
+                """, (empresa_id,))
+                pagos_por_conta = {row['conta_bancaria']: row for row in cursor.fetchall()}
+                
                 for c in contas:
-                    # Verificar se existem transa��es de extrato para esta conta
-                    cursor.execute("""
-                        SELECT saldo, data, id
-                        FROM transacoes_extrato
-                        WHERE empresa_id = %s
-                        AND conta_bancaria = %s
-                        ORDER BY data DESC, id DESC
-                        LIMIT 1
-                    """, (empresa_id, c.nome))
-                    
-                    ultima_transacao_extrato = cursor.fetchone()
+                    saldo_extrato = saldos_extrato.get(c.nome)
                     
-                    if ultima_transacao_extrato and ultima_transacao_extrato['saldo'] is not None:
-                        # ? USAR SALDO DO EXTRATO (mais recente e confi�vel)
-                        saldo_conta = Decimal(str(ultima_transacao_extrato['saldo']))
+                    if saldo_extrato is not None:
+                        # USAR SALDO DO EXTRATO (mais recente e confiavel)
+                        saldo_conta = Decimal(str(saldo_extrato))
                         print(f"?? Fluxo Projetado - Conta {c.nome}: Saldo do extrato = R$ {saldo_conta:.2f}")
                     else:
-                        # ?? FALLBACK: Calcular com base nos lan�amentos manuais
-                        print(f"?? Fluxo Projetado - Conta {c.nome}: Sem extrato, calculando com lan�amentos...")
-                        
-                        # Somar receitas pagas
-                        cursor.execute("""
-                            SELECT COALESCE(SUM(valor), 0) as total_receitas
-                            FROM lancamentos
-                            WHERE empresa_id = %s
-                            AND conta_bancaria = %s
-                            AND tipo = 'receita'
-                            AND status = 'pago'
-                        """, (empresa_id, c.nome))
-                        resultado_receitas = cursor.fetchone()
-                        total_receitas = Decimal(str(resultado_receitas['total_receitas'] or 0))
-                        
-                        # Somar despesas pagas
-                        cursor.execute("""
-                            SELECT COALESCE(SUM(valor), 0) as total_despesas
-                            FROM lancamentos
-                            WHERE empresa_id = %s
-                            AND conta_bancaria = %s
-                            AND tipo = 'despesa'
-                            AND status = 'pago'
-                        """, (empresa_id, c.nome))
-                        resultado_despesas = cursor.fetchone()
-                        total_despesas = Decimal(str(resultado_despesas['total_despesas'] or 0))
-                        
-                        # Calcular saldo
+                        # FALLBACK: Calcular com base nos lancamentos pagos
+                        pagos = pagos_por_conta.get(c.nome) or {}
+                        total_receitas = Decimal(str(pagos.get('total_receitas') or 0))
+                        total_despesas = Decimal(str(pagos.get('total_despesas') or 0))
                         saldo_conta = Decimal(str(c.saldo_inicial)) + total_receitas - total_despesas
                         print(f"?? Fluxo Projetado - Conta {c.nome}: Saldo calculado = R$ {saldo_conta:.2f}")
                     
@@ -13044,17 +12784,26 @@ def admin_backup_manual():
     Dispara backup manual do banco, separado por empresa.
     Gera um ZIP com os dados e retorna como download direto.
     (Envio de backup por e-mail foi desativado.)
+
+    Body opcional: {"formato": "jsonl" | "copy", "incremental": true}
+    O ZIP e gravado em arquivo temporario e enviado em streaming.
     """
     try:
-        from backup_email import gerar_backup_zip_por_empresa
+        from backup_email import gerar_backup_temporario
 
         DATABASE_URL_CHECK = os.getenv('DATABASE_URL', '')
         if not DATABASE_URL_CHECK:
             return jsonify({'success': False, 'error': 'DATABASE_URL não configurado'}), 500
 
+        data = request.get_json(silent=True) or {}
+        formato = data.get('formato', 'jsonl')
+        if formato not in ('jsonl', 'copy'):
+            return jsonify({'success': False, 'error': 'formato deve ser jsonl ou copy'}), 400
+
         print(f"📦 [BACKUP MANUAL] Iniciado por {request.usuario.get('username', '?')}")
-        zip_bytes, nome_arquivo, info = gerar_backup_zip_por_empresa()
-        print(f"✅ [BACKUP MANUAL] Zip gerado: {nome_arquivo} ({len(zip_bytes)} bytes)")
+        arquivo, nome_arquivo, info = gerar_backup_temporario(formato=formato, incremental=bool(data.get('incremental')))
+        tamanho = os.fstat(arquivo.fileno()).st_size
+        print(f"✅ [BACKUP MANUAL] Zip gerado: {nome_arquivo} ({tamanho} bytes, {info['modo']})")
 
         # Registrar log
         try:
@@ -13068,11 +12817,7 @@ def admin_backup_manual():
         except Exception:
             pass
 
-        from flask import make_response
-        response = make_response(zip_bytes)
-        response.headers['Content-Type'] = 'application/zip'
-        response.headers['Content-Disposition'] = f'attachment; filename="{nome_arquivo}"'
-        return response
+        return send_file(arquivo, mimetype='application/zip', as_attachment=True, download_name=nome_arquivo)
 
     except Exception as e:
         print(f"❌ [BACKUP MANUAL] Erro: {e}")
@@ -14308,8 +14053,10 @@ def pool_status():
         status = database.get_pool_status()
         
         # Adicionar informa��es extras
+        if 'error' in status:
+            return jsonify({'status': 'error', 'error': status['error']}), 500
         status['status'] = 'healthy'
-        status['pool_type'] = 'ThreadedConnectionPool'
+        status['pool_type'] = 'PoolConexoesJusto'
         
         # Verificar se h� muitas conex�es em uso
         if 'in_use' in status and 'maxconn' in status:
@@ -14321,6 +14068,10 @@ def pool_status():
             elif usage_percent > 75:
                 status['notice'] = 'Pool com alto uso.'
         
+        # Requisicoes aguardando conexao na fila (wait_time_s/queue_depth trazem o historico)
+        if status.get('waiting'):
+            status['warning'] = f"{status['waiting']} requisicao(oes) aguardando conexao."
+        
         return jsonify(status), 200
     except Exception as e:
         return jsonify({
@@ -14475,6 +14226,10 @@ def adicionar_permissoes_regras():
         cursor.close()
         conn.close()
         
+        # Permissões de usuario_empresas mudaram: descartar cache de acesso
+        from auth_cache import invalidar_usuario_cache
+        invalidar_usuario_cache()
+        
         return jsonify({
             'success': True,
             'message': f'{atualizados} v�nculo(s) atualizado(s)',
@@ -14721,6 +14476,9 @@ def adicionar_permissoes_config_extrato():
         """, fetch_one=True, allow_global=True)
         
         rows_updated = result['atualizados'] if result else 0
+        if rows_updated:
+            from auth_cache import invalidar_usuario_cache
+            invalidar_usuario_cache()
         
         # 3. Verificar total
         result_total = execute_query("""
@@ -16042,10 +15800,12 @@ def listar_nfse_controle():
             return jsonify({'success': False, 'error': 'Empresa não selecionada'}), 403
 
         db_params = get_nfse_db_params()
-        with psycopg2.connect(**db_params) as conn:
-            _ensure_nfse_controle_table(conn)
-            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-                cur.execute("""
+
+        def _nfses():
+            conn = psycopg2.connect(**db_params)
+            try:
+                _ensure_nfse_controle_table(conn)
+                yield from linhas_cursor(conn, """
                     SELECT id, numero_nfse, data_emissao, cnpj_tomador,
                            razao_social_tomador, valor_liquido, valor_servico,
                            discriminacao, situacao, situacao_recebimento,
@@ -16059,19 +15819,10 @@ def listar_nfse_controle():
                     WHERE empresa_id = %s
                     ORDER BY data_emissao DESC NULLS LAST
                 """, (empresa_id,))
-                rows = cur.fetchall()
-
-        result = []
-        for row in rows:
-            item = dict(row)
-            for k, v in item.items():
-                if isinstance(v, (date, datetime)):
-                    item[k] = v.isoformat()
-                elif isinstance(v, Decimal):
-                    item[k] = float(v)
-            result.append(item)
+            finally:
+                conn.close()
 
-        return jsonify({'success': True, 'nfses': result, 'total': len(result)})
+        return resposta_json_stream(_nfses(), chave='nfses')
     except Exception as e:
         logger.error(f"Erro ao listar NFS-e controle: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -16608,9 +16359,10 @@ def listar_nfse_baixadas():
             params_sql.append(data_fim)
         where_sql = " AND ".join(conditions)
 
-        with psycopg2.connect(**db_params) as conn:
-            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-                cur.execute(f"""
+        def _nfses():
+            conn = psycopg2.connect(**db_params)
+            try:
+                yield from linhas_cursor(conn, f"""
                     SELECT id, numero_nfse, data_emissao, cnpj_tomador,
                            razao_social_tomador, valor_liquido, valor_servico,
                            discriminacao, situacao, situacao_recebimento,
@@ -16620,19 +16372,10 @@ def listar_nfse_baixadas():
                     WHERE {where_sql}
                     ORDER BY data_emissao DESC
                 """, params_sql)
-                rows = cur.fetchall()
-
-        result = []
-        for row in rows:
-            item = dict(row)
-            for k, v in item.items():
-                if isinstance(v, (date, datetime)):
-                    item[k] = v.isoformat()
-                elif isinstance(v, Decimal):
-                    item[k] = float(v)
-            result.append(item)
+            finally:
+                conn.close()
 
-        return jsonify({'success': True, 'nfses': result, 'total': len(result)})
+        return resposta_json_stream(_nfses(), chave='nfses')
     except Exception as e:
         logger.error(f"Erro ao listar nfse_baixadas: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -18858,7 +18601,23 @@ def gerar_dre_api():
                 versao_plano_id=data.get('versao_plano_id'),
                 comparar_periodo_anterior=data.get('comparar_periodo_anterior', False)
             )
-        
+
+            # Evolução dos 12 meses até data_fim (agregado mensal, uma query)
+            if resultado.get('success') and data.get('incluir_evolucao_mensal', True):
+                from dateutil.relativedelta import relativedelta
+                from relatorios_contabeis_functions import gerar_evolucao_mensal_dre, resumir_mes_dre
+                evolucao = gerar_evolucao_mensal_dre(
+                    conn=conn,
+                    empresa_id=empresa_id,
+                    mes_inicio=data_fim.replace(day=1) - relativedelta(months=11),
+                    mes_fim=data_fim,
+                    versao_plano_id=data.get('versao_plano_id')
+                )
+                if evolucao['success']:
+                    resultado['evolucao_mensal'] = [
+                        resumir_mes_dre(item['mes'], item['dre']) for item in evolucao['meses']
+                    ]
+
         return jsonify(resultado)
     except Exception as e:
         logger.error(f"Erro ao gerar DRE: {e}")
@@ -19917,7 +19676,7 @@ def sped_ecd_gerar():
     }
     """
     try:
-        from sped_ecd_functions import gerar_arquivo_ecd
+        from sped_ecd_functions import escrever_arquivo_ecd
         
         data = request.get_json()
         usuario = get_usuario_logado()
@@ -19934,22 +19693,23 @@ def sped_ecd_gerar():
                 'error': 'data_inicio e data_fim s�o obrigat�rios'
             }), 400
         
-        # Gerar ECD
-        resultado = gerar_arquivo_ecd(
+        # Gerar ECD sem montar o arquivo em memoria (so hash, contagens e preview)
+        resultado = escrever_arquivo_ecd(
+            None,
             empresa_id=empresa_id,
             data_inicio=data_inicio,
             data_fim=data_fim,
-            versao_plano_id=versao_plano_id
+            versao_plano_id=versao_plano_id,
+            linhas_preview=50
         )
         
         if not resultado['success']:
             return jsonify(resultado), 400
         
         # Retornar preview (primeiras 50 linhas)
-        linhas = resultado['conteudo'].split('\n')
-        preview = '\n'.join(linhas[:50])
-        if len(linhas) > 50:
-            preview += f"\n\n... (mais {len(linhas) - 50} linhas)"
+        preview = '\n'.join(resultado['preview'])
+        if resultado['total_linhas'] > 50:
+            preview += f"\n\n... (mais {resultado['total_linhas'] - 50} linhas)"
         
         return jsonify({
             'success': True,
@@ -19986,10 +19746,15 @@ def sped_ecd_exportar():
         "hash": "ABC123...",
         "nome_arquivo": "ECD_CNPJ_AAAAMMDD.txt"
     }
+    
+    Com "download": true no body o arquivo TXT e gravado em disco durante a
+    geracao e devolvido como anexo (hash e total nos headers X-ECD-Hash e
+    X-ECD-Total-Linhas), sem carregar o conteudo inteiro em memoria.
     """
     try:
-        from sped_ecd_functions import gerar_arquivo_ecd
+        from sped_ecd_functions import gerar_arquivo_ecd, escrever_arquivo_ecd
         from database_postgresql import get_connection
+        import tempfile
         
         data = request.get_json()
         usuario = get_usuario_logado()
@@ -20007,12 +19772,25 @@ def sped_ecd_exportar():
             }), 400
         
         # Gerar ECD
-        resultado = gerar_arquivo_ecd(
-            empresa_id=empresa_id,
-            data_inicio=data_inicio,
-            data_fim=data_fim,
-            versao_plano_id=versao_plano_id
-        )
+        download = bool(data.get('download'))
+        if download:
+            arquivo = tempfile.TemporaryFile()
+            resultado = escrever_arquivo_ecd(
+                arquivo,
+                empresa_id=empresa_id,
+                data_inicio=data_inicio,
+                data_fim=data_fim,
+                versao_plano_id=versao_plano_id
+            )
+            if not resultado['success']:
+                arquivo.close()
+        else:
+            resultado = gerar_arquivo_ecd(
+                empresa_id=empresa_id,
+                data_inicio=data_inicio,
+                data_fim=data_fim,
+                versao_plano_id=versao_plano_id
+            )
         
         if not resultado['success']:
             return jsonify(resultado), 400
@@ -20032,6 +19810,13 @@ def sped_ecd_exportar():
         data_ref = data_fim.replace('-', '')[:8]  # AAAAMMDD
         nome_arquivo = f"ECD_{cnpj_limpo}_{data_ref}.txt"
         
+        if download:
+            arquivo.seek(0)
+            response = send_file(arquivo, mimetype='text/plain; charset=utf-8', as_attachment=True, download_name=nome_arquivo)
+            response.headers['X-ECD-Hash'] = resultado['hash']
+            response.headers['X-ECD-Total-Linhas'] = str(resultado['total_linhas'])
+            return response
+        
         return jsonify({
             'success': True,
             'conteudo': resultado['conteudo'],
@@ -22468,6 +22253,57 @@ def buscar_documentos():
         }), 500
 
 
+@app.route('/api/relatorios/buscar-documentos/lote', methods=['POST'])
+@require_auth
+@require_permission('relatorios_view')
+def buscar_documentos_lote():
+    """
+    Inicia em segundo plano a busca SEFAZ de TODOS os certificados ativos da empresa
+
+    Os certificados sao buscados em paralelo, em quantos lotes de NSU forem
+    necessarios. Acompanhar por GET /api/relatorios/buscar-documentos/lote/<job_id>.
+    """
+    try:
+        usuario = get_usuario_logado()
+        empresa_id = session.get('empresa_id') or usuario.get('empresa_id')
+        if not empresa_id:
+            return jsonify({'sucesso': False, 'erro': 'Empresa nao identificada'}), 403
+
+        from relatorios.nfe import nfe_orquestrador
+
+        resultado = nfe_orquestrador.iniciar_busca_lote(empresa_id=empresa_id, usuario_id=usuario['id'])
+        if not resultado.get('sucesso'):
+            return jsonify(resultado), 400
+        return jsonify(resultado), 202
+
+    except Exception as e:
+        logger.error(f"Erro ao iniciar busca de documentos em lote: {e}")
+        return jsonify({'sucesso': False, 'erro': f'Erro no servidor: {str(e)}'}), 500
+
+
+@app.route('/api/relatorios/buscar-documentos/lote/<job_id>', methods=['GET'])
+@require_auth
+@require_permission('relatorios_view')
+def status_buscar_documentos_lote(job_id):
+    """Andamento da busca em lote: status geral e contadores por certificado"""
+    try:
+        usuario = get_usuario_logado()
+        empresa_id = session.get('empresa_id') or usuario.get('empresa_id')
+        if not empresa_id:
+            return jsonify({'sucesso': False, 'erro': 'Empresa nao identificada'}), 403
+
+        from relatorios.nfe import nfe_orquestrador
+
+        job = nfe_orquestrador.obter_status_busca_lote(job_id, empresa_id=empresa_id)
+        if not job:
+            return jsonify({'sucesso': False, 'erro': 'Busca nao encontrada'}), 404
+        return jsonify({'sucesso': True, **job})
+
+    except Exception as e:
+        logger.error(f"Erro ao consultar busca de documentos em lote: {e}")
+        return jsonify({'sucesso': False, 'erro': f'Erro no servidor: {str(e)}'}), 500
+
+
 @app.route('/api/relatorios/consultar-chave', methods=['POST'])
 @require_auth
 @require_permission('relatorios_view')
@@ -22580,9 +22416,6 @@ def listar_documentos():
             sql += " LIMIT %s OFFSET %s"
             params.extend([per_page, (page - 1) * per_page])
             
-            cursor.execute(sql, params)
-            documentos = cursor.fetchall()
-            
             # Total de registros
             sql_count = """
                 SELECT COUNT(*) as total
@@ -22607,10 +22440,14 @@ def listar_documentos():
             
             cursor.execute(sql_count, count_params)
             total = cursor.fetchone()['total']
+            cursor.close()
         
-        return jsonify({
-            'success': True,
-            'documentos': documentos,
+        def _documentos():
+            with get_db_connection(empresa_id=empresa_id) as conn:
+                yield from linhas_cursor(conn, sql, params)
+        
+        # 'total' e o total de registros do filtro, nao o tamanho da pagina
+        return resposta_json_stream(_documentos(), chave='documentos', chave_total=None, campos={
             'total': total,
             'page': page,
             'per_page': per_page,
@@ -23662,6 +23499,116 @@ def admin_destinatarios_avisos():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+# =============================================================================
+# FILA DE JOBS (operacoes longas fora da requisicao HTTP)
+# =============================================================================
+
+def _job_permitido(fila_jobs, nome_tipo, usuario, empresa_id):
+    """
+    Mesmas regras do endpoint sincrono: somente_admin e a permissao do tipo
+    na empresa. Vale para enfileirar, acompanhar e baixar.
+    """
+    admin = usuario.get('tipo', '').strip().lower() == 'admin'
+    tipo = fila_jobs.obter_tipo(nome_tipo or '')
+    if tipo is None:
+        return admin
+    if admin or tipo.somente_admin or tipo.permissao is None:
+        return tipo.permite(admin, [])
+    return tipo.permite(False, obter_acesso_empresa(usuario['id'], empresa_id)['permissoes'])
+
+
+@app.route('/api/jobs', methods=['POST'])
+@require_auth
+def enfileirar_job():
+    """
+    Enfileira uma operacao longa e responde na hora (202) com o job_id
+
+    Body: {"tipo": "sped_ecd" | "efd_contribuicoes" | "dirf" | "dfe_busca" |
+           "nfse_busca" | "backup_zip", "parametros": {...}, "prioridade": 0}
+
+    Os parametros sao os mesmos do endpoint sincrono correspondente.
+    Acompanhar por GET /api/jobs/<job_id>; arquivo em GET /api/jobs/<job_id>/download.
+    """
+    try:
+        import fila_jobs
+
+        usuario = get_usuario_logado()
+        empresa_id = session.get('empresa_id') or usuario.get('empresa_id')
+        if not empresa_id:
+            return jsonify({'success': False, 'error': 'Empresa nao identificada'}), 403
+
+        data = request.get_json() or {}
+        tipo = fila_jobs.obter_tipo(data.get('tipo') or '')
+        if tipo is None:
+            return jsonify({'success': False, 'error': f"Tipo de job invalido: {data.get('tipo')}"}), 400
+        if not _job_permitido(fila_jobs, tipo.nome, usuario, empresa_id):
+            return jsonify({'success': False, 'error': 'Acesso negado'}), 403
+
+        resultado = fila_jobs.enfileirar(
+            tipo.nome,
+            empresa_id=empresa_id,
+            usuario_id=usuario['id'],
+            parametros=data.get('parametros') or {},
+            prioridade=int(data.get('prioridade') or 0)
+        )
+        if not resultado['success']:
+            return jsonify(resultado), 400
+        return jsonify(resultado), 202
+
+    except Exception as e:
+        logger.error(f"Erro ao enfileirar job: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@require_auth
+def status_job(job_id):
+    """Status, progresso, resultado e erro de um job da empresa"""
+    try:
+        import fila_jobs
+
+        usuario = get_usuario_logado()
+        empresa_id = session.get('empresa_id') or usuario.get('empresa_id')
+        if not empresa_id:
+            return jsonify({'success': False, 'error': 'Empresa nao identificada'}), 403
+
+        job = fila_jobs.obter_job(job_id, empresa_id=empresa_id)
+        if not job:
+            return jsonify({'success': False, 'error': 'Job nao encontrado'}), 404
+        if not _job_permitido(fila_jobs, job['tipo'], usuario, empresa_id):
+            return jsonify({'success': False, 'error': 'Acesso negado'}), 403
+        return jsonify({'success': True, **job})
+
+    except Exception as e:
+        logger.error(f"Erro ao consultar job {job_id}: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/jobs/<job_id>/download', methods=['GET'])
+@require_auth
+def download_job(job_id):
+    """Arquivo gerado por um job concluido (TXT do SPED/DIRF, ZIP do backup...)"""
+    try:
+        import fila_jobs
+
+        usuario = get_usuario_logado()
+        empresa_id = session.get('empresa_id') or usuario.get('empresa_id')
+        if not empresa_id:
+            return jsonify({'success': False, 'error': 'Empresa nao identificada'}), 403
+
+        artefato = fila_jobs.caminho_artefato(job_id, empresa_id=empresa_id)
+        if not artefato:
+            return jsonify({'success': False, 'error': 'Arquivo nao disponivel'}), 404
+        if not _job_permitido(fila_jobs, artefato['tipo'], usuario, empresa_id):
+            return jsonify({'success': False, 'error': 'Acesso negado'}), 403
+        return send_file(artefato['caminho'], mimetype=artefato['mime'], as_attachment=True,
+                         download_name=artefato['nome'])
+
+    except Exception as e:
+        logger.error(f"Erro no download do job {job_id}: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 if __name__ == '__main__':
     # Inicializar tabelas de importa��o
     try:
@@ -23674,6 +23621,21 @@ if __name__ == '__main__':
 
     # Backup automático por e-mail foi desativado — backups agora são somente sob demanda, via download
 
+    # Pool de parse da DistDFe (NFE_PROCESSOS_PARSE): fork agora, antes das threads do servidor
+    try:
+        from relatorios.nfe import nfe_processor
+        nfe_processor.iniciar_pool_parse()
+    except Exception as e:
+        print(f"Erro ao iniciar pool de parse de NF-e: {e}")
+
+    # Workers da fila de jobs (SPED, DIRF, backup, buscas DF-e/NFS-e) em processos filhos
+    try:
+        import fila_jobs
+        total_workers = fila_jobs.iniciar_workers_processo(int(os.getenv('JOBS_WORKERS', '1')))
+        print(f"? {total_workers} worker(s) da fila de jobs iniciado(s)")
+    except Exception as e:
+        print(f"?? Erro ao iniciar workers da fila de jobs: {e}")
+
     # Configurar logging para produ��o (WARNING/ERROR apenas)
     import logging
     log_level = logging.WARNING if os.getenv('RAILWAY_ENVIRONMENT') else logging.INFO